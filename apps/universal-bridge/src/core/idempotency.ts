@@ -15,6 +15,7 @@
  */
 export class IdempotencyManager {
   private cache = new Map<string, any>();  // TODO: Redis로 교체
+  private pending = new Map<string, Promise<any>>();  // 처리 중인 키 -> 먼저 온 요청의 결과
 
   /**
    * Idempotency Key 확인
@@ -52,6 +53,50 @@ export class IdempotencyManager {
     this.cache.delete(key);
   }
 
+  /**
+   * 같은 키의 요청을 한 번만 실행
+   * 
+   * 처리 중인 키로 들어온 요청(첫 요청이 DB 저장을 기다리는 동안 도착한 재시도 등)은
+   * 먼저 온 요청의 결과를 기다림. 결과가 null이면 캐시하지 않고, 핸들러가 실패하면
+   * 처리 중 표시를 지워 기다리던 요청이 다시 실행
+   * 
+   * @returns 결과와 중복 여부 (캐시 또는 먼저 온 요청의 결과면 duplicate)
+   */
+  async once<T>(
+    key: string,
+    handler: () => Promise<T | null>
+  ): Promise<{ result: T | null; duplicate: boolean }> {
+    const cached = await this.get(key);
+    if (cached) {
+      return { result: cached as T, duplicate: true };
+    }
+
+    const inFlight = this.pending.get(key);
+    if (inFlight) {
+      let result: T | null;
+      try {
+        result = await inFlight;
+      } catch {
+        // 먼저 온 요청이 실패했으면 이 요청이 다시 실행
+        return this.once(key, handler);
+      }
+      return { result, duplicate: result !== null };
+    }
+
+    // 확인과 등록 사이에 await가 없어야 동시에 온 요청이 모두 처리 중 표시를 봄
+    const promise = handler();
+    this.pending.set(key, promise);
+    try {
+      const result = await promise;
+      if (result !== null) {
+        await this.set(key, result);
+      }
+      return { result, duplicate: false };
+    } finally {
+      this.pending.delete(key);
+    }
+  }
+
   /**
    * Idempotent 핸들러 래퍼
    */
@@ -82,3 +82,69 @@ export async function getRecentReadings(
   return data;
 }
 
+
+/**
+ * 일괄 업로드 저장 위치 조회 (저장 완료한 줄 수, 없으면 0)
+ */
+export async function getBulkUploadOffset(
+  tenantId: string,
+  deviceUuid: string,
+  uploadId: string
+): Promise<number> {
+  const supabase = getSupabase();
+
+  const { data, error } = await supabase
+    .from('iot_bulk_uploads')
+    .select('line_offset')
+    .eq('tenant_id', tenantId)
+    .eq('device_id', deviceUuid)
+    .eq('upload_id', uploadId)
+    .maybeSingle();
+
+  if (error) {
+    console.error('[DB] Failed to get bulk upload offset:', error);
+    throw error;
+  }
+
+  return data?.line_offset || 0;
+}
+
+/**
+ * 일괄 업로드 배치 저장 (측정값과 진행 위치를 한 트랜잭션으로)
+ * 
+ * 저장된 위치가 start일 때만 저장하고 위치를 end로 옮김
+ * 
+ * @returns 저장 후 위치 (end가 아니면 다른 요청이 먼저 저장해 아무것도 넣지 않은 것)
+ */
+export async function insertBulkReadings(
+  tenantId: string,
+  deviceUuid: string,  // iot_devices.id (UUID)
+  uploadId: string,
+  start: number,
+  end: number,
+  readings: Reading[]
+): Promise<number> {
+  const supabase = getSupabase();
+
+  const { data, error } = await supabase.rpc('insert_bulk_readings', {
+    p_tenant_id: tenantId,
+    p_device_id: deviceUuid,
+    p_upload_id: uploadId,
+    p_start: start,
+    p_end: end,
+    p_readings: readings.map(reading => ({
+      ts: reading.ts,
+      key: reading.key,
+      value: reading.value,
+      unit: reading.unit,
+      quality: reading.quality || 'good',
+    })),
+  });
+
+  if (error) {
+    console.error('[DB] Failed to insert bulk readings:', error);
+    throw error;
+  }
+
+  return data as number;
+}
@@ -5,12 +5,23 @@
  */
 
 import type { Request, Response } from 'express';
+import fs from 'fs';
+import path from 'path';
+import readline from 'readline';
+import { pipeline } from 'stream/promises';
+import zlib from 'zlib';
 import { logger } from '../../utils/logger.js';
 import { tokenServer } from '../../security/jwt.js';
 import { getSupabase } from '../../db/client.js';
-import { insertReadings } from '../../db/readings.js';
+import { insertReadings, getBulkUploadOffset, insertBulkReadings } from '../../db/readings.js';
 import { insertDevice, getDeviceByDeviceId, updateDeviceState } from '../../db/devices.js';
 import { getPendingCommands, updateCommandStatus } from '../../db/commands.js';
+import { IdempotencyManager } from '../../core/idempotency.js';
+
+// Idempotency-Key로 재시도/재전송된 텔레메트리를 다시 저장하지 않음 (24시간)
+const telemetryIdempotency = new IdempotencyManager();
+// 재시도된 명령 ACK를 다시 반영하지 않음
+const commandAckIdempotency = new IdempotencyManager();
 
 /**
  * Provisioning - Claim
@@ -233,9 +244,45 @@ export async function handleTelemetry(req: Request, res: Response) {
       metricsCount: Object.keys(metrics || {}).length
     });
 
-    // 디바이스 존재 확인
-    const device = await getDeviceByDeviceId(tenant_id, device_id);
-    if (!device) {
+    // 저장 처리 (디바이스가 없으면 null)
+    const store = async () => {
+      const device = await getDeviceByDeviceId(tenant_id, device_id);
+      if (!device) {
+        return null;
+      }
+
+      // 텔레메트리 데이터 저장
+      const readings = Object.entries(metrics || {}).map(([key, value]) => ({
+        ts: timestamp || new Date().toISOString(),
+        key,
+        value: typeof value === 'number' ? value : parseFloat(String(value)) || 0,
+        unit: '', // 기본값
+        quality: 'good' as const
+      }));
+
+      if (readings.length > 0) {
+        await insertReadings(tenant_id, device.id, readings);
+      }
+
+      // 디바이스 마지막 접속 시간 업데이트
+      await updateDeviceState(device_id, tenant_id, {
+        status: 'online'
+      });
+
+      return {
+        success: true,
+        received_at: new Date().toISOString()
+      };
+    };
+
+    // 같은 Idempotency-Key면 한 번만 저장 (처리 중에 도착한 재시도는 첫 요청의 결과를 기다림)
+    const idempotencyKey = req.get('Idempotency-Key');
+    const cacheKey = idempotencyKey && `${req.get('x-tenant-id') || tenant_id}:${req.get('x-device-id') || device_id}:${idempotencyKey}`;
+    const { result, duplicate } = cacheKey
+      ? await telemetryIdempotency.once(cacheKey, store)
+      : { result: await store(), duplicate: false };
+
+    if (!result) {
       logger.warn('Device not found for telemetry', {
         reqId,
         deviceId: device_id,
@@ -243,36 +290,18 @@ export async function handleTelemetry(req: Request, res: Response) {
       });
       return res.status(404).json({ error: 'Device not found' });
     }
-
-    // 텔레메트리 데이터 저장
-    const readings = Object.entries(metrics || {}).map(([key, value]) => ({
-      ts: timestamp || new Date().toISOString(),
-      key,
-      value: typeof value === 'number' ? value : parseFloat(String(value)) || 0,
-      unit: '', // 기본값
-      quality: 'good' as const
-    }));
-
-    if (readings.length > 0) {
-      await insertReadings(tenant_id, device.id, readings);
+    if (duplicate) {
+      logger.debug('Duplicate telemetry ignored', { reqId, deviceId: device_id, idempotencyKey });
+      return res.json({ ...result, duplicate: true, reqId });
     }
 
-    // 디바이스 마지막 접속 시간 업데이트
-    await updateDeviceState(device_id, tenant_id, {
-      status: 'online'
-    });
-
     logger.debug('Telemetry processed successfully', {
       reqId,
       deviceId: device_id,
       tenantId: tenant_id
     });
 
-    res.json({
-      success: true,
-      received_at: new Date().toISOString(),
-      reqId
-    });
+    res.json({ ...result, reqId });
 
   } catch (error: unknown) {
     logger.logError(error instanceof Error ? error : new Error(String(error)), 'Telemetry processing failed', {
@@ -288,6 +317,269 @@ export async function handleTelemetry(req: Request, res: Response) {
   }
 }
 
+// 일괄 업로드 배치 크기 (배치마다 측정값과 진행 위치를 DB에 함께 저장 - iot_bulk_uploads)
+const BULK_BATCH_SIZE = 500;
+
+// 디바이스 측정 품질(good/suspect/bad 등) -> iot_readings.quality (good/fair/poor)
+const BULK_QUALITY: Record<string, 'good' | 'fair' | 'poor'> = {
+  good: 'good',
+  fair: 'fair',
+  suspect: 'fair',
+  poor: 'poor',
+  bad: 'poor'
+};
+
+// 같은 업로드를 다른 요청이 먼저 저장함 (저장된 위치부터 다시 보내야 함)
+class BulkOffsetConflictError extends Error {}
+
+/**
+ * Telemetry - Bulk Offset
+ * 
+ * GET /api/bridge/telemetry/bulk/:uploadId
+ * 
+ * 일괄 업로드를 이어서 보낼 위치 (이미 저장한 줄 수)
+ */
+export async function handleTelemetryBulkOffset(req: Request, res: Response) {
+  const { uploadId } = req.params;
+  const deviceId = req.get('x-device-id');
+  const tenantId = req.get('x-tenant-id') || (req.query.tenant_id as string | undefined);
+
+  try {
+    if (!deviceId || !tenantId) {
+      return res.status(400).json({ error: 'x-device-id and x-tenant-id headers required' });
+    }
+
+    const device = await getDeviceByDeviceId(tenantId, deviceId);
+    if (!device) {
+      return res.status(404).json({ error: 'Device not found' });
+    }
+
+    res.json({
+      upload_id: uploadId,
+      offset: await getBulkUploadOffset(tenantId, device.id, uploadId)
+    });
+
+  } catch (error: unknown) {
+    logger.logError(error instanceof Error ? error : new Error(String(error)), 'Bulk offset lookup failed', {
+      reqId: req.id,
+      deviceId,
+      uploadId
+    });
+
+    res.status(500).json({
+      error: 'Internal Server Error',
+      reqId: req.id
+    });
+  }
+}
+
+/**
+ * Telemetry - Bulk
+ * 
+ * POST /api/bridge/telemetry/bulk
+ * 
+ * NDJSON(한 줄에 측정값 하나) 스트리밍 업로드. 본문을 줄 단위로 읽으며 BULK_BATCH_SIZE개씩 저장하고
+ * 저장할 때마다 진행 위치를 같은 트랜잭션으로 기록 (끊기면 클라이언트가 GET으로 위치를 조회해 이어서 전송)
+ */
+export async function handleTelemetryBulk(req: Request, res: Response) {
+  const reqId = req.id || 'unknown';
+  const deviceId = req.get('x-device-id');
+  const tenantId = req.get('x-tenant-id') || (req.query.tenant_id as string | undefined);
+  const uploadId = req.get('x-upload-id');
+  let committed = 0;
+  let accepted = 0;
+
+  try {
+    if (!deviceId || !tenantId || !uploadId) {
+      return res.status(400).json({ error: 'x-device-id, x-tenant-id and x-upload-id headers required' });
+    }
+
+    const device = await getDeviceByDeviceId(tenantId, deviceId);
+    if (!device) {
+      return res.status(404).json({ error: 'Device not found' });
+    }
+    committed = await getBulkUploadOffset(tenantId, device.id, uploadId);
+
+    // 클라이언트가 보낸 첫 줄의 위치. 저장된 위치보다 뒤면 중간이 빠지므로 거부
+    const start = parseInt(req.get('x-upload-offset') || '0', 10) || 0;
+    if (start > committed) {
+      return res.status(409).json({ error: 'Upload offset ahead of stored offset', offset: committed });
+    }
+
+    const encoding = req.get('Content-Encoding');
+    const input = encoding === 'deflate' ? req.pipe(zlib.createInflate())
+      : encoding === 'gzip' ? req.pipe(zlib.createGunzip())
+      : req;
+    const lines = readline.createInterface({ input, crlfDelay: Infinity });
+
+    let index = start;
+    let batch: Array<{ ts: string; key: string; value: number; unit: string; quality: 'good' | 'fair' | 'poor' }> = [];
+    const flush = async () => {
+      if (batch.length === 0) return;
+      const stored = await insertBulkReadings(tenantId, device.id, uploadId, committed, index, batch);
+      if (stored !== index) {
+        committed = stored;
+        throw new BulkOffsetConflictError(`Upload ${uploadId} advanced to ${stored} by another request`);
+      }
+      accepted += batch.length;
+      committed = index;
+      batch = [];
+    };
+
+    for await (const line of lines) {
+      if (!line.trim()) continue;
+      // 이미 저장한 줄 (이어받기 중 다시 보낸 부분)은 건너뜀
+      if (index < committed) {
+        index++;
+        continue;
+      }
+      const reading = JSON.parse(line);
+      index++;
+      batch.push({
+        ts: reading.ts || new Date().toISOString(),
+        key: reading.key,
+        value: typeof reading.value === 'number' ? reading.value : parseFloat(String(reading.value)) || 0,
+        unit: reading.unit || '',
+        quality: BULK_QUALITY[reading.quality] || 'good'
+      });
+      if (batch.length >= BULK_BATCH_SIZE) {
+        await flush();
+      }
+    }
+    await flush();
+
+    logger.info('Bulk telemetry processed', { reqId, deviceId, tenantId, uploadId, accepted, offset: committed });
+
+    res.json({
+      success: true,
+      upload_id: uploadId,
+      accepted,
+      offset: committed,
+      reqId
+    });
+
+  } catch (error: unknown) {
+    logger.logError(error instanceof Error ? error : new Error(String(error)), 'Bulk telemetry processing failed', {
+      reqId,
+      deviceId,
+      uploadId,
+      offset: committed,
+      clientIp: req.ip
+    });
+
+    // 저장된 위치까지는 유지되므로 클라이언트는 offset부터 다시 전송
+    const status = error instanceof SyntaxError ? 400
+      : error instanceof BulkOffsetConflictError ? 409
+      : 500;
+    if (!res.headersSent) {
+      res.status(status).json({
+        error: status === 400 ? 'Invalid NDJSON line'
+          : status === 409 ? 'Upload offset changed by another request'
+          : 'Internal Server Error',
+        offset: committed,
+        reqId
+      });
+    }
+  }
+}
+
+// 이미지 업로드 저장 위치 (테넌트/디바이스별 디렉터리, 받는 중인 파일은 .part)
+const IMAGE_STORAGE_DIR = process.env.BRIDGE_IMAGE_DIR || path.resolve('data/images');
+const IMAGE_MAX_CHUNK_BYTES = 8 * 1024 * 1024;
+const SAFE_SEGMENT = /^[A-Za-z0-9_-][A-Za-z0-9_.-]{0,127}$/;
+
+async function fileSize(file: string) {
+  try {
+    return (await fs.promises.stat(file)).size;
+  } catch {
+    return null;
+  }
+}
+
+/**
+ * Images - Chunk Upload
+ * 
+ * PUT /api/bridge/images/:deviceId/:name
+ * 
+ * Content-Range(bytes 시작-끝/전체) 청크를 이어 붙여 저장. 중간 청크는 308, 마지막 청크는 201,
+ * 이미 받은 파일이면 200. 시작 위치가 받은 크기와 다르면 416 (x-upload-offset부터 다시 전송)
+ */
+export async function handleImageUpload(req: Request, res: Response) {
+  const reqId = req.id || 'unknown';
+  const { deviceId, name } = req.params;
+  const tenantId = req.get('x-tenant-id');
+
+  try {
+    if (!tenantId || !SAFE_SEGMENT.test(tenantId) || !SAFE_SEGMENT.test(deviceId) ||
+        !SAFE_SEGMENT.test(name) || !name.endsWith('.jpg')) {
+      return res.status(400).json({ error: 'Invalid tenant, device or file name', reqId });
+    }
+
+    const range = /^bytes (\d+)-(\d+)\/(\d+)$/.exec(req.get('Content-Range') || '');
+    if (!range) {
+      return res.status(400).json({ error: 'Content-Range header required', reqId });
+    }
+    const [start, end, total] = range.slice(1).map(Number);
+    if (end < start || end >= total || end - start + 1 > IMAGE_MAX_CHUNK_BYTES) {
+      return res.status(400).json({ error: 'Invalid Content-Range', reqId });
+    }
+
+    const device = await getDeviceByDeviceId(tenantId, deviceId);
+    if (!device) {
+      return res.status(404).json({ error: 'Device not found', reqId });
+    }
+
+    const dir = path.join(IMAGE_STORAGE_DIR, tenantId, deviceId);
+    const target = path.join(dir, name);
+    const partial = `${target}.part`;
+    await fs.promises.mkdir(dir, { recursive: true });
+
+    if (await fileSize(target) === total) {
+      res.set('x-upload-offset', String(total));
+      return res.status(200).json({ success: true, name, size: total, reqId });
+    }
+
+    const received = (await fileSize(partial)) || 0;
+    if (start !== received) {
+      res.set('x-upload-offset', String(received));
+      return res.status(416).json({ error: 'Unexpected chunk offset', offset: received, reqId });
+    }
+
+    await pipeline(req, fs.createWriteStream(partial, { flags: 'a' }));
+    const offset = (await fileSize(partial)) || 0;
+    if (offset !== end + 1) {
+      // 본문 길이가 Content-Range와 다르면 이어 붙인 파일을 믿을 수 없으므로 처음부터 다시 받음
+      await fs.promises.rm(partial, { force: true });
+      res.set('x-upload-offset', '0');
+      return res.status(416).json({ error: 'Chunk length does not match Content-Range', offset: 0, reqId });
+    }
+    res.set('x-upload-offset', String(offset));
+
+    if (offset < total) {
+      return res.status(308).json({ offset, reqId });
+    }
+
+    await fs.promises.rename(partial, target);
+    logger.info('Image uploaded', { reqId, deviceId, tenantId, name, size: total });
+    res.status(201).json({ success: true, name, size: total, reqId });
+
+  } catch (error: unknown) {
+    logger.logError(error instanceof Error ? error : new Error(String(error)), 'Image upload failed', {
+      reqId,
+      deviceId,
+      name,
+      clientIp: req.ip
+    });
+
+    if (!res.headersSent) {
+      res.status(500).json({
+        error: 'Internal Server Error',
+        reqId
+      });
+    }
+  }
+}
+
 /**
  * Commands - Poll
  * 
@@ -365,7 +657,26 @@ export async function handleCommandAck(req: Request, res: Response) {
     });
 
     // 명령 상태 업데이트
-    await updateCommandStatus(commandId, status, result || error_message || '');
+    const apply = async () => {
+      await updateCommandStatus(commandId, status, result || error_message || '');
+      return {
+        success: true,
+        command_id: commandId,
+        processed_at: new Date().toISOString()
+      };
+    };
+
+    // 응답 시간 초과 후 재시도된 ACK면 상태를 다시 쓰지 않고 처음 응답을 반환
+    const idempotencyKey = req.get('Idempotency-Key');
+    const cacheKey = idempotencyKey && `${commandId}:${idempotencyKey}`;
+    const { result: response, duplicate } = cacheKey
+      ? await commandAckIdempotency.once(cacheKey, apply)
+      : { result: await apply(), duplicate: false };
+
+    if (duplicate) {
+      logger.debug('Duplicate command ACK ignored', { reqId, commandId, idempotencyKey });
+      return res.json({ ...response, duplicate: true, reqId });
+    }
 
     logger.debug('Command ACK processed', {
       reqId,
@@ -373,12 +684,7 @@ export async function handleCommandAck(req: Request, res: Response) {
       status
     });
 
-    res.json({
-      success: true,
-      command_id: commandId,
-      processed_at: new Date().toISOString(),
-      reqId
-    });
+    res.json({ ...response, reqId });
 
   } catch (error: unknown) {
     logger.logError(error instanceof Error ? error : new Error(String(error)), 'Command ACK processing failed', {
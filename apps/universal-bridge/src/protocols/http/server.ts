@@ -160,40 +160,6 @@ export function createHttpServer() {
     });
   });
 
-  // 에러 핸들링 미들웨어
-  app.use((error: Error, req: any, res: any, next: any) => {
-    logger.logError(error, 'Unhandled request error', {
-      reqId: req.id,
-      method: req.method,
-      path: req.path,
-      userAgent: req.get('User-Agent'),
-      ip: req.ip
-    });
-
-    res.status(500).json({
-      error: 'Internal Server Error',
-      reqId: req.id,
-      message: process.env.NODE_ENV === 'production' ? 'Something went wrong' : error.message
-    });
-  });
-
-  // 404 핸들러
-  app.use('*', (req, res) => {
-    logger.warn('Route not found', {
-      reqId: req.id,
-      method: req.method,
-      path: req.path,
-      userAgent: req.get('User-Agent'),
-      ip: req.ip
-    });
-
-    res.status(404).json({
-      error: 'Not Found',
-      reqId: req.id,
-      message: `Route ${req.method} ${req.path} not found`
-    });
-  });
-
   // 인증 라우터 설정
   app.post('/api/auth/token', authRoutes.generateToken);
   app.get('/api/auth/verify', authenticateDevice, authRoutes.verifyToken);
@@ -218,6 +184,9 @@ export function createHttpServer() {
 
   // Bridge 엔드포인트
   app.post('/api/bridge/telemetry', routes.handleTelemetry);
+  app.post('/api/bridge/telemetry/bulk', routes.handleTelemetryBulk);
+  app.get('/api/bridge/telemetry/bulk/:uploadId', routes.handleTelemetryBulkOffset);
+  app.put('/api/bridge/images/:deviceId/:name', routes.handleImageUpload);
   app.get('/api/bridge/commands/:deviceId', routes.handleCommandPoll);
   app.post('/api/bridge/commands/:commandId/ack', routes.handleCommandAck);
 
@@ -226,15 +195,38 @@ export function createHttpServer() {
   app.get('/api/farms/:farmId/actuators/status', webAdminRoutes.getActuatorStatus);
   app.post('/api/farms/:farmId/actuators/control', webAdminRoutes.controlActuator);
 
-  // 404 핸들러
-  app.use((req, res) => {
-    res.status(404).json({ error: 'Not Found' });
+  // 404 핸들러 (모든 라우트 등록 뒤에 둬야 함)
+  app.use('*', (req, res) => {
+    logger.warn('Route not found', {
+      reqId: req.id,
+      method: req.method,
+      path: req.path,
+      userAgent: req.get('User-Agent'),
+      ip: req.ip
+    });
+
+    res.status(404).json({
+      error: 'Not Found',
+      reqId: req.id,
+      message: `Route ${req.method} ${req.path} not found`
+    });
   });
 
-  // 에러 핸들러
-  app.use((err: Error, req: express.Request, res: express.Response, next: express.NextFunction) => {
-    console.error('[HTTP] Error:', err);
-    res.status(500).json({ error: 'Internal Server Error' });
+  // 에러 핸들링 미들웨어
+  app.use((error: Error, req: any, res: any, next: any) => {
+    logger.logError(error, 'Unhandled request error', {
+      reqId: req.id,
+      method: req.method,
+      path: req.path,
+      userAgent: req.get('User-Agent'),
+      ip: req.ip
+    });
+
+    res.status(500).json({
+      error: 'Internal Server Error',
+      reqId: req.id,
+      message: process.env.NODE_ENV === 'production' ? 'Something went wrong' : error.message
+    });
   });
 
   // WebSocket 서버 설정
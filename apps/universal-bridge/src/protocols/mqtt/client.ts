@@ -6,14 +6,20 @@
 
 import mqtt from 'mqtt';
 import crypto from 'crypto';
+import zlib from 'zlib';
 import { logger } from '../../utils/logger.js';
 import { handleRegistry } from './handlers/registry.js';
 import { handleState } from './handlers/state.js';
 import { handleTelemetry } from './handlers/telemetry.js';
 import { handleCommandAck } from './handlers/commandAck.js';
 import { dispatchPendingCommands } from './dispatch/commands.js';
+import { SequenceTracker } from './utils/sequence.js';
 import { createClient } from '@supabase/supabase-js';
 
+const BACKFILL_MARGIN_MS = 5000;
+// Minimum interval between get_state resync requests to the same device
+const STATE_SYNC_INTERVAL_MS = 30000;
+
 export interface FarmConfig {
   farm_id: string;
   broker_url: string;
@@ -29,6 +35,10 @@ export interface FarmConfig {
 export class MQTTClientManager {
   private clients = new Map<string, mqtt.MqttClient>();
   private supabase: any;
+  // Per-device telemetry sequence windows (gap / duplicate detection)
+  private sequences = new SequenceTracker();
+  // Last get_state request per device (deltas keep failing until the snapshot arrives)
+  private stateSyncRequestedAt = new Map<string, number>();
 
   constructor() {
     this.supabase = createClient(
@@ -44,6 +54,16 @@ export class MQTTClientManager {
     return decipher.update(secret_enc, 'hex', 'utf8') + decipher.final('utf8');
   }
 
+  private shouldRequestStateSync(source: string): boolean {
+    const now = Date.now();
+    const last = this.stateSyncRequestedAt.get(source);
+    if (last !== undefined && now - last < STATE_SYNC_INTERVAL_MS) {
+      return false;
+    }
+    this.stateSyncRequestedAt.set(source, now);
+    return true;
+  }
+
   async connectToFarm(farmConfig: FarmConfig): Promise<void> {
     const {
       farm_id,
@@ -85,6 +105,8 @@ export class MQTTClientManager {
         `farms/${farm_id}/+/+/telemetry`,
         `farms/${farm_id}/+/+/command/ack`
       ];
+      // Compressed variants: devices append the content encoding as a topic suffix
+      farmTopics.push(...farmTopics.map(topic => `${topic}/deflate`));
       
       farmTopics.forEach(topic => {
         client.subscribe(topic, { qos: qos_default as any }, () => {
@@ -102,9 +124,17 @@ export class MQTTClientManager {
       }), { qos: 1 as any, retain: true });
     });
 
-    client.on('message', async (topic, message) => {
+    client.on('message', async (topic, message, packet) => {
       try {
-        const payload = JSON.parse(message.toString());
+        // Content encoding: topic suffix (MQTT 3.1.1) or `content-encoding` user property (MQTT 5)
+        const userProperties = packet.properties?.userProperties as Record<string, string> | undefined;
+        let encoding = userProperties?.['content-encoding'];
+        if (topic.endsWith('/deflate')) {
+          encoding = 'deflate';
+          topic = topic.slice(0, -'/deflate'.length);
+        }
+        const body = encoding === 'deflate' ? zlib.inflateSync(message) : message;
+        const payload = JSON.parse(body.toString());
         
         // Extract farm_id and device_id from topic
         const topicParts = topic.split('/');
@@ -119,12 +149,50 @@ export class MQTTClientManager {
           case 'registry':
             await handleRegistry(this.supabase, farm_id, deviceId, payload);
             break;
-          case 'state':
-            await handleState(this.supabase, farm_id, deviceId, payload);
+          case 'state': {
+            const needsSnapshot = await handleState(this.supabase, farm_id, deviceId, payload);
+            if (needsSnapshot && this.shouldRequestStateSync(`${farm_id}/${deviceId}`)) {
+              // Missed a state delta: ask the device for a full snapshot
+              client.publish(`farms/${farm_id}/devices/${deviceId}/command`, JSON.stringify({
+                command_id: `state-sync-${Date.now()}`,
+                command: 'get_state',
+                payload: {},
+                timestamp: new Date().toISOString()
+              }), { qos: 1 });
+            }
             break;
-          case 'telemetry':
+          }
+          case 'telemetry': {
+            const ingestTs = Date.now();
+            const source = `${farm_id}/${deviceId}`;
+            const { status, gap } = this.sequences.observe(source, payload);
+            if (status === 'duplicate') {
+              logger.debug('Duplicate telemetry ignored', { farm_id, deviceId, seq: payload.seq });
+              break;
+            }
+            if (gap) {
+              logger.warn('Telemetry sequence gap', { farm_id, deviceId, ...gap, stats: this.sequences.stats(source) });
+              if (gap.startTs !== null) {
+                // Ask the gateway to resend the gap from its backlog (gateway command format: type/params).
+                // The range comes from our receive times, so pad it for clock skew; resent readings are upserted.
+                client.publish(`farms/${farm_id}/devices/${deviceId}/command`, JSON.stringify({
+                  command_id: `backfill-${payload.seq_epoch ?? 0}-${gap.first}-${gap.last}`,
+                  type: 'backfill',
+                  params: { start: gap.startTs - BACKFILL_MARGIN_MS, end: gap.endTs + BACKFILL_MARGIN_MS },
+                  timestamp: new Date().toISOString()
+                }), { qos: 1 });
+              }
+            }
             await handleTelemetry(this.supabase, farm_id, deviceId, payload);
+            if (payload.trace && Array.isArray(payload.trace.hops)) {
+              // Sampled end-to-end trace from the gateway: append our hops and log per-stage latency
+              const storedTs = Date.now();
+              const hops = [...payload.trace.hops, ['bridge_ingest', ingestTs], ['stored', storedTs]];
+              const stages = Object.fromEntries(hops.slice(1).map(([stage, ts]: [string, number], i: number) => [stage, ts - hops[i][1]]));
+              logger.info('Telemetry trace', { farm_id, deviceId, trace_id: payload.trace.id, stages, total_ms: storedTs - hops[0][1] });
+            }
             break;
+          }
           case 'command':
             if (topicParts[4] === 'ack') {
               await handleCommandAck(this.supabase, farm_id, deviceId, payload);
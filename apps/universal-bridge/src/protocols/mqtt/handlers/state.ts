@@ -1,12 +1,60 @@
 import { SupabaseClient } from '@supabase/supabase-js';
 import { logger } from '../utils/logger.js';
 
-export async function handleState(
+/**
+ * JSON Merge Patch (RFC 7386) 적용
+ */
+function applyMergePatch(target: any, patch: any): any {
+  if (patch === null || typeof patch !== 'object' || Array.isArray(patch)) {
+    return patch;
+  }
+  const result = target && typeof target === 'object' && !Array.isArray(target) ? { ...target } : {};
+  for (const [key, value] of Object.entries(patch)) {
+    if (value === null) {
+      delete result[key];
+    } else {
+      result[key] = applyMergePatch(result[key], value);
+    }
+  }
+  return result;
+}
+
+// 디바이스별 처리 대기열 (devices.status 읽기-수정-쓰기가 겹치면 연속 변경분이 버전 누락으로 보임)
+const stateQueues = new Map<string, Promise<boolean>>();
+
+/**
+ * 디바이스 상태 처리
+ *
+ * 버전이 붙은 상태 섀도 메시지도 처리:
+ * - { version, full: true, state }: 전체 상태
+ * - { version, base_version, patch }: 변경분 (JSON Merge Patch)
+ *
+ * 같은 디바이스의 메시지는 도착 순서대로 하나씩 반영
+ *
+ * @returns 버전 누락으로 전체 상태(get_state)가 필요하면 true
+ */
+export function handleState(
   supabase: SupabaseClient,
   farmId: string,
   deviceId: string,
   payload: any
-): Promise<void> {
+): Promise<boolean> {
+  const key = `${farmId}/${deviceId}`;
+  const previous = stateQueues.get(key) || Promise.resolve(false);
+  const current = previous.then(() => applyState(supabase, farmId, deviceId, payload));
+  stateQueues.set(key, current);
+  current.finally(() => {
+    if (stateQueues.get(key) === current) stateQueues.delete(key);
+  });
+  return current;
+}
+
+async function applyState(
+  supabase: SupabaseClient,
+  farmId: string,
+  deviceId: string,
+  payload: any
+): Promise<boolean> {
   try {
     const { online, last_seen, actuators, health } = payload;
     
@@ -19,18 +67,44 @@ export async function handleState(
 
     if (fetchError) {
       logger.error('Failed to fetch device status', { farmId, deviceId, error: fetchError });
-      return;
+      return false;
     }
 
     // Merge with existing status
     const currentStatus = device?.status || {};
-    const newStatus = {
-      ...currentStatus,
-      online: online !== undefined ? online : currentStatus.online,
-      last_seen: last_seen || new Date().toISOString(),
-      ...(actuators && { actuators }),
-      ...(health && { health })
-    };
+    let newStatus;
+    if (payload.version !== undefined) {
+      let shadow;
+      if (payload.full) {
+        shadow = payload.state || {};
+      } else if (currentStatus.shadow && payload.base_version === currentStatus.shadow_version) {
+        shadow = applyMergePatch(currentStatus.shadow, payload.patch);
+      } else {
+        logger.warn('State version gap, requesting snapshot', {
+          farmId,
+          deviceId,
+          stored: currentStatus.shadow_version,
+          base_version: payload.base_version
+        });
+        return true;
+      }
+      newStatus = {
+        ...currentStatus,
+        online: true,
+        last_seen: new Date().toISOString(),
+        shadow,
+        shadow_version: payload.version,
+        ...(shadow.actuators && { actuators: shadow.actuators })
+      };
+    } else {
+      newStatus = {
+        ...currentStatus,
+        online: online !== undefined ? online : currentStatus.online,
+        last_seen: last_seen || new Date().toISOString(),
+        ...(actuators && { actuators }),
+        ...(health && { health })
+      };
+    }
 
     // Update device status
     const { error: updateError } = await supabase
@@ -43,11 +117,12 @@ export async function handleState(
 
     if (updateError) {
       logger.error('Failed to update device state', { farmId, deviceId, error: updateError });
-      return;
+      return false;
     }
 
-    logger.debug('State updated', { farmId, deviceId, online, last_seen });
+    logger.debug('State updated', { farmId, deviceId, online, last_seen, version: payload.version });
   } catch (error) {
     logger.error('Error processing state', { farmId, deviceId, error });
   }
+  return false;
 }
@@ -0,0 +1,147 @@
+// Per-source sequence tracking (gap / duplicate detection)
+//
+// Gateways stamp every telemetry message with `seq` (per-source counter assigned at ingest)
+// and `seq_epoch` (counter start time, ms). We keep a sliding bitmap of the last WINDOW_SIZE
+// sequence numbers per source, same layout as the gateway's sequence_tracker.py:
+// bit i = (highest - i) received.
+
+export const WINDOW_SIZE = 1024;
+const MASK = (1n << BigInt(WINDOW_SIZE)) - 1n;
+
+export type SequenceStatus = 'new' | 'late' | 'duplicate' | 'stale' | 'reset';
+
+export interface SequenceGap {
+  first: number;
+  last: number;
+  // Receive timestamps (ms) around the gap: the backfill range to request
+  startTs: number | null;
+  endTs: number;
+}
+
+export interface SequenceStats {
+  epoch: number | null;
+  highest: number;
+  received: number;
+  missing: number;
+  late: number;
+  duplicates: number;
+  lost: number;
+  resets: number;
+}
+
+function popcount(value: bigint): number {
+  let count = 0;
+  while (value) {
+    value &= value - 1n;
+    count++;
+  }
+  return count;
+}
+
+class SequenceWindow {
+  epoch: number | null = null;
+  highest = -1;
+  bitmap = 0n;
+  valid = 0;
+  lastTs: number | null = null;
+  stats = { received: 0, missing: 0, late: 0, duplicates: 0, lost: 0, resets: 0 };
+
+  observe(seq: number, epoch: number | null, ts: number): { status: SequenceStatus; gap?: SequenceGap } {
+    if (this.highest < 0) {
+      this.restart(seq, epoch, ts, false);
+      return { status: 'new' };
+    }
+    if (epoch !== null && epoch !== this.epoch) {
+      this.restart(seq, epoch, ts, true);
+      return { status: 'reset' };
+    }
+
+    if (seq > this.highest) {
+      const shift = seq - this.highest;
+      const gap = shift > 1
+        ? { first: this.highest + 1, last: seq - 1, startTs: this.lastTs, endTs: ts }
+        : undefined;
+
+      // Unreceived numbers shifted out of the window are lost for good
+      const keep = Math.max(0, WINDOW_SIZE - shift);
+      const dropped = this.valid > keep ? (this.valid - keep) - popcount(this.bitmap >> BigInt(keep)) : 0;
+      const skipped = shift - 1;
+      const overflow = Math.max(0, skipped - (WINDOW_SIZE - 1));
+
+      this.stats.lost += dropped + overflow;
+      this.stats.missing += skipped - overflow - dropped;
+      this.bitmap = shift >= WINDOW_SIZE ? 1n : ((this.bitmap << BigInt(shift)) | 1n) & MASK;
+      this.valid = Math.min(WINDOW_SIZE, this.valid + shift);
+      this.highest = seq;
+      this.lastTs = ts;
+      this.stats.received++;
+      return { status: 'new', gap };
+    }
+
+    const offset = this.highest - seq;
+    if (offset >= WINDOW_SIZE) {
+      if (epoch === null) {
+        // No epoch and far behind: the source restarted its counter
+        this.restart(seq, epoch, ts, true);
+        return { status: 'reset' };
+      }
+      return { status: 'stale' };
+    }
+    if (offset >= this.valid) {
+      // Older than the first number seen since (re)start: never counted as missing, so not late either
+      return { status: 'stale' };
+    }
+
+    const bit = 1n << BigInt(offset);
+    if (this.bitmap & bit) {
+      this.stats.duplicates++;
+      return { status: 'duplicate' };
+    }
+    this.bitmap |= bit;
+    this.stats.missing--;
+    this.stats.late++;
+    this.stats.received++;
+    return { status: 'late' };
+  }
+
+  private restart(seq: number, epoch: number | null, ts: number, reset: boolean): void {
+    if (reset) {
+      this.stats.resets++;
+      this.stats.lost += this.stats.missing;
+    }
+    this.epoch = epoch;
+    this.highest = seq;
+    this.bitmap = 1n;
+    this.valid = 1;
+    this.lastTs = ts;
+    this.stats.missing = 0;
+    this.stats.received++;
+  }
+}
+
+export class SequenceTracker {
+  private windows = new Map<string, SequenceWindow>();
+
+  /**
+   * Record a message's sequence number.
+   * Messages without a numeric `seq` are ignored (status null).
+   */
+  observe(source: string, payload: any, ts: number = Date.now()): { status: SequenceStatus | null; gap?: SequenceGap } {
+    const seq = payload?.seq;
+    if (typeof seq !== 'number' || !Number.isInteger(seq) || seq < 0) {
+      return { status: null };
+    }
+    let window = this.windows.get(source);
+    if (!window) {
+      window = new SequenceWindow();
+      this.windows.set(source, window);
+    }
+    const epoch = typeof payload.seq_epoch === 'number' ? payload.seq_epoch : null;
+    return window.observe(seq, epoch, ts);
+  }
+
+  stats(source: string): SequenceStats | null {
+    const window = this.windows.get(source);
+    return window ? { epoch: window.epoch, highest: window.highest, ...window.stats } : null;
+  }
+}
@@ -4,15 +4,955 @@
 스마트팜 플랫폼 연동용
 """
 
+import copy
+import heapq
+import itertools
 import json
+import math
+import os
 import time
 import random
 import threading
-from datetime import datetime, timezone
+import zlib
+from collections import OrderedDict, deque
 from typing import Dict, Any, Optional
 import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
 import ssl
 
+class CommandCache:
+    """최근 실행한 command_id의 ACK를 보관하는 LRU+TTL 캐시 (중복 명령 방지)"""
+    
+    def __init__(self, max_size: int = 1024, ttl: float = 3600, persist_path: Optional[str] = None,
+                 min_interval: float = 5.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.persist_path = persist_path
+        self.min_interval = min_interval  # 파일 저장 최소 간격 (초), 그 사이의 변경은 모아서 한 번에 저장
+        self._entries = OrderedDict()  # command_id -> (만료 시각, ack)
+        self._in_flight = set()  # 실행 중인 command_id (메모리만)
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saved_at = None
+        self._save_timer = None
+        
+        if persist_path:
+            self.load()
+    
+    def get(self, command_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """캐시된 ACK 반환 (없거나 만료되면 None)"""
+        if not command_id:
+            return None
+        
+        with self._lock:
+            entry = self._entries.get(command_id)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self._entries[command_id]
+                return None
+            self._entries.move_to_end(command_id)
+            return entry[1]
+    
+    def begin(self, command_id: Optional[str]) -> bool:
+        """실행 시작 표시. 이미 실행 중이거나 실행을 마친 명령이면 False (다시 실행하지 않음)"""
+        if not command_id:
+            return True
+        
+        with self._lock:
+            entry = self._entries.get(command_id)
+            if command_id in self._in_flight or (entry is not None and entry[0] >= time.time()):
+                return False
+            self._in_flight.add(command_id)
+            return True
+    
+    def discard(self, command_id: Optional[str]):
+        """ACK 없이 끝난 실행 표시 해제 (다음 재전송은 다시 실행)"""
+        with self._lock:
+            self._in_flight.discard(command_id)
+    
+    def put(self, command_id: Optional[str], ack: Dict[str, Any]):
+        """실행 완료된 명령의 ACK 저장"""
+        if not command_id:
+            return
+        
+        with self._lock:
+            self._in_flight.discard(command_id)
+            self._entries[command_id] = (time.time() + self.ttl, ack)
+            self._entries.move_to_end(command_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            if self.persist_path:
+                self._dirty = True
+                self._schedule_save_locked()
+    
+    def flush(self):
+        """저장 대기 중인 변경을 바로 파일에 씀 (종료 시 호출)"""
+        with self._lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+            if self._dirty:
+                self._save_locked()
+    
+    def load(self):
+        """파일에서 캐시 복원 (만료 항목은 버림)"""
+        try:
+            with open(self.persist_path, 'r') as f:
+                items = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        
+        now = time.time()
+        for command_id, expires_at, ack in items[-self.max_size:]:
+            if expires_at >= now:
+                self._entries[command_id] = (expires_at, ack)
+    
+    def _schedule_save_locked(self):
+        """min_interval이 지났으면 바로 저장, 아니면 남은 시간 뒤에 한 번 저장"""
+        if self._save_timer is not None:
+            return
+        elapsed = None if self._saved_at is None else time.monotonic() - self._saved_at
+        if elapsed is None or elapsed >= self.min_interval:
+            self._save_locked()
+            return
+        self._save_timer = threading.Timer(self.min_interval - elapsed, self.flush)
+        self._save_timer.daemon = True
+        self._save_timer.start()
+    
+    def _save_locked(self):
+        """임시 파일에 쓴 뒤 교체 (전원 차단 시 파일 손상 방지)"""
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        items = [[command_id, expires_at, ack] for command_id, (expires_at, ack) in self._entries.items()]
+        tmp_path = f"{self.persist_path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(items, f)
+            os.replace(tmp_path, self.persist_path)
+        except OSError as e:
+            print(f"⚠️ 명령 캐시 저장 실패: {e}")
+
+
+class ActuatorScheduler:
+    """힙 기반 액추에이터 스케줄러 (타이머 ON/OFF, 다단계 시퀀스, 인터록, 재시작 후 복원)"""
+    
+    def __init__(self, persist_path=None):
+        """
+        Args:
+            persist_path: 대기 중인 스케줄을 저장할 JSON 파일 경로 (None이면 저장 안 함)
+        """
+        self.persist_path = persist_path
+        self.states = {}           # 액추에이터 이름 -> 현재 상태
+        self._setters = {}         # 액추에이터 이름 -> setter(state) -> bool
+        self._interlocks = {}      # 액추에이터 이름 -> ON 전에 켜져 있어야 하는 액추에이터 목록
+        self._jobs = {}            # job_id -> {"steps": [(name, state, wait)], "index": int, "gen": int, "due": float}
+        self._heap = []            # (실행 시각(monotonic), 순번, job_id, gen)
+        self._seq = itertools.count()
+        self._cond = threading.Condition(threading.RLock())
+        self._running = False
+        self._thread = None
+    
+    # ---------- 설정 ----------
+    
+    def register(self, name, setter, requires=None, initial_state=False):
+        """액추에이터 등록 (requires: ON 되기 전에 켜져 있어야 하는 액추에이터 목록)"""
+        with self._cond:
+            self._setters[name] = setter
+            self.states[name] = initial_state
+            if requires:
+                self._interlocks[name] = list(requires)
+    
+    def start(self):
+        """스케줄러 스레드 시작 (저장된 스케줄 복원)"""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            self._restore_locked()
+        
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """스케줄러 스레드 중지 (대기 중인 스케줄은 파일에 남겨둠)"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=2)
+    
+    # ---------- 제어 API ----------
+    
+    def set(self, name, state):
+        """즉시 상태 변경 (해당 액추에이터의 대기 중인 스케줄은 취소)"""
+        with self._cond:
+            self._cancel_conflicts_locked({name})
+            ok = self._apply_locked(name, state)
+            self._save_locked()
+            return ok
+    
+    def pulse(self, name, duration, state=True, job_id=None):
+        """지정 시간 동안 상태 유지 후 원래대로 복귀 (예: 펌프 300초 ON)"""
+        return self.run_sequence([(name, state, 0), (name, not state, duration)], job_id)
+    
+    def run_sequence(self, steps, job_id=None):
+        """
+        다단계 시퀀스 실행
+        
+        Args:
+            steps: [(액추에이터 이름, 상태, 이전 단계로부터 대기 시간(초)), ...]
+            job_id: 작업 ID (None이면 자동 생성)
+        
+        Returns:
+            job_id (인터록으로 즉시 중단되면 None)
+        """
+        steps = [(name, state, float(wait)) for name, state, wait in steps]
+        for name, _, _ in steps:
+            if name not in self._setters:
+                raise KeyError(f"등록되지 않은 액추에이터: {name}")
+        
+        with self._cond:
+            job_id = job_id or f"job-{int(time.time())}-{next(self._seq)}"
+            self._cancel_conflicts_locked({name for name, _, _ in steps})
+            self._jobs[job_id] = {"steps": steps, "index": 0, "gen": 0, "due": 0.0}
+            
+            # 대기 시간 0인 앞쪽 단계는 호출 스레드에서 바로 실행
+            job = self._jobs[job_id]
+            while job["index"] < len(steps) and steps[job["index"]][2] <= 0:
+                if not self._execute_step_locked(job_id, job):
+                    self._save_locked()
+                    return None
+            
+            if job["index"] < len(steps):
+                self._schedule_locked(job_id, job, time.monotonic() + steps[job["index"]][2])
+            else:
+                del self._jobs[job_id]
+            
+            self._save_locked()
+            return job_id
+    
+    def cancel(self, job_id):
+        """작업 취소 (남은 OFF 단계는 즉시 실행)"""
+        with self._cond:
+            if job_id not in self._jobs:
+                return False
+            self._abort_locked(job_id)
+            self._save_locked()
+            return True
+    
+    def pending(self):
+        """대기 중인 작업 요약 (상태 보고용)"""
+        now = time.monotonic()
+        with self._cond:
+            return [
+                {
+                    "job_id": job_id,
+                    "next_step": job["steps"][job["index"]][0],
+                    "remaining_steps": len(job["steps"]) - job["index"],
+                    "due_in": round(max(0.0, job["due"] - now), 1)
+                }
+                for job_id, job in self._jobs.items()
+            ]
+    
+    # ---------- 내부 처리 ----------
+    
+    def _run(self):
+        with self._cond:
+            while self._running:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                
+                due, _, job_id, gen = self._heap[0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                
+                heapq.heappop(self._heap)
+                job = self._jobs.get(job_id)
+                if job is None or job["gen"] != gen:
+                    continue  # 취소되었거나 재스케줄된 항목
+                
+                if self._execute_step_locked(job_id, job):
+                    if job["index"] < len(job["steps"]):
+                        self._schedule_locked(job_id, job, time.monotonic() + job["steps"][job["index"]][2])
+                    else:
+                        del self._jobs[job_id]
+                self._save_locked()
+    
+    def _execute_step_locked(self, job_id, job):
+        """현재 단계 실행. 실패하면 작업을 중단하고 False 반환"""
+        name, state, _ = job["steps"][job["index"]]
+        if not self._apply_locked(name, state):
+            print(f"⚠️ 시퀀스 중단: {job_id} ({name} 제어 실패)")
+            self._abort_locked(job_id)
+            return False
+        job["index"] += 1
+        return True
+    
+    def _apply_locked(self, name, state):
+        """인터록 확인 후 실제 액추에이터 제어"""
+        if state:
+            blocked = [req for req in self._interlocks.get(name, []) if not self.states.get(req)]
+            if blocked:
+                print(f"⛔ 인터록: {name} ON 거부 ({', '.join(blocked)} 꺼짐)")
+                return False
+        
+        try:
+            ok = self._setters[name](state)
+        except Exception as e:
+            print(f"❌ 액추에이터 제어 오류 {name}: {e}")
+            ok = False
+        
+        if ok is not False:
+            self.states[name] = state
+            return True
+        return False
+    
+    def _schedule_locked(self, job_id, job, due):
+        job["gen"] += 1
+        job["due"] = due
+        heapq.heappush(self._heap, (due, next(self._seq), job_id, job["gen"]))
+        self._cond.notify()
+    
+    def _abort_locked(self, job_id, skip=()):
+        """작업 제거 후 남은 OFF 단계만 즉시 실행 (skip에 포함된 액추에이터 제외)"""
+        job = self._jobs.pop(job_id)
+        for name, state, _ in job["steps"][job["index"]:]:
+            if not state and name not in skip:
+                self._apply_locked(name, state)
+    
+    def _cancel_conflicts_locked(self, names):
+        """같은 액추에이터를 다루는 기존 작업 취소 (마지막 명령 우선)"""
+        for job_id in [j for j, job in self._jobs.items()
+                       if names & {name for name, _, _ in job["steps"][job["index"]:]}]:
+            self._abort_locked(job_id, skip=names)
+    
+    def _save_locked(self):
+        if not self.persist_path:
+            return
+        
+        offset = time.time() - time.monotonic()
+        data = [
+            {
+                "job_id": job_id,
+                "steps": job["steps"][job["index"]:],
+                "due_at": job["due"] + offset
+            }
+            for job_id, job in self._jobs.items()
+        ]
+        tmp_path = f"{self.persist_path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.persist_path)
+        except OSError as e:
+            print(f"⚠️ 스케줄 저장 실패: {e}")
+    
+    def _restore_locked(self):
+        """저장된 스케줄 복원 (지난 시각의 단계는 바로 실행됨)"""
+        if not self.persist_path:
+            return
+        
+        try:
+            with open(self.persist_path, 'r') as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        
+        offset = time.time() - time.monotonic()
+        for item in data:
+            steps = [tuple(step) for step in item["steps"] if step[0] in self._setters]
+            if not steps:
+                continue
+            job = {"steps": steps, "index": 0, "gen": 0, "due": 0.0}
+            self._jobs[item["job_id"]] = job
+            self._schedule_locked(item["job_id"], job, item["due_at"] - offset)
+        
+        if self._jobs:
+            print(f"⏰ 스케줄 복원: {len(self._jobs)}개 작업")
+
+
+class RollingMedian:
+    """최근 window개 값의 중앙값 (두 개의 힙 + 지연 삭제)"""
+    
+    def __init__(self, window):
+        self.window = window
+        self.values = deque()
+        self._low = []      # 작은 절반 (최대 힙, 부호 반전 저장)
+        self._high = []     # 큰 절반 (최소 힙)
+        self._low_size = 0
+        self._high_size = 0
+        self._delayed = {}  # 값 -> 아직 힙에서 빼지 못한 삭제 횟수
+    
+    def add(self, value):
+        if not self._low or value <= -self._low[0]:
+            heapq.heappush(self._low, -value)
+            self._low_size += 1
+        else:
+            heapq.heappush(self._high, value)
+            self._high_size += 1
+        
+        self.values.append(value)
+        if len(self.values) > self.window:
+            self._remove(self.values.popleft())
+        self._rebalance()
+    
+    def median(self):
+        if not self.values:
+            return None
+        if self._low_size > self._high_size:
+            return -self._low[0]
+        return (-self._low[0] + self._high[0]) / 2
+    
+    def _remove(self, value):
+        self._delayed[value] = self._delayed.get(value, 0) + 1
+        if value <= -self._low[0]:
+            self._low_size -= 1
+            if value == -self._low[0]:
+                self._prune(self._low, -1)
+        else:
+            self._high_size -= 1
+            if self._high and value == self._high[0]:
+                self._prune(self._high, 1)
+    
+    def _rebalance(self):
+        if self._low_size > self._high_size + 1:
+            heapq.heappush(self._high, -heapq.heappop(self._low))
+            self._low_size -= 1
+            self._high_size += 1
+            self._prune(self._low, -1)
+        elif self._low_size < self._high_size:
+            heapq.heappush(self._low, -heapq.heappop(self._high))
+            self._high_size -= 1
+            self._low_size += 1
+            self._prune(self._high, 1)
+    
+    def _prune(self, heap, sign):
+        while heap:
+            value = sign * heap[0]
+            count = self._delayed.get(value)
+            if not count:
+                break
+            if count == 1:
+                del self._delayed[value]
+            else:
+                self._delayed[value] = count - 1
+            heapq.heappop(heap)
+
+
+class SensorStats:
+    """센서 키 하나의 증분 통계"""
+    
+    def __init__(self, window=15, alpha=0.1):
+        self.alpha = alpha
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.ewma = None
+        self.ewvar = 0.0
+        self.median = RollingMedian(window)
+        self.last = None
+        self.flat_run = 0
+        self.rejected = 0
+    
+    @property
+    def variance(self):
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+    
+    def update(self, value):
+        # Welford
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        
+        # EWMA
+        if self.ewma is None:
+            self.ewma = value
+        else:
+            diff = value - self.ewma
+            incr = self.alpha * diff
+            self.ewma += incr
+            self.ewvar = (1 - self.alpha) * (self.ewvar + diff * incr)
+    
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "mean": round(self.mean, 4),
+            "std": round(math.sqrt(self.variance), 4),
+            "ewma": round(self.ewma, 4) if self.ewma is not None else None,
+            "median": self.median.median(),
+            "flat_run": self.flat_run,
+            "rejected": self.rejected
+        }
+
+
+class SensorQualityMonitor:
+    def __init__(self, limits=None, window=15, alpha=0.1, warmup=10,
+                 spike_z=4.0, bad_z=10.0, drift_z=None, flatline_count=60, flat_epsilon=0.0):
+        """
+        Args:
+            limits: 센서 키 -> {"min": 값, "max": 값} (물리적 범위, 벗어나면 bad)
+            window: 이동 중앙값 창 크기
+            alpha: EWMA 가중치
+            warmup: 급변/드리프트 판정 전 최소 샘플 수
+            spike_z: 중앙값 대비 편차가 이 배수(EWMA 표준편차 기준)를 넘으면 suspect
+            bad_z: 이 배수를 넘으면 bad
+            drift_z: EWMA가 장기 평균에서 이 배수 이상 벗어나면 suspect (None이면 사용 안 함)
+            flatline_count: 같은 값이 이 횟수 이상 연속되면 suspect (고착 의심)
+            flat_epsilon: 같은 값으로 간주할 변화량
+        """
+        self.limits = limits or {}
+        self.window = window
+        self.alpha = alpha
+        self.warmup = warmup
+        self.spike_z = spike_z
+        self.bad_z = bad_z
+        self.drift_z = drift_z
+        self.flatline_count = flatline_count
+        self.flat_epsilon = flat_epsilon
+        self._stats = {}
+    
+    def check(self, key, value):
+        """새 값의 품질 판정 후 통계 갱신. "good" / "suspect" / "bad" 반환"""
+        if value is None or isinstance(value, bool) or not isinstance(value, (int, float)) or math.isnan(value):
+            return "bad"
+        
+        limit = self.limits.get(key, {})
+        if ("min" in limit and value < limit["min"]) or ("max" in limit and value > limit["max"]):
+            stats = self._stats.get(key)
+            if stats:
+                stats.rejected += 1
+            return "bad"
+        
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = SensorStats(self.window, self.alpha)
+        
+        quality = "good"
+        if stats.count >= self.warmup:
+            median = stats.median.median()
+            std = max(math.sqrt(stats.ewvar), 0.01 * abs(median), 1e-3)
+            z = abs(value - median) / std
+            if z > self.bad_z:
+                quality = "bad"
+            elif z > self.spike_z:
+                quality = "suspect"
+            
+            if quality == "good" and self.drift_z and stats.count > 1:
+                long_std = math.sqrt(stats.variance)
+                if long_std > 0 and abs(stats.ewma - stats.mean) > self.drift_z * long_std:
+                    quality = "suspect"
+        
+        # 고착 판정
+        if stats.last is not None and abs(value - stats.last) <= self.flat_epsilon:
+            stats.flat_run += 1
+        else:
+            stats.flat_run = 0
+        stats.last = value
+        if quality == "good" and self.flatline_count and stats.flat_run >= self.flatline_count:
+            quality = "suspect"
+        
+        # 중앙값은 항상 갱신 (실제 수준 변화에 적응), 평균/분산은 bad 값 제외
+        stats.median.add(value)
+        if quality == "bad":
+            stats.rejected += 1
+        else:
+            stats.update(value)
+        
+        return quality
+    
+    def stats(self, key=None):
+        """키별 통계 요약"""
+        if key is not None:
+            stats = self._stats.get(key)
+            return stats.to_dict() if stats else None
+        return {key: stats.to_dict() for key, stats in self._stats.items()}
+
+
+class Mqtt5Publisher:
+    """MQTT 5 발행: 토픽 별칭, 메시지 만료, 사용자 속성, 상관 데이터 (3.1.1이면 속성 없이 발행)"""
+    
+    SCHEMA_VERSION = "1"
+    
+    def __init__(self, client, mqtt5=False):
+        self.client = client
+        self.mqtt5 = mqtt5
+        self.alias_maximum = 0
+        self._aliases = {}  # 토픽 -> 별칭
+        self._lock = threading.Lock()
+    
+    def on_connect(self, properties=None):
+        """연결(재연결)마다 호출 - 별칭은 연결마다 초기화"""
+        with self._lock:
+            self._aliases.clear()
+            self.alias_maximum = getattr(properties, "TopicAliasMaximum", 0) if properties else 0
+    
+    def publish(self, topic, payload, qos=1, expiry=None, user_properties=None, correlation_data=None):
+        if not self.mqtt5:
+            return self.client.publish(topic, payload, qos=qos)
+        
+        properties = Properties(PacketTypes.PUBLISH)
+        if expiry:
+            properties.MessageExpiryInterval = int(expiry)
+        for key, value in (user_properties or {}).items():
+            properties.UserProperty = (key, str(value))
+        if correlation_data:
+            properties.CorrelationData = correlation_data
+        
+        # 두 번째 메시지부터 토픽 문자열 대신 2바이트 별칭 (브로커가 허용한 개수 이내)
+        # QoS 1 이상은 끊기면 paho가 새 연결(별칭 없음)에 그대로 재전송하므로, CONNACK 전과 함께 별칭 없이 발행
+        with self._lock:
+            if qos or not self.client.is_connected():
+                return self.client.publish(topic, payload, qos=qos, properties=properties)
+            alias = self._aliases.get(topic)
+            if alias:
+                properties.TopicAlias = alias
+                topic = ""
+            elif len(self._aliases) < self.alias_maximum:
+                alias = len(self._aliases) + 1
+                self._aliases[topic] = alias
+                properties.TopicAlias = alias
+            return self.client.publish(topic, payload, qos=qos, properties=properties)
+
+
+class StateShadow:
+    """버전이 붙은 로컬 상태 섀도: 연결 시 전체 상태, 이후에는 변경분만 JSON Merge Patch(RFC 7386)로 보고"""
+    
+    def __init__(self):
+        self.version = 0
+        self.reported = None  # 마지막으로 보고한 상태
+        self.lock = threading.Lock()
+    
+    def snapshot(self, state):
+        """전체 상태 메시지 (연결 시 / get_state 요청 시)"""
+        with self.lock:
+            return self._snapshot_locked(state)
+    
+    def delta(self, state):
+        """마지막 보고 이후 변경분 메시지. 바뀐 것이 없으면 None"""
+        with self.lock:
+            if self.reported is None:
+                return self._snapshot_locked(state)
+            patch = self.merge_patch(self.reported, state)
+            if not patch:
+                return None
+            # 전송에 실패해도 버전은 올림 → 서버가 base_version 불일치로 누락을 감지하고 get_state 요청
+            self.version += 1
+            self.reported = copy.deepcopy(state)
+            return {"version": self.version, "base_version": self.version - 1, "patch": patch}
+    
+    def _snapshot_locked(self, state):
+        self.version += 1
+        self.reported = copy.deepcopy(state)
+        return {"version": self.version, "full": True, "state": state}
+    
+    @staticmethod
+    def merge_patch(old, new):
+        """old에 적용하면 new가 되는 merge patch (삭제된 키는 None이므로 상태 값으로 None은 쓰지 않음)"""
+        patch = {key: None for key in old.keys() - new.keys()}
+        for key, value in new.items():
+            previous = old.get(key)
+            if isinstance(value, dict) and isinstance(previous, dict):
+                nested = StateShadow.merge_patch(previous, value)
+                if nested:
+                    patch[key] = nested
+            elif key not in old or previous != value:
+                patch[key] = value
+        return patch
+
+
+class MonotonicClock:
+    """측정 시각: 수집 시점에는 monotonic_ns만 기록하고, 주기적으로 맞춘 오프셋으로 UTC epoch ms 변환"""
+    
+    def __init__(self, resync_interval: float = 60.0):
+        self.resync_interval_ns = int(resync_interval * 1e9)
+        self.offset_ns = 0
+        self.synced_ns = 0
+        self.resync()
+    
+    def resync(self):
+        """monotonic → UTC 오프셋 재측정 (NTP 보정 반영)"""
+        before = time.monotonic_ns()
+        wall = time.time_ns()
+        after = time.monotonic_ns()
+        self.offset_ns = wall - (before + after) // 2
+        self.synced_ns = after
+    
+    def to_epoch_ms(self, mono_ns: int) -> int:
+        if time.monotonic_ns() - self.synced_ns > self.resync_interval_ns:
+            self.resync()
+        return (mono_ns + self.offset_ns) // 1_000_000
+    
+    def now_ms(self) -> int:
+        return self.to_epoch_ms(time.monotonic_ns())
+    
+    @staticmethod
+    def format(ts_ms: int) -> str:
+        """epoch ms -> ISO 8601 UTC 문자열 (전송할 때만 호출)"""
+        seconds, ms = divmod(int(ts_ms), 1000)
+        return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(seconds)) + f".{ms:03d}Z"
+
+
+DEFAULT_PUBLISH_LANES = {
+    "control": {"strict": True, "max_queue": 1000},
+    "telemetry": {"weight": 4, "max_queue": 5000},
+    "state": {"weight": 2, "max_queue": 100},
+}
+
+
+class _Item:
+    __slots__ = ("send", "on_done", "ack", "queued_at", "finish")
+    
+    def __init__(self, send, on_done, ack, queued_at, finish):
+        self.send = send
+        self.on_done = on_done
+        self.ack = ack
+        self.queued_at = queued_at
+        self.finish = finish
+
+
+class _Lane:
+    __slots__ = ("name", "strict", "weight", "rate", "burst", "max_queue", "queue", "tokens", "refilled_at",
+                 "finish", "sent", "failed", "dropped", "wait_total_ms", "wait_max_ms")
+    
+    def __init__(self, name, strict=False, weight=1, rate=None, burst=None, max_queue=1000):
+        self.name = name
+        self.strict = strict
+        self.weight = weight
+        self.rate = rate
+        self.burst = burst or max(1.0, rate or 0)
+        self.max_queue = max_queue
+        self.queue = deque()
+        self.tokens = self.burst
+        self.refilled_at = time.monotonic()
+        self.finish = 0.0  # 마지막으로 넣은 메시지의 가상 종료 시각
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+    
+    def delay(self, now):
+        """다음 메시지를 보낼 수 있을 때까지 남은 시간 (초, 속도 제한)"""
+        if not self.rate:
+            return 0.0
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rate)
+        self.refilled_at = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+    
+    def take(self, now):
+        item = self.queue.popleft()
+        if self.rate:
+            self.tokens -= 1
+        wait_ms = (now - item.queued_at) * 1000
+        self.wait_total_ms += wait_ms
+        self.wait_max_ms = max(self.wait_max_ms, wait_ms)
+        return item
+    
+    def stats(self):
+        done = self.sent + self.failed
+        return {
+            "queued": len(self.queue),
+            "sent": self.sent,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "wait_ms_avg": round(self.wait_total_ms / done, 1) if done else None,
+            "wait_ms_max": round(self.wait_max_ms, 1),
+            "priority": "strict" if self.strict else f"weight {self.weight}",
+            "rate": self.rate
+        }
+
+
+class LaneScheduler:
+    """
+    발행 우선순위 레인 (백로그/대량 텔레메트리 중에도 명령 ACK가 먼저 나가도록)
+    - strict 레인(control): 항상 먼저 전송 / 나머지: 가중 공정 큐잉 (크기/가중치로 가상 종료 시각)
+    - 레인별 속도 제한(초당 메시지 수)과 대기열 길이 제한, ACK(PUBACK)를 기다리는 데이터 메시지 수 제한
+    """
+    
+    def __init__(self, lanes=None, window=20, ack_timeout=30.0):
+        """
+        Args:
+            lanes: {레인 이름: {strict, weight, rate, burst, max_queue}} (기본 DEFAULT_PUBLISH_LANES)
+            window: ACK를 기다리는 데이터 메시지 최대 수 (ack=True로 넣은 메시지만 셈)
+            ack_timeout: 이 시간(초) 안에 acked()가 오지 않으면 창에서 뺌 (세션이 끊겨 PUBACK이 오지 않는 경우)
+        """
+        self.lanes = {name: _Lane(name, **options) for name, options in (lanes or DEFAULT_PUBLISH_LANES).items()}
+        self.window = window
+        self.ack_timeout = ack_timeout
+        
+        self._vtime = 0.0          # 가상 시각 (마지막으로 보낸 데이터 메시지의 가상 종료 시각)
+        self._in_flight = {}       # send()가 돌려준 키 -> 보낸 시각 (monotonic)
+        self._early_acks = set()   # send()가 끝나기 전에 도착한 ACK (ack 메시지를 보내는 중일 때만 보관)
+        self._sending_ack = False
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+    
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="outbound-lanes", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """전송 스레드 종료. 아직 대기 중인 메시지는 버리고 on_done(None) 호출 (call()로 기다리는 쪽이 풀리도록)"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=5)
+        with self._cond:
+            pending = []
+            for lane in self.lanes.values():
+                pending.extend(lane.queue)
+                lane.dropped += len(lane.queue)
+                lane.queue.clear()
+        for item in pending:
+            self._done(item, None)
+    
+    def submit(self, lane, send, size=1, on_done=None, ack=False):
+        """
+        발행 예약 (send는 전송 스레드에서 호출)
+        
+        Args:
+            lane: 레인 이름
+            send: 인자 없는 전송 함수. 실패하면 None 또는 False 반환
+            size: 메시지 크기 (바이트 등, 가중 공정 큐잉에 사용)
+            on_done: on_done(send 결과) - 전송 후 호출 (버려지면 None으로 호출)
+            ack: True면 send()가 돌려준 값을 acked()로 받을 때까지 전송 창을 차지
+        """
+        dropped = None
+        with self._cond:
+            target = self.lanes.get(lane)
+            if target is None:
+                raise ValueError(f"알 수 없는 레인: {lane}")
+            finish = 0.0
+            if not target.strict:
+                finish = target.finish = max(self._vtime, target.finish) + size / target.weight
+            if len(target.queue) >= target.max_queue:
+                dropped = target.queue.popleft()
+                target.dropped += 1
+            target.queue.append(_Item(send, on_done, ack, time.monotonic(), finish))
+            self._cond.notify()
+        if dropped is not None:
+            print(f"⚠️ {lane} 레인 대기열 가득 참, 가장 오래된 메시지 버림")
+            self._done(dropped, None)
+    
+    def call(self, lane, send, size=1, ack=False, timeout=None):
+        """submit 후 전송될 때까지 기다려 send() 결과 반환 (시간 초과/버려지면 None)"""
+        done = threading.Event()
+        box = [None]
+        
+        def on_done(result):
+            box[0] = result
+            done.set()
+        
+        self.submit(lane, send, size, on_done, ack)
+        done.wait(timeout)
+        return box[0]
+    
+    def acked(self, key):
+        """전송 완료 확인 (MQTT on_publish에서 mid로 호출)"""
+        with self._cond:
+            if self._in_flight.pop(key, None) is not None:
+                self._cond.notify()
+            elif self._sending_ack:
+                self._early_acks.add(key)
+    
+    def stats(self):
+        with self._cond:
+            return {
+                "in_flight": len(self._in_flight),
+                "window": self.window,
+                "lanes": {name: lane.stats() for name, lane in self.lanes.items()}
+            }
+    
+    def _next_locked(self, now):
+        """(레인, 메시지, None). 보낼 것이 없으면 (None, None, 다시 확인할 때까지 대기 초 또는 None)"""
+        wait = None
+        for lane in self.lanes.values():
+            if lane.strict and lane.queue:
+                delay = lane.delay(now)
+                if not delay:
+                    return lane, lane.take(now), None
+                wait = delay if wait is None else min(wait, delay)
+        
+        # 전송 창이 차면 데이터 레인은 대기 (오래된 항목은 ACK를 못 받은 것으로 보고 정리)
+        if len(self._in_flight) >= self.window:
+            for key, sent_at in list(self._in_flight.items()):
+                if now - sent_at > self.ack_timeout:
+                    del self._in_flight[key]
+            if len(self._in_flight) >= self.window:
+                oldest = min(self._in_flight.values())
+                delay = max(0.01, self.ack_timeout - (now - oldest))
+                return None, None, delay if wait is None else min(wait, delay)
+        
+        best = None
+        for lane in self.lanes.values():
+            if lane.strict or not lane.queue:
+                continue
+            delay = lane.delay(now)
+            if delay:
+                wait = delay if wait is None else min(wait, delay)
+                continue
+            if best is None or lane.queue[0].finish < best.queue[0].finish:
+                best = lane
+        if best is None:
+            return None, None, wait
+        item = best.take(now)
+        self._vtime = item.finish
+        return best, item, None
+    
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if not self._running:
+                        return
+                    lane, item, wait = self._next_locked(time.monotonic())
+                    if lane is not None:
+                        break
+                    self._cond.wait(wait)
+                if item.ack:
+                    self._sending_ack = True
+            
+            result = None
+            try:
+                result = item.send()
+            except Exception as e:
+                print(f"❌ {lane.name} 레인 전송 오류: {e}")
+            
+            ok = result is not None and result is not False
+            with self._cond:
+                if ok:
+                    lane.sent += 1
+                else:
+                    lane.failed += 1
+                if item.ack:
+                    self._sending_ack = False
+                    if ok and result is not True and result not in self._early_acks:
+                        self._in_flight[result] = time.monotonic()
+                    self._early_acks.clear()
+            self._done(item, result)
+    
+    @staticmethod
+    def _done(item, result):
+        if item.on_done is None:
+            return
+        try:
+            item.on_done(result)
+        except Exception as e:
+            print(f"❌ 전송 완료 콜백 오류: {e}")
+
+
 class SmartFarmDevice:
     def __init__(self, config: Dict[str, Any]):
         """
@@ -28,12 +968,56 @@ class SmartFarmDevice:
                 - password: MQTT 비밀번호
                 - device_type: 디바이스 타입
                 - firmware_version: 펌웨어 버전
+                - command_cache_file: 중복 명령 캐시 저장 파일 (선택)
+                - schedule_file: 액추에이터 스케줄 저장 파일 (선택)
+                - interlocks: 인터록 설정 (선택, 예: {'pump': ['valve']})
+                - sensor_limits: 센서별 물리적 범위 (선택, 예: {'ph': {'min': 0, 'max': 14}})
+                - suppress_bad_readings: True면 품질 bad 값은 전송하지 않음 (선택)
+                - sampling_interval: 텔레메트리 전송 간격(초, 기본 30, update_config로 변경 가능)
+                - state_interval: 상태 변경 확인 간격(초, 기본 300, 바뀐 것이 있을 때만 전송, update_config로 변경 가능)
+                - mqtt5: True면 MQTT 5로 연결 (브로커가 지원할 때만, 기본 False)
+                - message_expiry: 텔레메트리 메시지 만료 시간(초, MQTT 5, 선택)
+                - compression_threshold: 이 크기(바이트) 이상인 메시지는 deflate 압축 (선택, 기본 0 = 압축 안 함)
+                - publish_lanes: 발행 레인 설정 (선택, 기본 DEFAULT_PUBLISH_LANES - 명령 ACK는 control 레인으로 항상 먼저,
+                  telemetry/state는 가중치 4:2, 레인별 rate(초당 메시지 수)/max_queue 지정 가능)
+                - publish_window: PUBACK을 기다리는 텔레메트리/상태 메시지 최대 수 (선택, 기본 20)
         """
         self.config = config
+        self.config_cond = threading.Condition()  # 설정 변경 시 주기 작업 재스케줄
         self.client = None
+        self.publisher = None
         self.connected = False
         self.batch_seq = 0
+        self.command_responses = {}  # command_id -> (응답 토픽, 상관 데이터), MQTT 5
         self.pump_state = False
+        self.valve_open = True
+        self.led_state = False
+        self.clock = MonotonicClock()
+        self.pump_changed_at = None  # epoch ms
+        self.started_at = self.clock.now_ms()
+        self.sensor_acquired_ms = None  # 마지막 센서 읽기 시각 (epoch ms)
+        
+        # 상태 섀도 (바뀐 상태만 전송, 유휴 디바이스는 상태 트래픽이 거의 없음)
+        self.shadow = StateShadow()
+        self.battery_level = random.randint(80, 100)   # 시뮬레이션 (실제로는 하드웨어에서 읽기)
+        self.signal_strength = random.randint(-70, -30)
+        
+        # 액추에이터 스케줄러 (펌프 동작 시간/시퀀스를 디바이스에서 직접 처리)
+        interlocks = config.get('interlocks', {})
+        self.scheduler = ActuatorScheduler(persist_path=config.get('schedule_file'))
+        self.scheduler.register('pump', self.set_pump, requires=interlocks.get('pump'))
+        self.scheduler.register('valve', self.set_valve, requires=interlocks.get('valve'), initial_state=True)
+        self.scheduler.register('led', self.set_led, requires=interlocks.get('led'))
+        
+        # 중복 명령 방지 캐시 (QoS1 재전송 대비)
+        self.command_cache = CommandCache(persist_path=config.get('command_cache_file'))
+        
+        # 센서 값 품질 판정 (고착/급변/범위 초과 → quality 필드)
+        self.quality_monitor = SensorQualityMonitor(limits=config.get('sensor_limits'))
+        
+        # 발행 레인 (명령 ACK가 밀린 텔레메트리/상태 문서 뒤에서 기다리지 않도록)
+        self.lanes = LaneScheduler(config.get('publish_lanes'), window=config.get('publish_window', 20))
+        self.lanes.start()
         
         # 센서 시뮬레이션 데이터
         self.sensor_data = {
@@ -50,7 +1034,12 @@ class SmartFarmDevice:
         """MQTT 클라이언트 설정"""
         client_id = f"device-{self.config['device_id']}-{int(time.time())}"
         
-        self.client = mqtt.Client(client_id=client_id, clean_session=False)
+        if self.config.get('mqtt5', False):
+            # 영구 세션은 connect()의 clean_start=False + 세션 만료 시간으로 유지
+            self.client = mqtt.Client(client_id=client_id, protocol=mqtt.MQTTv5)
+        else:
+            self.client = mqtt.Client(client_id=client_id, clean_session=False)
+        self.publisher = Mqtt5Publisher(self.client, self.config.get('mqtt5', False))
         self.client.username_pw_set(
             self.config['username'], 
             self.config['password']
@@ -64,26 +1053,30 @@ class SmartFarmDevice:
         self.client.on_connect = self.on_connect
         self.client.on_message = self.on_message
         self.client.on_disconnect = self.on_disconnect
+        self.client.on_publish = self.on_publish
     
-    def on_connect(self, client, userdata, flags, rc):
-        """MQTT 연결 콜백"""
+    def on_connect(self, client, userdata, flags, rc, properties=None):
+        """MQTT 연결 콜백 (MQTT 5면 CONNACK 속성도 전달됨)"""
         if rc == 0:
             print(f"✅ MQTT 연결 성공: {self.config['device_id']}")
             self.connected = True
+            self.publisher.on_connect(properties)
             
             # 명령 토픽 구독
             command_topic = self.get_command_topic()
             client.subscribe(command_topic, qos=1)
             print(f"📡 명령 토픽 구독: {command_topic}")
             
-            # 디바이스 등록
+            # 디바이스 등록 + 전체 상태 (이후에는 변경분만 전송)
             self.send_registry()
+            self.send_state(full=True)
             
         else:
             print(f"❌ MQTT 연결 실패: {rc}")
     
     def on_message(self, client, userdata, msg):
         """MQTT 메시지 수신 콜백"""
+        command_id = None
         try:
             payload = json.loads(msg.payload.decode('utf-8'))
             print(f"📨 메시지 수신 [{msg.topic}]: {payload}")
@@ -92,6 +1085,26 @@ class SmartFarmDevice:
             command_id = payload.get('command_id')
             command_payload = payload.get('payload', {})
             
+            # MQTT 5: ACK를 요청자가 지정한 응답 토픽으로, 상관 데이터를 붙여 전송 (서버가 페이로드 파싱 없이 매칭)
+            properties = getattr(msg, 'properties', None)
+            response_topic = getattr(properties, 'ResponseTopic', None)
+            correlation_data = getattr(properties, 'CorrelationData', None)
+            
+            # 이미 실행한 명령이면 액추에이터를 다시 움직이지 않고 캐시된 ACK만 재전송
+            cached_ack = self.command_cache.get(command_id)
+            if cached_ack is not None:
+                print(f"♻️ 중복 명령 무시: {command_id}")
+                self.publish_message(response_topic or self.get_ack_topic(), cached_ack,
+                                     correlation_data=correlation_data, lane='control')
+                return
+            # 실행 중인 명령의 QoS1 재전송은 다시 실행하지 않음 (실행이 끝나면 보내는 ACK가 응답)
+            if not self.command_cache.begin(command_id):
+                print(f"♻️ 실행 중인 명령 무시: {command_id}")
+                return
+            
+            if response_topic:
+                self.command_responses[command_id] = (response_topic, correlation_data)
+            
             # 명령 처리
             if command == 'pump_on':
                 self.handle_pump_on(command_id, command_payload)
@@ -105,8 +1118,14 @@ class SmartFarmDevice:
                 self.handle_led_on(command_id, command_payload)
             elif command == 'led_off':
                 self.handle_led_off(command_id, command_payload)
+            elif command == 'irrigation_sequence':
+                self.handle_irrigation_sequence(command_id, command_payload)
             elif command == 'update_config':
                 self.handle_config_update(command_id, command_payload)
+            elif command == 'get_state':
+                # 서버가 버전 누락을 감지했거나 전체 상태가 필요할 때
+                self.send_state(full=True)
+                self.send_command_ack(command_id, 'success', f'State snapshot v{self.shadow.version}')
             else:
                 print(f"⚠️ 알 수 없는 명령: {command}")
                 self.send_command_ack(command_id, 'error', f'Unknown command: {command}')
@@ -115,12 +1134,18 @@ class SmartFarmDevice:
             print(f"❌ JSON 파싱 오류: {e}")
         except Exception as e:
             print(f"❌ 메시지 처리 오류: {e}")
+            # ACK 없이 실패한 명령은 재전송되면 다시 실행
+            self.command_cache.discard(command_id)
     
-    def on_disconnect(self, client, userdata, rc):
+    def on_disconnect(self, client, userdata, rc, properties=None):
         """MQTT 연결 해제 콜백"""
         print(f"🔌 MQTT 연결 해제: {rc}")
         self.connected = False
     
+    def on_publish(self, client, userdata, mid):
+        """PUBACK 수신 콜백 (발행 레인의 전송 창 반환)"""
+        self.lanes.acked(mid)
+    
     def connect(self):
         """MQTT 브로커 연결"""
         try:
@@ -128,14 +1153,26 @@ class SmartFarmDevice:
             self.client.connect(
                 self.config['broker_url'], 
                 self.config['broker_port'], 
-                60
+                60,
+                **self.connect_properties()
             )
             self.client.loop_start()
         except Exception as e:
             print(f"❌ MQTT 연결 오류: {e}")
     
+    def connect_properties(self):
+        """MQTT 5 연결 인자 (clean_start=False + 세션 만료 시간)"""
+        if not self.config.get('mqtt5', False):
+            return {}
+        properties = Properties(PacketTypes.CONNECT)
+        properties.SessionExpiryInterval = self.config.get('session_expiry', 86400)
+        return {'clean_start': False, 'properties': properties}
+    
     def disconnect(self):
         """MQTT 브로커 연결 해제"""
+        self.command_cache.flush()
+        self.scheduler.stop()
+        self.lanes.stop()
         if self.connected:
             self.client.loop_stop()
             self.client.disconnect()
@@ -162,8 +1199,8 @@ class SmartFarmDevice:
         return f"farms/{self.config['farm_id']}/devices/{self.config['device_id']}/command/ack"
     
     def get_current_timestamp(self):
-        """현재 시간 반환 (ISO 8601 형식)"""
-        return datetime.now(timezone.utc).isoformat()
+        """현재 시간 반환 (ISO 8601 UTC 형식)"""
+        return self.clock.format(self.clock.now_ms())
     
     def send_registry(self):
         """디바이스 등록 정보 전송"""
@@ -185,19 +1222,17 @@ class SmartFarmDevice:
             "timestamp": self.get_current_timestamp()
         }
         
-        self.publish_message(self.get_registry_topic(), registry_data)
+        self.publish_message(self.get_registry_topic(), registry_data, lane='state')
         print("📋 디바이스 등록 전송")
     
-    def send_state(self):
-        """디바이스 상태 전송"""
-        state_data = {
-            "device_id": self.config['device_id'],
+    def get_state(self) -> Dict[str, Any]:
+        """현재 상태 문서 (섀도와 비교하므로 매번 바뀌는 값은 넣지 않음)"""
+        return {
             "status": {
                 "online": True,
-                "battery_level": random.randint(80, 100),
-                "signal_strength": random.randint(-70, -30),
-                "uptime": int(time.time()),
-                "last_restart": self.get_current_timestamp()
+                "battery_level": self.battery_level,
+                "signal_strength": self.signal_strength,
+                "last_restart": self.clock.format(self.started_at)
             },
             "sensors": {
                 "temperature": {"connected": True, "calibrated": True},
@@ -209,112 +1244,134 @@ class SmartFarmDevice:
             "actuators": {
                 "pump_1": {
                     "status": "on" if self.pump_state else "off",
-                    "last_command": self.get_current_timestamp()
+                    "last_command": self.clock.format(self.pump_changed_at or self.started_at)
                 },
                 "valve_1": {
-                    "status": "open",
-                    "position": random.randint(0, 100)
+                    "status": "open" if self.valve_open else "closed",
+                    "position": 75 if self.valve_open else 0
                 },
                 "led_1": {
-                    "status": "off",
+                    "status": "on" if self.led_state else "off",
                     "brightness": 0
                 }
-            },
-            "timestamp": self.get_current_timestamp()
+            }
         }
+    
+    def send_state(self, full: bool = False, lane: str = 'state'):
+        """디바이스 상태 전송 (full=False면 마지막 보고 이후 바뀐 부분만, 없으면 전송 안 함, lane: 발행 레인)"""
+        state = self.get_state()
+        state_data = self.shadow.snapshot(state) if full else self.shadow.delta(state)
+        if state_data is None:
+            return
         
-        self.publish_message(self.get_state_topic(), state_data)
-        print("📊 디바이스 상태 전송")
+        state_data["device_id"] = self.config['device_id']
+        state_data["timestamp"] = self.get_current_timestamp()
+        self.publish_message(self.get_state_topic(), state_data, lane=lane)
+        if state_data.get("full"):
+            print(f"📊 디바이스 상태 전송 (전체, v{state_data['version']})")
+        else:
+            print(f"📊 디바이스 상태 변경분 전송 (v{state_data['version']}): {state_data['patch']}")
     
     def send_telemetry(self):
         """센서 데이터 전송"""
         # 센서 데이터 시뮬레이션 (실제로는 하드웨어에서 읽기)
         self.simulate_sensor_data()
         
+        units = {
+            'temperature': 'celsius',
+            'humidity': 'percent',
+            'ec': 'ms_cm',
+            'ph': 'ph',
+            'water_level': 'percent'
+        }
+        
+        # 같은 주기에 읽은 값은 측정 시각이 같으므로 문자열도 한 번만 만듦
+        ts = self.clock.format(self.sensor_acquired_ms)
+        readings = []
+        for key, unit in units.items():
+            value = self.sensor_data[key]
+            quality = self.quality_monitor.check(key, value)
+            if quality != "good":
+                print(f"⚠️ 센서 품질 {quality}: {key}={value}")
+            if quality == "bad" and self.config.get('suppress_bad_readings', False):
+                continue
+            
+            readings.append({
+                "key": key,
+                "tier": 1,
+                "unit": unit,
+                "value": value,
+                "ts": ts,
+                "quality": quality
+            })
+        
         telemetry_data = {
             "device_id": self.config['device_id'],
             "batch_seq": self.batch_seq,
-            "window_ms": 30000,
-            "readings": [
-                {
-                    "key": "temperature",
-                    "tier": 1,
-                    "unit": "celsius",
-                    "value": self.sensor_data['temperature'],
-                    "ts": self.get_current_timestamp(),
-                    "quality": "good"
-                },
-                {
-                    "key": "humidity",
-                    "tier": 1,
-                    "unit": "percent",
-                    "value": self.sensor_data['humidity'],
-                    "ts": self.get_current_timestamp(),
-                    "quality": "good"
-                },
-                {
-                    "key": "ec",
-                    "tier": 1,
-                    "unit": "ms_cm",
-                    "value": self.sensor_data['ec'],
-                    "ts": self.get_current_timestamp(),
-                    "quality": "good"
-                },
-                {
-                    "key": "ph",
-                    "tier": 1,
-                    "unit": "ph",
-                    "value": self.sensor_data['ph'],
-                    "ts": self.get_current_timestamp(),
-                    "quality": "good"
-                },
-                {
-                    "key": "water_level",
-                    "tier": 1,
-                    "unit": "percent",
-                    "value": self.sensor_data['water_level'],
-                    "ts": self.get_current_timestamp(),
-                    "quality": "good"
-                }
-            ],
+            "window_ms": int(self.config.get('sampling_interval', 30) * 1000),
+            "readings": readings,
             "timestamp": self.get_current_timestamp()
         }
         
+        user_properties = {"schema": Mqtt5Publisher.SCHEMA_VERSION, "batch_seq": self.batch_seq}
         self.batch_seq += 1
-        self.publish_message(self.get_telemetry_topic(), telemetry_data)
+        self.publish_message(
+            self.get_telemetry_topic(), telemetry_data,
+            user_properties=user_properties,
+            expiry=self.config.get('message_expiry')
+        )
         print(f"📡 센서 데이터 전송: {len(telemetry_data['readings'])}개 읽기값")
     
     def send_command_ack(self, command_id: str, status: str, detail: str):
-        """명령 확인 응답 전송"""
+        """명령 확인 응답 전송 (명령으로 바뀐 상태는 변경분으로 먼저 보내고 ACK에는 버전만 포함)"""
+        # 변경분도 control 레인으로 보내 ACK보다 늦게 도착하지 않도록 함
+        self.send_state(lane='control')
         ack_data = {
             "command_id": command_id,
             "status": status,
             "detail": detail,
-            "state": {
-                "pump_1": {
-                    "status": "on" if self.pump_state else "off",
-                    "flow_rate": 2.5 if self.pump_state else 0.0
-                },
-                "valve_1": {
-                    "status": "open",
-                    "position": 75
-                }
-            },
+            "state_version": self.shadow.version,
             "timestamp": self.get_current_timestamp()
         }
         
-        self.publish_message(self.get_ack_topic(), ack_data)
+        self.command_cache.put(command_id, ack_data)
+        response_topic, correlation_data = self.command_responses.pop(command_id, (None, None))
+        self.publish_message(response_topic or self.get_ack_topic(), ack_data,
+                             correlation_data=correlation_data, lane='control')
         print(f"✅ 명령 ACK 전송: {status} - {detail}")
     
-    def publish_message(self, topic: str, data: Dict[str, Any]):
-        """메시지 발행"""
+    def publish_message(self, topic: str, data: Dict[str, Any], user_properties: Optional[Dict[str, Any]] = None,
+                        correlation_data: Optional[bytes] = None, expiry: Optional[int] = None,
+                        lane: str = 'telemetry'):
+        """
+        메시지 발행 (사용자 속성/상관 데이터/만료는 MQTT 5에서만 전송)
+        lane: 발행 레인 - control(명령 ACK 등, 항상 먼저) / telemetry / state (가중치에 따라 번갈아)
+        """
         if self.connected:
-            message = json.dumps(data, ensure_ascii=False)
-            result = self.client.publish(topic, message, qos=1)
-            if result.rc == mqtt.MQTT_ERR_SUCCESS:
+            message = json.dumps(data, ensure_ascii=False).encode('utf-8')
+            
+            # 큰 메시지(상태 문서 등)는 압축 - 토픽 접미사 /deflate로 표시
+            # (MQTT 5 사용자 속성은 3.1.1로 접속한 Bridge에 전달되지 않으므로 프로토콜과 관계없이 접미사 사용)
+            threshold = self.config.get('compression_threshold', 0)
+            if threshold and len(message) >= threshold:
+                compressed = zlib.compress(message)
+                if len(compressed) < len(message):
+                    message = compressed
+                    topic = f"{topic}/deflate"
+            
+            def send():
+                result = self.publisher.publish(
+                    topic, message, qos=1, expiry=expiry,
+                    user_properties=user_properties, correlation_data=correlation_data
+                )
+                if result.rc != mqtt.MQTT_ERR_SUCCESS:
+                    print(f"❌ 메시지 발행 실패: {topic}, rc={result.rc}")
+                    return None
                 print(f"📤 메시지 발행 성공: {topic}")
-            else:
-                print(f"❌ 메시지 발행 실패: {topic}, rc={result.rc}")
+                return result.mid
+            
+            # control 외 레인은 PUBACK까지 전송 창을 차지 (paho 내부 대기열에 데이터 메시지가 쌓이지 않도록)
+            self.lanes.submit(lane, send, size=len(message), ack=lane != 'control')
         else:
             print(f"⚠️ MQTT 연결되지 않음, 메시지 발행 실패: {topic}")
     
@@ -333,67 +1390,169 @@ class SmartFarmDevice:
         self.sensor_data['ec'] = max(0.5, min(3.0, self.sensor_data['ec']))
         self.sensor_data['ph'] = max(5.0, min(8.0, self.sensor_data['ph']))
         self.sensor_data['water_level'] = max(0.0, min(100.0, self.sensor_data['water_level']))
+        
+        # 측정 시각은 읽은 직후에 기록 (전송 시각이 아님)
+        self.sensor_acquired_ms = self.clock.to_epoch_ms(time.monotonic_ns())
+    
+    # 액추에이터 제어 (실제로는 GPIO/릴레이 제어)
+    def set_pump(self, state: bool) -> bool:
+        """펌프 상태 변경"""
+        if state != self.pump_state:
+            self.pump_changed_at = self.clock.now_ms()
+        self.pump_state = state
+        print(f"💧 펌프 {'켜짐' if state else '꺼짐'}")
+        return True
+    
+    def set_valve(self, state: bool) -> bool:
+        """밸브 상태 변경"""
+        self.valve_open = state
+        print(f"🚰 밸브 {'열림' if state else '닫힘'}")
+        return True
+    
+    def set_led(self, state: bool) -> bool:
+        """LED 상태 변경"""
+        self.led_state = state
+        print(f"💡 LED {'켜짐' if state else '꺼짐'}")
+        return True
     
     # 명령 처리 함수들
     def handle_pump_on(self, command_id: str, payload: Dict[str, Any]):
-        """펌프 켜기 처리"""
+        """펌프 켜기 처리 (duration 후 디바이스에서 자동으로 끔)"""
         duration = payload.get('duration', 300)
         flow_rate = payload.get('flow_rate', 2.5)
         
-        self.pump_state = True
-        detail = f"Pump turned on for {duration} seconds, flow rate: {flow_rate} L/min"
+        if self.scheduler.pulse('pump', duration, job_id=command_id) is None:
+            self.send_command_ack(command_id, "error", "Pump blocked by interlock")
+            return
         
+        detail = f"Pump turned on for {duration} seconds, flow rate: {flow_rate} L/min"
         print(f"💧 펌프 켜짐 - {duration}초, 유량: {flow_rate}L/min")
         self.send_command_ack(command_id, "success", detail)
     
     def handle_pump_off(self, command_id: str, payload: Dict[str, Any]):
-        """펌프 끄기 처리"""
-        self.pump_state = False
-        print("💧 펌프 꺼짐")
+        """펌프 끄기 처리 (대기 중인 펌프 스케줄도 취소)"""
+        self.scheduler.set('pump', False)
         self.send_command_ack(command_id, "success", "Pump turned off")
     
     def handle_valve_open(self, command_id: str, payload: Dict[str, Any]):
         """밸브 열기 처리"""
         position = payload.get('position', 100)
+        if not self.scheduler.set('valve', True):
+            self.send_command_ack(command_id, "error", "Valve blocked by interlock")
+            return
         print(f"🚰 밸브 열림 - 위치: {position}%")
         self.send_command_ack(command_id, "success", f"Valve opened to {position}%")
     
     def handle_valve_close(self, command_id: str, payload: Dict[str, Any]):
         """밸브 닫기 처리"""
-        print("🚰 밸브 닫힘")
+        self.scheduler.set('valve', False)
         self.send_command_ack(command_id, "success", "Valve closed")
     
     def handle_led_on(self, command_id: str, payload: Dict[str, Any]):
         """LED 켜기 처리"""
         brightness = payload.get('brightness', 100)
         color = payload.get('color', 'white')
+        if not self.scheduler.set('led', True):
+            self.send_command_ack(command_id, "error", "LED blocked by interlock")
+            return
         print(f"💡 LED 켜짐 - 밝기: {brightness}%, 색상: {color}")
         self.send_command_ack(command_id, "success", f"LED turned on, brightness: {brightness}%, color: {color}")
     
     def handle_led_off(self, command_id: str, payload: Dict[str, Any]):
         """LED 끄기 처리"""
-        print("💡 LED 꺼짐")
+        self.scheduler.set('led', False)
         self.send_command_ack(command_id, "success", "LED turned off")
     
+    def handle_irrigation_sequence(self, command_id: str, payload: Dict[str, Any]):
+        """
+        관수 시퀀스 처리
+        
+        payload['steps']가 없으면 기본 시퀀스 사용:
+        밸브 열기 → (valve_delay) → 펌프 ON → (duration) → 펌프 OFF → (drain_delay) → 밸브 닫기
+        """
+        steps = payload.get('steps')
+        if steps:
+            steps = [(step['actuator'], step['state'] in (True, 'on', 'open'), step.get('wait', 0)) for step in steps]
+        else:
+            steps = [
+                ('valve', True, 0),
+                ('pump', True, payload.get('valve_delay', 2)),
+                ('pump', False, payload.get('duration', 300)),
+                ('valve', False, payload.get('drain_delay', 2))
+            ]
+        
+        try:
+            job_id = self.scheduler.run_sequence(steps, job_id=command_id)
+        except KeyError as e:
+            self.send_command_ack(command_id, "error", str(e))
+            return
+        
+        if job_id is None:
+            self.send_command_ack(command_id, "error", "Sequence aborted by interlock")
+            return
+        
+        print(f"⏱️ 관수 시퀀스 시작: {len(steps)}단계")
+        self.send_command_ack(command_id, "success", f"Irrigation sequence scheduled: {len(steps)} steps")
+    
     def handle_config_update(self, command_id: str, payload: Dict[str, Any]):
-        """설정 업데이트 처리"""
-        sampling_interval = payload.get('sampling_interval', 30)
-        print(f"⚙️ 설정 업데이트 - 샘플링 간격: {sampling_interval}초")
-        self.send_command_ack(command_id, "success", f"Configuration updated, sampling interval: {sampling_interval}s")
+        """설정 업데이트 처리 (검증 후 바뀐 항목만 적용, 재연결 없음)"""
+        def is_number(value, low, high):
+            return isinstance(value, (int, float)) and not isinstance(value, bool) and low <= value <= high
+        
+        validators = {
+            'sampling_interval': lambda v: is_number(v, 5, 3600),
+            'state_interval': lambda v: is_number(v, 30, 86400),
+            'sensor_limits': lambda v: isinstance(v, dict) and all(isinstance(limit, dict) for limit in v.values()),
+            'suppress_bad_readings': lambda v: isinstance(v, bool)
+        }
+        
+        unsupported = [key for key in payload if key not in validators]
+        invalid = [key for key, value in payload.items() if key in validators and not validators[key](value)]
+        if unsupported or invalid:
+            self.send_command_ack(command_id, "error", f"Rejected config - unsupported: {unsupported}, invalid: {invalid}")
+            return
+        
+        changed = {key: value for key, value in payload.items() if self.config.get(key) != value}
+        if not changed:
+            self.send_command_ack(command_id, "success", "Configuration unchanged")
+            return
+        
+        with self.config_cond:
+            self.config.update(changed)
+            if 'sensor_limits' in changed:
+                self.quality_monitor.limits = changed['sensor_limits']  # 누적 통계는 유지
+            # 대기 중인 주기 작업이 새 간격 기준으로 남은 시간을 다시 계산
+            self.config_cond.notify_all()
+        
+        print(f"⚙️ 설정 업데이트: {changed}")
+        self.send_command_ack(command_id, "success", f"Configuration updated: {', '.join(sorted(changed))}")
+    
+    def wait_interval(self, key: str, default: float):
+        """설정된 간격만큼 대기 (도중에 간격이 바뀌면 마지막 실행 시점 기준으로 재계산)"""
+        start = time.monotonic()
+        with self.config_cond:
+            while True:
+                remaining = start + self.config.get(key, default) - time.monotonic()
+                if remaining <= 0:
+                    return
+                self.config_cond.wait(remaining)
     
     def start_periodic_tasks(self):
         """주기적 작업 시작"""
+        # 액추에이터 스케줄러 시작 (저장된 스케줄 복원)
+        self.scheduler.start()
+        
         def telemetry_task():
             while True:
                 if self.connected:
                     self.send_telemetry()
-                time.sleep(30)  # 30초마다
+                self.wait_interval('sampling_interval', 30)
         
         def state_task():
             while True:
                 if self.connected:
                     self.send_state()
-                time.sleep(300)  # 5분마다
+                self.wait_interval('state_interval', 300)
         
         # 백그라운드 스레드 시작
         telemetry_thread = threading.Thread(target=telemetry_task, daemon=True)
@@ -416,7 +1575,24 @@ def main():
         'username': 'your-username',
         'password': 'your-password',
         'device_type': 'sensor_gateway',
-        'firmware_version': '1.0.0'
+        'firmware_version': '1.0.0',
+        'command_cache_file': 'command_cache.json',
+        'schedule_file': 'actuator_schedule.json',
+        'interlocks': {'pump': ['valve']},  # 밸브가 열려 있어야 펌프 ON
+        'sensor_limits': {
+            'temperature': {'min': -20, 'max': 60},
+            'humidity': {'min': 0, 'max': 100},
+            'ec': {'min': 0, 'max': 10},
+            'ph': {'min': 0, 'max': 14},
+            'water_level': {'min': 0, 'max': 100}
+        },
+        'suppress_bad_readings': False,
+        'sampling_interval': 30,  # 텔레메트리 전송 간격 (초)
+        'state_interval': 300,    # 상태 변경 확인 간격 (초, 바뀐 것이 있을 때만 전송)
+        'mqtt5': False,           # MQTT 5 브로커(EMQX, Mosquitto 2 등)면 True
+        'message_expiry': 600,    # MQTT 5: 오프라인 동안 쌓인 텔레메트리 만료 (초)
+        'compression_threshold': 512,  # 이 크기 이상인 메시지는 deflate 압축 (0이면 압축 안 함)
+        'publish_window': 20      # PUBACK을 기다리는 텔레메트리/상태 메시지 최대 수 (명령 ACK는 제한 없이 먼저)
     }
     
     # 디바이스 생성 및 시작
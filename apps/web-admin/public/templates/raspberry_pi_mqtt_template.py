@@ -12,19 +12,28 @@
 - 로깅 시스템
 """
 
+import ast
+import heapq
+import itertools
 import json
+import operator
+import os
+import random
+import signal
+import sys
 import time
 import logging
 import threading
-from datetime import datetime
+from collections import OrderedDict, deque
 from typing import Dict, Any, Optional
 
 import paho.mqtt.client as mqtt
-import RPi.GPIO as GPIO
-import board
-import busio
-import adafruit_dht
-from adafruit_seesaw.seesaw import Seesaw
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+STARTED_AT = time.monotonic()  # 시작부터 첫 텔레메트리 전송까지 시간 측정용
+# RPi.GPIO / board / busio / adafruit_dht / adafruit_seesaw는 HardwareManager.init()에서 동시에 import
+# (하드웨어 초기화를 MQTT 연결과 겹쳐서 진행, 부팅 후 첫 전송까지의 시간 단축)
 
 # ==================== 설정 ====================
 class Config:
@@ -34,13 +43,16 @@ class Config:
     MQTT_USERNAME = "your_username"            # 실제 사용자명으로 변경
     MQTT_PASSWORD = "your_password"            # 실제 비밀번호로 변경
     MQTT_USE_TLS = False                       # TLS 사용 여부
+    MQTT_USE_V5 = False                        # MQTT 5 (토픽 별칭/메시지 만료) - 브로커가 지원할 때만 True
+    MQTT_SESSION_EXPIRY = 86400                # MQTT 5 세션 만료 시간 (초)
+    MESSAGE_EXPIRY = 600                       # MQTT 5: 오프라인 동안 쌓인 텔레메트리 만료 (초)
     
     # 디바이스 정보
     FARM_ID = "your_farm_id"                   # 실제 농장 ID로 변경
     DEVICE_ID = "raspberry_pi_001"             # 디바이스 고유 ID
     
     # 센서 설정
-    DHT_PIN = board.D4                         # DHT22 온습도 센서 핀
+    DHT_PIN = "D4"                             # DHT22 온습도 센서 핀 (board 모듈의 핀 이름)
     SOIL_SENSOR_ADDR = 0x36                    # 토양 센서 I2C 주소
     
     # 액추에이터 핀 설정
@@ -52,9 +64,49 @@ class Config:
     TELEMETRY_INTERVAL = 30
     HEARTBEAT_INTERVAL = 60
     
-    # 재연결 설정
-    RECONNECT_DELAY = 5
-    MAX_RECONNECT_ATTEMPTS = 10
+    # 발행 레인: 명령 ACK는 control 레인으로 항상 먼저, 텔레메트리/상태는 가중치(4:2)에 따라 번갈아 전송
+    PUBLISH_LANES = None                       # None이면 DEFAULT_PUBLISH_LANES, 레인별 rate(초당 메시지 수)/max_queue 지정 가능
+    PUBLISH_WINDOW = 20                        # PUBACK을 기다리는 텔레메트리/상태 메시지 최대 수
+    
+    # 샘플링 프로파일러 (kill -USR2 <pid> 또는 profile 명령으로 켜고 끄기, flamegraph용 collapsed stack)
+    PROFILE_FILE = "/var/lib/smartfarm/profile.folded"
+    PROFILE_INTERVAL = 0.02                    # 샘플링 주기 (초)
+    PROFILE_MAX_BYTES = 5 * 1024 * 1024        # 넘으면 .1로 교체
+    
+    # 빠른 시작: 마지막으로 전송한 측정값을 저장해 두고 재시작 후 첫 연결 때 바로 발행
+    STATE_FILE = "/var/lib/smartfarm/last_state.json"  # None이면 사용 안 함
+    STATE_SAVE_INTERVAL = 60                   # 저장 최소 간격 (초, SD 카드 쓰기 절약)
+    
+    # 저메모리 모드: 스레드 스택 크기 (KB, 기본 8MB 대신), None이면 시스템 기본값
+    THREAD_STACK_KB = 256
+    
+    # 지연 추적: 이 비율의 텔레메트리에 구간별 시각(trace)을 붙여 서버에서 센서 읽기→수신 지연 확인
+    TRACE_SAMPLE_RATE = 0.01
+    
+    # 재연결 설정 (지터가 들어간 지수 백오프, 브로커 재시작 시 동시 재접속 방지)
+    RECONNECT_DELAY = 5                        # 최소 재연결 대기 (초)
+    RECONNECT_MAX_DELAY = 120                  # 최대 재연결 대기 (초)
+    MAX_RECONNECT_ATTEMPTS = 10                # 연속 실패 시 서킷 브레이커 차단
+    RECONNECT_COOLDOWN = 300                   # 차단 유지 시간 (초)
+    RECONNECT_INITIAL_JITTER = 10              # 시작 시 첫 연결 전 임의 대기 최대값 (초)
+    MQTT_KEEPALIVE = 60
+    MQTT_CONNECT_TIMEOUT = 10                  # CONNACK 대기 시간 (초)
+    
+    # 중복 명령 방지 캐시 설정
+    COMMAND_CACHE_SIZE = 1024                  # 보관할 최대 command_id 수
+    COMMAND_CACHE_TTL = 3600                   # 보관 시간 (초)
+    COMMAND_CACHE_FILE = "/var/lib/smartfarm/command_cache.json"  # None이면 메모리만 사용
+    COMMAND_CACHE_SAVE_INTERVAL = 5.0          # 캐시 파일 저장 최소 간격 (초, SD 카드 쓰기 횟수 제한)
+    
+    # 액추에이터 스케줄 설정
+    SCHEDULE_FILE = "/var/lib/smartfarm/actuator_schedule.json"   # 재시작 후 스케줄 복원용
+    INTERLOCKS = {}                            # 예: {"pump": ["fan"]} → 팬이 켜져 있어야 펌프 ON
+    
+    # 로컬 제어 룰 (클라우드 없이 센서 값으로 액추에이터 제어, 오프라인에서도 동작)
+    # 사용 가능한 값: temperature, humidity, soil_moisture, soil_temperature
+    # 예: {"name": "fan_high_temp", "when": "temperature > 30", "hysteresis": 2, "actuator": "fan", "min_on": 60}
+    #     {"name": "pump_dry_soil", "when": "soil_moisture < 400", "off_when": "soil_moisture > 600", "actuator": "pump", "min_off": 600}
+    RULES = []
 
 # ==================== 로깅 설정 ====================
 logging.basicConfig(
@@ -67,55 +119,118 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# ==================== 측정 시각 ====================
+class MonotonicClock:
+    """수집 시점에는 monotonic_ns만 기록하고, 주기적으로 맞춘 오프셋으로 UTC epoch ms 변환 (NTP 조정에 안전)"""
+    
+    def __init__(self, resync_interval: float = 60.0):
+        self.resync_interval_ns = int(resync_interval * 1e9)
+        self.offset_ns = 0
+        self.synced_ns = 0
+        self.resync()
+    
+    def resync(self):
+        """monotonic → UTC 오프셋 재측정"""
+        before = time.monotonic_ns()
+        wall = time.time_ns()
+        after = time.monotonic_ns()
+        self.offset_ns = wall - (before + after) // 2
+        self.synced_ns = after
+    
+    def to_epoch_ms(self, mono_ns: int) -> int:
+        if time.monotonic_ns() - self.synced_ns > self.resync_interval_ns:
+            self.resync()
+        return (mono_ns + self.offset_ns) // 1_000_000
+    
+    def now_ms(self) -> int:
+        return self.to_epoch_ms(time.monotonic_ns())
+    
+    @staticmethod
+    def format(ts_ms: int) -> str:
+        """epoch ms -> ISO 8601 UTC 문자열 (전송할 때만 호출)"""
+        seconds, ms = divmod(int(ts_ms), 1000)
+        return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(seconds)) + f".{ms:03d}Z"
+    
+    def now_iso(self) -> str:
+        return self.format(self.now_ms())
+
+clock = MonotonicClock()
+
 # ==================== 하드웨어 초기화 ====================
 class HardwareManager:
     def __init__(self):
+        self.gpio = None
         self.dht_sensor = None
         self.soil_sensor = None
         self.i2c = None
+    
+    def init(self):
+        """GPIO, 온습도 센서, 토양 센서를 동시에 초기화 (라이브러리 import와 I2C/센서 준비 대기가 겹침)"""
+        start = time.monotonic()
+        errors = {}
         
-        try:
-            # GPIO 설정
-            GPIO.setmode(GPIO.BCM)
-            GPIO.setwarnings(False)
-            
-            # 출력 핀 설정
-            GPIO.setup(Config.PUMP_PIN, GPIO.OUT)
-            GPIO.setup(Config.LED_PIN, GPIO.OUT)
-            GPIO.setup(Config.FAN_PIN, GPIO.OUT)
-            
-            # 초기 상태: 모든 액추에이터 OFF
-            GPIO.output(Config.PUMP_PIN, GPIO.LOW)
-            GPIO.output(Config.LED_PIN, GPIO.LOW)
-            GPIO.output(Config.FAN_PIN, GPIO.LOW)
-            
-            # I2C 초기화
-            self.i2c = busio.I2C(board.SCL, board.SDA)
-            
-            # DHT22 온습도 센서 초기화
-            self.dht_sensor = adafruit_dht.DHT22(Config.DHT_PIN)
-            
-            # 토양 센서 초기화
-            self.soil_sensor = Seesaw(self.i2c, addr=Config.SOIL_SENSOR_ADDR)
-            
-            logger.info("하드웨어 초기화 완료")
-            
-        except Exception as e:
-            logger.error(f"하드웨어 초기화 실패: {e}")
-            raise
+        def run(name, init):
+            try:
+                init()
+            except Exception as e:
+                errors[name] = e
+        
+        threads = [
+            threading.Thread(target=run, args=(name, init), daemon=True)
+            for name, init in (("gpio", self._init_gpio), ("dht", self._init_dht), ("soil", self._init_soil))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        if errors:
+            for name, e in errors.items():
+                logger.error(f"하드웨어 초기화 실패 ({name}): {e}")
+            raise next(iter(errors.values()))
+        logger.info(f"하드웨어 초기화 완료 ({(time.monotonic() - start) * 1000:.0f}ms)")
+    
+    def _init_gpio(self):
+        import RPi.GPIO as GPIO
+        
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setwarnings(False)
+        
+        # 출력 핀 설정, 초기 상태: 모든 액추에이터 OFF
+        for pin in (Config.PUMP_PIN, Config.LED_PIN, Config.FAN_PIN):
+            GPIO.setup(pin, GPIO.OUT)
+            GPIO.output(pin, GPIO.LOW)
+        self.gpio = GPIO
+    
+    def _init_dht(self):
+        import board
+        import adafruit_dht
+        
+        # DHT22 온습도 센서
+        self.dht_sensor = adafruit_dht.DHT22(getattr(board, Config.DHT_PIN))
+    
+    def _init_soil(self):
+        import board
+        import busio
+        from adafruit_seesaw.seesaw import Seesaw
+        
+        # I2C + 토양 센서
+        self.i2c = busio.I2C(board.SCL, board.SDA)
+        self.soil_sensor = Seesaw(self.i2c, addr=Config.SOIL_SENSOR_ADDR)
     
     def read_temperature_humidity(self) -> Dict[str, Any]:
         """온습도 센서 데이터 읽기"""
         try:
             temperature = self.dht_sensor.temperature
             humidity = self.dht_sensor.humidity
+            acquired_ns = time.monotonic_ns()
             
             return {
                 "sensor_type": "temperature_humidity",
                 "temperature": round(temperature, 2) if temperature else None,
                 "humidity": round(humidity, 2) if humidity else None,
                 "unit": {"temperature": "celsius", "humidity": "percent"},
-                "timestamp": datetime.utcnow().isoformat() + "Z"
+                "timestamp": clock.to_epoch_ms(acquired_ns)
             }
         except Exception as e:
             logger.error(f"온습도 센서 읽기 실패: {e}")
@@ -126,13 +241,14 @@ class HardwareManager:
         try:
             moisture = self.soil_sensor.moisture_read()
             temperature = self.soil_sensor.get_temp()
+            acquired_ns = time.monotonic_ns()
             
             return {
                 "sensor_type": "soil_moisture",
                 "moisture": moisture,
                 "temperature": round(temperature, 2),
                 "unit": {"moisture": "raw", "temperature": "celsius"},
-                "timestamp": datetime.utcnow().isoformat() + "Z"
+                "timestamp": clock.to_epoch_ms(acquired_ns)
             }
         except Exception as e:
             logger.error(f"토양 센서 읽기 실패: {e}")
@@ -141,7 +257,7 @@ class HardwareManager:
     def control_pump(self, state: bool) -> bool:
         """펌프 제어"""
         try:
-            GPIO.output(Config.PUMP_PIN, GPIO.HIGH if state else GPIO.LOW)
+            self.gpio.output(Config.PUMP_PIN, self.gpio.HIGH if state else self.gpio.LOW)
             logger.info(f"펌프 {'ON' if state else 'OFF'}")
             return True
         except Exception as e:
@@ -151,7 +267,7 @@ class HardwareManager:
     def control_led(self, state: bool) -> bool:
         """LED 제어"""
         try:
-            GPIO.output(Config.LED_PIN, GPIO.HIGH if state else GPIO.LOW)
+            self.gpio.output(Config.LED_PIN, self.gpio.HIGH if state else self.gpio.LOW)
             logger.info(f"LED {'ON' if state else 'OFF'}")
             return True
         except Exception as e:
@@ -161,7 +277,7 @@ class HardwareManager:
     def control_fan(self, state: bool) -> bool:
         """팬 제어"""
         try:
-            GPIO.output(Config.FAN_PIN, GPIO.HIGH if state else GPIO.LOW)
+            self.gpio.output(Config.FAN_PIN, self.gpio.HIGH if state else self.gpio.LOW)
             logger.info(f"팬 {'ON' if state else 'OFF'}")
             return True
         except Exception as e:
@@ -170,19 +286,1194 @@ class HardwareManager:
     
     def cleanup(self):
         """GPIO 정리"""
+        if self.gpio is None:
+            return
         try:
-            GPIO.cleanup()
+            self.gpio.cleanup()
             logger.info("GPIO 정리 완료")
         except Exception as e:
             logger.error(f"GPIO 정리 실패: {e}")
 
+# ==================== 액추에이터 스케줄러 ====================
+class ActuatorScheduler:
+    """힙 기반 액추에이터 스케줄러 (타이머 ON/OFF, 다단계 시퀀스, 인터록, 재시작 후 복원)"""
+    
+    def __init__(self, persist_path=None):
+        """
+        Args:
+            persist_path: 대기 중인 스케줄을 저장할 JSON 파일 경로 (None이면 저장 안 함)
+        """
+        self.persist_path = persist_path
+        self.states = {}           # 액추에이터 이름 -> 현재 상태
+        self._setters = {}         # 액추에이터 이름 -> setter(state) -> bool
+        self._interlocks = {}      # 액추에이터 이름 -> ON 전에 켜져 있어야 하는 액추에이터 목록
+        self._jobs = {}            # job_id -> {"steps": [(name, state, wait)], "index": int, "gen": int, "due": float}
+        self._heap = []            # (실행 시각(monotonic), 순번, job_id, gen)
+        self._seq = itertools.count()
+        self._cond = threading.Condition(threading.RLock())
+        self._running = False
+        self._thread = None
+    
+    # ---------- 설정 ----------
+    
+    def register(self, name, setter, requires=None, initial_state=False):
+        """액추에이터 등록 (requires: ON 되기 전에 켜져 있어야 하는 액추에이터 목록)"""
+        with self._cond:
+            self._setters[name] = setter
+            self.states[name] = initial_state
+            if requires:
+                self._interlocks[name] = list(requires)
+    
+    def start(self):
+        """스케줄러 스레드 시작 (저장된 스케줄 복원)"""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            self._restore_locked()
+        
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """스케줄러 스레드 중지 (대기 중인 스케줄은 파일에 남겨둠)"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=2)
+    
+    # ---------- 제어 API ----------
+    
+    def set(self, name, state):
+        """즉시 상태 변경 (해당 액추에이터의 대기 중인 스케줄은 취소)"""
+        with self._cond:
+            self._cancel_conflicts_locked({name})
+            ok = self._apply_locked(name, state)
+            self._save_locked()
+            return ok
+    
+    def pulse(self, name, duration, state=True, job_id=None):
+        """지정 시간 동안 상태 유지 후 원래대로 복귀 (예: 펌프 300초 ON)"""
+        return self.run_sequence([(name, state, 0), (name, not state, duration)], job_id)
+    
+    def run_sequence(self, steps, job_id=None):
+        """
+        다단계 시퀀스 실행
+        
+        Args:
+            steps: [(액추에이터 이름, 상태, 이전 단계로부터 대기 시간(초)), ...]
+            job_id: 작업 ID (None이면 자동 생성)
+        
+        Returns:
+            job_id (인터록으로 즉시 중단되면 None)
+        """
+        steps = [(name, state, float(wait)) for name, state, wait in steps]
+        for name, _, _ in steps:
+            if name not in self._setters:
+                raise KeyError(f"등록되지 않은 액추에이터: {name}")
+        
+        with self._cond:
+            job_id = job_id or f"job-{int(time.time())}-{next(self._seq)}"
+            self._cancel_conflicts_locked({name for name, _, _ in steps})
+            self._jobs[job_id] = {"steps": steps, "index": 0, "gen": 0, "due": 0.0}
+            
+            # 대기 시간 0인 앞쪽 단계는 호출 스레드에서 바로 실행
+            job = self._jobs[job_id]
+            while job["index"] < len(steps) and steps[job["index"]][2] <= 0:
+                if not self._execute_step_locked(job_id, job):
+                    self._save_locked()
+                    return None
+            
+            if job["index"] < len(steps):
+                self._schedule_locked(job_id, job, time.monotonic() + steps[job["index"]][2])
+            else:
+                del self._jobs[job_id]
+            
+            self._save_locked()
+            return job_id
+    
+    def cancel(self, job_id):
+        """작업 취소 (남은 OFF 단계는 즉시 실행)"""
+        with self._cond:
+            if job_id not in self._jobs:
+                return False
+            self._abort_locked(job_id)
+            self._save_locked()
+            return True
+    
+    def pending(self):
+        """대기 중인 작업 요약 (상태 보고용)"""
+        now = time.monotonic()
+        with self._cond:
+            return [
+                {
+                    "job_id": job_id,
+                    "next_step": job["steps"][job["index"]][0],
+                    "remaining_steps": len(job["steps"]) - job["index"],
+                    "due_in": round(max(0.0, job["due"] - now), 1)
+                }
+                for job_id, job in self._jobs.items()
+            ]
+    
+    # ---------- 내부 처리 ----------
+    
+    def _run(self):
+        with self._cond:
+            while self._running:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                
+                due, _, job_id, gen = self._heap[0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                
+                heapq.heappop(self._heap)
+                job = self._jobs.get(job_id)
+                if job is None or job["gen"] != gen:
+                    continue  # 취소되었거나 재스케줄된 항목
+                
+                if self._execute_step_locked(job_id, job):
+                    if job["index"] < len(job["steps"]):
+                        self._schedule_locked(job_id, job, time.monotonic() + job["steps"][job["index"]][2])
+                    else:
+                        del self._jobs[job_id]
+                self._save_locked()
+    
+    def _execute_step_locked(self, job_id, job):
+        """현재 단계 실행. 실패하면 작업을 중단하고 False 반환"""
+        name, state, _ = job["steps"][job["index"]]
+        if not self._apply_locked(name, state):
+            logger.warning(f"시퀀스 중단: {job_id} ({name} 제어 실패)")
+            self._abort_locked(job_id)
+            return False
+        job["index"] += 1
+        return True
+    
+    def _apply_locked(self, name, state):
+        """인터록 확인 후 실제 액추에이터 제어"""
+        if state:
+            blocked = [req for req in self._interlocks.get(name, []) if not self.states.get(req)]
+            if blocked:
+                logger.warning(f"인터록: {name} ON 거부 ({', '.join(blocked)} 꺼짐)")
+                return False
+        
+        try:
+            ok = self._setters[name](state)
+        except Exception as e:
+            logger.error(f"액추에이터 제어 오류 {name}: {e}")
+            ok = False
+        
+        if ok is not False:
+            self.states[name] = state
+            return True
+        return False
+    
+    def _schedule_locked(self, job_id, job, due):
+        job["gen"] += 1
+        job["due"] = due
+        heapq.heappush(self._heap, (due, next(self._seq), job_id, job["gen"]))
+        self._cond.notify()
+    
+    def _abort_locked(self, job_id, skip=()):
+        """작업 제거 후 남은 OFF 단계만 즉시 실행 (skip에 포함된 액추에이터 제외)"""
+        job = self._jobs.pop(job_id)
+        for name, state, _ in job["steps"][job["index"]:]:
+            if not state and name not in skip:
+                self._apply_locked(name, state)
+    
+    def _cancel_conflicts_locked(self, names):
+        """같은 액추에이터를 다루는 기존 작업 취소 (마지막 명령 우선)"""
+        for job_id in [j for j, job in self._jobs.items()
+                       if names & {name for name, _, _ in job["steps"][job["index"]:]}]:
+            self._abort_locked(job_id, skip=names)
+    
+    def _save_locked(self):
+        if not self.persist_path:
+            return
+        
+        offset = time.time() - time.monotonic()
+        data = [
+            {
+                "job_id": job_id,
+                "steps": job["steps"][job["index"]:],
+                "due_at": job["due"] + offset
+            }
+            for job_id, job in self._jobs.items()
+        ]
+        tmp_path = f"{self.persist_path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.persist_path)
+        except OSError as e:
+            logger.error(f"스케줄 저장 실패: {e}")
+    
+    def _restore_locked(self):
+        """저장된 스케줄 복원 (지난 시각의 단계는 바로 실행됨)"""
+        if not self.persist_path:
+            return
+        
+        try:
+            with open(self.persist_path, 'r') as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        
+        offset = time.time() - time.monotonic()
+        for item in data:
+            steps = [tuple(step) for step in item["steps"] if step[0] in self._setters]
+            if not steps:
+                continue
+            job = {"steps": steps, "index": 0, "gen": 0, "due": 0.0}
+            self._jobs[item["job_id"]] = job
+            self._schedule_locked(item["job_id"], job, item["due_at"] - offset)
+        
+        if self._jobs:
+            logger.info(f"스케줄 복원: {len(self._jobs)}개 작업")
+
+# ==================== 로컬 룰 엔진 ====================
+_COMPARE_OPS = {
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+}
+
+_BINARY_OPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+}
+
+
+def compile_condition(expression):
+    """
+    조건식을 클로저로 컴파일
+    
+    Returns:
+        (condition(snapshot) -> bool, 참조하는 키 집합)
+    """
+    keys = set()
+    tree = ast.parse(expression, mode='eval')
+    return _compile_node(tree.body, keys, expression), keys
+
+
+def _compile_node(node, keys, expression):
+    if isinstance(node, ast.BoolOp):
+        parts = [_compile_node(value, keys, expression) for value in node.values]
+        if isinstance(node.op, ast.And):
+            return lambda s: all(part(s) for part in parts)
+        return lambda s: any(part(s) for part in parts)
+    
+    if isinstance(node, ast.UnaryOp):
+        operand = _compile_node(node.operand, keys, expression)
+        if isinstance(node.op, ast.Not):
+            return lambda s: not operand(s)
+        if isinstance(node.op, ast.USub):
+            return lambda s: -operand(s)
+    
+    if isinstance(node, ast.Compare):
+        left = _compile_node(node.left, keys, expression)
+        pairs = [(_COMPARE_OPS[type(op)], _compile_node(right, keys, expression))
+                 for op, right in zip(node.ops, node.comparators) if type(op) in _COMPARE_OPS]
+        if len(pairs) != len(node.ops):
+            raise ValueError(f"지원하지 않는 비교 연산: {expression}")
+        
+        def compare(s):
+            current = left(s)
+            for op, right in pairs:
+                value = right(s)
+                if not op(current, value):
+                    return False
+                current = value
+            return True
+        return compare
+    
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPS:
+        op = _BINARY_OPS[type(node.op)]
+        left = _compile_node(node.left, keys, expression)
+        right = _compile_node(node.right, keys, expression)
+        return lambda s: op(left(s), right(s))
+    
+    if isinstance(node, ast.Name):
+        key = node.id
+        keys.add(key)
+        return lambda s: s[key]
+    
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, bool)):
+        value = node.value
+        return lambda s: value
+    
+    raise ValueError(f"허용되지 않는 표현식: {expression}")
+
+
+def _hysteresis_expression(expression, band):
+    """'key > 30' 형태의 단순 조건에서 OFF 조건식 생성 ('key < 28')"""
+    node = ast.parse(expression, mode='eval').body
+    if (isinstance(node, ast.Compare) and len(node.ops) == 1
+            and isinstance(node.left, ast.Name) and isinstance(node.comparators[0], ast.Constant)):
+        key, threshold = node.left.id, node.comparators[0].value
+        if isinstance(node.ops[0], (ast.Gt, ast.GtE)):
+            return f"{key} < {threshold - band}"
+        if isinstance(node.ops[0], (ast.Lt, ast.LtE)):
+            return f"{key} > {threshold + band}"
+    raise ValueError(f"hysteresis는 'key > 값' 형태에만 사용 가능 (off_when 사용): {expression}")
+
+
+class Rule:
+    def __init__(self, config):
+        self.name = config['name']
+        self.actuator = config['actuator']
+        self.on_state = config.get('state', True)
+        self.min_on = config.get('min_on', 0)
+        self.min_off = config.get('min_off', 0)
+        
+        self.when, self.keys = compile_condition(config['when'])
+        off_expression = config.get('off_when')
+        if off_expression is None and config.get('hysteresis'):
+            off_expression = _hysteresis_expression(config['when'], config['hysteresis'])
+        if off_expression is not None:
+            self.off_when, off_keys = compile_condition(off_expression)
+            self.keys |= off_keys
+        else:
+            when = self.when
+            self.off_when = lambda s: not when(s)
+        
+        self.active = False
+        self.changed_at = float('-inf')
+        self.pending = False  # 최소 유지 시간 때문에 보류된 전환
+
+
+class RuleEngine:
+    def __init__(self, rules, actions):
+        """
+        Args:
+            rules: 룰 설정 목록 (dict)
+            actions: 액추에이터 이름 -> 제어 함수(state) -> bool
+        """
+        self.actions = actions
+        self.snapshot = {}
+        self.rules = []
+        self._by_key = {}  # 입력 키 -> 해당 키를 참조하는 룰 목록
+        
+        for config in rules:
+            if not config.get('enabled', True):
+                continue
+            rule = Rule(config)
+            if rule.actuator not in actions:
+                raise ValueError(f"알 수 없는 액추에이터: {rule.actuator} (룰 {rule.name})")
+            self.rules.append(rule)
+            for key in rule.keys:
+                self._by_key.setdefault(key, []).append(rule)
+    
+    def update(self, values):
+        """
+        새 센서 값 반영 후 영향 받는 룰만 평가
+        
+        Returns:
+            이번 평가에서 실행된 (룰 이름, 상태) 목록
+        """
+        affected = []
+        seen = set()
+        for key, value in values.items():
+            if value is None or self.snapshot.get(key) == value:
+                continue
+            self.snapshot[key] = value
+            for rule in self._by_key.get(key, ()):
+                if id(rule) not in seen:
+                    seen.add(id(rule))
+                    affected.append(rule)
+        
+        return self._evaluate(affected)
+    
+    def tick(self):
+        """최소 유지 시간 때문에 보류된 전환 재확인 (주기적으로 호출)"""
+        return self._evaluate([rule for rule in self.rules if rule.pending])
+    
+    def status(self):
+        """룰별 현재 상태"""
+        return {rule.name: rule.active for rule in self.rules}
+    
+    def _evaluate(self, rules):
+        fired = []
+        now = time.monotonic()
+        
+        for rule in rules:
+            try:
+                if rule.active:
+                    want_change = rule.off_when(self.snapshot)
+                else:
+                    want_change = rule.when(self.snapshot)
+            except (KeyError, TypeError, ZeroDivisionError):
+                continue  # 아직 값이 없는 센서 등
+            
+            if not want_change:
+                rule.pending = False
+                continue
+            
+            hold = rule.min_on if rule.active else rule.min_off
+            if now - rule.changed_at < hold:
+                rule.pending = True
+                continue
+            
+            target = not rule.active
+            state = rule.on_state if target else not rule.on_state
+            if self.actions[rule.actuator](state) is False:
+                rule.pending = True  # 다음 tick()에서 재시도
+                continue
+            
+            rule.active = target
+            rule.changed_at = now
+            rule.pending = False
+            fired.append((rule.name, state))
+            logger.info(f"룰 실행: {rule.name} → {rule.actuator} {'ON' if state else 'OFF'}")
+        
+        return fired
+
+# ==================== 중복 명령 캐시 ====================
+class CommandCache:
+    """최근 실행한 command_id의 ACK를 보관하는 LRU+TTL 캐시"""
+    
+    def __init__(self, max_size: int, ttl: float, persist_path: Optional[str] = None, min_interval: float = 5.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.persist_path = persist_path
+        self.min_interval = min_interval  # 파일 저장 최소 간격 (초), 그 사이의 변경은 모아서 한 번에 저장
+        self._entries = OrderedDict()  # command_id -> (만료 시각, ack)
+        self._in_flight = set()  # 실행 중인 command_id (메모리만)
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saved_at = None
+        self._save_timer = None
+        
+        if persist_path:
+            self.load()
+    
+    def get(self, command_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """캐시된 ACK 반환 (없거나 만료되면 None)"""
+        if not command_id or command_id == "unknown":
+            return None
+        
+        with self._lock:
+            entry = self._entries.get(command_id)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self._entries[command_id]
+                return None
+            self._entries.move_to_end(command_id)
+            return entry[1]
+    
+    def begin(self, command_id: Optional[str]) -> bool:
+        """실행 시작 표시. 이미 실행 중이거나 실행을 마친 명령이면 False (다시 실행하지 않음)"""
+        if not command_id or command_id == "unknown":
+            return True
+        
+        with self._lock:
+            entry = self._entries.get(command_id)
+            if command_id in self._in_flight or (entry is not None and entry[0] >= time.time()):
+                return False
+            self._in_flight.add(command_id)
+            return True
+    
+    def put(self, command_id: Optional[str], ack: Dict[str, Any]):
+        """실행 완료된 명령의 ACK 저장"""
+        if not command_id or command_id == "unknown":
+            return
+        
+        with self._lock:
+            self._in_flight.discard(command_id)
+            self._entries[command_id] = (time.time() + self.ttl, ack)
+            self._entries.move_to_end(command_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            if self.persist_path:
+                self._dirty = True
+                self._schedule_save_locked()
+    
+    def flush(self):
+        """저장 대기 중인 변경을 바로 파일에 씀 (종료 시 호출)"""
+        with self._lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+            if self._dirty:
+                self._save_locked()
+    
+    def load(self):
+        """파일에서 캐시 복원 (만료 항목은 버림)"""
+        try:
+            with open(self.persist_path, 'r') as f:
+                items = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        
+        now = time.time()
+        for command_id, expires_at, ack in items[-self.max_size:]:
+            if expires_at >= now:
+                self._entries[command_id] = (expires_at, ack)
+        logger.info(f"명령 캐시 복원: {len(self._entries)}개")
+    
+    def _schedule_save_locked(self):
+        """min_interval이 지났으면 바로 저장, 아니면 남은 시간 뒤에 한 번 저장"""
+        if self._save_timer is not None:
+            return
+        elapsed = None if self._saved_at is None else time.monotonic() - self._saved_at
+        if elapsed is None or elapsed >= self.min_interval:
+            self._save_locked()
+            return
+        self._save_timer = threading.Timer(self.min_interval - elapsed, self.flush)
+        self._save_timer.daemon = True
+        self._save_timer.start()
+    
+    def _save_locked(self):
+        """임시 파일에 쓴 뒤 교체 (전원 차단 시 파일 손상 방지)"""
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        items = [[command_id, expires_at, ack] for command_id, (expires_at, ack) in self._entries.items()]
+        tmp_path = f"{self.persist_path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(items, f)
+            os.replace(tmp_path, self.persist_path)
+        except OSError as e:
+            logger.error(f"명령 캐시 저장 실패: {e}")
+
+# ==================== 연결 감시 (지터 백오프 + 서킷 브레이커) ====================
+class Backoff:
+    """지터 지수 백오프: delay = random(base, min(cap, 이전 delay * 3))"""
+    
+    def __init__(self, base=1.0, cap=60.0):
+        self.base = base
+        self.cap = cap
+        self.attempts = 0
+        self._delay = base
+    
+    def next_delay(self):
+        self.attempts += 1
+        self._delay = min(self.cap, random.uniform(self.base, self._delay * 3))
+        return self._delay
+    
+    def reset(self):
+        self.attempts = 0
+        self._delay = self.base
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    def __init__(self, failure_threshold=10, open_timeout=300):
+        """
+        Args:
+            failure_threshold: 이 횟수만큼 연속 실패하면 차단 (open)
+            open_timeout: 차단 유지 시간 (초), 이후 한 번만 시도 (half-open)
+        """
+        self.failure_threshold = failure_threshold
+        self.open_timeout = open_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+    
+    def allow(self):
+        """지금 시도해도 되는지"""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.open_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+            return True
+    
+    def remaining(self):
+        """차단이 풀리기까지 남은 시간 (초)"""
+        with self._lock:
+            if self.state != self.OPEN:
+                return 0.0
+            return max(0.0, self.opened_at + self.open_timeout - time.monotonic())
+    
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+    
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"서킷 브레이커 차단: 연속 실패 {self.failures}회, {self.open_timeout}초 후 재시도")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+class ConnectionSupervisor:
+    def __init__(self, name, connect, close=None, probe=None, service=None,
+                 base_delay=1.0, max_delay=60.0, max_attempts=10, open_timeout=300,
+                 initial_jitter=0.0, probe_interval=30.0, on_connected=None):
+        """
+        Args:
+            name: 로그용 연결 이름
+            connect: connect() - 실패 시 예외 또는 False. 연결이 실제로 성립한 뒤 반환해야 함
+                (MQTT는 TCP 연결이 아니라 CONNACK rc=0까지 기다려야 인증 거부가 실패로 세어짐)
+            close: close() - 끊긴 연결 정리
+            probe: probe() -> bool, probe_interval마다 연결 상태 점검
+            service: service() -> bool, 연결 중 반복 호출 (예: MQTT network loop), False면 끊김으로 판단
+            base_delay / max_delay: 백오프 범위 (초)
+            max_attempts: 서킷 브레이커 차단 전 연속 실패 횟수
+            open_timeout: 차단 유지 시간 (초)
+            initial_jitter: 첫 연결 전 임의 대기 최대값 (정전 복구 후 동시 접속 분산)
+            probe_interval: 상태 점검 주기 (초)
+            on_connected: 연결(재연결) 성공 시 호출
+        """
+        self.name = name
+        self._connect = connect
+        self._close = close
+        self._probe = probe
+        self._service = service
+        self.backoff = Backoff(base_delay, max_delay)
+        self.breaker = CircuitBreaker(max_attempts, open_timeout)
+        self.initial_jitter = initial_jitter
+        self.probe_interval = probe_interval
+        self.on_connected = on_connected
+        
+        self.connected = False
+        self.running = False
+        self.thread = None
+        self._wake = threading.Event()
+        self._failed = False
+        self._attempted = False
+    
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name=f"supervisor-{self.name}", daemon=True)
+        self.thread.start()
+    
+    def stop(self):
+        self.running = False
+        self._wake.set()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=5)
+        self._disconnect()
+    
+    def mark_failed(self):
+        """입출력 오류 발생 시 호출 - 연결을 정리하고 재연결"""
+        if self.connected:
+            self._failed = True
+            self._wake.set()
+    
+    def _run(self):
+        if self.initial_jitter:
+            self._sleep(random.uniform(0, self.initial_jitter))
+        
+        while self.running:
+            if not self.connected:
+                self._try_connect()
+            elif self._failed:
+                self._failed = False
+                logger.warning(f"{self.name} 연결 오류 - 재연결")
+                self._disconnect()
+            elif self._service:
+                if not self._service():
+                    logger.warning(f"{self.name} 연결 끊김")
+                    self._disconnect()
+            else:
+                self._sleep(self.probe_interval)
+                if self.running and self._probe and not self._failed and not self._safe_probe():
+                    logger.warning(f"{self.name} 상태 점검 실패 - 재연결")
+                    self._disconnect()
+    
+    def _try_connect(self):
+        if not self.breaker.allow():
+            self._sleep(self.breaker.remaining())
+            return
+        
+        # 끊긴 직후에도 바로 붙지 않고 지터 대기 (브로커 재시작 시 동시 재접속 방지)
+        if self._attempted:
+            delay = self.backoff.next_delay()
+            logger.info(f"{self.name} {delay:.1f}초 후 재연결 시도 ({self.backoff.attempts}회째)")
+            if self._sleep(delay) or not self.running:
+                return
+        self._attempted = True
+        
+        try:
+            ok = self._connect()
+        except Exception as e:
+            logger.error(f"{self.name} 연결 실패: {e}")
+            ok = False
+        
+        if ok is False:
+            self.breaker.record_failure()
+            return
+        
+        self.connected = True
+        self._failed = False
+        self.backoff.reset()
+        self.breaker.record_success()
+        logger.info(f"{self.name} 연결됨")
+        if self.on_connected:
+            self.on_connected()
+    
+    def _sleep(self, seconds):
+        """대기 (stop() 등으로 깨어나면 True)"""
+        woken = self._wake.wait(seconds)
+        self._wake.clear()
+        return woken
+    
+    def _safe_probe(self):
+        try:
+            return bool(self._probe())
+        except Exception:
+            return False
+    
+    def _disconnect(self):
+        was_connected = self.connected
+        self.connected = False
+        if self._close and was_connected:
+            try:
+                self._close()
+            except Exception as e:
+                logger.debug(f"{self.name} 연결 정리 오류: {e}")
+
+# ==================== 샘플링 프로파일러 ====================
+class SamplingProfiler:
+    """켜 둔 동안 모든 스레드의 스택을 주기적으로 읽어 "스레드;파일:함수;... 횟수" 형식으로 기록"""
+    
+    def __init__(self, output: str, interval: float = 0.02, max_bytes: int = 5 * 1024 * 1024):
+        self.output = output
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.samples = 0
+        self._counts = {}
+        self._stop = threading.Event()
+        self._thread = None
+    
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+    
+    def start(self, duration: Optional[float] = None) -> bool:
+        if self.running:
+            return False
+        self._stop.clear()
+        self.samples = 0
+        self._thread = threading.Thread(target=self._run, args=(duration,), name="sampling-profiler", daemon=True)
+        self._thread.start()
+        logger.info(f"프로파일링 시작: {self.output}")
+        return True
+    
+    def stop(self) -> bool:
+        if not self.running:
+            return False
+        self._stop.set()
+        return True
+    
+    def toggle(self, *_):
+        """시그널 핸들러로 사용"""
+        if not self.stop():
+            self.start()
+    
+    def _run(self, duration):
+        own = threading.get_ident()
+        deadline = time.monotonic() + duration if duration else None
+        next_flush = time.monotonic() + 10
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                key = ";".join(reversed(stack))
+                self._counts[key] = self._counts.get(key, 0) + 1
+            self.samples += 1
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                break
+            if now >= next_flush:
+                self._flush()
+                next_flush = now + 10
+        self._flush()
+        logger.info(f"프로파일링 종료: 샘플 {self.samples}개")
+    
+    def _flush(self):
+        counts, self._counts = self._counts, {}
+        if not counts:
+            return
+        try:
+            if os.path.exists(self.output) and os.path.getsize(self.output) > self.max_bytes:
+                os.replace(self.output, self.output + ".1")
+            with open(self.output, "a") as f:
+                f.writelines(f"{stack} {count}\n" for stack, count in counts.items())
+        except OSError as e:
+            logger.warning(f"프로파일 기록 실패: {e}")
+
+# ==================== MQTT 5 발행 ====================
+class Mqtt5Publisher:
+    """토픽 별칭, 메시지 만료, 사용자 속성, 상관 데이터 (MQTT 3.1.1이면 속성 없이 발행)"""
+    
+    SCHEMA_VERSION = "1"
+    
+    def __init__(self, client, mqtt5=False):
+        self.client = client
+        self.mqtt5 = mqtt5
+        self.alias_maximum = 0
+        self._aliases = {}  # 토픽 -> 별칭
+        self._lock = threading.Lock()
+    
+    def on_connect(self, properties=None):
+        """연결(재연결)마다 호출 - 별칭은 연결마다 초기화"""
+        with self._lock:
+            self._aliases.clear()
+            self.alias_maximum = getattr(properties, "TopicAliasMaximum", 0) if properties else 0
+    
+    def publish(self, topic, payload, qos=1, expiry=None, user_properties=None, correlation_data=None):
+        if not self.mqtt5:
+            return self.client.publish(topic, payload, qos=qos)
+        
+        properties = Properties(PacketTypes.PUBLISH)
+        if expiry:
+            properties.MessageExpiryInterval = int(expiry)
+        for key, value in (user_properties or {}).items():
+            properties.UserProperty = (key, str(value))
+        if correlation_data:
+            properties.CorrelationData = correlation_data
+        
+        # 두 번째 메시지부터 토픽 문자열 대신 2바이트 별칭 (브로커가 허용한 개수 이내)
+        # QoS 1 이상은 끊기면 paho가 새 연결(별칭 없음)에 그대로 재전송하므로, CONNACK 전과 함께 별칭 없이 발행
+        with self._lock:
+            if qos or not self.client.is_connected():
+                return self.client.publish(topic, payload, qos=qos, properties=properties)
+            alias = self._aliases.get(topic)
+            if alias:
+                properties.TopicAlias = alias
+                topic = ""
+            elif len(self._aliases) < self.alias_maximum:
+                alias = len(self._aliases) + 1
+                self._aliases[topic] = alias
+                properties.TopicAlias = alias
+            return self.client.publish(topic, payload, qos=qos, properties=properties)
+
+# ==================== 발행 우선순위 레인 ====================
+DEFAULT_PUBLISH_LANES = {
+    "control": {"strict": True, "max_queue": 1000},
+    "telemetry": {"weight": 4, "max_queue": 5000},
+    "state": {"weight": 2, "max_queue": 100},
+}
+
+
+class _Item:
+    __slots__ = ("send", "on_done", "ack", "queued_at", "finish")
+    
+    def __init__(self, send, on_done, ack, queued_at, finish):
+        self.send = send
+        self.on_done = on_done
+        self.ack = ack
+        self.queued_at = queued_at
+        self.finish = finish
+
+
+class _Lane:
+    __slots__ = ("name", "strict", "weight", "rate", "burst", "max_queue", "queue", "tokens", "refilled_at",
+                 "finish", "sent", "failed", "dropped", "wait_total_ms", "wait_max_ms")
+    
+    def __init__(self, name, strict=False, weight=1, rate=None, burst=None, max_queue=1000):
+        self.name = name
+        self.strict = strict
+        self.weight = weight
+        self.rate = rate
+        self.burst = burst or max(1.0, rate or 0)
+        self.max_queue = max_queue
+        self.queue = deque()
+        self.tokens = self.burst
+        self.refilled_at = time.monotonic()
+        self.finish = 0.0  # 마지막으로 넣은 메시지의 가상 종료 시각
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+    
+    def delay(self, now):
+        """다음 메시지를 보낼 수 있을 때까지 남은 시간 (초, 속도 제한)"""
+        if not self.rate:
+            return 0.0
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rate)
+        self.refilled_at = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+    
+    def take(self, now):
+        item = self.queue.popleft()
+        if self.rate:
+            self.tokens -= 1
+        wait_ms = (now - item.queued_at) * 1000
+        self.wait_total_ms += wait_ms
+        self.wait_max_ms = max(self.wait_max_ms, wait_ms)
+        return item
+    
+    def stats(self):
+        done = self.sent + self.failed
+        return {
+            "queued": len(self.queue),
+            "sent": self.sent,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "wait_ms_avg": round(self.wait_total_ms / done, 1) if done else None,
+            "wait_ms_max": round(self.wait_max_ms, 1),
+            "priority": "strict" if self.strict else f"weight {self.weight}",
+            "rate": self.rate
+        }
+
+
+class LaneScheduler:
+    """
+    발행 우선순위 레인 (백로그/대량 텔레메트리 중에도 명령 ACK가 먼저 나가도록)
+    - strict 레인(control): 항상 먼저 전송 / 나머지: 가중 공정 큐잉 (크기/가중치로 가상 종료 시각)
+    - 레인별 속도 제한(초당 메시지 수)과 대기열 길이 제한, ACK(PUBACK)를 기다리는 데이터 메시지 수 제한
+    """
+    
+    def __init__(self, lanes=None, window=20, ack_timeout=30.0):
+        """
+        Args:
+            lanes: {레인 이름: {strict, weight, rate, burst, max_queue}} (기본 DEFAULT_PUBLISH_LANES)
+            window: ACK를 기다리는 데이터 메시지 최대 수 (ack=True로 넣은 메시지만 셈)
+            ack_timeout: 이 시간(초) 안에 acked()가 오지 않으면 창에서 뺌 (세션이 끊겨 PUBACK이 오지 않는 경우)
+        """
+        self.lanes = {name: _Lane(name, **options) for name, options in (lanes or DEFAULT_PUBLISH_LANES).items()}
+        self.window = window
+        self.ack_timeout = ack_timeout
+        
+        self._vtime = 0.0          # 가상 시각 (마지막으로 보낸 데이터 메시지의 가상 종료 시각)
+        self._in_flight = {}       # send()가 돌려준 키 -> 보낸 시각 (monotonic)
+        self._early_acks = set()   # send()가 끝나기 전에 도착한 ACK (ack 메시지를 보내는 중일 때만 보관)
+        self._sending_ack = False
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+    
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="outbound-lanes", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """전송 스레드 종료. 아직 대기 중인 메시지는 버리고 on_done(None) 호출 (call()로 기다리는 쪽이 풀리도록)"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=5)
+        with self._cond:
+            pending = []
+            for lane in self.lanes.values():
+                pending.extend(lane.queue)
+                lane.dropped += len(lane.queue)
+                lane.queue.clear()
+        for item in pending:
+            self._done(item, None)
+    
+    def submit(self, lane, send, size=1, on_done=None, ack=False):
+        """
+        발행 예약 (send는 전송 스레드에서 호출)
+        
+        Args:
+            lane: 레인 이름
+            send: 인자 없는 전송 함수. 실패하면 None 또는 False 반환
+            size: 메시지 크기 (바이트 등, 가중 공정 큐잉에 사용)
+            on_done: on_done(send 결과) - 전송 후 호출 (버려지면 None으로 호출)
+            ack: True면 send()가 돌려준 값을 acked()로 받을 때까지 전송 창을 차지
+        """
+        dropped = None
+        with self._cond:
+            target = self.lanes.get(lane)
+            if target is None:
+                raise ValueError(f"알 수 없는 레인: {lane}")
+            finish = 0.0
+            if not target.strict:
+                finish = target.finish = max(self._vtime, target.finish) + size / target.weight
+            if len(target.queue) >= target.max_queue:
+                dropped = target.queue.popleft()
+                target.dropped += 1
+            target.queue.append(_Item(send, on_done, ack, time.monotonic(), finish))
+            self._cond.notify()
+        if dropped is not None:
+            logger.warning(f"{lane} 레인 대기열 가득 참, 가장 오래된 메시지 버림")
+            self._done(dropped, None)
+    
+    def call(self, lane, send, size=1, ack=False, timeout=None):
+        """submit 후 전송될 때까지 기다려 send() 결과 반환 (시간 초과/버려지면 None)"""
+        done = threading.Event()
+        box = [None]
+        
+        def on_done(result):
+            box[0] = result
+            done.set()
+        
+        self.submit(lane, send, size, on_done, ack)
+        done.wait(timeout)
+        return box[0]
+    
+    def acked(self, key):
+        """전송 완료 확인 (MQTT on_publish에서 mid로 호출)"""
+        with self._cond:
+            if self._in_flight.pop(key, None) is not None:
+                self._cond.notify()
+            elif self._sending_ack:
+                self._early_acks.add(key)
+    
+    def stats(self):
+        with self._cond:
+            return {
+                "in_flight": len(self._in_flight),
+                "window": self.window,
+                "lanes": {name: lane.stats() for name, lane in self.lanes.items()}
+            }
+    
+    def _next_locked(self, now):
+        """(레인, 메시지, None). 보낼 것이 없으면 (None, None, 다시 확인할 때까지 대기 초 또는 None)"""
+        wait = None
+        for lane in self.lanes.values():
+            if lane.strict and lane.queue:
+                delay = lane.delay(now)
+                if not delay:
+                    return lane, lane.take(now), None
+                wait = delay if wait is None else min(wait, delay)
+        
+        # 전송 창이 차면 데이터 레인은 대기 (오래된 항목은 ACK를 못 받은 것으로 보고 정리)
+        if len(self._in_flight) >= self.window:
+            for key, sent_at in list(self._in_flight.items()):
+                if now - sent_at > self.ack_timeout:
+                    del self._in_flight[key]
+            if len(self._in_flight) >= self.window:
+                oldest = min(self._in_flight.values())
+                delay = max(0.01, self.ack_timeout - (now - oldest))
+                return None, None, delay if wait is None else min(wait, delay)
+        
+        best = None
+        for lane in self.lanes.values():
+            if lane.strict or not lane.queue:
+                continue
+            delay = lane.delay(now)
+            if delay:
+                wait = delay if wait is None else min(wait, delay)
+                continue
+            if best is None or lane.queue[0].finish < best.queue[0].finish:
+                best = lane
+        if best is None:
+            return None, None, wait
+        item = best.take(now)
+        self._vtime = item.finish
+        return best, item, None
+    
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if not self._running:
+                        return
+                    lane, item, wait = self._next_locked(time.monotonic())
+                    if lane is not None:
+                        break
+                    self._cond.wait(wait)
+                if item.ack:
+                    self._sending_ack = True
+            
+            result = None
+            try:
+                result = item.send()
+            except Exception as e:
+                logger.error(f"{lane.name} 레인 전송 오류: {e}")
+            
+            ok = result is not None and result is not False
+            with self._cond:
+                if ok:
+                    lane.sent += 1
+                else:
+                    lane.failed += 1
+                if item.ack:
+                    self._sending_ack = False
+                    if ok and result is not True and result not in self._early_acks:
+                        self._in_flight[result] = time.monotonic()
+                    self._early_acks.clear()
+            self._done(item, result)
+    
+    @staticmethod
+    def _done(item, result):
+        if item.on_done is None:
+            return
+        try:
+            item.on_done(result)
+        except Exception as e:
+            logger.error(f"전송 완료 콜백 오류: {e}")
+
 # ==================== MQTT 클라이언트 ====================
 class MQTTDevice:
     def __init__(self):
-        self.client = mqtt.Client()
+        # 고정 client_id + 영구 세션: 재연결 시 브로커가 구독과 끊긴 동안의 QoS1 명령을 보관
+        # (MQTT 5는 connect()의 clean_start=False + 세션 만료 시간으로 유지)
+        client_id = f"{Config.FARM_ID}-{Config.DEVICE_ID}"
+        if Config.MQTT_USE_V5:
+            self.client = mqtt.Client(client_id=client_id, protocol=mqtt.MQTTv5)
+        else:
+            self.client = mqtt.Client(client_id=client_id, clean_session=False)
+        self.publisher = Mqtt5Publisher(self.client, Config.MQTT_USE_V5)
+        self.batch_seq = 0
+        self.command_responses = {}  # command_id -> (응답 토픽, 상관 데이터), MQTT 5
         self.hardware = HardwareManager()
+        self.lanes = LaneScheduler(Config.PUBLISH_LANES, window=Config.PUBLISH_WINDOW)
         self.connected = False
+        self.connack_rc = None  # 마지막 CONNACK 결과 (연결 시도마다 초기화)
+        self.cached_state_sent = False
+        self.first_telemetry_sent = False
+        self.state_saved_at = None
         self.reconnect_count = 0
+        self.start_time = time.time()
+        
+        # MQTT 연결 감시 (paho 자체 재연결 대신 지터 백오프로 재연결)
+        self.supervisor = ConnectionSupervisor(
+            "mqtt",
+            self.connect,
+            close=self.client.disconnect,
+            service=lambda: self.client.loop(timeout=1.0) == mqtt.MQTT_ERR_SUCCESS,
+            base_delay=Config.RECONNECT_DELAY,
+            max_delay=Config.RECONNECT_MAX_DELAY,
+            max_attempts=Config.MAX_RECONNECT_ATTEMPTS,
+            open_timeout=Config.RECONNECT_COOLDOWN,
+            initial_jitter=Config.RECONNECT_INITIAL_JITTER
+        )
+        self.command_cache = CommandCache(
+            Config.COMMAND_CACHE_SIZE,
+            Config.COMMAND_CACHE_TTL,
+            Config.COMMAND_CACHE_FILE,
+            Config.COMMAND_CACHE_SAVE_INTERVAL
+        )
+        
+        # 펌프 동작 시간/시퀀스를 서버 왕복 없이 디바이스에서 처리
+        self.scheduler = ActuatorScheduler(Config.SCHEDULE_FILE)
+        self.scheduler.register("pump", self.hardware.control_pump, requires=Config.INTERLOCKS.get("pump"))
+        self.scheduler.register("led", self.hardware.control_led, requires=Config.INTERLOCKS.get("led"))
+        self.scheduler.register("fan", self.hardware.control_fan, requires=Config.INTERLOCKS.get("fan"))
+        
+        # 샘플링 프로파일러 (main()에서 SIGUSR2 핸들러 등록)
+        self.profiler = SamplingProfiler(Config.PROFILE_FILE, Config.PROFILE_INTERVAL, Config.PROFILE_MAX_BYTES)
+        
+        # 로컬 룰 엔진 (조건식은 여기서 한 번만 컴파일)
+        self.rule_engine = RuleEngine(Config.RULES, {
+            name: (lambda state, name=name: self.scheduler.set(name, state))
+            for name in ("pump", "led", "fan")
+        })
         
         # MQTT 콜백 설정
         self.client.on_connect = self.on_connect
@@ -198,25 +1489,35 @@ class MQTTDevice:
         if Config.MQTT_USE_TLS:
             self.client.tls_set()
     
-    def on_connect(self, client, userdata, flags, rc):
-        """MQTT 연결 콜백"""
+    def on_connect(self, client, userdata, flags, rc, properties=None):
+        """MQTT 연결 콜백 (MQTT 5면 CONNACK 속성도 전달됨)"""
+        self.connack_rc = rc
         if rc == 0:
             self.connected = True
             self.reconnect_count = 0
             logger.info("MQTT 브로커 연결 성공")
+            self.publisher.on_connect(properties)
             
-            # 토픽 구독
-            self.subscribe_topics()
+            # 브로커에 세션이 남아 있으면 구독도 유지되어 있음
+            if not flags.get("session present"):
+                self.subscribe_topics()
             
             # 디바이스 등록
             self.register_device()
             
+            # 재시작 직후 첫 연결: 센서 초기화를 기다리지 않고 마지막 측정값부터 발행
+            if not self.cached_state_sent:
+                self.cached_state_sent = True
+                self.publish_cached_state()
+        
         else:
             logger.error(f"MQTT 연결 실패: {rc}")
     
-    def on_disconnect(self, client, userdata, rc):
+    def on_disconnect(self, client, userdata, rc, properties=None):
         """MQTT 연결 끊김 콜백"""
         self.connected = False
+        if rc != 0:
+            self.reconnect_count += 1
         logger.warning(f"MQTT 연결 끊김: {rc}")
     
     def on_message(self, client, userdata, msg):
@@ -230,16 +1531,17 @@ class MQTTDevice:
             
             # 명령 처리
             if "/command" in topic:
-                self.handle_command(payload)
+                self.handle_command(payload, getattr(msg, "properties", None))
             elif "/config" in topic:
                 self.handle_config(payload)
-                
+        
         except Exception as e:
             logger.error(f"메시지 처리 실패: {e}")
     
     def on_publish(self, client, userdata, mid):
-        """메시지 발행 콜백"""
+        """메시지 발행 콜백 (PUBACK 수신 → 발행 레인의 전송 창 반환)"""
         logger.debug(f"메시지 발행 완료: {mid}")
+        self.lanes.acked(mid)
     
     def subscribe_topics(self):
         """토픽 구독"""
@@ -249,7 +1551,7 @@ class MQTTDevice:
         ]
         
         for topic in topics:
-            self.client.subscribe(topic)
+            self.client.subscribe(topic, qos=1)
             logger.info(f"토픽 구독: {topic}")
     
     def register_device(self):
@@ -266,39 +1568,74 @@ class MQTTDevice:
                 "led_control",
                 "fan_control"
             ],
-            "timestamp": datetime.utcnow().isoformat() + "Z"
+            "timestamp": clock.now_iso()
         }
         
         topic = f"farms/{Config.FARM_ID}/devices/{Config.DEVICE_ID}/registry"
-        self.publish_message(topic, registry_data)
+        self.publish_message(topic, registry_data, lane="state")
     
-    def handle_command(self, command: Dict[str, Any]):
+    def handle_command(self, command: Dict[str, Any], properties=None):
         """명령 처리"""
         try:
             action = command.get("action")
             parameters = command.get("parameters", {})
             command_id = command.get("command_id", "unknown")
             
+            # MQTT 5: ACK를 요청자가 지정한 응답 토픽으로, 상관 데이터를 붙여 전송 (서버가 페이로드 파싱 없이 매칭)
+            response_topic = getattr(properties, "ResponseTopic", None)
+            correlation_data = getattr(properties, "CorrelationData", None)
+            
+            # 이미 실행한 명령이면 액추에이터를 다시 움직이지 않고 캐시된 ACK만 재전송
+            cached_ack = self.command_cache.get(command_id)
+            if cached_ack is not None:
+                logger.info(f"중복 명령 무시: {command_id}")
+                self.publish_message(response_topic or self.get_ack_topic(), cached_ack,
+                                     correlation_data=correlation_data, lane="control")
+                return
+            # 실행 중인 명령의 QoS1 재전송은 다시 실행하지 않음 (실행이 끝나면 보내는 ACK가 응답)
+            if not self.command_cache.begin(command_id):
+                logger.info(f"실행 중인 명령 무시: {command_id}")
+                return
+            
+            if response_topic:
+                self.command_responses[command_id] = (response_topic, correlation_data)
+            
             success = False
             
-            if action == "pump_on":
-                success = self.hardware.control_pump(True)
+            if action in ("pump_on", "led_on", "fan_on") and parameters.get("duration"):
+                # 지정 시간 후 디바이스에서 자동으로 OFF
+                actuator = action[:-3]
+                success = self.scheduler.pulse(actuator, parameters["duration"], job_id=command_id) is not None
+            elif action == "pump_on":
+                success = self.scheduler.set("pump", True)
             elif action == "pump_off":
-                success = self.hardware.control_pump(False)
+                success = self.scheduler.set("pump", False)
             elif action == "led_on":
-                success = self.hardware.control_led(True)
+                success = self.scheduler.set("led", True)
             elif action == "led_off":
-                success = self.hardware.control_led(False)
+                success = self.scheduler.set("led", False)
             elif action == "fan_on":
-                success = self.hardware.control_fan(True)
+                success = self.scheduler.set("fan", True)
             elif action == "fan_off":
-                success = self.hardware.control_fan(False)
+                success = self.scheduler.set("fan", False)
+            elif action == "sequence":
+                # 예: {"steps": [{"actuator": "fan", "state": true, "wait": 0}, {"actuator": "pump", "state": true, "wait": 5}, ...]}
+                steps = [(step["actuator"], step["state"] in (True, "on"), step.get("wait", 0)) for step in parameters.get("steps", [])]
+                success = self.scheduler.run_sequence(steps, job_id=command_id) is not None
+            elif action == "cancel_schedule":
+                success = self.scheduler.cancel(parameters.get("job_id"))
+            elif action == "profile":
+                # 예: {"state": "start", "duration": 60} / {"state": "stop"}
+                if parameters.get("state", "start") == "stop":
+                    success = self.profiler.stop()
+                else:
+                    success = self.profiler.start(parameters.get("duration"))
             else:
                 logger.warning(f"알 수 없는 명령: {action}")
             
             # 명령 확인 응답
             self.send_command_ack(command_id, success)
-            
+        
         except Exception as e:
             logger.error(f"명령 처리 실패: {e}")
             self.send_command_ack(command.get("command_id", "unknown"), False)
@@ -316,44 +1653,137 @@ class MQTTDevice:
         ack_data = {
             "command_id": command_id,
             "success": success,
-            "timestamp": datetime.utcnow().isoformat() + "Z"
+            "timestamp": clock.now_iso()
         }
         
-        topic = f"farms/{Config.FARM_ID}/devices/{Config.DEVICE_ID}/command/ack"
-        self.publish_message(topic, ack_data)
+        self.command_cache.put(command_id, ack_data)
+        response_topic, correlation_data = self.command_responses.pop(command_id, (None, None))
+        self.publish_message(response_topic or self.get_ack_topic(), ack_data,
+                             correlation_data=correlation_data, lane="control")
+    
+    def get_ack_topic(self) -> str:
+        """ACK 토픽 반환"""
+        return f"farms/{Config.FARM_ID}/devices/{Config.DEVICE_ID}/command/ack"
     
-    def publish_message(self, topic: str, data: Dict[str, Any]):
-        """메시지 발행"""
+    def publish_message(self, topic: str, data: Dict[str, Any], user_properties: Optional[Dict[str, Any]] = None,
+                        correlation_data: Optional[bytes] = None, expiry: Optional[int] = None,
+                        lane: str = "telemetry"):
+        """
+        메시지 발행 (사용자 속성/상관 데이터/만료는 MQTT 5에서만 전송)
+        lane: 발행 레인 - control(명령 ACK, 항상 먼저) / telemetry / state (가중치에 따라 번갈아)
+        """
         try:
             payload = json.dumps(data)
-            result = self.client.publish(topic, payload, qos=1)
             
-            if result.rc == mqtt.MQTT_ERR_SUCCESS:
+            def send():
+                result = self.publisher.publish(
+                    topic, payload, qos=1, expiry=expiry,
+                    user_properties=user_properties, correlation_data=correlation_data
+                )
+                if result.rc != mqtt.MQTT_ERR_SUCCESS:
+                    logger.error(f"메시지 발행 실패: {topic}, {result.rc}")
+                    return None
                 logger.debug(f"메시지 발행 성공: {topic}")
-            else:
-                logger.error(f"메시지 발행 실패: {topic}, {result.rc}")
-                
+                return result.mid
+            
+            # control 외 레인은 PUBACK까지 전송 창을 차지 (paho 내부 대기열에 데이터 메시지가 쌓이지 않도록)
+            self.lanes.submit(lane, send, size=len(payload), ack=lane != "control")
+        
         except Exception as e:
             logger.error(f"메시지 발행 오류: {e}")
     
     def send_telemetry(self):
-        """센서 데이터 전송"""
+        """센서 데이터 수집, 로컬 룰 평가 및 전송"""
         try:
-            # 온습도 데이터
             temp_humidity = self.hardware.read_temperature_humidity()
+            soil_data = self.hardware.read_soil_moisture()
+            
+            # 로컬 룰 평가 (MQTT 연결 여부와 무관)
+            values = {}
             if temp_humidity:
-                topic = f"farms/{Config.FARM_ID}/devices/{Config.DEVICE_ID}/telemetry"
-                self.publish_message(topic, temp_humidity)
+                values["temperature"] = temp_humidity["temperature"]
+                values["humidity"] = temp_humidity["humidity"]
+            if soil_data:
+                values["soil_moisture"] = soil_data["moisture"]
+                values["soil_temperature"] = soil_data["temperature"]
+            self.rule_engine.update(values)
+            self.rule_engine.tick()
             
-            # 토양 수분 데이터
-            soil_data = self.hardware.read_soil_moisture()
+            if not self.connected:
+                return
+            
+            topic = f"farms/{Config.FARM_ID}/devices/{Config.DEVICE_ID}/telemetry"
+            user_properties = {"schema": Mqtt5Publisher.SCHEMA_VERSION, "batch_seq": self.batch_seq}
+            self.batch_seq += 1
+            
+            self.save_state([reading for reading in (temp_humidity, soil_data) if reading])
+            
+            # 온습도 데이터 (측정 시각은 epoch ms로 들고 있다가 전송할 때 문자열로 변환)
+            if temp_humidity:
+                temp_humidity = self.with_trace(temp_humidity)
+                temp_humidity["timestamp"] = clock.format(temp_humidity["timestamp"])
+                self.publish_message(topic, temp_humidity, user_properties, expiry=Config.MESSAGE_EXPIRY)
+            
+            # 토양 수분 데이터 (MQTT 5면 같은 토픽이므로 별칭으로 전송)
             if soil_data:
-                topic = f"farms/{Config.FARM_ID}/devices/{Config.DEVICE_ID}/telemetry"
-                self.publish_message(topic, soil_data)
-                
+                soil_data = self.with_trace(soil_data)
+                soil_data["timestamp"] = clock.format(soil_data["timestamp"])
+                self.publish_message(topic, soil_data, user_properties, expiry=Config.MESSAGE_EXPIRY)
+            
+            if not self.first_telemetry_sent and (temp_humidity or soil_data):
+                self.first_telemetry_sent = True
+                logger.info(f"첫 텔레메트리 전송: 시작 후 {time.monotonic() - STARTED_AT:.1f}초")
+        
         except Exception as e:
             logger.error(f"텔레메트리 전송 실패: {e}")
     
+    def save_state(self, readings):
+        """마지막 측정값 저장 (STATE_SAVE_INTERVAL마다 최대 한 번, 임시 파일 → os.replace로 원자적 교체)"""
+        if not Config.STATE_FILE or not readings:
+            return
+        now = time.monotonic()
+        if self.state_saved_at is not None and now - self.state_saved_at < Config.STATE_SAVE_INTERVAL:
+            return
+        self.state_saved_at = now
+        tmp_path = f"{Config.STATE_FILE}.tmp"
+        try:
+            os.makedirs(os.path.dirname(Config.STATE_FILE), exist_ok=True)
+            with open(tmp_path, "w") as f:
+                json.dump(readings, f)
+            os.replace(tmp_path, Config.STATE_FILE)
+        except OSError as e:
+            logger.warning(f"상태 저장 실패: {e}")
+    
+    def publish_cached_state(self):
+        """저장된 마지막 측정값 발행 (원래 측정 시각 유지, cached 표시)"""
+        if not Config.STATE_FILE:
+            return
+        try:
+            with open(Config.STATE_FILE) as f:
+                readings = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"상태 캐시 읽기 실패: {e}")
+            return
+        
+        topic = f"farms/{Config.FARM_ID}/devices/{Config.DEVICE_ID}/telemetry"
+        for reading in readings:
+            reading = dict(reading, cached=True, timestamp=clock.format(reading["timestamp"]))
+            self.publish_message(topic, reading, {"schema": Mqtt5Publisher.SCHEMA_VERSION, "cached": True},
+                                 expiry=Config.MESSAGE_EXPIRY)
+        logger.info(f"캐시된 마지막 측정값 발행: {len(readings)}건 (시작 후 {time.monotonic() - STARTED_AT:.1f}초)")
+    
+    def with_trace(self, reading):
+        """샘플링된 측정값에 추적 컨텍스트 추가 (센서 읽기 → 발행 시각, epoch ms)"""
+        reading = dict(reading)
+        if random.random() < Config.TRACE_SAMPLE_RATE:
+            reading["trace"] = {
+                "id": os.urandom(8).hex(),
+                "hops": [["read", reading["timestamp"]], ["publish", clock.now_ms()]]
+            }
+        return reading
+    
     def send_heartbeat(self):
         """하트비트 전송"""
         try:
@@ -361,22 +1791,39 @@ class MQTTDevice:
                 "device_id": Config.DEVICE_ID,
                 "status": "online",
                 "uptime": time.time() - self.start_time,
-                "timestamp": datetime.utcnow().isoformat() + "Z"
+                "timestamp": clock.now_iso()
             }
             
             topic = f"farms/{Config.FARM_ID}/devices/{Config.DEVICE_ID}/state"
-            self.publish_message(topic, heartbeat_data)
-            
+            self.publish_message(topic, heartbeat_data, lane="state")
+        
         except Exception as e:
             logger.error(f"하트비트 전송 실패: {e}")
     
     def connect(self):
-        """MQTT 브로커 연결"""
+        """MQTT 브로커 연결 (CONNACK까지 대기, 브로커가 거부하면 False → 연결 감시자가 실패로 셈)"""
         try:
             logger.info(f"MQTT 브로커 연결 시도: {Config.MQTT_BROKER_HOST}:{Config.MQTT_BROKER_PORT}")
-            self.client.connect(Config.MQTT_BROKER_HOST, Config.MQTT_BROKER_PORT, 60)
-            self.start_time = time.time()
-            return True
+            kwargs = {}
+            if Config.MQTT_USE_V5:
+                properties = Properties(PacketTypes.CONNECT)
+                properties.SessionExpiryInterval = Config.MQTT_SESSION_EXPIRY
+                kwargs = {"clean_start": False, "properties": properties}
+            self.connack_rc = None
+            rc = self.client.connect(Config.MQTT_BROKER_HOST, Config.MQTT_BROKER_PORT, Config.MQTT_KEEPALIVE, **kwargs)
+            if rc != mqtt.MQTT_ERR_SUCCESS:
+                return False
+            
+            deadline = time.monotonic() + Config.MQTT_CONNECT_TIMEOUT
+            while self.connack_rc is None and time.monotonic() < deadline:
+                if self.client.loop(timeout=0.5) != mqtt.MQTT_ERR_SUCCESS:
+                    break
+            if self.connack_rc == 0:
+                return True
+            if self.connack_rc is None:
+                logger.error("MQTT CONNACK 시간 초과")
+            self.client.disconnect()
+            return False
         except Exception as e:
             logger.error(f"MQTT 연결 실패: {e}")
             return False
@@ -384,12 +1831,16 @@ class MQTTDevice:
     def start(self):
         """디바이스 시작"""
         try:
-            # MQTT 연결
-            if not self.connect():
-                return False
+            # MQTT 연결 감시 시작 (연결 실패 시 백오프 후 계속 재시도, 그동안 로컬 제어는 동작)
+            # 하드웨어 초기화보다 먼저 시작해 연결과 센서 준비가 겹치도록 함
+            self.lanes.start()
+            self.supervisor.start()
             
-            # 메인 루프 시작
-            self.client.loop_start()
+            # 하드웨어 초기화 (GPIO / 온습도 / 토양 센서 동시 진행)
+            self.hardware.init()
+            
+            # 액추에이터 스케줄러 시작 (저장된 스케줄 복원)
+            self.scheduler.start()
             
             # 데이터 전송 스레드 시작
             telemetry_thread = threading.Thread(target=self.telemetry_loop, daemon=True)
@@ -400,7 +1851,7 @@ class MQTTDevice:
             
             logger.info("라즈베리파이5 디바이스 시작 완료")
             return True
-            
+        
         except Exception as e:
             logger.error(f"디바이스 시작 실패: {e}")
             return False
@@ -409,8 +1860,8 @@ class MQTTDevice:
         """텔레메트리 전송 루프"""
         while True:
             try:
-                if self.connected:
-                    self.send_telemetry()
+                # 오프라인에서도 로컬 룰이 동작하도록 센서는 항상 읽음
+                self.send_telemetry()
                 time.sleep(Config.TELEMETRY_INTERVAL)
             except Exception as e:
                 logger.error(f"텔레메트리 루프 오류: {e}")
@@ -431,8 +1882,11 @@ class MQTTDevice:
         """디바이스 중지"""
         try:
             logger.info("디바이스 중지 중...")
-            self.client.loop_stop()
-            self.client.disconnect()
+            self.command_cache.flush()
+            self.scheduler.stop()
+            self.profiler.stop()
+            self.supervisor.stop()
+            self.lanes.stop()
             self.hardware.cleanup()
             logger.info("디바이스 중지 완료")
         except Exception as e:
@@ -446,8 +1900,13 @@ def main():
     try:
         logger.info("라즈베리파이5 스마트팜 디바이스 시작")
         
+        # 스레드 스택 크기 (이후 만드는 스레드에만 적용되므로 디바이스 생성 전에 설정)
+        if Config.THREAD_STACK_KB:
+            threading.stack_size(Config.THREAD_STACK_KB * 1024)
+        
         # 디바이스 생성 및 시작
         device = MQTTDevice()
+        signal.signal(signal.SIGUSR2, device.profiler.toggle)  # kill -USR2 <pid>로 프로파일링 켜고 끄기
         if not device.start():
             logger.error("디바이스 시작 실패")
             return
@@ -0,0 +1,79 @@
+-- =====================================================
+-- Universal Bridge: 텔레메트리 일괄 업로드 진행 위치
+-- =====================================================
+--
+-- POST /api/bridge/telemetry/bulk 이어받기용 (업로드별 저장 완료한 줄 수)
+-- 측정값 배치와 진행 위치를 한 트랜잭션으로 저장하므로
+-- Bridge가 재시작되거나 같은 업로드가 동시에 들어와도 같은 줄을 두 번 저장하지 않음
+--
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS iot_bulk_uploads (
+  tenant_id UUID NOT NULL REFERENCES tenants(id) ON DELETE CASCADE,
+  device_id UUID NOT NULL REFERENCES iot_devices(id) ON DELETE CASCADE,
+  upload_id TEXT NOT NULL,
+  line_offset INT NOT NULL DEFAULT 0,
+  created_at TIMESTAMPTZ DEFAULT NOW(),
+  updated_at TIMESTAMPTZ DEFAULT NOW(),
+  PRIMARY KEY (tenant_id, device_id, upload_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_iot_bulk_uploads_updated_at
+  ON iot_bulk_uploads(updated_at);
+
+ALTER TABLE iot_bulk_uploads ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Service role full access to iot_bulk_uploads" ON iot_bulk_uploads;
+CREATE POLICY "Service role full access to iot_bulk_uploads" ON iot_bulk_uploads
+  FOR ALL
+  TO service_role
+  USING (true)
+  WITH CHECK (true);
+
+-- 배치 저장: 저장된 위치가 p_start일 때만 측정값을 넣고 위치를 p_end로 옮김
+-- 반환값은 저장된 위치 (p_end가 아니면 다른 요청이 먼저 저장한 것이므로 아무것도 넣지 않음)
+CREATE OR REPLACE FUNCTION insert_bulk_readings(
+  p_tenant_id UUID,
+  p_device_id UUID,
+  p_upload_id TEXT,
+  p_start INT,
+  p_end INT,
+  p_readings JSONB
+)
+RETURNS INT AS $$
+DECLARE
+  current_offset INT;
+BEGIN
+  INSERT INTO iot_bulk_uploads (tenant_id, device_id, upload_id)
+  VALUES (p_tenant_id, p_device_id, p_upload_id)
+  ON CONFLICT DO NOTHING;
+
+  SELECT line_offset INTO current_offset
+  FROM iot_bulk_uploads
+  WHERE tenant_id = p_tenant_id AND device_id = p_device_id AND upload_id = p_upload_id
+  FOR UPDATE;
+
+  IF current_offset <> p_start THEN
+    RETURN current_offset;
+  END IF;
+
+  INSERT INTO iot_readings (tenant_id, device_id, ts, key, value, unit, quality, schema_version)
+  SELECT p_tenant_id, p_device_id, r.ts, r.key, r.value, r.unit, r.quality, 'v1'
+  FROM jsonb_to_recordset(p_readings) AS r(ts TIMESTAMPTZ, key TEXT, value NUMERIC, unit TEXT, quality TEXT);
+
+  UPDATE iot_bulk_uploads
+  SET line_offset = p_end, updated_at = NOW()
+  WHERE tenant_id = p_tenant_id AND device_id = p_device_id AND upload_id = p_upload_id;
+
+  RETURN p_end;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 오래된 업로드 위치 정리 (7일 이상 갱신 없음)
+CREATE OR REPLACE FUNCTION cleanup_stale_bulk_uploads()
+RETURNS void AS $$
+BEGIN
+  DELETE FROM iot_bulk_uploads
+  WHERE updated_at < NOW() - INTERVAL '7 days';
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+디바이스 내장 액추에이터 스케줄러
+펌프 동작 시간, 다단계 시퀀스(밸브 열기 → 펌프 ON → 대기 → 펌프 OFF → 밸브 닫기),
+인터록을 서버 왕복 없이 디바이스에서 직접 처리
+
+- 힙(heapq) 기반 타이머: 다음 실행 시각까지 스레드가 대기
+- 인터록: 필수 액추에이터가 켜져 있지 않으면 ON 단계 거부 후 시퀀스 중단
+- 중단/취소 시 남은 OFF 단계는 즉시 실행 (펌프가 켜진 채로 남지 않도록)
+- 대기 중인 스케줄은 JSON 파일에 저장되어 재시작 후에도 이어서 실행
+"""
+
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+
+
+class ActuatorScheduler:
+    def __init__(self, persist_path=None):
+        """
+        Args:
+            persist_path: 대기 중인 스케줄을 저장할 JSON 파일 경로 (None이면 저장 안 함)
+        """
+        self.persist_path = persist_path
+        self.states = {}           # 액추에이터 이름 -> 현재 상태
+        self._setters = {}         # 액추에이터 이름 -> setter(state) -> bool
+        self._interlocks = {}      # 액추에이터 이름 -> ON 전에 켜져 있어야 하는 액추에이터 목록
+        self._jobs = {}            # job_id -> {"steps": [(name, state, wait)], "index": int, "gen": int, "due": float}
+        self._heap = []            # (실행 시각(monotonic), 순번, job_id, gen)
+        self._seq = itertools.count()
+        self._cond = threading.Condition(threading.RLock())
+        self._running = False
+        self._thread = None
+
+    # ---------- 설정 ----------
+
+    def register(self, name, setter, requires=None, initial_state=False):
+        """액추에이터 등록 (requires: ON 되기 전에 켜져 있어야 하는 액추에이터 목록)"""
+        with self._cond:
+            self._setters[name] = setter
+            self.states[name] = initial_state
+            if requires:
+                self._interlocks[name] = list(requires)
+
+    def start(self):
+        """스케줄러 스레드 시작 (저장된 스케줄 복원)"""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            self._restore_locked()
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """스케줄러 스레드 중지 (대기 중인 스케줄은 파일에 남겨둠)"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=2)
+
+    # ---------- 제어 API ----------
+
+    def set(self, name, state):
+        """즉시 상태 변경 (해당 액추에이터의 대기 중인 스케줄은 취소)"""
+        with self._cond:
+            self._cancel_conflicts_locked({name})
+            ok = self._apply_locked(name, state)
+            self._save_locked()
+            return ok
+
+    def pulse(self, name, duration, state=True, job_id=None):
+        """지정 시간 동안 상태 유지 후 원래대로 복귀 (예: 펌프 300초 ON)"""
+        return self.run_sequence([(name, state, 0), (name, not state, duration)], job_id)
+
+    def run_sequence(self, steps, job_id=None):
+        """
+        다단계 시퀀스 실행
+
+        Args:
+            steps: [(액추에이터 이름, 상태, 이전 단계로부터 대기 시간(초)), ...]
+            job_id: 작업 ID (None이면 자동 생성)
+
+        Returns:
+            job_id (인터록으로 즉시 중단되면 None)
+        """
+        steps = [(name, state, float(wait)) for name, state, wait in steps]
+        for name, _, _ in steps:
+            if name not in self._setters:
+                raise KeyError(f"등록되지 않은 액추에이터: {name}")
+
+        with self._cond:
+            job_id = job_id or f"job-{int(time.time())}-{next(self._seq)}"
+            self._cancel_conflicts_locked({name for name, _, _ in steps})
+            self._jobs[job_id] = {"steps": steps, "index": 0, "gen": 0, "due": 0.0}
+
+            # 대기 시간 0인 앞쪽 단계는 호출 스레드에서 바로 실행
+            job = self._jobs[job_id]
+            while job["index"] < len(steps) and steps[job["index"]][2] <= 0:
+                if not self._execute_step_locked(job_id, job):
+                    self._save_locked()
+                    return None
+
+            if job["index"] < len(steps):
+                self._schedule_locked(job_id, job, time.monotonic() + steps[job["index"]][2])
+            else:
+                del self._jobs[job_id]
+
+            self._save_locked()
+            return job_id
+
+    def cancel(self, job_id):
+        """작업 취소 (남은 OFF 단계는 즉시 실행)"""
+        with self._cond:
+            if job_id not in self._jobs:
+                return False
+            self._abort_locked(job_id)
+            self._save_locked()
+            return True
+
+    def pending(self):
+        """대기 중인 작업 요약 (상태 보고용)"""
+        now = time.monotonic()
+        with self._cond:
+            return [
+                {
+                    "job_id": job_id,
+                    "next_step": job["steps"][job["index"]][0],
+                    "remaining_steps": len(job["steps"]) - job["index"],
+                    "due_in": round(max(0.0, job["due"] - now), 1)
+                }
+                for job_id, job in self._jobs.items()
+            ]
+
+    # ---------- 내부 처리 ----------
+
+    def _run(self):
+        with self._cond:
+            while self._running:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+
+                due, _, job_id, gen = self._heap[0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+
+                heapq.heappop(self._heap)
+                job = self._jobs.get(job_id)
+                if job is None or job["gen"] != gen:
+                    continue  # 취소되었거나 재스케줄된 항목
+
+                if self._execute_step_locked(job_id, job):
+                    if job["index"] < len(job["steps"]):
+                        self._schedule_locked(job_id, job, time.monotonic() + job["steps"][job["index"]][2])
+                    else:
+                        del self._jobs[job_id]
+                self._save_locked()
+
+    def _execute_step_locked(self, job_id, job):
+        """현재 단계 실행. 실패하면 작업을 중단하고 False 반환"""
+        name, state, _ = job["steps"][job["index"]]
+        if not self._apply_locked(name, state):
+            print(f"⚠️ 시퀀스 중단: {job_id} ({name} 제어 실패)")
+            self._abort_locked(job_id)
+            return False
+        job["index"] += 1
+        return True
+
+    def _apply_locked(self, name, state):
+        """인터록 확인 후 실제 액추에이터 제어"""
+        if state:
+            blocked = [req for req in self._interlocks.get(name, []) if not self.states.get(req)]
+            if blocked:
+                print(f"⛔ 인터록: {name} ON 거부 ({', '.join(blocked)} 꺼짐)")
+                return False
+
+        try:
+            ok = self._setters[name](state)
+        except Exception as e:
+            print(f"❌ 액추에이터 제어 오류 {name}: {e}")
+            ok = False
+
+        if ok is not False:
+            self.states[name] = state
+            return True
+        return False
+
+    def _schedule_locked(self, job_id, job, due):
+        job["gen"] += 1
+        job["due"] = due
+        heapq.heappush(self._heap, (due, next(self._seq), job_id, job["gen"]))
+        self._cond.notify()
+
+    def _abort_locked(self, job_id, skip=()):
+        """작업 제거 후 남은 OFF 단계만 즉시 실행 (skip에 포함된 액추에이터 제외)"""
+        job = self._jobs.pop(job_id)
+        for name, state, _ in job["steps"][job["index"]:]:
+            if not state and name not in skip:
+                self._apply_locked(name, state)
+
+    def _cancel_conflicts_locked(self, names):
+        """같은 액추에이터를 다루는 기존 작업 취소 (마지막 명령 우선)"""
+        for job_id in [j for j, job in self._jobs.items()
+                       if names & {name for name, _, _ in job["steps"][job["index"]:]}]:
+            self._abort_locked(job_id, skip=names)
+
+    def _save_locked(self):
+        if not self.persist_path:
+            return
+
+        offset = time.time() - time.monotonic()
+        data = [
+            {
+                "job_id": job_id,
+                "steps": job["steps"][job["index"]:],
+                "due_at": job["due"] + offset
+            }
+            for job_id, job in self._jobs.items()
+        ]
+        tmp_path = f"{self.persist_path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.persist_path)
+        except OSError as e:
+            print(f"⚠️ 스케줄 저장 실패: {e}")
+
+    def _restore_locked(self):
+        """저장된 스케줄 복원 (지난 시각의 단계는 바로 실행됨)"""
+        if not self.persist_path:
+            return
+
+        try:
+            with open(self.persist_path, 'r') as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+
+        offset = time.time() - time.monotonic()
+        for item in data:
+            steps = [tuple(step) for step in item["steps"] if step[0] in self._setters]
+            if not steps:
+                continue
+            job = {"steps": steps, "index": 0, "gen": 0, "due": 0.0}
+            self._jobs[item["job_id"]] = job
+            self._schedule_locked(item["job_id"], job, item["due_at"] - offset)
+
+        if self._jobs:
+            print(f"⏰ 스케줄 복원: {len(self._jobs)}개 작업")
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+카메라 촬영 파이프라인
+명령 처리 스레드를 막지 않도록 촬영/리사이즈/업로드를 백그라운드에서 처리
+
+- 카메라는 picamera2로 한 번만 열어 유지 (없으면 촬영마다 libcamera-still 실행)
+- 촬영 요청은 크기 제한 큐에 넣고 즉시 반환 (큐가 가득 차면 거절)
+- 디바이스에서 썸네일 생성 (Pillow, JPEG draft 모드로 축소 디코딩)
+- 이미지 인덱스(개수/용량/최신 파일)를 증분 관리하여 디렉터리 재스캔 없음
+- Bridge로 청크 단위 업로드, 확인된 오프셋을 저장해 중단 지점부터 이어서 전송
+
+업로드 프로토콜 (청크마다):
+    PUT /api/bridge/images/<device_id>/<파일명>
+    Content-Range: bytes <시작>-<끝>/<전체 크기>
+    → 200/201: 완료, 308/416: 다음 청크 (응답 헤더 x-upload-offset = 서버가 받은 바이트 수)
+    → 408/429를 제외한 4xx: 다시 보내도 실패하므로 업로드 실패로 표시하고 다음 파일로 넘어감
+"""
+
+import json
+import os
+import queue
+import re
+import subprocess
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+
+FAILED = -1  # 업로드 상태: 서버가 거부한 파일
+TAG_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,32}$")  # 파일명/업로드 URL에 들어가는 촬영 태그
+
+
+class ImageIndex:
+    """이미지 디렉터리 인덱스 (시작 시 한 번만 스캔, 이후 증분 갱신)"""
+
+    def __init__(self, image_dir, state_path=None):
+        self.image_dir = image_dir
+        self.state_path = state_path
+        self.count = 0
+        self.total_bytes = 0
+        self.newest = None
+        self.uploads = {}  # 업로드 대기 파일명 -> 서버가 확인한 오프셋 (FAILED면 서버가 거부해 재시도 안 함)
+        self._lock = threading.Lock()
+
+        os.makedirs(image_dir, exist_ok=True)
+        self._scan()
+        self._load_state()
+
+    def _scan(self):
+        newest_mtime = 0
+        for entry in os.scandir(self.image_dir):
+            if entry.name.endswith('.jpg') and not entry.name.endswith('_thumb.jpg') and entry.is_file():
+                stat = entry.stat()
+                self.count += 1
+                self.total_bytes += stat.st_size
+                if stat.st_mtime > newest_mtime:
+                    newest_mtime = stat.st_mtime
+                    self.newest = entry.name
+
+    def _load_state(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, 'r') as f:
+                self.uploads = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ 업로드 상태 로드 실패: {e}")
+
+    def _save_state(self):
+        if not self.state_path:
+            return
+        tmp_path = f"{self.state_path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self.uploads, f)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            print(f"⚠️ 업로드 상태 저장 실패: {e}")
+
+    def add(self, name, size):
+        with self._lock:
+            self.count += 1
+            self.total_bytes += size
+            self.newest = name
+            self.uploads.setdefault(name, 0)
+            self._save_state()
+
+    def remove(self, name, size):
+        with self._lock:
+            self.count -= 1
+            self.total_bytes -= size
+            self.uploads.pop(name, None)
+            self._save_state()
+
+    def set_offset(self, name, offset, done=False):
+        with self._lock:
+            if done:
+                self.uploads.pop(name, None)
+            else:
+                self.uploads[name] = offset
+            self._save_state()
+
+    def get_offset(self, name):
+        with self._lock:
+            return self.uploads.get(name, 0)
+
+    def mark_failed(self, name):
+        """서버가 거부한 파일 (재시작해도 다시 업로드하지 않음, 로컬 파일은 유지)"""
+        self.set_offset(name, FAILED)
+
+    def pending_uploads(self):
+        """업로드가 끝나지 않은 파일명 목록 (오래된 순, 실패 표시된 파일 제외)"""
+        with self._lock:
+            return sorted(name for name, offset in self.uploads.items() if offset != FAILED)
+
+    def summary(self):
+        with self._lock:
+            return {
+                "image_count": self.count,
+                "image_bytes": self.total_bytes,
+                "latest_image": self.newest,
+                "images_pending_upload": sum(1 for offset in self.uploads.values() if offset != FAILED),
+                "images_failed_upload": sum(1 for offset in self.uploads.values() if offset == FAILED)
+            }
+
+
+class CameraPipeline:
+    def __init__(self, image_dir, index, resolution=(640, 480), quality=80,
+                 thumbnail_size=(160, 120), queue_size=4, uploader=None):
+        """
+        Args:
+            image_dir: 이미지 저장 디렉터리
+            index: ImageIndex
+            resolution: 촬영 해상도
+            quality: JPEG 품질
+            thumbnail_size: 썸네일 최대 크기 (None이면 생성 안 함)
+            queue_size: 대기 가능한 촬영 요청 수
+            uploader: ImageUploader (촬영 후 업로드 대기열에 추가)
+        """
+        self.image_dir = image_dir
+        self.index = index
+        self.resolution = resolution
+        self.quality = quality
+        self.thumbnail_size = thumbnail_size
+        self.uploader = uploader
+        self.requests = queue.Queue(maxsize=queue_size)
+        self.camera = None
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        try:
+            self.requests.put_nowait(None)
+        except queue.Full:
+            pass
+        if self.thread:
+            self.thread.join(timeout=5)
+        if self.camera is not None:
+            self.camera.close()
+            self.camera = None
+
+    def request_capture(self, tag=None):
+        """촬영 요청 (즉시 반환). 큐가 가득 차면 False, tag가 영문/숫자/_/- 32자 이내가 아니면 ValueError"""
+        if tag and not TAG_PATTERN.match(str(tag)):
+            raise ValueError(f"잘못된 촬영 태그: {tag!r} (영문/숫자/_/- 32자 이내)")
+        try:
+            self.requests.put_nowait(tag)
+            return True
+        except queue.Full:
+            print("⚠️ 촬영 대기열이 가득 참 - 요청 거절")
+            return False
+
+    def _open_camera(self):
+        """picamera2로 카메라를 열어 유지 (설치되지 않았으면 None)"""
+        try:
+            from picamera2 import Picamera2
+        except ImportError:
+            print("ℹ️ picamera2 없음 - libcamera-still 사용")
+            return None
+
+        camera = Picamera2()
+        camera.configure(camera.create_still_configuration(main={"size": self.resolution}))
+        camera.options["quality"] = self.quality
+        camera.start()
+        return camera
+
+    def _run(self):
+        try:
+            self.camera = self._open_camera()
+        except Exception as e:
+            print(f"❌ 카메라 초기화 오류: {e}")
+
+        while self.running:
+            tag = self.requests.get()
+            if tag is None and not self.running:
+                break
+            try:
+                self._capture(tag)
+            except Exception as e:
+                print(f"❌ 이미지 촬영 오류: {e}")
+
+    def _capture(self, tag):
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
+        name = f"capture_{timestamp}.jpg" if not tag else f"capture_{timestamp}_{tag}.jpg"
+        path = os.path.join(self.image_dir, name)
+        tmp_path = path + ".tmp"
+
+        if self.camera is not None:
+            self.camera.capture_file(tmp_path, format="jpeg")
+        else:
+            subprocess.run([
+                "libcamera-still", "-n", "-t", "1",
+                "-o", tmp_path,
+                "--width", str(self.resolution[0]),
+                "--height", str(self.resolution[1]),
+                "-q", str(self.quality)
+            ], check=True, timeout=30, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+
+        if self.thumbnail_size:
+            self._make_thumbnail(path)
+
+        self.index.add(name, size)
+        print(f"📸 이미지 촬영 완료: {name} ({size // 1024}KB)")
+
+        if self.uploader:
+            self.uploader.enqueue(name)
+
+    def _make_thumbnail(self, path):
+        try:
+            from PIL import Image
+        except ImportError:
+            return
+
+        try:
+            with Image.open(path) as image:
+                # JPEG는 DCT 단계에서 축소 디코딩 (전체 해상도 디코딩 생략)
+                image.draft("RGB", self.thumbnail_size)
+                image.thumbnail(self.thumbnail_size)
+                image.save(path[:-4] + "_thumb.jpg", "JPEG", quality=70)
+        except OSError as e:
+            print(f"⚠️ 썸네일 생성 실패: {e}")
+
+
+class PermanentUploadError(Exception):
+    """다시 보내도 성공할 수 없는 업로드 (서버가 4xx로 거부)"""
+
+
+class ImageUploader:
+    def __init__(self, bridge_url, device_id, headers, index, chunk_size=256 * 1024, delete_after_upload=False,
+                 max_attempts=5):
+        """
+        Args:
+            bridge_url: Universal Bridge 주소
+            device_id: 디바이스 ID
+            headers: 공통 요청 헤더 (x-device-id, x-tenant-id 등)
+            index: ImageIndex (업로드 오프셋 저장)
+            chunk_size: 청크 크기 (바이트)
+            delete_after_upload: 업로드 완료 후 로컬 원본 삭제 (썸네일은 유지)
+            max_attempts: 파일 하나의 연속 재시도 횟수. 넘으면 보류하고 다음 파일로 넘어감
+                (보류된 파일은 다른 파일 업로드가 성공하면 다시 대기열에 넣음)
+        """
+        self.bridge_url = bridge_url
+        self.device_id = device_id
+        self.headers = headers
+        self.index = index
+        self.chunk_size = chunk_size
+        self.delete_after_upload = delete_after_upload
+        self.max_attempts = max_attempts
+        self.pending = queue.Queue()
+        self.deferred = []  # 연속 실패로 보류한 파일 (Bridge가 다시 응답하면 재시도)
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        # 이전 실행에서 끝나지 않은 업로드 재개
+        for name in self.index.pending_uploads():
+            self.pending.put(name)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.pending.put(None)
+
+    def enqueue(self, name):
+        self.pending.put(name)
+
+    def _run(self):
+        while self.running:
+            name = self.pending.get()
+            if name is None:
+                continue
+            retry_delay = 5
+            for attempt in range(1, self.max_attempts + 1):
+                try:
+                    uploaded = self.upload(name)
+                except PermanentUploadError as e:
+                    print(f"❌ 이미지 업로드 거부: {name} {e} - 업로드 실패로 표시")
+                    self.index.mark_failed(name)
+                    break
+                if uploaded:
+                    # Bridge가 다시 응답하므로 보류했던 파일 재시도
+                    for deferred in self.deferred:
+                        self.pending.put(deferred)
+                    self.deferred = []
+                    break
+                if not self.running:
+                    return
+                if attempt < self.max_attempts:
+                    time.sleep(retry_delay)
+                    retry_delay = min(retry_delay * 2, 300)
+            else:
+                print(f"⚠️ 이미지 업로드 {self.max_attempts}회 실패: {name} - 보류하고 다음 파일 업로드")
+                self.deferred.append(name)
+
+    def upload(self, name):
+        """이미지 하나를 청크 단위로 업로드. 완료(또는 파일 없음) 시 True, 서버가 거부하면 PermanentUploadError"""
+        path = os.path.join(self.index.image_dir, name)
+        if not os.path.exists(path):
+            self.index.set_offset(name, 0, done=True)
+            return True
+
+        total = os.path.getsize(path)
+        offset = self.index.get_offset(name)
+        url = f"{self.bridge_url}/api/bridge/images/{self.device_id}/{name}"
+
+        with open(path, 'rb') as f:
+            while offset < total:
+                f.seek(offset)
+                chunk = f.read(self.chunk_size)
+                headers = dict(self.headers)
+                headers["Content-Type"] = "image/jpeg"
+                headers["Content-Range"] = f"bytes {offset}-{offset + len(chunk) - 1}/{total}"
+
+                try:
+                    response = requests.put(url, data=chunk, headers=headers, timeout=30)
+                except requests.RequestException as e:
+                    print(f"❌ 이미지 업로드 오류: {name} ({offset}/{total}) {e}")
+                    return False
+
+                if response.status_code in (200, 201):
+                    offset = total
+                elif response.status_code in (308, 416):
+                    # 서버가 실제로 받은 위치부터 이어서 전송
+                    offset = int(response.headers.get("x-upload-offset", offset + len(chunk)))
+                    self.index.set_offset(name, offset)
+                # 404는 파일이 아니라 업로드 엔드포인트가 없는 것 (구버전 Bridge) - 재시도/보류 대상
+                elif 400 <= response.status_code < 500 and response.status_code not in (404, 408, 429):
+                    raise PermanentUploadError(f"HTTP {response.status_code}")
+                else:
+                    print(f"❌ 이미지 업로드 실패: {name} {response.status_code}")
+                    return False
+
+        self.index.set_offset(name, total, done=True)
+        print(f"☁️ 이미지 업로드 완료: {name}")
+
+        if self.delete_after_upload:
+            os.remove(path)
+            self.index.remove(name, total)
+        return True
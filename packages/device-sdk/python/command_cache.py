@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+명령 중복 실행 방지 캐시
+최근 실행한 command_id와 그 ACK를 LRU+TTL 방식으로 보관
+
+QoS1 재전송이나 HTTP 폴링 중복으로 같은 명령이 다시 들어오면
+액추에이터를 다시 움직이지 않고 캐시된 ACK를 그대로 돌려준다.
+실행 중인 명령(begin 후 put 전)이 다시 들어오면 무시하고, 실행이 끝나면 보내는 ACK가 응답이 된다.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class CommandCache:
+    def __init__(self, max_size=1024, ttl=3600, persist_path=None, min_interval=5.0):
+        """
+        Args:
+            max_size: 보관할 최대 command_id 개수 (초과 시 가장 오래된 항목 제거)
+            ttl: 항목 유지 시간 (초)
+            persist_path: 재시작 후에도 유지할 JSON 파일 경로 (None이면 메모리만 사용)
+            min_interval: 파일 저장 최소 간격 (초, SD 카드 쓰기 횟수 제한). 그 사이의 변경은 모아서 한 번에 저장
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.persist_path = persist_path
+        self.min_interval = min_interval
+        self._entries = OrderedDict()  # command_id -> (만료 시각, ack)
+        self._in_flight = set()  # 실행 중인 command_id (메모리만, 재시작하면 비움)
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saved_at = None
+        self._save_timer = None
+        self.hits = 0
+
+        if self.persist_path:
+            self.load()
+
+    def get(self, command_id):
+        """캐시된 ACK 반환 (없거나 만료되면 None)"""
+        if not command_id:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(command_id)
+            if entry is None:
+                return None
+
+            expires_at, ack = entry
+            if expires_at < time.time():
+                del self._entries[command_id]
+                return None
+
+            self._entries.move_to_end(command_id)
+            self.hits += 1
+            return ack
+
+    def begin(self, command_id):
+        """실행 시작 표시. 이미 실행 중이거나 실행을 마친 명령이면 False (다시 실행하지 않음)"""
+        if not command_id:
+            return True
+
+        with self._lock:
+            entry = self._entries.get(command_id)
+            if command_id in self._in_flight or (entry is not None and entry[0] >= time.time()):
+                self.hits += 1
+                return False
+            self._in_flight.add(command_id)
+            return True
+
+    def discard(self, command_id):
+        """ACK 없이 끝난 실행 표시 해제 (다음 재전송은 다시 실행)"""
+        with self._lock:
+            self._in_flight.discard(command_id)
+
+    def put(self, command_id, ack):
+        """실행 완료된 명령의 ACK 저장"""
+        if not command_id:
+            return
+
+        with self._lock:
+            self._in_flight.discard(command_id)
+            self._entries[command_id] = (time.time() + self.ttl, ack)
+            self._entries.move_to_end(command_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+            if self.persist_path:
+                self._dirty = True
+                self._schedule_save_locked()
+
+    def flush(self):
+        """저장 대기 중인 변경을 바로 파일에 씀 (종료 시 호출)"""
+        with self._lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+            if self._dirty:
+                self._save_locked()
+
+    def load(self):
+        """파일에서 캐시 복원 (만료 항목은 버림)"""
+        try:
+            with open(self.persist_path, 'r') as f:
+                items = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+
+        now = time.time()
+        with self._lock:
+            for command_id, expires_at, ack in items[-self.max_size:]:
+                if expires_at >= now:
+                    self._entries[command_id] = (expires_at, ack)
+
+    def _schedule_save_locked(self):
+        """min_interval이 지났으면 바로 저장, 아니면 남은 시간 뒤에 한 번 저장"""
+        if self._save_timer is not None:
+            return
+        elapsed = None if self._saved_at is None else time.monotonic() - self._saved_at
+        if elapsed is None or elapsed >= self.min_interval:
+            self._save_locked()
+            return
+        self._save_timer = threading.Timer(self.min_interval - elapsed, self.flush)
+        self._save_timer.daemon = True
+        self._save_timer.start()
+
+    def _save_locked(self):
+        """임시 파일에 쓴 뒤 교체 (전원 차단 시 파일 손상 방지)"""
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        items = [[command_id, expires_at, ack] for command_id, (expires_at, ack) in self._entries.items()]
+        tmp_path = f"{self.persist_path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(items, f)
+            os.replace(tmp_path, self.persist_path)
+        except OSError as e:
+            print(f"⚠️ 명령 캐시 저장 실패: {e}")
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+하위 디바이스(ESP32) 레지스트리 + 다중 시리얼 포트 관리
+
+- 시리얼 포트 여러 개를 동시에 사용 (포트마다 읽기 스레드 하나)
+- 핫플러그: /dev/serial/by-id/* 를 주기적으로 다시 검색해 새 포트는 열고, 사라진 포트는 닫음
+  (udev가 USB 시리얼마다 고정 이름의 링크를 만들어 주므로 ttyUSB 번호가 바뀌어도 같은 장치로 인식)
+- 디바이스별 마지막 수신 시각, 수신 속도(메시지/초), 시퀀스 누락/중복 집계 (sequence_tracker 슬라이딩 비트맵)
+- 디바이스 ID -> 포트 매핑을 dict로 유지해 명령을 해당 디바이스가 연결된 포트로만 전송 (O(1) 조회)
+- device_id가 없는 프레임은 포트별 기본 ID 사용 (그 포트에서 마지막으로 본 디바이스, 없으면 포트 이름)
+"""
+
+import glob
+import os
+import threading
+import time
+
+import serial
+
+from sequence_tracker import SequenceWindow
+
+
+class DeviceStats:
+    """디바이스 하나의 수신 통계"""
+
+    __slots__ = ("device_id", "port", "first_seen", "last_seen", "_last_monotonic", "messages", "rate", "sequence")
+
+    def __init__(self, device_id, port):
+        self.device_id = device_id
+        self.port = port
+        self.first_seen = self.last_seen = time.time()
+        self._last_monotonic = time.monotonic()
+        self.messages = 0
+        self.rate = 0.0       # 메시지/초 (지수 이동 평균)
+        self.sequence = SequenceWindow(256)
+
+    def observe(self, port, seq=None, alpha=0.2):
+        """수신 기록. 시퀀스 상태 반환 (seq가 없으면 None)"""
+        now = time.monotonic()
+        if self.messages:
+            interval = now - self._last_monotonic
+            if interval > 0:
+                self.rate = (1 - alpha) * self.rate + alpha / interval if self.rate else 1 / interval
+        self._last_monotonic = now
+        self.last_seen = time.time()
+        self.messages += 1
+        self.port = port
+
+        if seq is None:
+            return None
+        return self.sequence.observe(seq)[0]
+
+    def to_dict(self, stale_after):
+        age = time.time() - self.last_seen
+        return {
+            "port": self.port,
+            "online": self.port is not None and age < stale_after,
+            "last_seen": round(self.last_seen, 3),
+            "age": round(age, 1),
+            "messages": self.messages,
+            "rate": round(self.rate, 3),
+            "sequence": self.sequence.stats()
+        }
+
+
+class DeviceRegistry:
+    def __init__(self, patterns=("/dev/serial/by-id/*",), baud_rate=115200, on_line=None,
+                 scan_interval=5.0, stale_after=120):
+        """
+        Args:
+            patterns: 사용할 시리얼 포트 경로 또는 glob 패턴 목록
+            on_line: on_line(line, port, received_ns) - 포트에서 한 줄 수신 시 호출 (읽기 스레드에서 실행)
+                     received_ns: 줄을 다 읽은 시점의 time.monotonic_ns()
+            scan_interval: 포트 재검색 주기 (초)
+            stale_after: 이 시간(초) 동안 수신이 없으면 오프라인으로 표시
+        """
+        self.patterns = list(patterns)
+        self.baud_rate = baud_rate
+        self.on_line = on_line
+        self.scan_interval = scan_interval
+        self.stale_after = stale_after
+
+        self.devices = {}        # device_id -> DeviceStats
+        self.ports = {}          # 포트 경로 -> serial.Serial
+        self._port_devices = {}  # 포트 경로 -> 마지막으로 본 device_id (ID 없는 프레임용)
+        self._lock = threading.Lock()
+        self.running = False
+        self.scan_thread = None
+
+    def __contains__(self, device_id):
+        return device_id in self.devices
+
+    def __len__(self):
+        return len(self.devices)
+
+    def start(self):
+        """포트 검색/읽기 시작"""
+        self.running = True
+        self.scan()
+        self.scan_thread = threading.Thread(target=self._scan_loop, daemon=True)
+        self.scan_thread.start()
+
+    def stop(self):
+        self.running = False
+        with self._lock:
+            ports = list(self.ports.values())
+            self.ports.clear()
+        for ser in ports:
+            try:
+                ser.close()
+            except Exception:
+                pass
+
+    def scan(self):
+        """패턴에 맞는 포트를 다시 검색 (같은 장치를 가리키는 링크는 한 번만 연결)"""
+        found = {}
+        for pattern in self.patterns:
+            for path in sorted(glob.glob(pattern)):
+                found.setdefault(os.path.realpath(path), path)
+
+        with self._lock:
+            opened = {os.path.realpath(path) for path in self.ports}
+        for real_path, path in found.items():
+            if real_path not in opened:
+                self._open(path)
+
+    def _open(self, path):
+        try:
+            ser = serial.Serial(path, self.baud_rate, timeout=1)
+        except Exception as e:
+            print(f"❌ 시리얼 연결 실패 ({path}): {e}")
+            return
+        with self._lock:
+            self.ports[path] = ser
+        print(f"✅ ESP32 연결: {path}")
+        threading.Thread(target=self._reader, args=(path, ser), daemon=True).start()
+
+    def _close(self, path, ser):
+        with self._lock:
+            if self.ports.get(path) is ser:
+                del self.ports[path]
+            for stats in self.devices.values():
+                if stats.port == path:
+                    stats.port = None
+        try:
+            ser.close()
+        except Exception:
+            pass
+        print(f"🔌 ESP32 분리: {path}")
+
+    def _scan_loop(self):
+        while self.running:
+            time.sleep(self.scan_interval)
+            self.scan()
+
+    def _reader(self, path, ser):
+        """포트 하나의 수신 루프 (장치가 뽑히면 포트를 닫고 종료, 다시 꽂히면 scan()이 새로 염)"""
+        while self.running:
+            try:
+                line = ser.readline()
+                received_ns = time.monotonic_ns()
+            except (serial.SerialException, OSError) as e:
+                print(f"❌ ESP32 데이터 수신 오류 ({path}): {e}")
+                break
+            except TypeError:
+                break  # 다른 스레드에서 포트를 닫은 경우
+            line = line.decode("utf-8", errors="replace").strip()
+            if line and self.on_line:
+                try:
+                    self.on_line(line, path, received_ns)
+                except Exception as e:
+                    print(f"❌ 데이터 처리 오류 ({path}): {e}")
+        self._close(path, ser)
+
+    def resolve(self, frame, port):
+        """프레임의 디바이스 ID (없으면 그 포트의 기본 ID)"""
+        device_id = frame.get("device_id")
+        if device_id:
+            return device_id
+        return self._port_devices.get(port) or os.path.basename(port or "serial")
+
+    def observe(self, device_id, port, seq=None):
+        """디바이스 수신 기록 (처음 보는 디바이스면 등록). 시퀀스 상태 반환 (sequence_tracker.DUPLICATE면 버릴 것)"""
+        with self._lock:
+            stats = self.devices.get(device_id)
+            if stats is None:
+                stats = self.devices[device_id] = DeviceStats(device_id, port)
+                print(f"🆕 디바이스 등록: {device_id} ({port})")
+            elif stats.port != port:
+                print(f"🔀 디바이스 포트 변경: {device_id} {stats.port} -> {port}")
+            status = stats.observe(port, seq)
+            if port:
+                self._port_devices[port] = device_id
+            return status
+
+    def port_of(self, device_id):
+        """디바이스가 연결된 포트 (모르거나 분리됐으면 None)"""
+        stats = self.devices.get(device_id)
+        return stats.port if stats else None
+
+    def send(self, device_id, line):
+        """디바이스가 연결된 포트로만 한 줄 전송. 포트를 모르면 False"""
+        port = self.port_of(device_id)
+        ser = self.ports.get(port) if port else None
+        if ser is None:
+            return False
+        return self._write(port, ser, line)
+
+    def broadcast(self, line):
+        """모든 포트로 전송 (대상 디바이스가 없는 명령용). 보낸 포트 수 반환"""
+        with self._lock:
+            ports = list(self.ports.items())
+        return sum(self._write(port, ser, line) for port, ser in ports)
+
+    def _write(self, port, ser, line):
+        if isinstance(line, str):
+            line = line.encode("utf-8")
+        try:
+            ser.write(line + b"\n")
+            return True
+        except Exception as e:
+            print(f"❌ 명령 전송 실패 ({port}): {e}")
+            return False
+
+    def stats(self):
+        """디바이스별 통계"""
+        with self._lock:
+            return {device_id: s.to_dict(self.stale_after) for device_id, s in self.devices.items()}
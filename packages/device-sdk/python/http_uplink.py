@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+HTTP 업링크 (연결 재사용, 동시 전송 제한, 타임아웃/재시도, 멱등 키)
+
+- 연결 풀: requests.Session + HTTPAdapter (keep-alive로 TCP/TLS 연결 재사용, 연결 수는 pool_size로 제한)
+- HTTP/2: https 주소이고 httpx + h2 패키지가 있으면 연결 하나에서 여러 요청을 다중화. 없으면 requests (HTTP/1.1)
+- 동시 전송 제한: 진행 중인 요청은 max_in_flight개까지. submit()은 작업 풀에 넘기고 바로 반환하므로
+  느린 응답 하나가 뒤의 전송을 막지 않음 (대기열이 queue_size를 넘으면 거부 → 호출 측이 백로그에 저장)
+- 요청마다 (연결, 응답) 타임아웃. 연결 오류/타임아웃/429/5xx는 지터 백오프 후 재시도 (429는 Retry-After 따름)
+- Idempotency-Key 헤더: 재시도와 백로그 재전송에 같은 키를 보내 Bridge가 같은 데이터를 두 번 저장하지 않음
+"""
+
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+    import h2  # noqa: F401  httpx의 HTTP/2 지원에 필요
+except ImportError:
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def idempotency_key(payload):
+    """페이로드 내용으로 만든 멱등 키 (같은 데이터를 다시 보내면 같은 키)"""
+    if not isinstance(payload, (bytes, str)):
+        payload = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()[:32]
+
+
+class HttpUplink:
+    def __init__(self, base_url, headers=None, pool_size=4, max_in_flight=4, queue_size=256,
+                 timeout=(3.05, 10.0), retries=3, backoff=0.5, max_backoff=10.0, http2=True):
+        """
+        Args:
+            base_url: Bridge 주소 (예: http://192.168.1.100:3001)
+            headers: 모든 요청에 붙일 헤더 (디바이스/테넌트 ID 등)
+            pool_size: 유지할 최대 연결 수
+            max_in_flight: 동시에 진행하는 최대 요청 수 (submit 작업 풀 크기)
+            queue_size: submit 대기열 최대 길이
+            timeout: (연결, 응답) 타임아웃 (초)
+            retries: 실패 시 재시도 횟수
+            backoff / max_backoff: 재시도 대기 기준/최대 (초, 지터 적용)
+            http2: 가능하면 HTTP/2 사용
+        """
+        self.base_url = base_url.rstrip("/")
+        self.headers = dict(headers or {})
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.queue_size = queue_size
+
+        self.http2 = bool(http2 and httpx is not None and self.base_url.startswith("https://"))
+        if self.http2:
+            self._client = httpx.Client(
+                http2=True,
+                limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+                timeout=httpx.Timeout(timeout[1], connect=timeout[0])
+            )
+            self._errors = (httpx.TransportError,)
+        else:
+            self._client = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True, max_retries=0)
+            self._client.mount("http://", adapter)
+            self._client.mount("https://", adapter)
+            self._errors = (requests.ConnectionError, requests.Timeout)
+
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="uplink")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._stats = {"requests": 0, "failed": 0, "retries": 0, "rejected": 0}
+
+    def request(self, method, path, body=None, headers=None, idempotency_key=None, timeout=None):
+        """
+        요청 전송 (재시도 포함). 재시도할 수 없는 응답(2xx/4xx)은 그대로 반환, 끝까지 실패하면 마지막 예외 발생
+
+        Args:
+            body: 요청 본문 (bytes/str, dict면 JSON으로 변환)
+            idempotency_key: Idempotency-Key 헤더 (재시도해도 같은 키)
+        """
+        request_headers = dict(self.headers)
+        if isinstance(body, dict):
+            body = json.dumps(body)
+            request_headers["Content-Type"] = "application/json"
+        request_headers.update(headers or {})
+        if idempotency_key:
+            request_headers["Idempotency-Key"] = idempotency_key
+        url = f"{self.base_url}{path}"
+
+        for attempt in range(self.retries + 1):
+            retry_after = None
+            try:
+                with self._in_flight:
+                    response = self._send(method, url, body, request_headers, timeout or self.timeout)
+                with self._lock:
+                    self._stats["requests"] += 1
+                if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                    return response
+                retry_after = response.headers.get("Retry-After")
+                logger.warning(f"{method} {path} 응답 {response.status_code}, 재시도 {attempt + 1}/{self.retries}")
+            except self._errors as e:
+                with self._lock:
+                    self._stats["failed"] += 1
+                if attempt == self.retries:
+                    raise
+                logger.warning(f"{method} {path} 실패: {e}, 재시도 {attempt + 1}/{self.retries}")
+
+            with self._lock:
+                self._stats["retries"] += 1
+            time.sleep(self._delay(attempt, retry_after))
+
+    def _send(self, method, url, body, headers, timeout):
+        if self.http2:
+            return self._client.request(method, url, content=body, headers=headers,
+                                        timeout=httpx.Timeout(timeout[1], connect=timeout[0]))
+        return self._client.request(method, url, data=body, headers=headers, timeout=timeout)
+
+    def post(self, path, body=None, headers=None, idempotency_key=None, timeout=None):
+        return self.request("POST", path, body, headers, idempotency_key, timeout)
+
+    def get(self, path, headers=None, timeout=None):
+        return self.request("GET", path, headers=headers, timeout=timeout)
+
+    def submit(self, path, body=None, headers=None, idempotency_key=None, callback=None):
+        """
+        비동기 POST (작업 풀에서 전송). 대기열이 가득 차면 False (callback은 호출되지 않음)
+
+        Args:
+            callback: callback(response) - 끝까지 실패하면 response는 None
+        """
+        with self._lock:
+            if self._pending >= self.queue_size:
+                self._stats["rejected"] += 1
+                return False
+            self._pending += 1
+        self._executor.submit(self._run, path, body, headers, idempotency_key, callback)
+        return True
+
+    def _run(self, path, body, headers, idempotency_key, callback):
+        try:
+            response = None
+            try:
+                response = self.post(path, body, headers, idempotency_key)
+            except Exception as e:
+                logger.error(f"POST {path} 전송 실패: {e}")
+            if callback:
+                callback(response)
+        except Exception as e:
+            logger.error(f"업링크 콜백 오류: {e}")
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _delay(self, attempt, retry_after=None):
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_backoff)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))  # 전체 지터
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, pending=self._pending, http2=self.http2)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self._client.close()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+저메모리 모드 (Pi Zero 등 512MB 보드에서 여러 스크립트를 함께 실행할 때)
+
+- 스레드 스택 크기 축소: threading.stack_size()는 이후에 만드는 스레드에만 적용되므로 시작 직후 호출
+  (기본 8MB 가상 스택 대신 256KB, 실제 RSS보다 주소 공간/오버커밋 여유를 줄이는 효과가 큼)
+- 공유 작업 풀: 일회성 작업(backfill 등)마다 스레드를 새로 만들지 않고 작은 풀 하나를 같이 사용
+- 메모리 보고서: /proc/self/status의 RSS/최대 RSS + tracemalloc 스냅샷을 컴포넌트(이 디렉터리의 모듈,
+  그 밖은 최상위 패키지)별로 합산. tracemalloc은 자체 오버헤드가 크므로 진단할 때만 켬
+"""
+
+import logging
+import os
+import sys
+import threading
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STACK_KB = 256
+
+_pool = None
+_pool_lock = threading.Lock()
+_pool_workers = 2
+
+
+def configure_threads(stack_kb=DEFAULT_STACK_KB, pool_workers=2):
+    """이후 생성되는 스레드의 스택 크기와 공유 풀 크기 설정. 스택 크기를 적용했으면 True"""
+    global _pool_workers
+    _pool_workers = pool_workers
+    try:
+        threading.stack_size(stack_kb * 1024)
+        return True
+    except (ValueError, RuntimeError) as e:
+        logger.warning(f"스레드 스택 크기 설정 실패 ({stack_kb}KB): {e}")
+        return False
+
+
+def shared_pool():
+    """일회성 작업용 공유 스레드 풀 (처음 사용할 때 생성)"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=_pool_workers, thread_name_prefix="worker")
+        return _pool
+
+
+def read_rss():
+    """현재/최대 RSS (KB). /proc이 없으면 최대 RSS만"""
+    usage = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    key = "rss_kb" if line.startswith("VmRSS") else "peak_rss_kb"
+                    usage[key] = int(line.split()[1])
+    except OSError:
+        import resource
+        usage["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage
+
+
+class MemoryReport:
+    def __init__(self, base_dir=None, frames=16):
+        """
+        Args:
+            base_dir: 컴포넌트로 구분할 모듈이 있는 디렉터리 (기본: 이 파일이 있는 디렉터리)
+            frames: 할당마다 저장할 스택 깊이 (깊을수록 정확하지만 tracemalloc 메모리 증가)
+        """
+        self.base_dir = os.path.abspath(base_dir or os.path.dirname(os.path.abspath(__file__)))
+        self.frames = frames
+        self._components = {}  # 파일 경로 -> 컴포넌트 이름
+
+    @property
+    def tracing(self):
+        return tracemalloc.is_tracing()
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            logger.info(f"tracemalloc 시작 (스택 {self.frames}단계)")
+
+    def stop(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def report(self, top=10):
+        """RSS, 스레드 수, 컴포넌트별 할당량 (KB, tracemalloc이 켜져 있을 때만)"""
+        result = dict(read_rss(), threads=threading.active_count())
+        if not tracemalloc.is_tracing():
+            return result
+
+        totals = {}
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__)
+        ])
+        for stat in snapshot.statistics("traceback"):
+            component = self._component(stat.traceback)
+            totals[component] = totals.get(component, 0) + stat.size
+
+        current, peak = tracemalloc.get_traced_memory()
+        result["traced_kb"] = current // 1024
+        result["traced_peak_kb"] = peak // 1024
+        result["components"] = {
+            name: size // 1024 for name, size in sorted(totals.items(), key=lambda item: -item[1])[:top]
+        }
+        return result
+
+    def _component(self, traceback):
+        """할당을 일으킨 가장 가까운 이 디렉터리 모듈 (없으면 할당 위치의 최상위 패키지)"""
+        for frame in reversed(traceback):  # 최근 프레임부터
+            name = self._component_of(frame.filename)
+            if name is not None:
+                return name
+        return self._package_of(traceback[-1].filename)
+
+    def _component_of(self, filename):
+        if filename not in self._components:
+            path = os.path.abspath(filename)
+            inside = os.path.dirname(path) == self.base_dir
+            self._components[filename] = os.path.splitext(os.path.basename(path))[0] if inside else None
+        return self._components[filename]
+
+    @staticmethod
+    def _package_of(filename):
+        for path in sorted(sys.path, key=len, reverse=True):
+            if path and filename.startswith(path + os.sep):
+                return filename[len(path) + 1:].split(os.sep)[0].split(".")[0]
+        return os.path.basename(filename)
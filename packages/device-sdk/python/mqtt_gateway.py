@@ -6,54 +6,119 @@ Universal Bridge의 MQTT 브로커와 연결
 """
 
 import paho.mqtt.client as mqtt
-import serial
 import json
 import time
 import threading
-from datetime import datetime
+
+from device_registry import DeviceRegistry
+from fast_start import StartupTimer, parallel_init
+from latency_trace import Tracer
+from memory_profile import MemoryReport, configure_threads, shared_pool
+from outbound_lanes import LaneScheduler
+from payload_codec import PayloadCodec
+from sampling_profiler import SamplingProfiler
+from sequence_tracker import DUPLICATE, SEQUENCE_FIELDS, SequenceCounter
+from timebase import Clock, elapsed_ms, format_ts
+from mqtt_v5 import SCHEMA_VERSION, Mqtt5Publisher, connect_kwargs, create_client
+from telemetry_backlog import TelemetryBacklog
 
 class MQTTGateway:
     def __init__(self):
+        self.startup = StartupTimer()  # 프로세스 시작 기준 단계별 경과 시간
+        
+        # 저메모리 모드 (Pi Zero 등): 이후 만드는 스레드의 스택을 256KB로, 일회성 작업은 공유 풀에서 실행
+        self.low_memory = False
+        if self.low_memory:
+            configure_threads(256)
+        self.memory_report = MemoryReport()  # memory 명령 응답 (진단할 때만 memory_report.start()로 tracemalloc 켜기)
+        
         # MQTT 설정 (Universal Bridge의 MQTT 브로커)
         self.mqtt_broker = "192.168.1.100"  # Universal Bridge 주소
         self.mqtt_port = 1883
         self.mqtt_username = "your_username"
         self.mqtt_password = "your_password"
         
-        # 시리얼 설정 (ESP32와 연결)
-        self.serial_port = "/dev/ttyUSB0"
+        # MQTT 5 (토픽 별칭, 메시지 만료, 사용자 속성) - EMQX/Mosquitto 2 등 MQTT 5 브로커일 때만 True
+        self.mqtt5 = False
+        self.message_expiry = 600  # 오프라인 동안 브로커에 쌓인 텔레메트리 만료 시간 (초)
+        self.batch_seq = 0
+        
+        # 페이로드 압축 (512바이트 이상만 deflate, 토픽 접미사 /deflate로 표시, None이면 압축 안 함)
+        self.codec = PayloadCodec("deflate", threshold=512)
+        
+        # 시리얼 설정 (ESP32와 연결, 포트 경로 또는 glob 패턴 - by-id는 USB를 꽂는 대로 자동 연결)
+        self.serial_ports = ["/dev/serial/by-id/*"]  # 또는 ["/dev/ttyUSB0"]
         self.baud_rate = 115200
-        self.ser = None
+        
+        # 측정 시각 (수신 시점 monotonic_ns -> UTC epoch ms, 디바이스 시각이 유효하면 그대로 사용)
+        self.clock = Clock()
+        
+        # 구간별 지연 추적 (1%만 샘플링, 브로커 PUBACK까지 측정)
+        self.tracer = Tracer(
+            sample_rate=0.01,
+            trace_file="/home/pi/.smartfarm_mqtt_traces.jsonl",
+            clock=self.clock
+        )
+        self._traces = {}          # mid -> PUBACK을 기다리는 추적
+        self._early_acks = set()   # 등록 전에 도착한 PUBACK의 mid (추적 중인 발행이 진행 중일 때만 보관)
+        self._tracing_publishes = 0
+        self._trace_lock = threading.Lock()
+        
+        # 샘플링 프로파일러 (kill -USR2 또는 profile 명령으로 켜고 끄기, flamegraph용 collapsed stack)
+        self.profiler = SamplingProfiler("/home/pi/.smartfarm_mqtt_profile.folded")
+        
+        # 수집 시점에 디바이스별로 붙이는 시퀀스 번호 (수신 측이 손실과 무응답을 구분, 누락 구간은 backfill 요청)
+        self.sequencer = SequenceCounter()
+        
+        # 연결된 ESP32 디바이스들 (디바이스별 포트, 마지막 수신, 수신 속도, 시퀀스 누락/중복)
+        self.connected_devices = DeviceRegistry(
+            self.serial_ports,
+            baud_rate=self.baud_rate,
+            on_line=self.process_esp32_data
+        )
+        
+        # 토픽 설정
+        self.base_topic = "farm/001"
+        self.telemetry_topic = f"{self.base_topic}/telemetry"
+        self.command_topic = f"{self.base_topic}/commands"
+        self.backfill_topic = f"{self.telemetry_topic}/backfill"
+        self.devices_topic = f"{self.base_topic}/devices"  # 하위 디바이스 통계 (devices 명령 응답)
+        self.metrics_topic = f"{self.base_topic}/metrics"  # 구간별 지연 통계 (latency 명령 응답)
         
         # MQTT 클라이언트
-        self.mqtt_client = mqtt.Client()
+        self.mqtt_client = create_client(f"mqtt-gateway-{self.base_topic.replace('/', '-')}", self.mqtt5)
         self.mqtt_client.username_pw_set(self.mqtt_username, self.mqtt_password)
+        self.publisher = Mqtt5Publisher(self.mqtt_client, self.mqtt5)
         
         # MQTT 콜백 설정
         self.mqtt_client.on_connect = self.on_mqtt_connect
         self.mqtt_client.on_message = self.on_mqtt_message
+        self.mqtt_client.on_publish = self.on_mqtt_publish
         
-        # 토픽 설정
-        self.base_topic = "farm/001"
-        self.telemetry_topic = f"{self.base_topic}/telemetry"
-        self.command_topic = f"{self.base_topic}/commands"
+        # 오프라인 백로그 (재연결 시 최근 원본 + 오래된 구간은 1분/15분 롤업으로 재전송)
+        self.backlog = TelemetryBacklog("/home/pi/.smartfarm_mqtt_backlog.db")
+        self.replay_thread = None
+        
+        # 발행 레인: 명령 응답은 항상 먼저, 실시간 텔레메트리와 백로그 재전송은 4:1 가중치로 나눔
+        # (PUBACK을 기다리는 데이터 메시지는 20개까지만 - paho 내부 대기열에 재전송분이 쌓이지 않도록)
+        self.lanes = LaneScheduler({
+            "control": {"strict": True, "max_queue": 1000},
+            "telemetry": {"weight": 4, "max_queue": 5000},
+            "backfill": {"weight": 1, "rate": 5, "max_queue": 10}
+        }, window=20)
         
     def start(self):
         """MQTT 게이트웨이 시작"""
         print("🌉 MQTT 게이트웨이 시작")
+        self.profiler.install_signal()
+        self.startup.mark("imports")
+        self.lanes.start()
         
-        # 시리얼 연결
-        self.connect_serial()
-        
-        # MQTT 연결
-        self.connect_mqtt()
+        # MQTT 연결과 시리얼 연결(포트별 수신 스레드, 핫플러그 검색)을 동시에 (브로커 접속을 기다리지 않고 수신 시작)
+        parallel_init({"mqtt": self.connect_mqtt, "serial": self.connected_devices.start})
+        self.startup.mark("init")
         
-        # ESP32 데이터 수신 스레드
-        self.receive_thread = threading.Thread(target=self.receive_from_esp32)
-        self.receive_thread.daemon = True
-        self.receive_thread.start()
-        
-        print("✅ MQTT 게이트웨이 실행 중...")
+        print(f"✅ MQTT 게이트웨이 실행 중... ({self.startup.summary()})")
         
         # 메인 루프
         try:
@@ -63,30 +128,28 @@ class MQTTGateway:
             print("\n🛑 MQTT 게이트웨이 종료")
             self.stop()
     
-    def connect_serial(self):
-        """ESP32와 시리얼 연결"""
-        try:
-            self.ser = serial.Serial(self.serial_port, self.baud_rate, timeout=1)
-            print(f"✅ ESP32 연결: {self.serial_port}")
-        except Exception as e:
-            print(f"❌ 시리얼 연결 실패: {e}")
-    
     def connect_mqtt(self):
         """MQTT 브로커 연결"""
         try:
-            self.mqtt_client.connect(self.mqtt_broker, self.mqtt_port, 60)
+            self.mqtt_client.connect(self.mqtt_broker, self.mqtt_port, 60, **connect_kwargs(self.mqtt5))
             self.mqtt_client.loop_start()
             print(f"✅ MQTT 브로커 연결: {self.mqtt_broker}")
         except Exception as e:
             print(f"❌ MQTT 연결 실패: {e}")
     
-    def on_mqtt_connect(self, client, userdata, flags, rc):
-        """MQTT 연결 콜백"""
+    def on_mqtt_connect(self, client, userdata, flags, rc, properties=None):
+        """MQTT 연결 콜백 (MQTT 5면 CONNACK 속성도 전달됨)"""
         if rc == 0:
             print("✅ MQTT 연결 성공")
-            # 명령 토픽 구독
-            client.subscribe(self.command_topic)
-            print(f"📡 명령 토픽 구독: {self.command_topic}")
+            self.publisher.on_connect(properties)
+            # 명령 토픽 구독 (게이트웨이 전체 + 디바이스별 {command_topic}/{device_id})
+            client.subscribe([(self.command_topic, 0), (f"{self.command_topic}/+", 0)])
+            print(f"📡 명령 토픽 구독: {self.command_topic}, {self.command_topic}/+")
+            
+            # 밀린 데이터 재전송 (별도 스레드에서 속도 제한)
+            if not (self.replay_thread and self.replay_thread.is_alive()):
+                self.replay_thread = threading.Thread(target=self.replay_backlog, daemon=True)
+                self.replay_thread.start()
         else:
             print(f"❌ MQTT 연결 실패: {rc}")
     
@@ -98,73 +161,238 @@ class MQTTGateway:
             
             if topic == self.command_topic:
                 self.process_command(payload)
+            elif topic.startswith(f"{self.command_topic}/"):
+                self.process_command(payload, topic[len(self.command_topic) + 1:])
                 
         except Exception as e:
             print(f"❌ MQTT 메시지 처리 오류: {e}")
     
-    def receive_from_esp32(self):
-        """ESP32에서 데이터 수신"""
-        while True:
-            try:
-                if self.ser and self.ser.in_waiting > 0:
-                    line = self.ser.readline().decode('utf-8').strip()
-                    if line:
-                        self.process_esp32_data(line)
-            except Exception as e:
-                print(f"❌ ESP32 데이터 수신 오류: {e}")
-            time.sleep(0.1)
+    def on_mqtt_publish(self, client, userdata, mid):
+        """PUBACK 수신 콜백 (paho 내부 락 안에서 호출되므로 레인/추적 락만 잠깐 잡음)"""
+        ack_ns = self.clock.now_ns()
+        self.lanes.acked(mid)
+        with self._trace_lock:
+            trace = self._traces.pop(mid, None)
+            if trace is None:
+                if self._tracing_publishes:
+                    self._early_acks.add(mid)
+                return
+        self.tracer.mark(trace, "puback", ack_ns)
+        self.tracer.finish(trace)
+    
+    def begin_traced_publish(self):
+        """추적할 메시지 발행 직전 호출 (발행 중에 도착하는 PUBACK을 놓치지 않도록)"""
+        with self._trace_lock:
+            self._tracing_publishes += 1
     
-    def process_esp32_data(self, data):
-        """ESP32 데이터 처리 및 MQTT로 전송"""
+    def track_publish(self, mid, trace):
+        """발행한 메시지의 PUBACK 대기 등록 (mid가 None이면 발행 실패, 락 없이 발행한 다음 호출)"""
+        with self._trace_lock:
+            self._tracing_publishes -= 1
+            acked = mid in self._early_acks
+            if not self._tracing_publishes:
+                self._early_acks.clear()
+            if mid is None:
+                return
+            if not acked:
+                self._traces[mid] = trace
+                return
+        self.tracer.mark(trace, "puback")
+        self.tracer.finish(trace)
+    
+    def process_esp32_data(self, data, port=None, received_ns=None):
+        """ESP32 데이터 처리 및 MQTT로 전송 (port: 수신한 시리얼 포트, received_ns: 수신 시점)"""
+        if received_ns is None:
+            received_ns = self.clock.now_ns()
         try:
             # ESP32 데이터 파싱
             esp32_data = json.loads(data)
+            trace = self.tracer.start("telemetry", esp32_data.pop("trace", None), received_ns, "serial_rx")
             
-            # 디바이스 ID 추가
-            device_id = esp32_data.get("device_id", "esp32-001")
+            # 디바이스 ID 추가 (없으면 포트별 기본 ID) 및 레지스트리 갱신
+            device_id = self.connected_devices.resolve(esp32_data, port)
             esp32_data["device_id"] = device_id
-            esp32_data["timestamp"] = datetime.now().isoformat()
+            if self.connected_devices.observe(device_id, port, esp32_data.get("seq")) == DUPLICATE:
+                print(f"♻️ 중복 프레임 무시: {device_id} seq={esp32_data['seq']}")
+                return
+            
+            # 게이트웨이 시퀀스 번호 (디바이스가 보낸 seq는 device_seq로 보존)
+            if "seq" in esp32_data:
+                esp32_data["device_seq"] = esp32_data["seq"]
+            esp32_data["seq"] = self.sequencer.next(device_id)
+            esp32_data["seq_epoch"] = self.sequencer.epoch
+            
+            # 측정 시각 (epoch ms, 문자열은 전송할 때 만듦)
+            device_ts = esp32_data.pop("timestamp", None)
+            if device_ts is None:
+                device_ts = esp32_data.pop("ts", None)
             
             # MQTT로 전송
-            self.send_to_mqtt(esp32_data)
+            self.tracer.mark(trace, "gateway")
+            self.send_to_mqtt(esp32_data, self.clock.device_ts(device_ts, received_ns), received_ns, trace)
             
         except json.JSONDecodeError:
             print(f"❌ JSON 파싱 오류: {data}")
         except Exception as e:
             print(f"❌ 데이터 처리 오류: {e}")
     
-    def send_to_mqtt(self, data):
-        """MQTT로 데이터 전송"""
+    def send_to_mqtt(self, data, ts_ms, received_ns, trace=None):
+        """
+        MQTT로 데이터 전송 (telemetry 레인에 넣고 발행 결과에 따라 백로그 저장, 연결이 끊겨 있으면 백로그에만 저장)
+        ts_ms: 측정 시각 epoch ms, trace: 지연 추적
+        """
+        device_id = data["device_id"]
+        topic = f"{self.telemetry_topic}/{device_id}"
+        values = {f"{device_id}.{key}": value for key, value in data.items() if key not in SEQUENCE_FIELDS}
+        
+        message = dict(data, timestamp=format_ts(ts_ms))
+        if trace is not None:
+            self.tracer.mark(trace, "encode")
+            message["trace"] = self.tracer.context(trace)
+        payload = json.dumps(message)
+        
+        def send():
+            """전송 스레드에서 호출, 발행한 mid 반환 (실패하면 None)"""
+            if not self.mqtt_client.is_connected():
+                return None
+            if trace is not None:
+                self.begin_traced_publish()
+            mid = None
+            try:
+                result = self.publish(
+                    topic, payload,
+                    {"schema": SCHEMA_VERSION, "batch_seq": self.batch_seq},
+                    expiry=self.message_expiry
+                )
+                if result.rc == mqtt.MQTT_ERR_SUCCESS:
+                    mid = result.mid
+            finally:
+                if trace is not None:
+                    self.tracer.mark(trace, "publish")
+                    self.track_publish(mid, trace)
+            self.batch_seq += 1
+            print(f"📤 MQTT 전송: {topic} - {data.get('temp', 'N/A')}°C ({elapsed_ms(received_ns)}ms)")
+            return mid
+        
+        def on_done(mid):
+            # 백로그 저장 (키: "디바이스ID.필드")
+            self.backlog.append(values, ts_ms, sent=mid is not None)
+        
+        if self.mqtt_client.is_connected():
+            self.lanes.submit("telemetry", send, size=len(payload), on_done=on_done, ack=True)
+        else:
+            self.backlog.append(values, ts_ms, sent=False)
+    
+    def publish(self, topic, payload, user_properties, expiry=None):
+        """QoS1 발행 (큰 페이로드는 압축, 압축 방식은 MQTT 버전과 관계없이 토픽 접미사로 표시)"""
+        if self.codec:
+            payload, encoding = self.codec.encode(payload)
+            if encoding:
+                # 사용자 속성은 3.1.1로 접속한 구독자(Bridge)에게 전달되지 않음
+                topic = f"{topic}/{encoding}"
+        return self.publisher.publish(topic, payload, qos=1, expiry=expiry, user_properties=user_properties)
+    
+    def send_backfill(self, batch):
+        """백로그 배치 전송 (원본 또는 1분/15분 롤업, backfill 레인에서 차례가 와서 발행될 때까지 대기)"""
+        if not self.mqtt_client.is_connected():
+            return False
+        
+        payload = json.dumps(batch)
+        
+        def send():
+            result = self.publish(
+                self.backfill_topic, payload,
+                {"schema": SCHEMA_VERSION, "resolution": batch["resolution"]}
+            )
+            return result.mid if result.rc == mqtt.MQTT_ERR_SUCCESS else None
+        
+        # 레인이 멈추거나 창이 풀리지 않으면 ack_timeout 후 실패로 보고 재전송 스레드를 끝냄
+        if self.lanes.call("backfill", send, size=len(payload), ack=True, timeout=self.lanes.ack_timeout) is None:
+            return False
+        
+        count = sum(len(points) for points in batch["series"].values())
+        print(f"📤 백로그 전송: {batch['resolution']} {count}개")
+        return True
+    
+    def replay_backlog(self):
+        """재연결 후 밀린 데이터를 배치 단위로 재전송 (속도는 backfill 레인의 속도 제한/가중치로 조절)"""
+        while self.mqtt_client.is_connected():
+            if not self.backlog.replay(self.send_backfill, max_batches=1):
+                break
+    
+    def respond(self, topic, data):
+        """명령 응답 발행 (control 레인, 텔레메트리/재전송 대기열보다 먼저)"""
+        payload = json.dumps(data)
+        self.lanes.submit("control", lambda: self.publish(topic, payload, {"schema": SCHEMA_VERSION}).mid)
+    
+    def process_command(self, payload, device_id=None):
+        """명령 처리 및 ESP32로 전송 (device_id: 디바이스별 토픽으로 받은 명령의 대상)"""
         try:
-            device_id = data["device_id"]
-            topic = f"{self.telemetry_topic}/{device_id}"
+            command = json.loads(payload)
+            target = device_id or command.get("device_id")
+            trace = self.tracer.start("command", command.get("trace"), stage="received")
             
-            payload = json.dumps(data)
-            self.mqtt_client.publish(topic, payload, qos=1)
+            # 게이트웨이 자체 명령: 원본 해상도 재전송 요청
+            if command.get("type") == "backfill":
+                params = command.get("params", {})
+                shared_pool().submit(
+                    self.backlog.backfill,
+                    self.send_backfill, params.get("start", 0), params.get("end", int(time.time() * 1000)),
+                    keys=params.get("keys")
+                )
+                return
             
-            print(f"📤 MQTT 전송: {topic} - {data.get('temp', 'N/A')}°C")
+            # 게이트웨이 자체 명령: 하위 디바이스 목록/통계
+            if command.get("type") == "devices":
+                self.respond(self.devices_topic, self.connected_devices.stats())
+                return
             
-        except Exception as e:
-            print(f"❌ MQTT 전송 오류: {e}")
-    
-    def process_command(self, payload):
-        """명령 처리 및 ESP32로 전송"""
-        try:
-            command = json.loads(payload)
+            # 게이트웨이 자체 명령: 구간별 지연 통계 (p50/p90/p99, ms)
+            if command.get("type") == "latency":
+                self.respond(self.metrics_topic, {"latency": self.tracer.stats()})
+                return
+            
+            # 게이트웨이 자체 명령: RSS, 스레드 수, 컴포넌트별 할당량
+            if command.get("type") == "memory":
+                self.respond(self.metrics_topic, {"memory": self.memory_report.report()})
+                return
+            
+            # 게이트웨이 자체 명령: 샘플링 프로파일러 켜고 끄기 (상태는 metrics 토픽으로)
+            if command.get("type") == "profile":
+                params = command.get("params", {})
+                status = self.profiler.control(params.get("action", "status"), params.get("duration"))
+                self.respond(self.metrics_topic, {"profile": status})
+                return
+            
+            # 게이트웨이 자체 명령: 발행 레인별 대기 길이, 전송/버림 수, 대기 시간
+            if command.get("type") == "lanes":
+                self.respond(self.metrics_topic, {"lanes": self.lanes.stats()})
+                return
+            
+            # ESP32가 실행 시각을 이어서 기록할 수 있도록 추적 컨텍스트 전달
+            if trace is not None:
+                self.tracer.mark(trace, "serial_tx")
+                command["trace"] = self.tracer.context(trace)
+                payload = json.dumps(command)
             
-            # 명령을 ESP32로 전송
-            if self.ser:
-                self.ser.write(payload.encode('utf-8'))
-                self.ser.write(b'\n')
+            # 명령을 ESP32로 전송 (대상이 있으면 그 디바이스의 포트로만, 없으면 모든 포트로)
+            if target:
+                sent = self.connected_devices.send(target, payload)
+            else:
+                sent = self.connected_devices.broadcast(payload)
+            if sent:
                 print(f"📤 명령 전송: {command}")
+                self.tracer.finish(trace)
+            else:
+                print(f"⚠️ {target or 'ESP32'} 미연결, 명령 무시: {command}")
                 
         except Exception as e:
             print(f"❌ 명령 처리 오류: {e}")
     
     def stop(self):
         """게이트웨이 종료"""
-        if self.ser:
-            self.ser.close()
+        self.connected_devices.stop()
+        self.lanes.stop()
         self.mqtt_client.loop_stop()
         self.mqtt_client.disconnect()
 
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+발행 우선순위 레인 (백로그 재전송 중에도 명령 ACK/알람이 텔레메트리 뒤에서 기다리지 않도록)
+
+- strict 레인 (기본 control: 명령 ACK, 알람): 대기 중인 메시지가 있으면 항상 먼저 보냄, 전송 창 제한도 받지 않음
+- 나머지 레인 (telemetry, state, backfill): 가중 공정 큐잉 - 메시지마다 가상 종료 시각(이전 종료 시각 + 크기/가중치)을
+  매겨 가장 이른 것부터 보냄. 한 레인이 밀려 있어도 다른 레인이 가중치 비율만큼 대역을 나눠 씀
+- 레인별 속도 제한 (토큰 버킷, 초당 메시지 수)과 대기열 길이 제한 (가득 차면 가장 오래된 메시지를 버림)
+- 전송 창: ack=True로 넣은 메시지는 send()가 돌려준 값(MQTT mid)을 acked()로 받을 때까지 창을 차지.
+  창이 차면 데이터 레인은 기다리므로 MQTT 라이브러리 내부 대기열에 텔레메트리가 쌓이지 않고 control이 바로 나감
+- 레인별 지표: 대기 길이, 전송/실패/버림 수, 대기 시간 평균/최대 (ms)
+
+사용 예:
+    lanes = LaneScheduler(window=20)
+    lanes.start()
+    lanes.submit("control", lambda: client.publish(ack_topic, ack, qos=1).mid)
+    lanes.submit("telemetry", lambda: client.publish(topic, payload, qos=1).mid, size=len(payload), ack=True)
+    client.on_publish = lambda client, userdata, mid: lanes.acked(mid)
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LANES = {
+    "control": {"strict": True, "max_queue": 1000},
+    "telemetry": {"weight": 4, "max_queue": 5000},
+    "state": {"weight": 2, "max_queue": 100},
+    "backfill": {"weight": 1, "rate": 5, "max_queue": 100},
+}
+
+
+class _Item:
+    __slots__ = ("send", "on_done", "ack", "queued_at", "finish")
+
+    def __init__(self, send, on_done, ack, queued_at, finish):
+        self.send = send
+        self.on_done = on_done
+        self.ack = ack
+        self.queued_at = queued_at
+        self.finish = finish
+
+
+class _Lane:
+    __slots__ = ("name", "strict", "weight", "rate", "burst", "max_queue", "queue", "tokens", "refilled_at",
+                 "finish", "sent", "failed", "dropped", "wait_total_ms", "wait_max_ms")
+
+    def __init__(self, name, strict=False, weight=1, rate=None, burst=None, max_queue=1000):
+        self.name = name
+        self.strict = strict
+        self.weight = weight
+        self.rate = rate
+        self.burst = burst or max(1.0, rate or 0)
+        self.max_queue = max_queue
+        self.queue = deque()
+        self.tokens = self.burst
+        self.refilled_at = time.monotonic()
+        self.finish = 0.0  # 마지막으로 넣은 메시지의 가상 종료 시각
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+
+    def delay(self, now):
+        """다음 메시지를 보낼 수 있을 때까지 남은 시간 (초, 속도 제한)"""
+        if not self.rate:
+            return 0.0
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rate)
+        self.refilled_at = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        item = self.queue.popleft()
+        if self.rate:
+            self.tokens -= 1
+        wait_ms = (now - item.queued_at) * 1000
+        self.wait_total_ms += wait_ms
+        self.wait_max_ms = max(self.wait_max_ms, wait_ms)
+        return item
+
+    def stats(self):
+        done = self.sent + self.failed
+        return {
+            "queued": len(self.queue),
+            "sent": self.sent,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "wait_ms_avg": round(self.wait_total_ms / done, 1) if done else None,
+            "wait_ms_max": round(self.wait_max_ms, 1),
+            "priority": "strict" if self.strict else f"weight {self.weight}",
+            "rate": self.rate
+        }
+
+
+class LaneScheduler:
+    def __init__(self, lanes=None, window=20, ack_timeout=30.0):
+        """
+        Args:
+            lanes: {레인 이름: {strict, weight, rate, burst, max_queue}} (기본 DEFAULT_LANES)
+            window: ACK를 기다리는 데이터 메시지 최대 수 (ack=True로 넣은 메시지만 셈)
+            ack_timeout: 이 시간(초) 안에 acked()가 오지 않으면 창에서 뺌 (세션이 끊겨 PUBACK이 오지 않는 경우)
+        """
+        self.lanes = {name: _Lane(name, **options) for name, options in (lanes or DEFAULT_LANES).items()}
+        self.window = window
+        self.ack_timeout = ack_timeout
+
+        self._vtime = 0.0          # 가상 시각 (마지막으로 보낸 데이터 메시지의 가상 종료 시각)
+        self._in_flight = {}       # send()가 돌려준 키 -> 보낸 시각 (monotonic)
+        self._early_acks = set()   # send()가 끝나기 전에 도착한 ACK (ack 메시지를 보내는 중일 때만 보관)
+        self._sending_ack = False
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="outbound-lanes", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """전송 스레드 종료. 아직 대기 중인 메시지는 버리고 on_done(None) 호출 (call()로 기다리는 쪽이 풀리도록)"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=5)
+        with self._cond:
+            pending = []
+            for lane in self.lanes.values():
+                pending.extend(lane.queue)
+                lane.dropped += len(lane.queue)
+                lane.queue.clear()
+        for item in pending:
+            self._done(item, None)
+
+    def submit(self, lane, send, size=1, on_done=None, ack=False):
+        """
+        발행 예약 (send는 전송 스레드에서 호출)
+
+        Args:
+            lane: 레인 이름
+            send: 인자 없는 전송 함수. 실패하면 None 또는 False 반환
+            size: 메시지 크기 (바이트 등, 가중 공정 큐잉에 사용)
+            on_done: on_done(send 결과) - 전송 후 호출 (버려지면 None으로 호출)
+            ack: True면 send()가 돌려준 값을 acked()로 받을 때까지 전송 창을 차지
+        """
+        dropped = None
+        with self._cond:
+            target = self.lanes.get(lane)
+            if target is None:
+                raise ValueError(f"알 수 없는 레인: {lane}")
+            finish = 0.0
+            if not target.strict:
+                finish = target.finish = max(self._vtime, target.finish) + size / target.weight
+            if len(target.queue) >= target.max_queue:
+                dropped = target.queue.popleft()
+                target.dropped += 1
+            target.queue.append(_Item(send, on_done, ack, time.monotonic(), finish))
+            self._cond.notify()
+        if dropped is not None:
+            logger.warning(f"{lane} 레인 대기열 가득 참, 가장 오래된 메시지 버림")
+            self._done(dropped, None)
+
+    def call(self, lane, send, size=1, ack=False, timeout=None):
+        """submit 후 전송될 때까지 기다려 send() 결과 반환 (시간 초과/버려지면 None)"""
+        done = threading.Event()
+        box = [None]
+
+        def on_done(result):
+            box[0] = result
+            done.set()
+
+        self.submit(lane, send, size, on_done, ack)
+        done.wait(timeout)
+        return box[0]
+
+    def acked(self, key):
+        """전송 완료 확인 (MQTT on_publish에서 mid로 호출)"""
+        with self._cond:
+            if self._in_flight.pop(key, None) is not None:
+                self._cond.notify()
+            elif self._sending_ack:
+                self._early_acks.add(key)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "in_flight": len(self._in_flight),
+                "window": self.window,
+                "lanes": {name: lane.stats() for name, lane in self.lanes.items()}
+            }
+
+    def _next_locked(self, now):
+        """(레인, 메시지, None). 보낼 것이 없으면 (None, None, 다시 확인할 때까지 대기 초 또는 None)"""
+        wait = None
+        for lane in self.lanes.values():
+            if lane.strict and lane.queue:
+                delay = lane.delay(now)
+                if not delay:
+                    return lane, lane.take(now), None
+                wait = delay if wait is None else min(wait, delay)
+
+        # 전송 창이 차면 데이터 레인은 대기 (오래된 항목은 ACK를 못 받은 것으로 보고 정리)
+        if len(self._in_flight) >= self.window:
+            for key, sent_at in list(self._in_flight.items()):
+                if now - sent_at > self.ack_timeout:
+                    del self._in_flight[key]
+            if len(self._in_flight) >= self.window:
+                oldest = min(self._in_flight.values())
+                delay = max(0.01, self.ack_timeout - (now - oldest))
+                return None, None, delay if wait is None else min(wait, delay)
+
+        best = None
+        for lane in self.lanes.values():
+            if lane.strict or not lane.queue:
+                continue
+            delay = lane.delay(now)
+            if delay:
+                wait = delay if wait is None else min(wait, delay)
+                continue
+            if best is None or lane.queue[0].finish < best.queue[0].finish:
+                best = lane
+        if best is None:
+            return None, None, wait
+        item = best.take(now)
+        self._vtime = item.finish
+        return best, item, None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if not self._running:
+                        return
+                    lane, item, wait = self._next_locked(time.monotonic())
+                    if lane is not None:
+                        break
+                    self._cond.wait(wait)
+                if item.ack:
+                    self._sending_ack = True
+
+            result = None
+            try:
+                result = item.send()
+            except Exception as e:
+                logger.error(f"{lane.name} 레인 전송 오류: {e}")
+
+            ok = result is not None and result is not False
+            with self._cond:
+                if ok:
+                    lane.sent += 1
+                else:
+                    lane.failed += 1
+                if item.ack:
+                    self._sending_ack = False
+                    if ok and result is not True and result not in self._early_acks:
+                        self._in_flight[result] = time.monotonic()
+                    self._early_acks.clear()
+            self._done(item, result)
+
+    @staticmethod
+    def _done(item, result):
+        if item.on_done is None:
+            return
+        try:
+            item.on_done(result)
+        except Exception as e:
+            logger.error(f"전송 완료 콜백 오류: {e}")
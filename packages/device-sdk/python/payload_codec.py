@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+페이로드 압축 (MQTT/HTTP 업링크 공용)
+
+- 크기 임계값 이상인 페이로드만 압축 (작은 메시지는 압축 헤더 때문에 오히려 커지거나 이득이 적음)
+- deflate: 표준 라이브러리 zlib, Universal Bridge가 해제 (HTTP는 Content-Encoding, MQTT는 토픽 접미사)
+- zstd: zstandard 패키지 (선택). 텔레메트리 샘플로 학습한 사전을 쓰면 수백 바이트 메시지도 잘 압축됨
+  수신 측도 같은 사전을 가지고 있어야 하므로 자체 수신 서버에서만 사용
+- 압축 결과가 원본보다 크면 원본 그대로 전송
+
+인코딩 표시:
+- HTTP: Content-Encoding 헤더
+- MQTT: 토픽 뒤에 /<인코딩> (예: farms/farm_001/devices/dev_001/telemetry/deflate)
+  MQTT 5 사용자 속성은 3.1.1로 접속한 구독자에게 전달되지 않으므로 프로토콜 버전과 관계없이 접미사 사용
+
+압축률/CPU 비교 (샘플이 없으면 합성 텔레메트리/상태 메시지 사용):
+    python3 payload_codec.py [samples.jsonl]
+zstd 사전 학습 (JSON Lines, 한 줄에 메시지 하나):
+    python3 payload_codec.py --train samples.jsonl telemetry.dict
+"""
+
+import json
+import random
+import sys
+import threading
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFLATE = "deflate"
+ZSTD = "zstd"
+
+
+class PayloadCodec:
+    def __init__(self, method=DEFLATE, threshold=512, level=None, dictionary=None):
+        """
+        Args:
+            method: "deflate" 또는 "zstd" (zstandard가 없으면 deflate 사용, self.method로 확인)
+            threshold: 이 크기(바이트) 이상인 페이로드만 압축
+            level: 압축 레벨 (기본: deflate 6, zstd 3)
+            dictionary: zstd 사전 파일 경로 (train_dictionary()로 생성)
+        """
+        if method not in (DEFLATE, ZSTD):
+            raise ValueError(f"지원하지 않는 압축 방식: {method}")
+        if method == ZSTD and zstandard is None:
+            method = DEFLATE
+
+        self.method = method
+        self.threshold = threshold
+        self.level = level if level is not None else (3 if method == ZSTD else 6)
+        self.stats = {"messages": 0, "compressed": 0, "bytes_in": 0, "bytes_out": 0}
+        self._lock = threading.Lock()  # zstd 압축기는 동시에 쓸 수 없음
+
+        self._compressor = self._decompressor = None
+        if method == ZSTD:
+            dict_data = None
+            if dictionary:
+                with open(dictionary, "rb") as f:
+                    dict_data = zstandard.ZstdCompressionDict(f.read())
+            if dict_data is not None:
+                self._compressor = zstandard.ZstdCompressor(level=self.level, dict_data=dict_data)
+            else:
+                self._compressor = zstandard.ZstdCompressor(level=self.level)
+            self._decompressor = zstandard.ZstdDecompressor(dict_data=dict_data)
+
+    def encode(self, payload):
+        """(전송할 바이트, 인코딩) - 압축하지 않았으면 인코딩은 None"""
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+
+        data, encoding = payload, None
+        if len(payload) >= self.threshold:
+            compressed = self._compress(payload)
+            if len(compressed) < len(payload):
+                data, encoding = compressed, self.method
+
+        with self._lock:
+            self.stats["messages"] += 1
+            self.stats["bytes_in"] += len(payload)
+            self.stats["bytes_out"] += len(data)
+            if encoding:
+                self.stats["compressed"] += 1
+        return data, encoding
+
+    def decode(self, data, encoding):
+        """encode()의 역변환"""
+        if not encoding or encoding == "identity":
+            return data
+        if encoding == DEFLATE:
+            return zlib.decompress(data)
+        if encoding == ZSTD and self._decompressor is not None:
+            with self._lock:
+                return self._decompressor.decompress(data)
+        raise ValueError(f"해제할 수 없는 인코딩: {encoding}")
+
+    def _compress(self, payload):
+        if self.method == ZSTD:
+            with self._lock:
+                return self._compressor.compress(payload)
+        return zlib.compress(payload, self.level)
+
+
+def train_dictionary(samples, size=16384):
+    """메시지 샘플(bytes 목록)로 zstd 사전 학습 (수백 개 이상 권장)"""
+    if zstandard is None:
+        raise RuntimeError("zstandard 패키지가 필요합니다: pip install zstandard")
+    return zstandard.train_dictionary(size, samples).as_bytes()
+
+
+def _synthetic_samples(count=500):
+    """벤치마크용 텔레메트리 배치/상태 메시지"""
+    units = {"temperature": "celsius", "humidity": "percent", "ec": "ms_cm", "ph": "ph", "water_level": "percent"}
+    samples = []
+    for i in range(count):
+        ts = 1760000000000 + i * 30000
+        readings = [
+            {"key": key, "tier": 1, "unit": unit, "value": round(random.uniform(0, 100), 2),
+             "ts": ts, "quality": "good"}
+            for key, unit in units.items()
+        ]
+        samples.append({
+            "device_id": f"device_{i % 8:03d}", "batch_seq": i, "window_ms": 30000,
+            "readings": readings, "timestamp": ts
+        })
+        samples.append({
+            "device_id": f"device_{i % 8:03d}", "status": "online", "uptime": 3600 + i * 30,
+            "state": {
+                "pump_1": {"status": random.choice(["on", "off"]), "flow_rate": round(random.uniform(0, 3), 1)},
+                "valve_1": {"status": "open", "position": 75},
+                "led_1": {"status": "off", "brightness": 0}
+            },
+            "health": {"cpu_temp": round(random.uniform(40, 70), 1), "memory_usage": round(random.uniform(20, 60), 1),
+                       "disk_free_mb": 10240.5, "under_voltage": False, "throttled": "0x0"},
+            "pending_jobs": [], "rules": {"fan_high_temp": False, "pump_dry_soil": False},
+            "timestamp": ts
+        })
+    return [json.dumps(sample).encode("utf-8") for sample in samples]
+
+
+def _benchmark(samples, rounds=3):
+    train, test = samples[::2] + samples[1::4], samples[3::4]
+    codecs = [
+        ("deflate 1", PayloadCodec(DEFLATE, threshold=0, level=1)),
+        ("deflate 6", PayloadCodec(DEFLATE, threshold=0, level=6)),
+        ("deflate 9", PayloadCodec(DEFLATE, threshold=0, level=9)),
+    ]
+    if zstandard is not None:
+        dict_path = "/tmp/payload_codec_bench.dict"
+        with open(dict_path, "wb") as f:
+            f.write(train_dictionary(train, 8192))
+        codecs += [
+            ("zstd 3", PayloadCodec(ZSTD, threshold=0, level=3)),
+            ("zstd 3 + 사전", PayloadCodec(ZSTD, threshold=0, level=3, dictionary=dict_path)),
+            ("zstd 9 + 사전", PayloadCodec(ZSTD, threshold=0, level=9, dictionary=dict_path)),
+        ]
+    else:
+        print("zstandard 없음 - deflate만 비교 (pip install zstandard)")
+
+    raw = sum(len(sample) for sample in test)
+    print(f"메시지 {len(test)}개, 평균 {raw / len(test):.0f}바이트")
+    print(f"{'방식':<14} {'압축률':>6} {'평균 크기':>9} {'압축 µs':>8} {'해제 µs':>8}")
+    for name, codec in codecs:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            encoded = [codec._compress(sample) for sample in test]
+        compress_us = (time.perf_counter() - start) / (rounds * len(test)) * 1e6
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for data in encoded:
+                codec.decode(data, codec.method)
+        decompress_us = (time.perf_counter() - start) / (rounds * len(test)) * 1e6
+
+        size = sum(len(data) for data in encoded)
+        print(f"{name:<14} {raw / size:>6.2f} {size / len(test):>9.0f} {compress_us:>8.1f} {decompress_us:>8.1f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--train":
+        with open(sys.argv[2], "rb") as f:
+            lines = [line.strip() for line in f if line.strip()]
+        with open(sys.argv[3], "wb") as f:
+            f.write(train_dictionary(lines))
+        print(f"사전 저장: {sys.argv[3]} ({len(lines)}개 샘플)")
+    elif len(sys.argv) == 2:
+        with open(sys.argv[1], "rb") as f:
+            _benchmark([line.strip() for line in f if line.strip()])
+    else:
+        _benchmark(_synthetic_samples())
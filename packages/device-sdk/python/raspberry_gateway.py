@@ -4,39 +4,93 @@
 ESP32와 Universal Bridge 사이의 중계 역할
 """
 
-import serial
-import requests
 import json
 import time
 import threading
-from datetime import datetime
+
+from command_cache import CommandCache
+from device_registry import DeviceRegistry
+from http_uplink import HttpUplink, idempotency_key
+from latency_trace import Tracer
+from memory_profile import MemoryReport, configure_threads
+from payload_codec import PayloadCodec
+from sampling_profiler import SamplingProfiler
+from sequence_tracker import DUPLICATE, SEQUENCE_FIELDS, SequenceCounter
+from timebase import Clock, elapsed_ms, format_ts
+from telemetry_backlog import TelemetryBacklog
 
 class RaspberryGateway:
     def __init__(self):
+        # 저메모리 모드 (Pi Zero 등): 이후 만드는 스레드의 스택을 256KB로
+        self.low_memory = False
+        if self.low_memory:
+            configure_threads(256)
+        self.memory_report = MemoryReport()  # memory 명령 응답 (진단할 때만 memory_report.start()로 tracemalloc 켜기)
+        
         # Universal Bridge 설정
         self.bridge_url = "http://192.168.1.100:3001"
         self.device_id = "raspberry-gateway-001"
         self.device_key = "DK_your_device_key"
         
-        # 시리얼 통신 설정 (ESP32와 연결)
-        self.serial_port = "/dev/ttyUSB0"  # 또는 "/dev/ttyACM0"
+        # HTTP 업링크 (연결 재사용, 동시 전송 4개, 타임아웃/재시도, 멱등 키로 재전송 중복 방지, https면 HTTP/2)
+        self.uplink = HttpUplink(
+            self.bridge_url,
+            headers={
+                "x-device-id": self.device_id,
+                "x-tenant-id": "00000000-0000-0000-0000-000000000001"
+            },
+            pool_size=4,
+            max_in_flight=4
+        )
+        
+        # 시리얼 통신 설정 (ESP32와 연결, 포트 경로 또는 glob 패턴 - by-id는 USB를 꽂는 대로 자동 연결)
+        self.serial_ports = ["/dev/serial/by-id/*"]  # 또는 ["/dev/ttyUSB0", "/dev/ttyACM0"]
         self.baud_rate = 115200
-        self.ser = None
         
-        # 연결된 ESP32 디바이스들
-        self.connected_devices = {}
+        # 측정 시각 (수신 시점 monotonic_ns -> UTC epoch ms, 디바이스 시각이 유효하면 그대로 사용)
+        self.clock = Clock()
+        
+        # 구간별 지연 추적 (1%만 샘플링, ESP32가 trace를 붙여 보내면 항상 이어서 추적)
+        self.tracer = Tracer(
+            sample_rate=0.01,
+            trace_file="/home/pi/.smartfarm_gateway_traces.jsonl",
+            clock=self.clock
+        )
+        
+        # 샘플링 프로파일러 (kill -USR2 또는 profile 명령으로 켜고 끄기, flamegraph용 collapsed stack)
+        self.profiler = SamplingProfiler("/home/pi/.smartfarm_gateway_profile.folded")
+        
+        # 수집 시점에 디바이스별로 붙이는 시퀀스 번호 (수신 측이 손실과 무응답을 구분, 누락 구간은 backfill 요청)
+        self.sequencer = SequenceCounter()
+        
+        # 연결된 ESP32 디바이스들 (디바이스별 포트, 마지막 수신, 수신 속도, 시퀀스 누락/중복)
+        self.connected_devices = DeviceRegistry(
+            self.serial_ports,
+            baud_rate=self.baud_rate,
+            on_line=self.process_esp32_data
+        )
+        
+        # 중복 명령 방지 캐시 (재시작 후에도 유지)
+        self.command_cache = CommandCache(
+            max_size=1024,
+            ttl=3600,
+            persist_path="/home/pi/.smartfarm_gateway_commands.json"
+        )
+        
+        # 오프라인 백로그 (재연결 시 최근 원본 + 오래된 구간은 1분/15분 롤업으로 재전송)
+        self.backlog = TelemetryBacklog("/home/pi/.smartfarm_gateway_backlog.db")
+        
+        # 업링크 압축 (512바이트 이상인 배치/백필만 deflate, None이면 압축 안 함)
+        self.codec = PayloadCodec("deflate", threshold=512)
+        self._replay_lock = threading.Lock()
         
     def start(self):
         """게이트웨이 시작"""
         print("🌉 라즈베리파이 게이트웨이 시작")
+        self.profiler.install_signal()
         
-        # 시리얼 연결
-        self.connect_serial()
-        
-        # ESP32 데이터 수신 스레드
-        self.receive_thread = threading.Thread(target=self.receive_from_esp32)
-        self.receive_thread.daemon = True
-        self.receive_thread.start()
+        # 시리얼 연결 (포트별 수신 스레드, 핫플러그 검색)
+        self.connected_devices.start()
         
         # Universal Bridge 명령 수신 스레드
         self.command_thread = threading.Thread(target=self.receive_commands)
@@ -53,74 +107,124 @@ class RaspberryGateway:
             print("\n🛑 게이트웨이 종료")
             self.stop()
     
-    def connect_serial(self):
-        """ESP32와 시리얼 연결"""
-        try:
-            self.ser = serial.Serial(self.serial_port, self.baud_rate, timeout=1)
-            print(f"✅ ESP32 연결: {self.serial_port}")
-        except Exception as e:
-            print(f"❌ 시리얼 연결 실패: {e}")
-    
-    def receive_from_esp32(self):
-        """ESP32에서 데이터 수신"""
-        while True:
-            try:
-                if self.ser and self.ser.in_waiting > 0:
-                    line = self.ser.readline().decode('utf-8').strip()
-                    if line:
-                        self.process_esp32_data(line)
-            except Exception as e:
-                print(f"❌ ESP32 데이터 수신 오류: {e}")
-            time.sleep(0.1)
-    
-    def process_esp32_data(self, data):
-        """ESP32 데이터 처리 및 Universal Bridge로 전송"""
+    def process_esp32_data(self, data, port=None, received_ns=None):
+        """ESP32 데이터 처리 및 Universal Bridge로 전송 (port: 수신한 시리얼 포트, received_ns: 수신 시점)"""
+        if received_ns is None:
+            received_ns = self.clock.now_ns()
         try:
             # ESP32 데이터 파싱 (JSON 형식)
             esp32_data = json.loads(data)
+            trace = self.tracer.start("telemetry", esp32_data.pop("trace", None), received_ns, "serial_rx")
+            
+            # 디바이스 ID 추가 (없으면 포트별 기본 ID) 및 레지스트리 갱신
+            device_id = self.connected_devices.resolve(esp32_data, port)
+            esp32_data["device_id"] = device_id
+            if self.connected_devices.observe(device_id, port, esp32_data.get("seq")) == DUPLICATE:
+                print(f"♻️ 중복 프레임 무시: {device_id} seq={esp32_data['seq']}")
+                return
+            
+            # 게이트웨이 시퀀스 번호 (디바이스가 보낸 seq는 device_seq로 보존)
+            if "seq" in esp32_data:
+                esp32_data["device_seq"] = esp32_data["seq"]
+            esp32_data["seq"] = self.sequencer.next(device_id)
+            esp32_data["seq_epoch"] = self.sequencer.epoch
             
-            # 디바이스 ID 추가
-            esp32_data["device_id"] = esp32_data.get("device_id", "esp32-001")
-            esp32_data["timestamp"] = datetime.now().isoformat()
+            # 측정 시각 (epoch ms, 문자열은 전송할 때 만듦)
+            device_ts = esp32_data.pop("timestamp", None)
+            if device_ts is None:
+                device_ts = esp32_data.pop("ts", None)
+            ts_ms = self.clock.device_ts(device_ts, received_ns)
             
-            # Universal Bridge로 전송
-            self.send_to_bridge(esp32_data)
+            # 백로그에 저장할 값 (키: "디바이스ID.필드")
+            values = {f"{device_id}.{key}": value for key, value in esp32_data.items() if key not in SEQUENCE_FIELDS}
+            
+            def on_sent(response):
+                sent = self.check_bridge_response(response, esp32_data)
+                if sent:
+                    print(f"⏱️ 수신→전송 {elapsed_ms(received_ns)}ms: {device_id}")
+                    self.tracer.mark(trace, "bridge_ack")
+                    self.tracer.finish(trace)
+                # 백로그 저장 및 재연결 후 밀린 데이터 재전송
+                self.backlog.append(values, ts_ms, sent=sent)
+                if sent:
+                    self.replay_backlog()
+            
+            # Universal Bridge로 전송 (업링크 작업 풀에서 비동기, 느린 응답이 다음 수신을 막지 않음)
+            self.tracer.mark(trace, "gateway")
+            if not self.submit_to_bridge(esp32_data, ts_ms, trace, on_sent):
+                print(f"⚠️ 업링크 대기열 가득 참, 백로그에 저장: {device_id}")
+                self.backlog.append(values, ts_ms, sent=False)
             
         except json.JSONDecodeError:
             print(f"❌ JSON 파싱 오류: {data}")
         except Exception as e:
             print(f"❌ 데이터 처리 오류: {e}")
     
-    def send_to_bridge(self, data):
-        """Universal Bridge로 데이터 전송"""
+    def telemetry_request(self, data, ts_ms=None, trace=None):
+        """텔레메트리 요청 본문, 헤더, 멱등 키 (ts_ms: 측정 시각 epoch ms, 없으면 현재 시각, trace: 지연 추적)"""
+        # 멱등 키는 측정 내용(시퀀스 번호, 측정 시각 포함)으로 만들어 재시도/재전송해도 같은 키
+        key = idempotency_key(dict(data, ts=ts_ms))
+        headers = {"Content-Type": "application/json"}
+        
+        payload = dict(data, timestamp=format_ts(ts_ms if ts_ms is not None else self.clock.now_ms()))
+        if trace is not None:
+            self.tracer.mark(trace, "encode")
+            payload["trace"] = self.tracer.context(trace)
+        body = json.dumps(payload)
+        if self.codec:
+            body, encoding = self.codec.encode(body)
+            if encoding:
+                headers["Content-Encoding"] = encoding
+        return body, headers, key
+    
+    def send_to_bridge(self, data, ts_ms=None, trace=None):
+        """Universal Bridge로 데이터 전송 (응답을 기다림, 재시도 포함)"""
         try:
-            url = f"{self.bridge_url}/api/bridge/telemetry"
-            headers = {
-                "Content-Type": "application/json",
-                "x-device-id": self.device_id,
-                "x-tenant-id": "00000000-0000-0000-0000-000000000001"
-            }
-            
-            response = requests.post(url, json=data, headers=headers)
-            if response.status_code == 200:
-                print(f"✅ 데이터 전송 성공: {data.get('device_id', 'unknown')}")
-            else:
-                print(f"❌ 데이터 전송 실패: {response.status_code}")
-                
+            body, headers, key = self.telemetry_request(data, ts_ms, trace)
+            response = self.uplink.post("/api/bridge/telemetry", body, headers, idempotency_key=key)
+            self.tracer.mark(trace, "bridge_ack")
+            return self.check_bridge_response(response, data)
         except Exception as e:
             print(f"❌ Bridge 전송 오류: {e}")
+        return False
+    
+    def submit_to_bridge(self, data, ts_ms=None, trace=None, callback=None):
+        """Universal Bridge로 비동기 전송 (callback(response), 실패하면 None). 대기열이 가득 차면 False"""
+        body, headers, key = self.telemetry_request(data, ts_ms, trace)
+        return self.uplink.submit("/api/bridge/telemetry", body, headers, idempotency_key=key, callback=callback)
+    
+    def check_bridge_response(self, response, data):
+        if response is None:
+            return False
+        if response.status_code == 200:
+            print(f"✅ 데이터 전송 성공: {data.get('device_id', 'unknown')}")
+            return True
+        print(f"❌ 데이터 전송 실패: {response.status_code}")
+        return False
+    
+    def replay_backlog(self):
+        """밀린 데이터 재전송 (다른 업링크 스레드가 이미 재전송 중이면 건너뜀)"""
+        if not self._replay_lock.acquire(blocking=False):
+            return
+        try:
+            self.backlog.replay(self.send_backfill, max_batches=2)
+        finally:
+            self._replay_lock.release()
+    
+    def send_backfill(self, batch):
+        """백로그 배치 전송 (원본 또는 1분/15분 롤업)"""
+        data = {
+            "device_id": self.device_id,
+            "status": "backfill"
+        }
+        data.update(batch)
+        return self.send_to_bridge(data)
     
     def receive_commands(self):
         """Universal Bridge에서 명령 수신"""
         while True:
             try:
-                url = f"{self.bridge_url}/api/bridge/commands/{self.device_id}"
-                headers = {
-                    "x-device-id": self.device_id,
-                    "x-tenant-id": "00000000-0000-0000-0000-000000000001"
-                }
-                
-                response = requests.get(url, headers=headers)
+                response = self.uplink.get(f"/api/bridge/commands/{self.device_id}")
                 if response.status_code == 200:
                     commands = response.json().get("commands", [])
                     for cmd in commands:
@@ -133,26 +237,119 @@ class RaspberryGateway:
     
     def process_command(self, cmd):
         """명령 처리 및 ESP32로 전송"""
+        command_id = cmd.get("command_id")
+        trace = self.tracer.start("command", cmd.get("trace"), stage="received")
+        
+        # 이미 실행한 명령이면 캐시된 ACK만 다시 전송
+        cached_ack = self.command_cache.get(command_id)
+        if cached_ack is not None:
+            print(f"♻️ 중복 명령 무시: {command_id}")
+            self.send_command_ack(command_id, cached_ack)
+            return
+        
+        # 게이트웨이 자체 명령: 원본 해상도 재전송 요청
+        if cmd.get("type") == "backfill":
+            # 재전송이 끝나기 전에 다시 들어온 같은 요청은 무시 (끝나면 ACK 전송)
+            if not self.command_cache.begin(command_id):
+                print(f"♻️ 실행 중인 명령 무시: {command_id}")
+                return
+            params = cmd.get("params", {})
+            count = self.backlog.backfill(
+                self.send_backfill,
+                params.get("start", 0),
+                params.get("end", int(time.time() * 1000)),
+                keys=params.get("keys")
+            )
+            ack = {"status": "success", "result": f"backfilled {count} readings"}
+            self.command_cache.put(command_id, ack)
+            self.send_command_ack(command_id, ack)
+            return
+        
+        # 게이트웨이 자체 명령: 하위 디바이스 목록/통계, 구간별 지연 통계, 업링크 통계, 메모리, 프로파일러 제어 (캐시하지 않음)
+        if cmd.get("type") == "devices":
+            self.send_command_ack(command_id, {"status": "success", "result": self.connected_devices.stats()})
+            return
+        if cmd.get("type") == "latency":
+            self.send_command_ack(command_id, {"status": "success", "result": self.tracer.stats()})
+            return
+        if cmd.get("type") == "uplink":
+            self.send_command_ack(command_id, {"status": "success", "result": self.uplink.stats()})
+            return
+        if cmd.get("type") == "memory":
+            self.send_command_ack(command_id, {"status": "success", "result": self.memory_report.report()})
+            return
+        if cmd.get("type") == "profile":
+            params = cmd.get("params", {})
+            try:
+                result = self.profiler.control(params.get("action", "status"), params.get("duration"))
+                self.send_command_ack(command_id, {"status": "success", "result": result})
+            except ValueError as e:
+                self.send_command_ack(command_id, {"status": "error", "error_message": str(e)})
+            return
+        
+        if not self.command_cache.begin(command_id):
+            print(f"♻️ 실행 중인 명령 무시: {command_id}")
+            return
         try:
-            # 명령을 ESP32로 전송
+            # 명령을 ESP32로 전송 (device_id가 있으면 그 디바이스의 포트로만, 없으면 모든 포트로)
+            target = cmd.get("device_id")
             command_data = {
                 "type": cmd["type"],
-                "action": cmd["action"],
-                "params": cmd["params"]
+                "action": cmd.get("action"),
+                "params": cmd.get("params", {})
             }
+            if trace is not None:
+                # ESP32가 실행 시각을 이어서 기록할 수 있도록 추적 컨텍스트 전달
+                self.tracer.mark(trace, "serial_tx")
+                command_data["trace"] = self.tracer.context(trace)
+            line = json.dumps(command_data)
             
-            if self.ser:
-                self.ser.write(json.dumps(command_data).encode('utf-8'))
-                self.ser.write(b'\n')
-                print(f"📤 명령 전송: {command_data}")
+            if target:
+                if not self.connected_devices.send(target, line):
+                    print(f"⚠️ {target} 미연결, 명령 보류: {command_id}")
+                    self.command_cache.discard(command_id)
+                    return
+                result = f"forwarded to {target}"
+            elif not self.connected_devices.broadcast(line):
+                print(f"⚠️ ESP32 미연결, 명령 보류: {command_id}")
+                self.command_cache.discard(command_id)
+                return
+            else:
+                result = "forwarded to ESP32"
+            print(f"📤 명령 전송: {command_data}")
+            ack = {"status": "success", "result": result}
                 
         except Exception as e:
             print(f"❌ 명령 처리 오류: {e}")
+            ack = {"status": "error", "error_message": str(e)}
+        
+        self.command_cache.put(command_id, ack)
+        self.send_command_ack(command_id, ack)
+        self.tracer.mark(trace, "ack")
+        self.tracer.finish(trace)
+    
+    def send_command_ack(self, command_id, ack):
+        """Universal Bridge로 명령 ACK 전송"""
+        if not command_id:
+            return
+        
+        try:
+            # 응답 시간 초과 후 재시도해도 Bridge가 같은 ACK를 한 번만 반영하도록 멱등 키 전송
+            response = self.uplink.post(
+                f"/api/bridge/commands/{command_id}/ack", ack,
+                idempotency_key=idempotency_key({"command_id": command_id, **ack})
+            )
+            if response.status_code != 200:
+                print(f"❌ 명령 ACK 전송 실패: {response.status_code}")
+                
+        except Exception as e:
+            print(f"❌ 명령 ACK 전송 오류: {e}")
     
     def stop(self):
         """게이트웨이 종료"""
-        if self.ser:
-            self.ser.close()
+        self.command_cache.flush()
+        self.connected_devices.stop()
+        self.uplink.close()
 
 if __name__ == "__main__":
     gateway = RaspberryGateway()
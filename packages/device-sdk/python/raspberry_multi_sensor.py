@@ -4,14 +4,20 @@
 DHT22 + 릴레이 + 카메라 + 기타 센서들
 """
 
-import requests
 import json
 import time
 import threading
-from datetime import datetime
 import RPi.GPIO as GPIO
 import Adafruit_DHT
 
+from actuator_scheduler import ActuatorScheduler
+from camera_pipeline import CameraPipeline, ImageIndex, ImageUploader
+from command_cache import CommandCache
+from http_uplink import HttpUplink, idempotency_key
+from rule_engine import RuleEngine
+from system_health import SystemHealth
+from timebase import Clock, format_ts
+
 class RaspberryMultiSensor:
     def __init__(self):
         # Universal Bridge 설정
@@ -19,6 +25,17 @@ class RaspberryMultiSensor:
         self.device_id = "raspberry-multi-001"
         self.device_key = "DK_your_device_key"
         
+        # HTTP 업링크 (연결 재사용, 타임아웃/재시도, 멱등 키로 재시도 중복 방지, https면 HTTP/2)
+        self.uplink = HttpUplink(
+            self.bridge_url,
+            headers={
+                "x-device-id": self.device_id,
+                "x-tenant-id": "00000000-0000-0000-0000-000000000001"
+            },
+            pool_size=2,
+            max_in_flight=2
+        )
+        
         # 센서 설정
         self.dht_sensor = Adafruit_DHT.DHT22
         self.dht_pin = 4
@@ -30,16 +47,80 @@ class RaspberryMultiSensor:
             GPIO.setup(pin, GPIO.OUT)
             GPIO.output(pin, GPIO.LOW)
         
-        # 카메라 설정
+        # 릴레이 인터록 (예: {"relay_2": ["relay_1"]} → 릴레이1(밸브)이 켜져 있어야 릴레이2(펌프) ON 가능)
+        self.relay_interlocks = {}
+        
+        # 릴레이 타이머/시퀀스 스케줄러 (서버 왕복 없이 디바이스에서 OFF 처리)
+        self.scheduler = ActuatorScheduler(persist_path="/home/pi/.smartfarm_multi_schedule.json")
+        for i, pin in enumerate(self.relay_pins):
+            name = f"relay_{i+1}"
+            self.scheduler.register(
+                name,
+                lambda state, pin=pin: GPIO.output(pin, GPIO.HIGH if state else GPIO.LOW),
+                requires=self.relay_interlocks.get(name)
+            )
+        
+        # 로컬 제어 룰 (클라우드 없이 센서 값으로 릴레이 제어, 오프라인에서도 동작)
+        # 예: {"name": "fan_high_temp", "when": "temp > 30", "hysteresis": 2, "actuator": "relay_3", "min_on": 60}
+        self.rules = []
+        self.rule_engine = RuleEngine(self.rules, {
+            f"relay_{i+1}": (lambda state, name=f"relay_{i+1}": self.scheduler.set(name, state))
+            for i in range(len(self.relay_pins))
+        })
+        
+        # 카메라 설정 (촬영/썸네일/업로드는 백그라운드 스레드에서 처리)
         self.camera_enabled = True
+        self.image_dir = "/home/pi/images"
+        self.image_index = ImageIndex(self.image_dir, state_path="/home/pi/.smartfarm_image_uploads.json")
+        self.image_uploader = ImageUploader(
+            self.bridge_url,
+            self.device_id,
+            {
+                "x-device-id": self.device_id,
+                "x-tenant-id": "00000000-0000-0000-0000-000000000001"
+            },
+            self.image_index
+        )
+        self.camera = CameraPipeline(
+            self.image_dir,
+            self.image_index,
+            resolution=(640, 480),
+            quality=80,
+            thumbnail_size=(160, 120),
+            queue_size=4,
+            uploader=self.image_uploader
+        )
         
         # 전송 주기
         self.send_interval = 30  # 30초
         
+        # 측정 시각 (monotonic_ns -> UTC epoch ms, 주기적으로 오프셋 재측정)
+        self.clock = Clock()
+        
+        # 시스템 상태 수집 (자체 주기로 샘플링, 텔레메트리에는 마지막 값만 병합)
+        self.system_health = SystemHealth(interval=10, block_device="mmcblk0")
+        
+        # 중복 명령 방지 캐시 (재시작 후에도 유지)
+        self.command_cache = CommandCache(
+            max_size=1024,
+            ttl=3600,
+            persist_path="/home/pi/.smartfarm_multi_commands.json"
+        )
+        
     def start(self):
         """센서 클라이언트 시작"""
         print("🌉 라즈베리파이 다중 센서 클라이언트 시작")
         
+        # 릴레이 스케줄러 시작 (저장된 스케줄 복원)
+        self.scheduler.start()
+        
+        # 시스템 상태 수집 시작
+        self.system_health.start()
+        
+        # 카메라 파이프라인 시작 (미완료 업로드 재개)
+        self.camera.start()
+        self.image_uploader.start()
+        
         # 센서 데이터 전송 스레드
         self.sensor_thread = threading.Thread(target=self.send_sensor_data)
         self.sensor_thread.daemon = True
@@ -67,6 +148,10 @@ class RaspberryMultiSensor:
                 # 모든 센서 데이터 수집
                 sensor_data = self.collect_all_sensors()
                 
+                # 로컬 룰 평가 (전송 성공 여부와 무관)
+                self.rule_engine.update(sensor_data)
+                self.rule_engine.tick()
+                
                 # Universal Bridge로 전송
                 self.send_to_bridge(sensor_data)
                 
@@ -76,14 +161,12 @@ class RaspberryMultiSensor:
             time.sleep(self.send_interval)
     
     def collect_all_sensors(self):
-        """모든 센서 데이터 수집"""
-        data = {
-            "device_id": self.device_id,
-            "timestamp": datetime.now().isoformat()
-        }
+        """모든 센서 데이터 수집 (timestamp: DHT22 측정 시점의 epoch ms, 전송할 때 문자열로 변환)"""
+        data = {"device_id": self.device_id}
         
-        # DHT22 온습도 센서
+        # DHT22 온습도 센서 (read_retry는 재시도로 몇 초 걸릴 수 있으므로 읽은 직후 시각 기록)
         humidity, temperature = Adafruit_DHT.read_retry(self.dht_sensor, self.dht_pin)
+        data["timestamp"] = self.clock.to_epoch_ms(self.clock.now_ns())
         if humidity is not None and temperature is not None:
             data["temp"] = round(temperature, 1)
             data["hum"] = round(humidity, 1)
@@ -94,64 +177,36 @@ class RaspberryMultiSensor:
         # 릴레이 상태
         for i, pin in enumerate(self.relay_pins):
             data[f"relay_{i+1}_state"] = GPIO.input(pin)
+        data["scheduled_jobs"] = len(self.scheduler.pending())
         
-        # 시스템 정보
-        data["cpu_temp"] = self.get_cpu_temperature()
-        data["memory_usage"] = self.get_memory_usage()
+        # 시스템 정보 (CPU/메모리/디스크/네트워크/스로틀링)
+        data.update(self.system_health.snapshot())
         
         # 카메라 정보 (이미지 촬영은 별도 처리)
         if self.camera_enabled:
             data["camera_available"] = True
-            data["image_count"] = self.get_image_count()
+            data.update(self.image_index.summary())
         
         return data
     
     def get_cpu_temperature(self):
-        """CPU 온도 읽기"""
-        try:
-            with open('/sys/class/thermal/thermal_zone0/temp', 'r') as f:
-                temp = int(f.read()) / 1000.0
-                return round(temp, 1)
-        except:
-            return None
+        """CPU 온도 (마지막 샘플)"""
+        return self.system_health.snapshot().get("cpu_temp")
     
     def get_memory_usage(self):
-        """메모리 사용률 읽기"""
-        try:
-            with open('/proc/meminfo', 'r') as f:
-                meminfo = f.read()
-                for line in meminfo.split('\n'):
-                    if 'MemAvailable:' in line:
-                        available = int(line.split()[1])
-                    elif 'MemTotal:' in line:
-                        total = int(line.split()[1])
-                usage = ((total - available) / total) * 100
-                return round(usage, 1)
-        except:
-            return None
+        """메모리 사용률 (마지막 샘플)"""
+        return self.system_health.snapshot().get("memory_usage")
     
     def get_image_count(self):
-        """저장된 이미지 개수"""
-        try:
-            import os
-            image_dir = "/home/pi/images"
-            if os.path.exists(image_dir):
-                return len([f for f in os.listdir(image_dir) if f.endswith('.jpg')])
-            return 0
-        except:
-            return 0
+        """저장된 이미지 개수 (인덱스에서 조회, 디렉터리 스캔 없음)"""
+        return self.image_index.count
     
     def send_to_bridge(self, data):
         """Universal Bridge로 데이터 전송"""
         try:
-            url = f"{self.bridge_url}/api/bridge/telemetry"
-            headers = {
-                "Content-Type": "application/json",
-                "x-device-id": self.device_id,
-                "x-tenant-id": "00000000-0000-0000-0000-000000000001"
-            }
-            
-            response = requests.post(url, json=data, headers=headers)
+            payload = dict(data, timestamp=format_ts(data["timestamp"]))
+            # 측정 시각이 들어 있으므로 같은 측정값을 다시 보내면 같은 키
+            response = self.uplink.post("/api/bridge/telemetry", payload, idempotency_key=idempotency_key(payload))
             if response.status_code == 200:
                 print(f"✅ 센서 데이터 전송 성공: {data['temp']}°C, {data['hum']}%")
             else:
@@ -164,13 +219,7 @@ class RaspberryMultiSensor:
         """Universal Bridge에서 명령 수신"""
         while True:
             try:
-                url = f"{self.bridge_url}/api/bridge/commands/{self.device_id}"
-                headers = {
-                    "x-device-id": self.device_id,
-                    "x-tenant-id": "00000000-0000-0000-0000-000000000001"
-                }
-                
-                response = requests.get(url, headers=headers)
+                response = self.uplink.get(f"/api/bridge/commands/{self.device_id}")
                 if response.status_code == 200:
                     commands = response.json().get("commands", [])
                     for cmd in commands:
@@ -183,56 +232,105 @@ class RaspberryMultiSensor:
     
     def process_command(self, cmd):
         """명령 처리"""
+        command_id = cmd.get("command_id")
+        
+        # 이미 실행한 명령이면 릴레이를 다시 움직이지 않고 캐시된 ACK만 재전송
+        cached_ack = self.command_cache.get(command_id)
+        if cached_ack is not None:
+            print(f"♻️ 중복 명령 무시: {command_id}")
+            self.send_command_ack(command_id, cached_ack)
+            return
+        # 실행 중인 명령의 재전송 (폴링 중복)은 무시 - 실행이 끝나면 ACK 전송
+        if not self.command_cache.begin(command_id):
+            print(f"♻️ 실행 중인 명령 무시: {command_id}")
+            return
+        
+        ack = {"status": "success"}
         try:
             cmd_type = cmd["type"]
-            action = cmd["action"]
-            params = cmd["params"]
+            action = cmd.get("action")
+            params = cmd.get("params", {})
             
             if cmd_type == "relay_control":
                 relay_num = params["relay"]
-                state = params["state"]
+                state = params["state"] == "on"
+                duration = params.get("duration")
                 
                 if 1 <= relay_num <= len(self.relay_pins):
-                    pin = self.relay_pins[relay_num - 1]
-                    GPIO.output(pin, GPIO.HIGH if state == "on" else GPIO.LOW)
-                    print(f"🔌 릴레이 {relay_num} {'ON' if state == 'on' else 'OFF'}")
+                    name = f"relay_{relay_num}"
+                    if duration:
+                        # 지정 시간 후 자동 복귀
+                        ok = self.scheduler.pulse(name, duration, state, job_id=command_id) is not None
+                    else:
+                        ok = self.scheduler.set(name, state)
+                    if not ok:
+                        ack = {"status": "error", "error_message": f"{name} 제어 거부 (인터록)"}
+                    print(f"🔌 릴레이 {relay_num} {'ON' if state else 'OFF'}" + (f" ({duration}초)" if duration else ""))
+            
+            elif cmd_type == "relay_sequence":
+                # 예: [{"relay": 1, "state": "on", "wait": 0}, {"relay": 2, "state": "on", "wait": 2}, ...]
+                steps = [
+                    (f"relay_{step['relay']}", step["state"] == "on", step.get("wait", 0))
+                    for step in params["steps"]
+                ]
+                if self.scheduler.run_sequence(steps, job_id=command_id) is None:
+                    ack = {"status": "error", "error_message": "시퀀스 중단 (인터록)"}
+                print(f"⏱️ 릴레이 시퀀스 시작: {len(steps)}단계")
+            
+            elif cmd_type == "relay_cancel":
+                self.scheduler.cancel(params["job_id"])
             
             elif cmd_type == "camera_control":
                 if action == "capture":
-                    self.capture_image()
+                    # 촬영 대기열에 넣고 바로 ACK (촬영 완료를 기다리지 않음)
+                    if not self.capture_image(params.get("tag")):
+                        ack = {"status": "error", "error_message": "촬영 대기열이 가득 참"}
                 elif action == "enable":
                     self.camera_enabled = True
                 elif action == "disable":
                     self.camera_enabled = False
             
             elif cmd_type == "system_control":
+                # 재부팅/종료 전에 ACK를 파일에 기록해야 재시작 후 같은 명령을 반복하지 않음
+                self.command_cache.put(command_id, ack)
+                self.command_cache.flush()
+                self.send_command_ack(command_id, ack)
                 if action == "reboot":
                     self.reboot_system()
                 elif action == "shutdown":
                     self.shutdown_system()
+                return
                     
         except Exception as e:
             print(f"❌ 명령 처리 오류: {e}")
+            ack = {"status": "error", "error_message": str(e)}
+        
+        self.command_cache.put(command_id, ack)
+        self.send_command_ack(command_id, ack)
     
-    def capture_image(self):
-        """이미지 촬영"""
+    def send_command_ack(self, command_id, ack):
+        """Universal Bridge로 명령 ACK 전송"""
+        if not command_id:
+            return
+        
         try:
-            import subprocess
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"/home/pi/images/capture_{timestamp}.jpg"
-            
-            subprocess.run([
-                "raspistill", 
-                "-o", filename,
-                "-w", "640", 
-                "-h", "480",
-                "-q", "80"
-            ], check=True)
-            
-            print(f"📸 이미지 촬영 완료: {filename}")
-            
+            # 응답 시간 초과 후 재시도해도 Bridge가 같은 ACK를 한 번만 반영하도록 멱등 키 전송
+            response = self.uplink.post(
+                f"/api/bridge/commands/{command_id}/ack", ack,
+                idempotency_key=idempotency_key({"command_id": command_id, **ack})
+            )
+            if response.status_code != 200:
+                print(f"❌ 명령 ACK 전송 실패: {response.status_code}")
+                
         except Exception as e:
-            print(f"❌ 이미지 촬영 오류: {e}")
+            print(f"❌ 명령 ACK 전송 오류: {e}")
+    
+    def capture_image(self, tag=None):
+        """이미지 촬영 요청 (비동기)"""
+        if not self.camera_enabled:
+            print("⚠️ 카메라 비활성화 상태")
+            return False
+        return self.camera.request_capture(tag)
     
     def reboot_system(self):
         """시스템 재부팅"""
@@ -248,6 +346,12 @@ class RaspberryMultiSensor:
     
     def stop(self):
         """클라이언트 종료"""
+        self.command_cache.flush()
+        self.scheduler.stop()
+        self.system_health.stop()
+        self.camera.stop()
+        self.image_uploader.stop()
+        self.uplink.close()
         GPIO.cleanup()
 
 if __name__ == "__main__":
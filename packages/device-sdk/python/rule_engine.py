@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+엣지 로컬 룰 엔진
+클라우드 왕복 없이 디바이스에서 바로 제어 (예: 30°C 초과 시 팬 ON, 토양 건조 시 펌프 ON)
+
+- 룰의 조건식은 설정 로드 시 한 번만 파이썬 클로저로 컴파일 (eval 미사용)
+- 입력 값이 바뀐 키를 참조하는 룰만 다시 평가 (증분 평가)
+- 히스테리시스(off_when 또는 hysteresis)와 최소 ON/OFF 유지 시간 지원
+- 네트워크가 끊겨도 로컬 센서 값만으로 계속 동작
+
+룰 예시:
+    {
+        "name": "fan_high_temp",
+        "when": "temperature > 30",
+        "hysteresis": 2,            # 28°C 미만이 되면 OFF (또는 "off_when": "temperature < 28")
+        "actuator": "fan",
+        "min_on": 60,               # 최소 ON 유지 시간 (초)
+        "min_off": 30               # 최소 OFF 유지 시간 (초)
+    }
+"""
+
+import ast
+import operator
+import time
+
+_COMPARE_OPS = {
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+}
+
+_BINARY_OPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+}
+
+
+def compile_condition(expression):
+    """
+    조건식을 클로저로 컴파일
+
+    Returns:
+        (condition(snapshot) -> bool, 참조하는 키 집합)
+    """
+    keys = set()
+    tree = ast.parse(expression, mode='eval')
+    return _compile_node(tree.body, keys, expression), keys
+
+
+def _compile_node(node, keys, expression):
+    if isinstance(node, ast.BoolOp):
+        parts = [_compile_node(value, keys, expression) for value in node.values]
+        if isinstance(node.op, ast.And):
+            return lambda s: all(part(s) for part in parts)
+        return lambda s: any(part(s) for part in parts)
+
+    if isinstance(node, ast.UnaryOp):
+        operand = _compile_node(node.operand, keys, expression)
+        if isinstance(node.op, ast.Not):
+            return lambda s: not operand(s)
+        if isinstance(node.op, ast.USub):
+            return lambda s: -operand(s)
+
+    if isinstance(node, ast.Compare):
+        left = _compile_node(node.left, keys, expression)
+        pairs = [(_COMPARE_OPS[type(op)], _compile_node(right, keys, expression))
+                 for op, right in zip(node.ops, node.comparators) if type(op) in _COMPARE_OPS]
+        if len(pairs) != len(node.ops):
+            raise ValueError(f"지원하지 않는 비교 연산: {expression}")
+
+        def compare(s):
+            current = left(s)
+            for op, right in pairs:
+                value = right(s)
+                if not op(current, value):
+                    return False
+                current = value
+            return True
+        return compare
+
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPS:
+        op = _BINARY_OPS[type(node.op)]
+        left = _compile_node(node.left, keys, expression)
+        right = _compile_node(node.right, keys, expression)
+        return lambda s: op(left(s), right(s))
+
+    if isinstance(node, ast.Name):
+        key = node.id
+        keys.add(key)
+        return lambda s: s[key]
+
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, bool)):
+        value = node.value
+        return lambda s: value
+
+    raise ValueError(f"허용되지 않는 표현식: {expression}")
+
+
+def _hysteresis_expression(expression, band):
+    """'key > 30' 형태의 단순 조건에서 OFF 조건식 생성 ('key < 28')"""
+    node = ast.parse(expression, mode='eval').body
+    if (isinstance(node, ast.Compare) and len(node.ops) == 1
+            and isinstance(node.left, ast.Name) and isinstance(node.comparators[0], ast.Constant)):
+        key, threshold = node.left.id, node.comparators[0].value
+        if isinstance(node.ops[0], (ast.Gt, ast.GtE)):
+            return f"{key} < {threshold - band}"
+        if isinstance(node.ops[0], (ast.Lt, ast.LtE)):
+            return f"{key} > {threshold + band}"
+    raise ValueError(f"hysteresis는 'key > 값' 형태에만 사용 가능 (off_when 사용): {expression}")
+
+
+class Rule:
+    __slots__ = ("name", "actuator", "on_state", "min_on", "min_off", "when", "keys", "off_when",
+                 "active", "changed_at", "pending")
+
+    def __init__(self, config):
+        self.name = config['name']
+        self.actuator = config['actuator']
+        self.on_state = config.get('state', True)
+        self.min_on = config.get('min_on', 0)
+        self.min_off = config.get('min_off', 0)
+
+        self.when, self.keys = compile_condition(config['when'])
+        off_expression = config.get('off_when')
+        if off_expression is None and config.get('hysteresis'):
+            off_expression = _hysteresis_expression(config['when'], config['hysteresis'])
+        if off_expression is not None:
+            self.off_when, off_keys = compile_condition(off_expression)
+            self.keys |= off_keys
+        else:
+            when = self.when
+            self.off_when = lambda s: not when(s)
+
+        self.active = False
+        self.changed_at = float('-inf')
+        self.pending = False  # 최소 유지 시간 때문에 보류된 전환
+
+
+class RuleEngine:
+    def __init__(self, rules, actions):
+        """
+        Args:
+            rules: 룰 설정 목록 (dict)
+            actions: 액추에이터 이름 -> 제어 함수(state) -> bool
+        """
+        self.actions = actions
+        self.snapshot = {}
+        self.rules = []
+        self._by_key = {}  # 입력 키 -> 해당 키를 참조하는 룰 목록
+
+        for config in rules:
+            if not config.get('enabled', True):
+                continue
+            rule = Rule(config)
+            if rule.actuator not in actions:
+                raise ValueError(f"알 수 없는 액추에이터: {rule.actuator} (룰 {rule.name})")
+            self.rules.append(rule)
+            for key in rule.keys:
+                self._by_key.setdefault(key, []).append(rule)
+
+    def update(self, values):
+        """
+        새 센서 값 반영 후 영향 받는 룰만 평가
+
+        Returns:
+            이번 평가에서 실행된 (룰 이름, 상태) 목록
+        """
+        affected = []
+        seen = set()
+        for key, value in values.items():
+            if value is None or self.snapshot.get(key) == value:
+                continue
+            self.snapshot[key] = value
+            for rule in self._by_key.get(key, ()):
+                if id(rule) not in seen:
+                    seen.add(id(rule))
+                    affected.append(rule)
+
+        return self._evaluate(affected)
+
+    def tick(self):
+        """최소 유지 시간 때문에 보류된 전환 재확인 (주기적으로 호출)"""
+        return self._evaluate([rule for rule in self.rules if rule.pending])
+
+    def status(self):
+        """룰별 현재 상태"""
+        return {rule.name: rule.active for rule in self.rules}
+
+    def _evaluate(self, rules):
+        fired = []
+        now = time.monotonic()
+
+        for rule in rules:
+            try:
+                if rule.active:
+                    want_change = rule.off_when(self.snapshot)
+                else:
+                    want_change = rule.when(self.snapshot)
+            except (KeyError, TypeError, ZeroDivisionError):
+                continue  # 아직 값이 없는 센서 등
+
+            if not want_change:
+                rule.pending = False
+                continue
+
+            hold = rule.min_on if rule.active else rule.min_off
+            if now - rule.changed_at < hold:
+                rule.pending = True
+                continue
+
+            target = not rule.active
+            state = rule.on_state if target else not rule.on_state
+            if self.actions[rule.actuator](state) is False:
+                rule.pending = True  # 다음 tick()에서 재시도
+                continue
+
+            rule.active = target
+            rule.changed_at = now
+            rule.pending = False
+            fired.append((rule.name, state))
+            print(f"⚙️ 룰 실행: {rule.name} → {rule.actuator} {'ON' if state else 'OFF'}")
+
+        return fired
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+샘플링 프로파일러 (실행 중 켜고 끄기, flamegraph용 collapsed stack 출력)
+
+- interval마다 sys._current_frames()로 모든 스레드의 스택을 읽어 "스레드;파일:함수;..." 단위로 횟수 집계
+  (인터프리터를 멈추거나 트레이스 훅을 걸지 않으므로 켜 둔 동안에도 부하가 작음)
+- flush_interval마다 "스택 횟수" 줄을 파일에 추가, max_bytes를 넘으면 .1, .2 ...로 교체
+- 켜고 끄기: 시그널 (기본 SIGUSR2, `kill -USR2 <pid>`) 또는 원격 profile 명령
+
+flamegraph 만들기:
+    cat profile.folded* | flamegraph.pl > profile.svg     # 또는 https://www.speedscope.app 에 업로드
+"""
+
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SamplingProfiler:
+    def __init__(self, output, interval=0.02, flush_interval=10.0, max_bytes=5 * 1024 * 1024, backups=3):
+        """
+        Args:
+            output: collapsed stack 파일 경로
+            interval: 샘플링 주기 (초, 기본 50Hz)
+            flush_interval: 집계한 스택을 파일에 쓰는 주기 (초)
+            max_bytes / backups: 파일 최대 크기와 보관할 이전 파일 수
+        """
+        self.output = output
+        self.interval = interval
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+
+        self.samples = 0
+        self.started_at = None
+        self._counts = {}   # collapsed stack -> 횟수 (아직 파일에 쓰지 않은 것)
+        self._labels = {}   # code 객체 -> "파일:함수"
+        self._lock = threading.RLock()  # 시그널 핸들러가 start() 도중에 다시 들어올 수 있음
+        self._stop = threading.Event()
+        self._thread = None
+        self._deadline = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration=None):
+        """샘플링 시작 (duration초 뒤 자동 종료, None이면 stop()까지). 이미 실행 중이면 False"""
+        with self._lock:
+            if self.running:
+                return False
+            self._stop.clear()
+            self._deadline = time.monotonic() + duration if duration else None
+            self.started_at = time.time()
+            self.samples = 0
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+        logger.info(f"프로파일링 시작: {self.output} ({1 / self.interval:.0f}Hz)")
+        return True
+
+    def stop(self):
+        """샘플링 종료 (기다리지 않음, 남은 집계는 샘플링 스레드가 파일에 씀). 실행 중이 아니었으면 False"""
+        if not self.running:
+            return False
+        self._stop.set()
+        return True
+
+    def toggle(self, *_):
+        """켜져 있으면 끄고, 꺼져 있으면 켬 (시그널 핸들러로 사용)"""
+        if not self.stop():
+            self.start()
+
+    def control(self, action="status", duration=None):
+        """원격 profile 명령 처리 (action: start / stop / toggle / status). 처리 후 상태 반환"""
+        if action == "start":
+            self.start(duration)
+        elif action == "stop":
+            self.stop()
+        elif action == "toggle":
+            self.toggle()
+        elif action != "status":
+            raise ValueError(f"알 수 없는 profile action: {action}")
+        return self.status()
+
+    def install_signal(self, signum=getattr(signal, "SIGUSR2", None)):
+        """시그널로 켜고 끄기 (메인 스레드에서 호출). 설치했으면 True"""
+        if signum is None or threading.current_thread() is not threading.main_thread():
+            return False
+        signal.signal(signum, self.toggle)
+        return True
+
+    def status(self):
+        return {
+            "running": self.running,
+            "output": self.output,
+            "interval": self.interval,
+            "samples": self.samples,
+            "started_at": self.started_at
+        }
+
+    def _run(self):
+        own = threading.get_ident()
+        next_flush = time.monotonic() + self.flush_interval
+        while not self._stop.wait(self.interval):
+            self._sample(own)
+            now = time.monotonic()
+            if self._deadline is not None and now >= self._deadline:
+                break
+            if now >= next_flush:
+                self._flush()
+                next_flush = now + self.flush_interval
+        self._flush()
+        logger.info(f"프로파일링 종료: 샘플 {self.samples}개 → {self.output}")
+
+    def _sample(self, own):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            key = ";".join(reversed(stack))
+            self._counts[key] = self._counts.get(key, 0) + 1
+        self.samples += 1
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{os.path.basename(code.co_filename)}:{code.co_name}".replace(";", ":")
+        return label
+
+    def _flush(self):
+        counts, self._counts = self._counts, {}
+        if not counts:
+            return
+        try:
+            self._rotate()
+            with open(self.output, "a") as f:
+                f.writelines(f"{stack} {count}\n" for stack, count in counts.items())
+        except OSError as e:
+            logger.warning(f"프로파일 기록 실패: {e}")
+
+    def _rotate(self):
+        if not os.path.exists(self.output) or os.path.getsize(self.output) < self.max_bytes:
+            return
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.output}.{i}"):
+                os.replace(f"{self.output}.{i}", f"{self.output}.{i + 1}")
+        if self.backups:
+            os.replace(self.output, f"{self.output}.1")
+        else:
+            os.remove(self.output)
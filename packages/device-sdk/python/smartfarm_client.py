@@ -12,8 +12,11 @@ SmartFarm Universal Bridge - Python HTTP Client
 """
 
 import requests
+import itertools
+import os
 import time
 import json
+import zlib
 from datetime import datetime, timezone
 
 # ========== 여기만 수정하세요! ==========
@@ -22,18 +25,30 @@ from datetime import datetime, timezone
 SERVER_URL = "http://192.168.1.100:3000"
 DEVICE_ID = "pi-001"
 DEVICE_KEY = "DK_your_device_key"
+TENANT_ID = ""  # 일괄 업로드(스풀 재전송)에 필요
 
 # 전송 주기 (초)
 SEND_INTERVAL = 30
 
+# 압축: 이 크기(바이트) 이상인 전송은 deflate로 압축 (LTE 데이터 절약, 0이면 압축 안 함)
+COMPRESS_THRESHOLD = 512
+
+# 전송 실패한 측정값을 NDJSON 파일로 모아 두었다가 연결되면 한 요청으로 스트리밍 업로드 (None이면 버림)
+SPOOL_DIR = "spool"
+BULK_CHUNK_SIZE = 64 * 1024   # 일괄 업로드 본문을 나눠 보내는 크기 (바이트)
+BULK_TIMEOUT = 120            # 일괄 업로드 응답 대기 (초)
+
 # ========== 이하 수정 불필요 ==========
 
 class SmartFarmClient:
-    def __init__(self, server_url, device_id, device_key):
+    def __init__(self, server_url, device_id, device_key, compress_threshold=COMPRESS_THRESHOLD, tenant_id=TENANT_ID):
         self.server_url = server_url
         self.device_id = device_id
         self.device_key = device_key
+        self.tenant_id = tenant_id
+        self.compress_threshold = compress_threshold
         self.session = requests.Session()
+        self.spool_file = None  # 지금 쌓고 있는 스풀 파일
         
     def send_telemetry(self, readings):
         """센서 데이터 전송"""
@@ -52,7 +67,14 @@ class SmartFarmClient:
                 "timestamp": datetime.now(timezone.utc).isoformat(),
             }
             
-            response = self.session.post(url, json=payload, headers=headers, timeout=10)
+            body = json.dumps(payload).encode("utf-8")
+            if self.compress_threshold and len(body) >= self.compress_threshold:
+                compressed = zlib.compress(body)
+                if len(compressed) < len(body):
+                    body = compressed
+                    headers["Content-Encoding"] = "deflate"
+            
+            response = self.session.post(url, data=body, headers=headers, timeout=10)
             response.raise_for_status()
             
             result = response.json()
@@ -63,6 +85,108 @@ class SmartFarmClient:
             print(f"❌ 전송 실패: {e}")
             return False
     
+    def bulk_offset(self, upload_id):
+        """서버가 이미 저장한 줄 수 (업로드를 이어서 보낼 위치)"""
+        url = f"{self.server_url}/api/bridge/telemetry/bulk/{upload_id}"
+        response = self.session.get(url, headers=self._bulk_headers(upload_id), timeout=10)
+        response.raise_for_status()
+        return int(response.json().get("offset", 0))
+    
+    def send_bulk(self, readings, upload_id, chunk_size=BULK_CHUNK_SIZE):
+        """
+        측정값을 NDJSON(한 줄에 하나) 한 요청으로 스트리밍 업로드 (chunked 전송)
+        
+        본문은 제너레이터로 만들어 chunk_size씩 보내므로 backlog 크기와 무관하게 메모리 사용량이 일정.
+        서버가 upload_id별로 저장한 줄 수를 기록하므로 끊기면 같은 upload_id로 다시 호출해 이어서 전송
+        (readings는 매번 같은 순서로 같은 측정값을 내야 함, 예: 추가만 하는 NDJSON 파일)
+        
+        Returns:
+            서버가 저장한 전체 줄 수. 실패하면 None
+        """
+        try:
+            offset = self.bulk_offset(upload_id)
+            headers = self._bulk_headers(upload_id)
+            headers["Content-Type"] = "application/x-ndjson"
+            headers["x-upload-offset"] = str(offset)
+            if self.compress_threshold:
+                headers["Content-Encoding"] = "deflate"
+            
+            body = self._ndjson_chunks(itertools.islice(readings, offset, None), chunk_size)
+            url = f"{self.server_url}/api/bridge/telemetry/bulk"
+            # (연결, 응답) 타임아웃: 서버는 본문을 다 받고 마지막 배치를 저장한 뒤 응답
+            response = self.session.post(url, data=body, headers=headers, timeout=(10, BULK_TIMEOUT))
+            response.raise_for_status()
+            
+            result = response.json()
+            print(f"✅ 일괄 전송 완료: {result.get('accepted', 0)}건 저장 (누적 {result.get('offset')}줄)")
+            return int(result.get("offset", 0))
+        
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"❌ 일괄 전송 실패 (다음에 이어서 전송): {e}")
+            return None
+    
+    def _bulk_headers(self, upload_id):
+        return {
+            "x-device-id": self.device_id,
+            "x-device-key": self.device_key,
+            "x-tenant-id": self.tenant_id,
+            "x-upload-id": upload_id,
+        }
+    
+    def _ndjson_chunks(self, readings, chunk_size):
+        """측정값을 NDJSON 줄로 바꿔 chunk_size 바이트씩 내보냄 (압축하면 deflate 스트림으로)"""
+        compressor = zlib.compressobj() if self.compress_threshold else None
+        buffer = []
+        size = 0
+        for reading in readings:
+            line = (json.dumps(reading, separators=(",", ":")) + "\n").encode("utf-8")
+            buffer.append(line)
+            size += len(line)
+            if size >= chunk_size:
+                data = b"".join(buffer)
+                buffer, size = [], 0
+                if compressor:
+                    data = compressor.compress(data)
+                if data:
+                    yield data
+        data = b"".join(buffer)
+        if compressor:
+            data = compressor.compress(data) + compressor.flush()
+        if data:
+            yield data
+    
+    def spool(self, readings):
+        """전송 실패한 측정값을 스풀 파일 끝에 추가"""
+        if not SPOOL_DIR:
+            return
+        try:
+            if self.spool_file is None:
+                os.makedirs(SPOOL_DIR, exist_ok=True)
+                self.spool_file = os.path.join(SPOOL_DIR, f"{int(time.time() * 1000)}.ndjson")
+            with open(self.spool_file, "a") as f:
+                f.writelines(json.dumps(reading) + "\n" for reading in readings)
+        except OSError as e:
+            print(f"⚠️  스풀 저장 실패: {e}")
+    
+    def drain_spool(self):
+        """스풀 파일을 오래된 것부터 일괄 업로드하고, 끝까지 저장되면 삭제"""
+        if not SPOOL_DIR or not os.path.isdir(SPOOL_DIR):
+            return
+        for name in sorted(os.listdir(SPOOL_DIR)):
+            if not name.endswith(".ndjson"):
+                continue
+            path = os.path.join(SPOOL_DIR, name)
+            with open(path) as f:
+                total = sum(1 for line in f if line.strip())
+            with open(path) as f:
+                # 파일 이름이 스풀을 시작한 시각이라 파일마다 고유한 upload_id
+                offset = self.send_bulk((json.loads(line) for line in f if line.strip()), f"{self.device_id}-{name[:-7]}")
+            if offset is None or offset < total:
+                return
+            os.remove(path)
+            if path == self.spool_file:
+                self.spool_file = None
+    
     def read_sensors(self):
         """센서 값 읽기 (예시)"""
         readings = []
@@ -128,8 +252,11 @@ class SmartFarmClient:
                 readings = self.read_sensors()
                 
                 if readings:
-                    # 서버 전송
-                    self.send_telemetry(readings)
+                    # 서버 전송 (실패하면 스풀에 모았다가 연결되면 한 번에 업로드)
+                    if self.send_telemetry(readings):
+                        self.drain_spool()
+                    else:
+                        self.spool(readings)
                 else:
                     print("⚠️  읽을 센서 데이터가 없습니다.")
                 
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+시스템 상태 수집기 (라즈베리파이)
+매 주기 파일을 다시 열고 전체를 파싱하는 대신, 파일 디스크립터를 열어 둔 채 os.pread로 다시 읽고 필요한 필드만 파싱
+
+수집 항목:
+- CPU 온도, CPU 사용률 (/proc/stat 차분)
+- 메모리 사용률 (MemTotal / MemAvailable)
+- 디스크 여유 공간, SD 카드 쓰기 속도 (/sys/block/<dev>/stat 차분)
+- 네트워크 송수신 바이트 (/proc/net/dev)
+- 스로틀링 플래그 (저전압, 주파수 제한, 온도 제한)
+
+자체 주기로 백그라운드 샘플링하고, snapshot()은 마지막 결과만 반환 (텔레메트리 주기에 부담 없음)
+"""
+
+import os
+import subprocess
+import threading
+import time
+
+_THROTTLED_PATH = "/sys/devices/platform/soc/soc:firmware/get_throttled"
+
+# get_throttled 비트 (0~3: 현재 상태, 16~19: 부팅 이후 발생 여부)
+_THROTTLE_FLAGS = {
+    0: "under_voltage",
+    1: "freq_capped",
+    2: "throttled",
+    3: "soft_temp_limit",
+}
+
+
+class _ProcFile:
+    """열어 둔 채 os.pread로 다시 읽는 파일"""
+
+    def __init__(self, path, size=4096):
+        self.size = size
+        try:
+            self.fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            self.fd = None
+
+    def read(self):
+        if self.fd is None:
+            return None
+        try:
+            return os.pread(self.fd, self.size, 0)
+        except OSError:
+            return None
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class SystemHealth:
+    def __init__(self, interval=10, disk_path="/", block_device="mmcblk0", net_interfaces=None):
+        """
+        Args:
+            interval: 샘플링 주기 (초)
+            disk_path: 여유 공간을 확인할 경로
+            block_device: 쓰기 속도를 측정할 블록 디바이스 (SD 카드: mmcblk0)
+            net_interfaces: 합산할 네트워크 인터페이스 목록 (None이면 lo 제외 전체)
+        """
+        self.interval = interval
+        self.disk_path = disk_path
+        self.net_interfaces = set(net_interfaces) if net_interfaces else None
+
+        self._thermal = _ProcFile("/sys/class/thermal/thermal_zone0/temp", 32)
+        self._meminfo = _ProcFile("/proc/meminfo", 512)  # MemTotal/MemAvailable은 앞쪽 3줄 안에 있음
+        self._stat = _ProcFile("/proc/stat", 256)        # 첫 줄(cpu 합계)만 사용
+        self._block = _ProcFile(f"/sys/block/{block_device}/stat", 256)
+        self._netdev = _ProcFile("/proc/net/dev", 8192)
+        self._throttled = _ProcFile(_THROTTLED_PATH, 32)
+        self._use_vcgencmd = self._throttled.fd is None  # 구형 커널: sysfs 노드가 없으면 vcgencmd 사용
+
+        self._prev_cpu = None
+        self._prev_sectors = None
+        self._prev_time = None
+
+        self._lock = threading.Lock()
+        self._latest = {}
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.sample()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        for proc_file in (self._thermal, self._meminfo, self._stat, self._block, self._netdev, self._throttled):
+            proc_file.close()
+
+    def snapshot(self):
+        """마지막 샘플 (복사본)"""
+        with self._lock:
+            return dict(self._latest)
+
+    def _run(self):
+        while self.running:
+            time.sleep(self.interval)
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"❌ 시스템 상태 수집 오류: {e}")
+
+    def sample(self):
+        """모든 항목 1회 수집"""
+        now = time.monotonic()
+        data = {
+            "cpu_temp": self.cpu_temperature(),
+            "cpu_usage": self.cpu_usage(),
+            "memory_usage": self.memory_usage(),
+        }
+        data.update(self.disk_usage(now))
+        data.update(self.network_bytes())
+        data.update(self.throttling())
+        self._prev_time = now
+
+        with self._lock:
+            self._latest = data
+        return data
+
+    def cpu_temperature(self):
+        raw = self._thermal.read()
+        if not raw:
+            return None
+        return round(int(raw) / 1000.0, 1)
+
+    def cpu_usage(self):
+        raw = self._stat.read()
+        if not raw:
+            return None
+        # "cpu  user nice system idle iowait irq softirq steal ..."
+        fields = [int(value) for value in raw.split(b"\n", 1)[0].split()[1:9]]
+        idle = fields[3] + fields[4]
+        total = sum(fields)
+
+        usage = None
+        if self._prev_cpu is not None:
+            total_delta = total - self._prev_cpu[0]
+            idle_delta = idle - self._prev_cpu[1]
+            if total_delta > 0:
+                usage = round(100.0 * (total_delta - idle_delta) / total_delta, 1)
+        self._prev_cpu = (total, idle)
+        return usage
+
+    def memory_usage(self):
+        raw = self._meminfo.read()
+        if not raw:
+            return None
+        total = available = None
+        for line in raw.split(b"\n"):
+            if line.startswith(b"MemTotal:"):
+                total = int(line.split()[1])
+            elif line.startswith(b"MemAvailable:"):
+                available = int(line.split()[1])
+                break
+        if not total or available is None:
+            return None
+        return round((total - available) * 100.0 / total, 1)
+
+    def disk_usage(self, now):
+        data = {}
+        try:
+            stat = os.statvfs(self.disk_path)
+            data["disk_free_mb"] = round(stat.f_bavail * stat.f_frsize / 1048576, 1)
+            data["disk_usage"] = round(100.0 * (1 - stat.f_bavail / stat.f_blocks), 1) if stat.f_blocks else None
+        except OSError:
+            pass
+
+        raw = self._block.read()
+        if raw:
+            # read I/Os, read merges, read sectors, read ticks, write I/Os, write merges, write sectors, ...
+            sectors = int(raw.split()[6])
+            if self._prev_sectors is not None and self._prev_time is not None and now > self._prev_time:
+                data["disk_write_kbps"] = round((sectors - self._prev_sectors) * 512 / 1024 / (now - self._prev_time), 1)
+            self._prev_sectors = sectors
+        return data
+
+    def network_bytes(self):
+        raw = self._netdev.read()
+        if not raw:
+            return {}
+        rx_total = tx_total = 0
+        for line in raw.split(b"\n")[2:]:
+            name, sep, counters = line.partition(b":")
+            if not sep:
+                continue
+            name = name.strip().decode()
+            if name == "lo" or (self.net_interfaces and name not in self.net_interfaces):
+                continue
+            fields = counters.split()
+            rx_total += int(fields[0])
+            tx_total += int(fields[8])
+        return {"net_rx_bytes": rx_total, "net_tx_bytes": tx_total}
+
+    def throttling(self):
+        raw = self._throttled.read()
+        try:
+            if raw:
+                value = int(raw.strip(), 16)
+            elif self._use_vcgencmd:
+                output = subprocess.run(["vcgencmd", "get_throttled"], capture_output=True, text=True, timeout=2).stdout
+                value = int(output.strip().split("=")[1], 16)
+            else:
+                return {}
+        except FileNotFoundError:
+            self._use_vcgencmd = False  # 라즈베리파이가 아님
+            return {}
+        except (OSError, ValueError, IndexError, subprocess.SubprocessError):
+            return {}
+
+        data = {"throttled": hex(value)}
+        for bit, name in _THROTTLE_FLAGS.items():
+            data[name] = bool(value & (1 << bit))
+            data[f"{name}_occurred"] = bool(value & (1 << (bit + 16)))
+        return data
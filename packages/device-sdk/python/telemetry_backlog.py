@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+업링크 백로그 + 롤업 계층 (raw → 1분 → 15분)
+오프라인 동안의 데이터를 로컬(SQLite)에 보관했다가 재연결 시 대역폭을 제한하며 재전송
+
+재연결 시 전송 순서:
+1. 최근 raw_window 초 이내의 미전송 원본 데이터
+2. rollup_1m_window 초 이내의 오래된 미전송 구간 → 1분 롤업
+3. 그보다 오래된 미전송 구간 → 15분 롤업
+
+롤업으로 요약 전송된 원본은 삭제하지 않고 보관하며, backfill()로 원본 해상도를 다시 요청할 수 있음
+(raw_retention 기간 동안 유지)
+"""
+
+import sqlite3
+import threading
+import time
+
+# 원본 데이터 상태
+PENDING = 0      # 미전송
+SENT = 1         # 원본 전송 완료
+SUMMARIZED = 2   # 롤업으로 요약 전송 (원본은 요청 시 backfill)
+
+TIERS = (("1m", 60_000), ("15m", 900_000))
+
+
+class TelemetryBacklog:
+    def __init__(self, path, raw_window=600, rollup_1m_window=6 * 3600,
+                 raw_retention=7 * 86400, rollup_retention=90 * 86400, batch_size=500):
+        """
+        Args:
+            path: SQLite 파일 경로
+            raw_window: 재연결 시 원본 그대로 보낼 최근 구간 (초)
+            rollup_1m_window: 1분 롤업으로 보낼 구간 (초), 그 이전은 15분 롤업
+            raw_retention: 원본 보관 기간 (초)
+            rollup_retention: 롤업 보관 기간 (초)
+            batch_size: 한 번에 전송할 최대 행 수
+        """
+        self.raw_window_ms = int(raw_window * 1000)
+        self.rollup_1m_window_ms = int(rollup_1m_window * 1000)
+        self.raw_retention_ms = int(raw_retention * 1000)
+        self.rollup_retention_ms = int(rollup_retention * 1000)
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._appends = 0
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS raw (
+                key TEXT NOT NULL,
+                ts INTEGER NOT NULL,
+                value REAL NOT NULL,
+                state INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS raw_state_ts ON raw (state, ts);
+            CREATE INDEX IF NOT EXISTS raw_key_ts ON raw (key, ts);
+            CREATE TABLE IF NOT EXISTS rollup (
+                tier TEXT NOT NULL,
+                key TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                sum REAL NOT NULL,
+                min REAL NOT NULL,
+                max REAL NOT NULL,
+                PRIMARY KEY (tier, key, bucket)
+            ) WITHOUT ROWID;
+        """)
+        self.conn.commit()
+
+    def append(self, values, ts_ms=None, sent=False):
+        """
+        한 주기의 측정값 저장 및 롤업 갱신
+
+        Args:
+            values: 키 -> 숫자 값 (숫자가 아닌 값은 무시)
+            ts_ms: 측정 시각 (epoch ms, None이면 현재 시각)
+            sent: 이미 실시간으로 전송된 값인지 여부
+        """
+        ts_ms = int(ts_ms if ts_ms is not None else time.time() * 1000)
+        rows = [(key, ts_ms, float(value), SENT if sent else PENDING)
+                for key, value in values.items()
+                if isinstance(value, (int, float)) and not isinstance(value, bool)]
+        if not rows:
+            return
+
+        with self._lock:
+            self.conn.executemany("INSERT INTO raw (key, ts, value, state) VALUES (?, ?, ?, ?)", rows)
+            for tier, size in TIERS:
+                bucket = ts_ms - ts_ms % size
+                self.conn.executemany("""
+                    INSERT INTO rollup (tier, key, bucket, count, sum, min, max) VALUES (?, ?, ?, 1, ?, ?, ?)
+                    ON CONFLICT (tier, key, bucket) DO UPDATE SET
+                        count = count + 1,
+                        sum = sum + excluded.sum,
+                        min = MIN(min, excluded.min),
+                        max = MAX(max, excluded.max)
+                """, [(tier, key, bucket, value, value, value) for key, _, value, _ in rows])
+            self.conn.commit()
+
+            self._appends += 1
+            if self._appends % 1000 == 0:
+                self._prune_locked(ts_ms)
+
+    def pending_count(self):
+        """미전송 원본 행 수"""
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM raw WHERE state = ?", (PENDING,)).fetchone()[0]
+
+    def replay(self, send, max_batches=1, now_ms=None):
+        """
+        미전송 데이터 재전송 (호출당 최대 max_batches개 배치)
+
+        Args:
+            send: send(batch) -> bool. batch = {"resolution": "raw"|"1m"|"15m", "series": {key: [...]}}
+                  raw 항목: [ts, value], 롤업 항목: [bucket_ts, count, avg, min, max]
+        Returns:
+            전송한 배치 수
+        """
+        now_ms = int(now_ms if now_ms is not None else time.time() * 1000)
+        raw_cutoff = now_ms - self.raw_window_ms
+        raw_cutoff -= raw_cutoff % TIERS[0][1]
+        rollup_cutoff = now_ms - self.rollup_1m_window_ms
+        rollup_cutoff -= rollup_cutoff % TIERS[1][1]
+
+        sent_batches = 0
+        while sent_batches < max_batches:
+            # 1. 최근 원본 (최신 구간 우선)
+            if self._replay_raw(send, raw_cutoff):
+                sent_batches += 1
+                continue
+            # 2. 1분 롤업, 3. 15분 롤업
+            if self._replay_rollup(send, "1m", rollup_cutoff, raw_cutoff):
+                sent_batches += 1
+                continue
+            if self._replay_rollup(send, "15m", 0, rollup_cutoff):
+                sent_batches += 1
+                continue
+            break
+
+        return sent_batches
+
+    def backfill(self, send, start_ms, end_ms, keys=None):
+        """원본 해상도 재전송 요청 처리 (요약 전송된 구간 포함). 전송한 행 수 반환"""
+        total = 0
+        after = (start_ms - 1, -1)
+        while True:
+            with self._lock:
+                query = "SELECT rowid, key, ts, value FROM raw WHERE (ts, rowid) > (?, ?) AND ts < ?"
+                params = [after[0], after[1], end_ms]
+                if keys:
+                    query += f" AND key IN ({','.join('?' * len(keys))})"
+                    params += list(keys)
+                rows = self.conn.execute(query + " ORDER BY ts, rowid LIMIT ?", params + [self.batch_size]).fetchall()
+            if not rows:
+                return total
+
+            if not send({"resolution": "raw", "backfill": True, "series": self._group_raw(rows)}):
+                return total
+
+            self._mark([row[0] for row in rows], SENT)
+            total += len(rows)
+            after = (rows[-1][2], rows[-1][0])
+
+    def _replay_raw(self, send, cutoff):
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT rowid, key, ts, value FROM raw WHERE state = ? AND ts >= ? ORDER BY ts DESC LIMIT ?",
+                (PENDING, cutoff, self.batch_size)
+            ).fetchall()
+        if not rows:
+            return False
+
+        rows.reverse()
+        if not send({"resolution": "raw", "series": self._group_raw(rows)}):
+            return False
+        self._mark([row[0] for row in rows], SENT)
+        return True
+
+    def _replay_rollup(self, send, tier, start, end):
+        size = dict(TIERS)[tier]
+        with self._lock:
+            # 미전송 원본이 있는 (키, 버킷)만 선택 (최신 구간 우선)
+            buckets = self.conn.execute(f"""
+                SELECT DISTINCT key, ts - ts % {size} AS bucket FROM raw
+                WHERE state = ? AND ts >= ? AND ts < ?
+                ORDER BY bucket DESC LIMIT ?
+            """, (PENDING, start, end, self.batch_size)).fetchall()
+            if not buckets:
+                return False
+
+            series = {}
+            for key, bucket in buckets:
+                row = self.conn.execute(
+                    "SELECT count, sum, min, max FROM rollup WHERE tier = ? AND key = ? AND bucket = ?",
+                    (tier, key, bucket)
+                ).fetchone()
+                if row:
+                    count, total, low, high = row
+                    series.setdefault(key, []).append([bucket, count, round(total / count, 4), low, high])
+
+        for points in series.values():
+            points.sort()
+        if series and not send({"resolution": tier, "series": series}):
+            return False
+
+        with self._lock:
+            self.conn.executemany(
+                "UPDATE raw SET state = ? WHERE state = ? AND key = ? AND ts >= ? AND ts < ?",
+                [(SUMMARIZED, PENDING, key, bucket, bucket + size) for key, bucket in buckets]
+            )
+            self.conn.commit()
+        return True
+
+    def _mark(self, rowids, state):
+        with self._lock:
+            self.conn.executemany("UPDATE raw SET state = ? WHERE rowid = ?", [(state, rowid) for rowid in rowids])
+            self.conn.commit()
+
+    def _prune_locked(self, now_ms):
+        """보관 기간이 지난 데이터 삭제"""
+        self.conn.execute("DELETE FROM raw WHERE ts < ?", (now_ms - self.raw_retention_ms,))
+        self.conn.execute("DELETE FROM rollup WHERE bucket < ?", (now_ms - self.rollup_retention_ms,))
+        self.conn.commit()
+
+    @staticmethod
+    def _group_raw(rows):
+        series = {}
+        for _, key, ts, value in rows:
+            series.setdefault(key, []).append([ts, value])
+        return series
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
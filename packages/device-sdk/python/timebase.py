@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+측정 시각 기록 (수집 시점의 monotonic_ns → UTC epoch ms)
+
+- 수집 시점에는 time.monotonic_ns()만 기록 (시스템 시계가 NTP로 조정되어도 순서/간격이 틀어지지 않음)
+- monotonic → UTC 변환 오프셋은 resync_interval마다 다시 측정해 NTP 보정을 반영
+- 디바이스가 보낸 시각은 수신 시각 기준으로 그럴듯하면(epoch 초/ms 또는 시간대가 있는 ISO 8601) 그대로 사용
+  (ESP32의 millis()처럼 부팅 후 경과 시간이거나 시계가 틀린 값은 버리고 수신 시각 사용)
+- 내부에서는 정수 epoch ms로만 다루고, 문자열은 전송 직전 format_ts()로 한 번만 만듦
+"""
+
+import math
+import threading
+import time
+from datetime import datetime
+
+NS_PER_MS = 1_000_000
+
+
+def format_ts(ts_ms):
+    """epoch ms -> ISO 8601 UTC 문자열 (밀리초, 'Z')"""
+    seconds, ms = divmod(int(ts_ms), 1000)
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(seconds)) + f".{ms:03d}Z"
+
+
+def parse_ts(value):
+    """디바이스 시각 -> epoch ms (epoch 초/ms 숫자 또는 시간대가 있는 ISO 8601). 해석할 수 없으면 None"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        if not math.isfinite(value):
+            return None
+        # 1e11 미만이면 초 단위 (ms라면 1973년 이전)
+        return int(value * 1000) if value < 1e11 else int(value)
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+        if parsed.tzinfo is None:
+            return None  # 시간대 없는 로컬 시각은 어느 기준인지 알 수 없음
+        return int(parsed.timestamp() * 1000)
+    return None
+
+
+class Clock:
+    def __init__(self, resync_interval=60.0, max_past=86400.0, max_future=5.0):
+        """
+        Args:
+            resync_interval: monotonic → UTC 오프셋 재측정 주기 (초)
+            max_past / max_future: 디바이스 시각을 믿을 수 있는 수신 시각 전후 범위 (초)
+        """
+        self.resync_interval_ns = int(resync_interval * 1e9)
+        self.max_past_ms = int(max_past * 1000)
+        self.max_future_ms = int(max_future * 1000)
+        self._lock = threading.Lock()
+        self._offset_ns = 0
+        self._synced_ns = 0
+        self.resync()
+
+    @staticmethod
+    def now_ns():
+        """수집 시점 기록용 (monotonic)"""
+        return time.monotonic_ns()
+
+    def resync(self, samples=3):
+        """오프셋 재측정 (monotonic 두 번 사이에 읽은 wall clock 중 간격이 가장 짧은 측정 사용)"""
+        best = None
+        for _ in range(samples):
+            before = time.monotonic_ns()
+            wall = time.time_ns()
+            after = time.monotonic_ns()
+            if best is None or after - before < best[0]:
+                best = (after - before, wall - (before + after) // 2)
+        with self._lock:
+            self._offset_ns = best[1]
+            self._synced_ns = time.monotonic_ns()
+
+    def to_epoch_ms(self, mono_ns):
+        """monotonic_ns -> UTC epoch ms"""
+        if time.monotonic_ns() - self._synced_ns > self.resync_interval_ns:
+            self.resync()
+        return (mono_ns + self._offset_ns) // NS_PER_MS
+
+    def now_ms(self):
+        return self.to_epoch_ms(time.monotonic_ns())
+
+    def device_ts(self, value, received_ns):
+        """디바이스가 보낸 시각이 유효하면 그 값, 아니면 수신 시각 (epoch ms)"""
+        received_ms = self.to_epoch_ms(received_ns)
+        ts_ms = parse_ts(value)
+        if ts_ms is None or not received_ms - self.max_past_ms <= ts_ms <= received_ms + self.max_future_ms:
+            return received_ms
+        return ts_ms
+
+
+def elapsed_ms(start_ns, end_ns=None):
+    """monotonic_ns 두 시점 사이 경과 시간 (ms, 소수점 3자리)"""
+    return round(((end_ns if end_ns is not None else time.monotonic_ns()) - start_ns) / NS_PER_MS, 3)
@@ -7,11 +7,25 @@ Modbus/Serial 장치를 폴링하여 MQTT/HTTP로 업링크하는 게이트웨
 import json
 import time
 import logging
+import threading
 import paho.mqtt.client as mqtt
-import requests
-from pymodbus.client.sync import ModbusTcpClient
-import serial
-from datetime import datetime
+
+# requests / pymodbus / pyserial은 해당 연결을 설정했을 때만 처음 사용하는 곳에서 import (설정하지 않은 라이브러리는 메모리에 올리지 않음)
+from connection_supervisor import CircuitBreaker, ConnectionSupervisor
+from fast_start import StartupTimer, StateCache, parallel_init
+from latency_trace import Tracer
+from memory_profile import MemoryReport, configure_threads, shared_pool
+from modbus_bus import ModbusBus
+from payload_codec import PayloadCodec
+from mqtt_v5 import SCHEMA_VERSION, Mqtt5Publisher, command_correlation, connect_kwargs, create_client
+from config_watcher import ConfigWatcher, changed_keys, diff_config, validate_config, write_config
+from rule_engine import RuleEngine
+from sampling_profiler import SamplingProfiler
+from sensor_quality import SensorQualityMonitor
+from sequence_tracker import SequenceCounter
+from telemetry_backlog import TelemetryBacklog
+from timebase import Clock, elapsed_ms, format_ts
+from tsdb import TimeSeriesStore, serve_queries
 
 # 로깅 설정
 logging.basicConfig(level=logging.INFO)
@@ -19,11 +33,35 @@ logger = logging.getLogger(__name__)
 
 class Gateway:
     def __init__(self, config_file='config.json'):
+        self.startup = StartupTimer()  # 프로세스 시작 기준 단계별 경과 시간 (인터프리터 기동/import 포함)
+        self.startup.mark('imports')
+        self.config_file = config_file
         self.config = self.load_config(config_file)
+        self.memory_report = self.init_memory()  # 스레드 스택 크기는 스레드를 만들기 전에 설정
+        self.memory_reported_at = time.monotonic()
         self.device_id = self.config.get('device_id', 'rpi-gateway-001')
         self.mqtt_client = None
+        self.mqtt_publisher = None
+        self.mqtt_connack_rc = None  # 마지막 CONNACK 결과 (연결 시도마다 초기화)
+        self.batch_seq = 0         # MQTT 5 사용자 속성으로 보내는 업링크 순번
+        self.sequencer = SequenceCounter()  # 텔레메트리 seq (수집 시점에 부여, 수신 측 누락 검출용)
+        self.clock = Clock()       # 수집 시점 monotonic_ns -> UTC epoch ms
         self.modbus_client = None
+        self.modbus_bus = None     # 버스 트랜잭션 스케줄러 (쓰기 우선, 읽기 묶음)
         self.serial_conn = None
+        self.supervisors = {}      # 연결 이름 -> ConnectionSupervisor
+        self.http_breakers = {}    # HTTP URL -> CircuitBreaker
+        self.rule_engine = None
+        self.pending_config = None
+        self.wake = threading.Event()  # 설정 변경 시 폴링 대기를 깨움
+        self.quality_monitor = self.init_quality_monitor()
+        self.backlog = self.init_backlog()
+        self.history = self.init_history()
+        self.codec = self.init_compression()
+        self.tracer = self.init_tracing()
+        self.profiler = self.init_profiler()
+        self.state_cache = self.init_state_cache()
+        self.first_sent = False
         
     def load_config(self, config_file):
         """설정 파일 로드"""
@@ -34,84 +72,586 @@ class Gateway:
             logger.error(f"설정 파일을 찾을 수 없습니다: {config_file}")
             return {}
     
+    def supervise(self, name, connect, **kwargs):
+        """연결 감시 시작 (지터 백오프 재연결, 상태 점검, 서킷 브레이커)"""
+        self.stop_supervisor(name)
+        
+        reconnect = self.config.get('reconnect', {})
+        supervisor = ConnectionSupervisor(
+            name,
+            connect,
+            base_delay=reconnect.get('base_delay', 1),
+            max_delay=reconnect.get('max_delay', 60),
+            max_attempts=reconnect.get('max_attempts', 10),
+            open_timeout=reconnect.get('open_timeout', 300),
+            initial_jitter=reconnect.get('initial_jitter', 10),
+            probe_interval=reconnect.get('probe_interval', 30),
+            **kwargs
+        )
+        self.supervisors[name] = supervisor
+        supervisor.start()
+        return supervisor
+    
+    def stop_supervisor(self, name):
+        """연결 감시 중지 및 연결 종료"""
+        supervisor = self.supervisors.pop(name, None)
+        if supervisor:
+            supervisor.stop()
+    
+    def is_connected(self, name):
+        supervisor = self.supervisors.get(name)
+        return bool(supervisor and supervisor.connected)
+    
+    def connection_failed(self, name):
+        """입출력 오류 보고 (감시자가 연결 정리 후 재연결)"""
+        supervisor = self.supervisors.get(name)
+        if supervisor:
+            supervisor.mark_failed()
+    
     def init_mqtt(self):
-        """MQTT 클라이언트 초기화"""
+        """MQTT 클라이언트 초기화 (영구 세션: 재연결 시 구독/QoS1 메시지 유지)"""
         mqtt_config = self.config.get('mqtt', {})
         if not mqtt_config:
             return
-            
-        self.mqtt_client = mqtt.Client()
+        
+        # 고정 client_id + 영구 세션 → 브로커가 세션을 보관하므로 재연결 후 재구독/재전송 불필요
+        # protocol: 5 → 토픽 별칭/메시지 만료/사용자 속성 (브로커가 MQTT 5를 지원할 때만)
+        mqtt5 = mqtt_config.get('protocol') == 5
+        self.mqtt_client = create_client(mqtt_config.get('client_id', self.device_id), mqtt5)
+        self.mqtt_publisher = Mqtt5Publisher(self.mqtt_client, mqtt5)
         self.mqtt_client.on_connect = self.on_mqtt_connect
         self.mqtt_client.on_message = self.on_mqtt_message
+        if mqtt_config.get('username'):
+            self.mqtt_client.username_pw_set(mqtt_config['username'], mqtt_config.get('password'))
+        if mqtt_config.get('tls'):
+            self.mqtt_client.tls_set()
+        
+        client = self.mqtt_client
+        self.supervise(
+            'mqtt',
+            lambda: self.connect_mqtt(client, mqtt_config, mqtt5),
+            close=client.disconnect,
+            # paho 자체 재연결(지터 없음) 대신 감시자 스레드에서 network loop 실행
+            service=lambda: client.loop(timeout=1.0) == mqtt.MQTT_ERR_SUCCESS
+        )
+    
+    def connect_mqtt(self, client, mqtt_config, mqtt5):
+        """
+        브로커 연결 후 CONNACK까지 대기 (TCP 연결만으로는 성공으로 보지 않음)
+        인증 실패 등으로 브로커가 거부(rc != 0)하면 False → 감시자가 실패로 세어 서킷 브레이커 차단
+        """
+        self.mqtt_connack_rc = None
+        if client.connect(
+            mqtt_config.get('host', 'localhost'),
+            mqtt_config.get('port', 1883),
+            mqtt_config.get('keepalive', 60),
+            **connect_kwargs(mqtt5, mqtt_config.get('session_expiry', 86400))
+        ) != mqtt.MQTT_ERR_SUCCESS:
+            return False
         
+        deadline = time.monotonic() + mqtt_config.get('connect_timeout', 10)
+        while self.mqtt_connack_rc is None and time.monotonic() < deadline:
+            if client.loop(timeout=0.5) != mqtt.MQTT_ERR_SUCCESS:
+                break
+        if self.mqtt_connack_rc == 0:
+            return True
+        
+        if self.mqtt_connack_rc is None:
+            logger.error("MQTT CONNACK 시간 초과")
         try:
-            self.mqtt_client.connect(
-                mqtt_config.get('host', 'localhost'),
-                mqtt_config.get('port', 1883),
-                60
-            )
-            self.mqtt_client.loop_start()
-            logger.info("MQTT 연결됨")
-        except Exception as e:
-            logger.error(f"MQTT 연결 실패: {e}")
+            client.disconnect()
+        except Exception:
+            pass
+        return False
+    
+    def close_mqtt(self):
+        """MQTT 연결 종료"""
+        self.stop_supervisor('mqtt')
+        self.mqtt_client = None
+        self.mqtt_publisher = None
     
     def init_modbus(self):
-        """Modbus 클라이언트 초기화"""
+        """Modbus 클라이언트 초기화 (TCP 또는 RS-485 RTU, 끊기면 백오프 후 재연결)"""
         modbus_config = self.config.get('modbus', {})
         if not modbus_config:
             return
-            
-        try:
+        
+        from pymodbus.client.sync import ModbusSerialClient, ModbusTcpClient
+        
+        rtu = modbus_config.get('method', 'tcp') == 'rtu'
+        if rtu:
+            self.modbus_client = ModbusSerialClient(
+                method='rtu',
+                port=modbus_config.get('device', '/dev/ttyUSB1'),
+                baudrate=modbus_config.get('baudrate', 9600),
+                parity=modbus_config.get('parity', 'N'),
+                stopbits=modbus_config.get('stopbits', 1),
+                bytesize=modbus_config.get('bytesize', 8),
+                timeout=modbus_config.get('timeout', 1)
+            )
+        else:
             self.modbus_client = ModbusTcpClient(
                 modbus_config.get('host', 'localhost'),
                 modbus_config.get('port', 502)
             )
-            self.modbus_client.connect()
-            logger.info("Modbus 연결됨")
-        except Exception as e:
-            logger.error(f"Modbus 연결 실패: {e}")
+        client = self.modbus_client
+        
+        # 버스 하나에 트랜잭션 하나씩: 전용 스레드가 쓰기를 폴링보다 먼저, 가까운 주소는 묶어서 실행
+        self.modbus_bus = ModbusBus(
+            client,
+            baudrate=modbus_config.get('baudrate', 9600),
+            rtu=rtu,
+            ready=lambda: self.is_connected('modbus'),
+            on_error=lambda e: self.connection_failed('modbus'),
+            max_gap=modbus_config.get('max_gap', 8),
+            max_block=modbus_config.get('max_block')
+        )
+        self.modbus_bus.start()
+        self.supervise(
+            'modbus',
+            client.connect,
+            close=client.close,
+            probe=client.is_socket_open
+        )
+    
+    def close_modbus(self):
+        """Modbus 연결 및 버스 스케줄러 종료"""
+        if self.modbus_bus:
+            self.modbus_bus.stop()
+            self.modbus_bus = None
+        self.stop_supervisor('modbus')
+        self.modbus_client = None
     
     def init_serial(self):
-        """시리얼 연결 초기화"""
+        """시리얼 연결 초기화 (장치가 빠졌다 다시 연결되어도 재연결)"""
         serial_config = self.config.get('serial', {})
         if not serial_config:
             return
-            
-        try:
+        
+        def connect():
+            import serial
             self.serial_conn = serial.Serial(
                 port=serial_config.get('port', '/dev/ttyUSB0'),
                 baudrate=serial_config.get('baudrate', 9600),
                 timeout=serial_config.get('timeout', 1)
             )
-            logger.info("시리얼 연결됨")
+        
+        def close():
+            if self.serial_conn:
+                self.serial_conn.close()
+        
+        self.supervise(
+            'serial',
+            connect,
+            close=close,
+            probe=lambda: self.serial_conn is not None and self.serial_conn.is_open
+        )
+    
+    def http_breaker(self, url):
+        """HTTP 엔드포인트별 서킷 브레이커"""
+        breaker = self.http_breakers.get(url)
+        if breaker is None:
+            reconnect = self.config.get('reconnect', {})
+            breaker = self.http_breakers[url] = CircuitBreaker(
+                reconnect.get('max_attempts', 10),
+                reconnect.get('open_timeout', 300)
+            )
+        return breaker
+    
+    def init_quality_monitor(self):
+        """센서 값 품질 판정기 초기화"""
+        quality_config = self.config.get('quality', {})
+        if not quality_config.get('enabled', True):
+            return None
+        
+        params = {k: v for k, v in quality_config.items() if k not in ('enabled', 'suppress_bad')}
+        try:
+            return SensorQualityMonitor(limits=self.sensor_limits(), **params)
+        except (TypeError, ValueError) as e:
+            # 잘못된 설정이 저장되어 있어도 게이트웨이는 시작 (품질 판정만 끔)
+            logger.error(f"품질 판정기 초기화 실패: {e}")
+            return None
+    
+    def sensor_limits(self):
+        """센서별 물리적 범위 (min/max)"""
+        return {
+            name: {k: sensor[k] for k in ('min', 'max') if k in sensor}
+            for name, sensor in self.config.get('sensors', {}).items()
+        }
+    
+    def check_quality(self, data):
+        """센서 값별 품질 판정 ("good"/"suspect"/"bad")"""
+        if not self.quality_monitor:
+            return {}
+        
+        quality = {name: self.quality_monitor.check(name, value) for name, value in data.items()}
+        for name, q in quality.items():
+            if q != 'good':
+                logger.warning(f"센서 품질 {q}: {name}={data[name]}")
+        return quality
+    
+    def init_compression(self):
+        """업링크 페이로드 압축 초기화 (compression 설정이 있을 때만)"""
+        compression_config = self.config.get('compression')
+        if not compression_config or not compression_config.get('enabled', True):
+            return None
+        
+        method = compression_config.get('method', 'deflate')
+        codec = PayloadCodec(
+            method,
+            threshold=compression_config.get('threshold', 512),
+            level=compression_config.get('level'),
+            dictionary=compression_config.get('dictionary')
+        )
+        if codec.method != method:
+            logger.warning(f"zstandard 패키지가 없어 {codec.method} 압축 사용")
+        logger.info(f"업링크 압축: {codec.method}, {codec.threshold}바이트 이상")
+        return codec
+    
+    def init_memory(self):
+        """저메모리 모드 (memory 설정): 작은 스레드 스택, tracemalloc 컴포넌트별 할당 보고"""
+        memory_config = self.config.get('memory', {})
+        if memory_config.get('low_memory', False):
+            stack_kb = memory_config.get('thread_stack_kb', 256)
+            if configure_threads(stack_kb, memory_config.get('pool_workers', 2)):
+                logger.info(f"저메모리 모드: 스레드 스택 {stack_kb}KB")
+        
+        report = MemoryReport()
+        if memory_config.get('tracemalloc', False):
+            report.start()
+        return report
+    
+    def init_tracing(self):
+        """구간별 지연 추적 초기화 (tracing 설정이 없으면 디바이스가 보낸 trace만 이어서 추적)"""
+        tracing_config = self.config.get('tracing', {})
+        return Tracer(
+            sample_rate=tracing_config.get('sample_rate', 0.0),
+            trace_file=tracing_config.get('file'),
+            max_bytes=tracing_config.get('max_bytes', 5 * 1024 * 1024),
+            clock=self.clock
+        )
+    
+    def init_profiler(self):
+        """샘플링 프로파일러 초기화 (SIGUSR2 또는 profile 명령으로 켜고 끄기)"""
+        profiling_config = self.config.get('profiling', {})
+        return SamplingProfiler(
+            profiling_config.get('file', 'profile.folded'),
+            interval=profiling_config.get('interval', 0.02),
+            flush_interval=profiling_config.get('flush_interval', 10),
+            max_bytes=profiling_config.get('max_bytes', 5 * 1024 * 1024),
+            backups=profiling_config.get('backups', 3)
+        )
+    
+    def init_state_cache(self):
+        """마지막 상태 캐시 (startup 설정, 기본 사용). 재시작 직후 센서를 읽기 전에 마지막 상태를 먼저 발행"""
+        startup_config = self.config.get('startup', {})
+        if not startup_config.get('publish_cached', True):
+            return None
+        return StateCache(
+            startup_config.get('state_file', 'last_state.json'),
+            min_interval=startup_config.get('save_interval', 60)
+        )
+    
+    def publish_cached_state(self):
+        """캐시된 마지막 상태 발행 (MQTT를 쓰면 연결될 때까지 startup.cached_wait초 대기, 원래 측정 시각 유지)"""
+        state = self.state_cache.load() if self.state_cache else None
+        if not state or not state.get('metrics'):
+            return
+        
+        deadline = time.monotonic() + self.config.get('startup', {}).get('cached_wait', 15)
+        while self.mqtt_client and not self.mqtt_client.is_connected() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        
+        telemetry = {
+            'device_id': self.device_id,
+            'ts': format_ts(state['ts']),
+            'metrics': state['metrics'],
+            'status': 'cached'
+        }
+        if state.get('quality'):
+            telemetry['quality'] = state['quality']
+        if self.uplink(telemetry, {'cached': True}):
+            logger.info(f"캐시된 마지막 상태 발행 ({self.startup.mark('cached_publish')}ms)")
+    
+    def init_backlog(self):
+        """오프라인 백로그 저장소 초기화 (backlog 설정이 있을 때만)"""
+        backlog_config = self.config.get('backlog')
+        if not backlog_config:
+            return None
+        
+        params = {k: v for k, v in backlog_config.items() if k not in ('path', 'max_batches_per_cycle')}
+        try:
+            return TelemetryBacklog(backlog_config.get('path', 'backlog.db'), **params)
+        except Exception as e:
+            logger.error(f"백로그 저장소 초기화 실패: {e}")
+            return None
+    
+    def init_history(self):
+        """로컬 시계열 이력 저장소 및 조회 API 초기화 (history 설정이 있을 때만)"""
+        history_config = self.config.get('history')
+        if not history_config:
+            return None
+        
+        try:
+            store = TimeSeriesStore(
+                history_config.get('path', 'history'),
+                chunk_span=history_config.get('chunk_span', 7200),
+                retention=history_config.get('retention_days', 30) * 86400
+            )
         except Exception as e:
-            logger.error(f"시리얼 연결 실패: {e}")
+            logger.error(f"이력 저장소 초기화 실패: {e}")
+            return None
+        
+        api_config = history_config.get('api')
+        if api_config:
+            try:
+                serve_queries(store, api_config.get('host', '127.0.0.1'), api_config.get('port', 8081))
+                logger.info(f"이력 조회 API 시작: {api_config.get('host', '127.0.0.1')}:{api_config.get('port', 8081)}")
+            except OSError as e:
+                logger.error(f"이력 조회 API 시작 실패: {e}")
+        return store
+    
+    def init_rules(self):
+        """로컬 제어 룰 초기화 (조건식은 여기서 한 번만 컴파일)"""
+        rules = self.config.get('rules', [])
+        if not rules:
+            return
+        
+        actions = {
+            name: (lambda state, name=name: self.set_control(name, state))
+            for name in self.config.get('controls', {})
+        }
+        
+        try:
+            self.rule_engine = RuleEngine(rules, actions)
+            logger.info(f"로컬 룰 {len(self.rule_engine.rules)}개 로드됨")
+        except (ValueError, KeyError, SyntaxError) as e:
+            logger.error(f"룰 설정 오류: {e}")
+    
+    def reload_rules(self):
+        """룰 재컴파일 (이름과 조건이 같은 룰은 현재 ON/OFF 상태와 유지 시간을 이어받음)"""
+        previous = {}
+        if self.rule_engine:
+            previous = {rule.name: rule for rule in self.rule_engine.rules}
+            snapshot = self.rule_engine.snapshot
+        else:
+            snapshot = {}
+        
+        self.rule_engine = None
+        self.init_rules()
+        if not self.rule_engine:
+            return
+        
+        self.rule_engine.snapshot = dict(snapshot)
+        for rule in self.rule_engine.rules:
+            old = previous.get(rule.name)
+            if old and old.actuator == rule.actuator:
+                rule.active = old.active
+                rule.changed_at = old.changed_at
+                rule.pending = True  # 새 조건으로 다음 tick()에서 재평가
+    
+    def request_config(self, config):
+        """새 설정 적용 요청 (실제 적용은 메인 루프에서 수행)"""
+        self.pending_config = config
+        self.wake.set()
     
-    def on_mqtt_connect(self, client, userdata, flags, rc):
-        """MQTT 연결 콜백"""
+    def apply_config(self, new_config):
+        """
+        새 설정 검증 후 바뀐 섹션만 적용
+        
+        Returns:
+            (성공 여부, 오류 목록 또는 적용된 섹션 목록)
+        """
+        errors = validate_config(new_config)
+        if errors:
+            for error in errors:
+                logger.error(f"설정 검증 실패: {error}")
+            return False, errors
+        
+        changes = diff_config(self.config, new_config)
+        if not changes:
+            return True, []
+        
+        self.config = dict(new_config)
+        failed = []
+        
+        def apply(sections, step, rollback=None):
+            """
+            섹션 적용. 실패하면 그 섹션만 이전 값으로 되돌리고 다시 초기화
+            (self.config에 이전 값이 남으므로 다음 설정 변경 때 다시 바뀐 섹션으로 잡힘)
+            """
+            sections = [section for section in sections if section in changes]
+            if not sections:
+                return
+            try:
+                step()
+                return
+            except Exception as e:
+                logger.error(f"{', '.join(sections)} 설정 적용 실패, 이전 설정으로 복원: {e}")
+            failed.extend(sections)
+            for section in sections:
+                old = changes[section][0]
+                if old is None:
+                    self.config.pop(section, None)
+                else:
+                    self.config[section] = old
+            try:
+                (rollback or step)()
+            except Exception as e:
+                logger.error(f"{', '.join(sections)} 이전 설정 복원 실패: {e}")
+        
+        for section in ('device_id', 'history', 'memory', 'startup'):
+            if section in changes:
+                logger.warning(f"{section} 변경은 재시작 후 적용됩니다")
+        
+        def reopen_mqtt():
+            self.close_mqtt()
+            self.init_mqtt()
+        
+        def apply_mqtt():
+            old, new = changes['mqtt']
+            keys = changed_keys(old, new)
+            if keys & {'host', 'port', 'username', 'password', 'protocol', 'session_expiry'} or not new or not old:
+                reopen_mqtt()
+            elif 'command_topic' in keys and self.mqtt_client:
+                # 연결은 유지하고 구독만 변경
+                self.mqtt_client.unsubscribe(old.get('command_topic', 'device/command'))
+                self.mqtt_client.subscribe(new.get('command_topic', 'device/command'))
+        apply(('mqtt',), apply_mqtt, reopen_mqtt)
+        
+        def apply_modbus():
+            self.close_modbus()
+            self.init_modbus()
+        apply(('modbus',), apply_modbus)
+        
+        def apply_serial():
+            self.stop_supervisor('serial')
+            self.serial_conn = None
+            self.init_serial()
+        apply(('serial',), apply_serial)
+        
+        def apply_reconnect():
+            reconnect = self.config.get('reconnect', {})
+            for supervisor in self.supervisors.values():
+                supervisor.backoff.base = reconnect.get('base_delay', 1)
+                supervisor.backoff.cap = reconnect.get('max_delay', 60)
+                supervisor.breaker.failure_threshold = reconnect.get('max_attempts', 10)
+                supervisor.breaker.open_timeout = reconnect.get('open_timeout', 300)
+                supervisor.probe_interval = reconnect.get('probe_interval', 30)
+            self.http_breakers = {}
+        apply(('reconnect',), apply_reconnect)
+        
+        def apply_quality():
+            # 판정 파라미터가 바뀌면 통계를 새로 시작
+            old, new = changes['quality']
+            if changed_keys(old, new) - {'suppress_bad'}:
+                self.quality_monitor = self.init_quality_monitor()
+        
+        def reset_quality():
+            self.quality_monitor = self.init_quality_monitor()
+        apply(('quality',), apply_quality, reset_quality)
+        
+        def apply_sensors():
+            if self.quality_monitor:
+                # 센서 범위만 교체 (누적 통계 유지)
+                self.quality_monitor.limits = self.sensor_limits()
+        apply(('sensors',), apply_sensors)
+        
+        def apply_compression():
+            self.codec = self.init_compression()
+        apply(('compression',), apply_compression)
+        
+        def apply_tracing():
+            self.tracer = self.init_tracing()
+        apply(('tracing',), apply_tracing)
+        
+        def apply_profiling():
+            # 실행 중이던 샘플링은 이전 파일에 마무리하고 종료 (시그널 핸들러는 새 프로파일러로 교체)
+            self.profiler.stop()
+            self.profiler = self.init_profiler()
+            self.profiler.install_signal()
+        apply(('profiling',), apply_profiling)
+        
+        def apply_backlog():
+            if self.backlog:
+                self.backlog.close()
+            self.backlog = self.init_backlog()
+        apply(('backlog',), apply_backlog)
+        
+        apply(('rules', 'controls'), self.reload_rules)
+        
+        applied = sorted(set(changes) - set(failed))
+        if failed:
+            logger.error(f"설정 일부 적용 실패 (이전 설정 유지): {', '.join(sorted(failed))}")
+            return False, [f'{section} 적용 실패' for section in sorted(failed)]
+        logger.info(f"설정 적용됨: {', '.join(applied)}")
+        return True, applied
+    
+    def on_mqtt_connect(self, client, userdata, flags, rc, properties=None):
+        """MQTT 연결 콜백 (MQTT 5면 CONNACK 속성도 전달됨)"""
+        self.mqtt_connack_rc = rc
         if rc == 0:
             logger.info("MQTT 연결 성공")
-            # 명령 토픽 구독
-            command_topic = self.config.get('mqtt', {}).get('command_topic', 'device/command')
-            client.subscribe(command_topic)
+            self.mqtt_publisher.on_connect(properties)
+            # 브로커에 이전 세션이 남아 있으면 구독도 유지되어 있음 (끊긴 동안의 QoS1 명령도 전달됨)
+            if not flags.get('session present'):
+                command_topic = self.config.get('mqtt', {}).get('command_topic', 'device/command')
+                client.subscribe(command_topic, qos=1)
         else:
             logger.error(f"MQTT 연결 실패: {rc}")
     
     def on_mqtt_message(self, client, userdata, msg):
         """MQTT 메시지 수신 콜백"""
+        # MQTT 5: 요청자가 지정한 응답 토픽/상관 데이터로 결과 응답 (서버가 페이로드 파싱 없이 매칭)
+        response_topic, correlation_data = command_correlation(msg)
+        status = 'ok'
+        result = None
+        trace = None
         try:
             command = json.loads(msg.payload.decode())
             logger.info(f"명령 수신: {command}")
-            self.process_command(command)
+            trace = self.tracer.start('command', command.get('trace'), stage='received')
+            result = self.process_command(command)
+            self.tracer.mark(trace, 'executed')
         except Exception as e:
             logger.error(f"명령 처리 실패: {e}")
+            status = 'error'
+        
+        response = {'device_id': self.device_id, 'status': status, **(result or {})}
+        if response_topic:
+            self.mqtt_publisher.publish(response_topic, json.dumps(response), correlation_data=correlation_data)
+        elif result:
+            # MQTT 3.1.1: 결과가 있는 명령(control)만 ACK 토픽으로 응답
+            mqtt_config = self.config.get('mqtt', {})
+            ack_topic = mqtt_config.get('ack_topic', f"{mqtt_config.get('command_topic', 'device/command')}/ack")
+            self.mqtt_publisher.publish(ack_topic, json.dumps(response))
+        self.tracer.mark(trace, 'ack')
+        self.tracer.finish(trace)
     
     def process_command(self, command):
-        """명령 처리"""
+        """명령 처리 (ACK에 실을 결과가 있으면 dict 반환)"""
         command_type = command.get('type')
         params = command.get('params', {})
         
-        if command_type == 'modbus_write':
+        if command_type == 'control':
+            # 여러 제어 출력을 한 번에 변경 - 같은 유닛의 인접 주소는 한 번의 쓰기로 묶임
+            results = self.set_controls(params.get('controls', {}), verify=params.get('verify'))
+            return {
+                'command_id': command.get('command_id'),
+                'status': 'ok' if all(r['ok'] for r in results.values()) else 'error',
+                'controls': results
+            }
+        elif command_type == 'latency':
+            # 구간별 지연 통계 (p50/p90/p99, ms)
+            return {'command_id': command.get('command_id'), 'latency': self.tracer.stats()}
+        elif command_type == 'memory':
+            # RSS, 스레드 수, 컴포넌트별 할당량 (tracemalloc이 켜져 있을 때만, KB)
+            return {'command_id': command.get('command_id'), 'memory': self.memory_report.report()}
+        elif command_type == 'profile':
+            # 샘플링 프로파일러 켜고 끄기 (action: start / stop / toggle / status, duration초 뒤 자동 종료)
+            status = self.profiler.control(params.get('action', 'status'), params.get('duration'))
+            return {'command_id': command.get('command_id'), 'profile': status}
+        elif command_type == 'modbus_write':
             self.write_modbus_register(
                 params.get('address', 0),
                 params.get('value', 0),
@@ -119,44 +659,60 @@ class Gateway:
             )
         elif command_type == 'serial_write':
             self.write_serial(params.get('data', ''))
+        elif command_type == 'update_config':
+            # 일부 섹션만 보내도 됨 (보낸 섹션만 교체)
+            new_config = dict(self.config)
+            new_config.update(params.get('config', {}))
+            errors = validate_config(new_config)
+            if errors:
+                logger.error(f"원격 설정 거부: {errors}")
+                return
+            self.request_config(new_config)
+            if params.get('persist', True):
+                # 재시작 후에도 유지 (파일 감시가 다시 읽어도 바뀐 내용이 없어 무시됨)
+                write_config(self.config_file, new_config)
+        elif command_type == 'backfill' and self.backlog:
+            # 원본 해상도 재전송 요청 (오래 걸릴 수 있으므로 공유 작업 풀에서 실행)
+            shared_pool().submit(
+                self.backlog.backfill,
+                self.send_backfill, params.get('start', 0), params.get('end', int(time.time() * 1000)),
+                keys=params.get('keys')
+            )
     
     def read_modbus_registers(self):
-        """Modbus 레지스터 읽기"""
-        if not self.modbus_client:
+        """Modbus 레지스터 읽기 (슬레이브별로 가까운 주소를 묶어 한 번에 요청)"""
+        if not self.is_connected('modbus') or not self.modbus_bus:
             return {}
-            
-        sensors = self.config.get('sensors', {})
-        data = {}
         
-        for sensor_name, sensor_config in sensors.items():
-            if sensor_config.get('type') == 'modbus':
-                try:
-                    address = sensor_config.get('address', 0)
-                    count = sensor_config.get('count', 1)
-                    unit_id = sensor_config.get('unit_id', 1)
-                    
-                    result = self.modbus_client.read_holding_registers(
-                        address, count, unit=unit_id
-                    )
-                    
-                    if result.isError():
-                        logger.error(f"Modbus 읽기 실패: {sensor_name}")
-                        continue
-                    
-                    value = result.registers[0]
-                    scale = sensor_config.get('scale', 1.0)
-                    offset = sensor_config.get('offset', 0.0)
-                    
-                    data[sensor_name] = (value * scale) + offset
-                    
-                except Exception as e:
-                    logger.error(f"센서 읽기 실패 {sensor_name}: {e}")
+        sensors = {
+            name: sensor for name, sensor in self.config.get('sensors', {}).items()
+            if sensor.get('type') == 'modbus'
+        }
+        points = {
+            name: (
+                sensor.get('unit_id', 1),
+                sensor.get('function', 'holding'),
+                sensor.get('address', 0),
+                sensor.get('count', 1)
+            )
+            for name, sensor in sensors.items()
+        }
+        
+        data = {}
+        for sensor_name, registers in self.modbus_bus.read(points).items():
+            sensor_config = sensors[sensor_name]
+            value = registers[0]
+            scale = sensor_config.get('scale', 1.0)
+            offset = sensor_config.get('offset', 0.0)
+            
+            data[sensor_name] = (value * scale) + offset
         
+        logger.debug(f"Modbus 버스: {self.modbus_bus.stats()}")
         return data
     
     def read_serial_data(self):
         """시리얼 데이터 읽기"""
-        if not self.serial_conn:
+        if not self.is_connected('serial'):
             return {}
             
         data = {}
@@ -170,26 +726,71 @@ class Gateway:
                         if ':' in pair:
                             key, value = pair.split(':', 1)
                             data[key.lower()] = float(value)
+        except OSError as e:  # serial.SerialException 포함
+            logger.error(f"시리얼 읽기 실패: {e}")
+            self.connection_failed('serial')
         except Exception as e:
             logger.error(f"시리얼 읽기 실패: {e}")
         
         return data
     
     def write_modbus_register(self, address, value, unit_id):
-        """Modbus 레지스터 쓰기"""
-        if not self.modbus_client:
-            return False
-            
-        try:
-            result = self.modbus_client.write_register(address, value, unit=unit_id)
-            return not result.isError()
-        except Exception as e:
-            logger.error(f"Modbus 쓰기 실패: {e}")
+        """Modbus 레지스터 쓰기 (대기 중인 폴링보다 먼저 실행)"""
+        if not self.is_connected('modbus') or not self.modbus_bus:
             return False
+        
+        return self.modbus_bus.write_register(address, value, unit_id)
+    
+    def set_control(self, name, state):
+        """이름으로 지정한 제어 출력(controls) 변경"""
+        return self.set_controls({name: state})[name]['ok']
+    
+    def set_controls(self, states, verify=None):
+        """
+        여러 제어 출력(controls)을 한 번에 변경
+        
+        Args:
+            states: {제어 이름: on/off}
+            verify: 쓰기 후 다시 읽어 확인할지 여부 (None이면 제어별 verify 설정)
+        
+        Returns:
+            {제어 이름: {'ok', 'verified', 'latency_ms'}} - latency_ms는 요청부터 쓰기(확인) 완료까지
+        """
+        controls = self.config.get('controls', {})
+        results = {}
+        writes = {}
+        for name, state in states.items():
+            control = controls.get(name)
+            if not control:
+                logger.error(f"알 수 없는 제어 출력: {name}")
+                results[name] = {'ok': False, 'error': 'unknown control'}
+            elif control.get('type') != 'modbus':
+                logger.error(f"지원하지 않는 제어 타입: {control.get('type')}")
+                results[name] = {'ok': False, 'error': 'unsupported type'}
+            else:
+                writes[name] = (
+                    control.get('unit_id', 1),
+                    control.get('register', 'holding'),
+                    control.get('address', 0),
+                    control.get('on_value', 1) if state else control.get('off_value', 0)
+                )
+        
+        if writes and (not self.is_connected('modbus') or not self.modbus_bus):
+            results.update({name: {'ok': False, 'error': 'modbus not connected'} for name in writes})
+        elif writes:
+            checks = [
+                name for name in writes
+                if (verify if verify is not None else controls[name].get('verify', False))
+            ]
+            results.update(self.modbus_bus.write_many(writes, verify=checks))
+            failed = [name for name in writes if not results[name]['ok']]
+            if failed:
+                logger.error(f"제어 출력 변경 실패: {failed}")
+        return results
     
     def write_serial(self, data):
         """시리얼 데이터 쓰기"""
-        if not self.serial_conn:
+        if not self.is_connected('serial'):
             return False
             
         try:
@@ -197,62 +798,195 @@ class Gateway:
             return True
         except Exception as e:
             logger.error(f"시리얼 쓰기 실패: {e}")
+            self.connection_failed('serial')
             return False
     
-    def send_telemetry(self, data):
-        """텔레메트리 전송"""
+    def send_telemetry(self, data, quality=None, ts_ms=None, trace=None):
+        """텔레메트리 전송 (ts_ms: 측정 시각 epoch ms, trace: 지연 추적). 하나 이상의 업링크로 전송에 성공하면 True"""
         telemetry = {
             'device_id': self.device_id,
-            'ts': datetime.now().isoformat(),
+            'seq': self.sequencer.next(self.device_id),
+            'seq_epoch': self.sequencer.epoch,
+            'ts': format_ts(ts_ms if ts_ms is not None else self.clock.now_ms()),
             'metrics': data,
             'status': 'ok'
         }
+        if quality:
+            telemetry['quality'] = quality
+        
+        return self.uplink(telemetry, trace=trace)
+    
+    def send_backfill(self, batch):
+        """백로그 배치 전송 (원본 또는 1분/15분 롤업)"""
+        telemetry = {
+            'device_id': self.device_id,
+            'ts': format_ts(self.clock.now_ms()),
+            'status': 'backfill'
+        }
+        telemetry.update(batch)
+        
+        sent = self.uplink(telemetry, {'resolution': batch['resolution']})
+        if sent:
+            count = sum(len(points) for points in batch['series'].values())
+            logger.info(f"백로그 전송: {batch['resolution']} {count}개")
+        return sent
+    
+    def uplink(self, telemetry, user_properties=None, trace=None):
+        """MQTT/HTTP 업링크 전송 (trace가 있으면 페이로드에 추적 컨텍스트를 싣고 전송 구간 기록)"""
+        sent = False
+        if trace is not None:
+            self.tracer.mark(trace, 'encode')
+            telemetry = dict(telemetry, trace=self.tracer.context(trace))
+        payload = json.dumps(telemetry)
+        
+        # 임계값 이상이면 압축 (큰 배치/백필만, 작은 메시지는 그대로)
+        body, encoding = self.codec.encode(payload) if self.codec else (payload, None)
         
         # MQTT 전송
-        if self.mqtt_client:
-            topic = self.config.get('mqtt', {}).get('telemetry_topic', 'device/telemetry')
-            payload = json.dumps(telemetry)
-            self.mqtt_client.publish(topic, payload)
-            logger.info(f"MQTT 텔레메트리 전송: {payload}")
+        if self.mqtt_client and self.mqtt_client.is_connected():
+            mqtt_config = self.config.get('mqtt', {})
+            topic = mqtt_config.get('telemetry_topic', 'device/telemetry')
+            # MQTT 5: 두 번째 메시지부터 토픽 별칭, 오프라인 동안 쌓인 메시지는 만료 후 폐기
+            properties = {'schema': SCHEMA_VERSION, 'batch_seq': self.batch_seq}
+            properties.update(user_properties or {})
+            if encoding:
+                # 압축 방식은 토픽 접미사로 표시 (사용자 속성은 3.1.1로 접속한 Bridge에 전달되지 않음)
+                topic = f"{topic}/{encoding}"
+            result = self.mqtt_publisher.publish(
+                topic, body, qos=mqtt_config.get('qos', 0),
+                expiry=mqtt_config.get('message_expiry'),
+                user_properties=properties
+            )
+            if result.rc == mqtt.MQTT_ERR_SUCCESS:
+                sent = True
+                self.batch_seq += 1
+                self.tracer.mark(trace, 'mqtt_publish')
+                logger.info(f"MQTT 텔레메트리 전송: {payload}")
+            else:
+                logger.error(f"MQTT 텔레메트리 전송 실패: {result.rc}")
         
         # HTTP 전송
         http_config = self.config.get('http', {})
         if http_config:
-            try:
-                url = http_config.get('url', 'http://localhost:3000/api/telemetry')
-                response = requests.post(url, json=telemetry, timeout=5)
-                if response.status_code == 200:
-                    logger.info("HTTP 텔레메트리 전송 성공")
-                else:
-                    logger.error(f"HTTP 텔레메트리 전송 실패: {response.status_code}")
-            except Exception as e:
-                logger.error(f"HTTP 전송 실패: {e}")
+            url = http_config.get('url', 'http://localhost:3000/api/telemetry')
+            breaker = self.http_breaker(url)
+            # 서버 장애 중에는 차단 시간 동안 요청하지 않음 (백로그에 쌓였다가 재전송)
+            if breaker.allow():
+                import requests
+                headers = {'Content-Type': 'application/json'}
+                if encoding:
+                    headers['Content-Encoding'] = encoding
+                try:
+                    response = requests.post(url, data=body, headers=headers, timeout=5)
+                    self.tracer.mark(trace, 'http_ack')
+                    if response.status_code == 200:
+                        sent = True
+                        breaker.record_success()
+                        logger.info("HTTP 텔레메트리 전송 성공")
+                    else:
+                        logger.error(f"HTTP 텔레메트리 전송 실패: {response.status_code}")
+                        if response.status_code >= 500:
+                            breaker.record_failure()
+                except Exception as e:
+                    logger.error(f"HTTP 전송 실패: {e}")
+                    breaker.record_failure()
+        
+        self.tracer.finish(trace)
+        return sent
     
     def run(self):
         """메인 루프"""
         logger.info("게이트웨이 시작")
+        self.profiler.install_signal()
+        
+        # 연결 초기화 (서로 독립적이므로 동시에: 라이브러리 import와 버스/포트 준비가 겹침)
+        for name, (ok, elapsed, error) in parallel_init({
+            'mqtt': self.init_mqtt,
+            'modbus': self.init_modbus,
+            'serial': self.init_serial,
+            'rules': self.init_rules
+        }).items():
+            if not ok:
+                logger.error(f"{name} 초기화 실패 ({elapsed}ms): {error}")
+        self.startup.mark('init')
         
-        # 연결 초기화
-        self.init_mqtt()
-        self.init_modbus()
-        self.init_serial()
+        # 센서 폴링과 별도로 마지막 상태를 먼저 발행
+        if self.state_cache:
+            shared_pool().submit(self.publish_cached_state)
         
-        interval = self.config.get('poll_interval', 30)
+        # 설정 파일 변경 감시
+        ConfigWatcher(self.config_file, self.request_config).start()
         
         while True:
             try:
-                # 센서 데이터 수집
+                # 대기 중 들어온 설정 변경 적용
+                if self.pending_config is not None:
+                    config, self.pending_config = self.pending_config, None
+                    self.apply_config(config)
+                
+                # 센서 데이터 수집 (측정 시각은 읽기 구간의 중간 시점)
+                started_ns = self.clock.now_ns()
                 data = {}
                 data.update(self.read_modbus_registers())
                 data.update(self.read_serial_data())
+                acquired_ns = self.clock.now_ns()
+                ts_ms = self.clock.to_epoch_ms((started_ns + acquired_ns) // 2)
+                trace = self.tracer.start('telemetry', started_ns=started_ns, stage='poll')
+                self.tracer.mark(trace, 'read', acquired_ns)
+                
+                # 품질 판정 (bad 값은 로컬 제어에 사용하지 않음)
+                quality = self.check_quality(data)
+                valid = {name: value for name, value in data.items() if quality.get(name) != 'bad'}
+                if self.config.get('quality', {}).get('suppress_bad', False):
+                    data = valid
+                    quality = {name: q for name, q in quality.items() if q != 'bad'}
+                
+                # 로컬 이력 저장 (bad 값 제외)
+                if self.history:
+                    self.history.append_many(valid, ts_ms)
+                
+                # 로컬 룰 평가 (업링크 연결 여부와 무관하게 동작)
+                if self.rule_engine:
+                    self.rule_engine.update(valid)
+                    self.rule_engine.tick()
+                self.tracer.mark(trace, 'rules')
                 
                 if data:
-                    self.send_telemetry(data)
+                    sent = self.send_telemetry(data, quality, ts_ms, trace)
+                    if sent and self.state_cache:
+                        self.state_cache.save({'ts': ts_ms, 'metrics': data, 'quality': quality})
+                    if sent and not self.first_sent:
+                        self.first_sent = True
+                        self.startup.mark('first_publish')
+                        logger.info(f"시작 완료: {self.startup.summary()}")
+                    logger.debug(f"수집 {elapsed_ms(started_ns, acquired_ns)}ms, 수집→전송 {elapsed_ms(acquired_ns)}ms")
+                    
+                    # 백로그 저장 및 재연결 후 밀린 데이터 재전송 (주기당 배치 수 제한)
+                    if self.backlog:
+                        self.backlog.append(data, ts_ms, sent=sent)
+                        if sent:
+                            self.backlog.replay(
+                                self.send_backfill,
+                                max_batches=self.config['backlog'].get('max_batches_per_cycle', 5)
+                            )
+                
+                # 메모리 사용량 주기 보고 (memory.report_interval초, 0이면 끔)
+                report_interval = self.config.get('memory', {}).get('report_interval', 0)
+                if report_interval and time.monotonic() - self.memory_reported_at >= report_interval:
+                    self.memory_reported_at = time.monotonic()
+                    logger.info(f"메모리: {self.memory_report.report()}")
                 
-                time.sleep(interval)
+                # poll_interval 대기 (설정이 바뀌면 즉시 깨어나 새 주기로 재스케줄)
+                if self.wake.wait(self.config.get('poll_interval', 30)):
+                    self.wake.clear()
                 
             except KeyboardInterrupt:
                 logger.info("게이트웨이 종료")
+                if self.history:
+                    self.history.flush()
+                self.close_modbus()
+                for name in list(self.supervisors):
+                    self.stop_supervisor(name)
                 break
             except Exception as e:
                 logger.error(f"메인 루프 오류: {e}")
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+설정 파일 감시 및 검증/비교
+프로세스를 재시작하지 않고 config.json 변경을 반영하기 위한 도구
+
+- inotify로 설정 파일이 있는 디렉터리를 감시 (편집기가 파일을 교체하는 경우도 감지)
+- inotify를 쓸 수 없으면 수정 시각(mtime) 폴링
+- validate_config()로 새 설정을 검증하고, diff_config()로 바뀐 섹션만 골라 적용
+"""
+
+import ctypes
+import ctypes.util
+import inspect
+import json
+import logging
+import os
+import select
+import struct
+import threading
+import time
+
+from modbus_bus import MAX_WRITE, READ_FUNCTIONS
+from rule_engine import Rule
+from sensor_quality import SensorQualityMonitor
+from telemetry_backlog import TelemetryBacklog
+
+logger = logging.getLogger(__name__)
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+
+_EVENT = struct.Struct('iIII')  # wd, mask, cookie, len
+
+SENSOR_TYPES = ('modbus', 'serial')
+CONTROL_TYPES = ('modbus',)
+COMPRESSION_METHODS = ('deflate', 'zstd')
+MODBUS_METHODS = ('tcp', 'rtu')
+
+
+def _parameters(cls, exclude):
+    """생성자 키워드 인자 이름 (설정 섹션을 그대로 **kwargs로 넘기는 경우 허용 키)"""
+    return {name for name in inspect.signature(cls.__init__).parameters if name not in ('self',) + exclude}
+
+
+# 섹션 키 -> 생성자 인자로 넘어가므로 모르는 키가 있으면 적용 시점에 TypeError
+QUALITY_KEYS = _parameters(SensorQualityMonitor, ('limits',)) | {'enabled', 'suppress_bad'}
+BACKLOG_KEYS = _parameters(TelemetryBacklog, ()) | {'max_batches_per_cycle'}
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def validate_config(config):
+    """설정 검증. 오류 메시지 목록 반환 (비어 있으면 정상)"""
+    if not isinstance(config, dict):
+        return ['설정은 JSON 객체여야 합니다']
+
+    errors = []
+
+    interval = config.get('poll_interval', 30)
+    if not isinstance(interval, (int, float)) or isinstance(interval, bool) or interval <= 0:
+        errors.append(f'poll_interval은 양수여야 합니다: {interval}')
+
+    invalid = [
+        section for section in ('mqtt', 'http', 'modbus', 'serial', 'reconnect', 'compression', 'tracing', 'profiling', 'memory', 'startup', 'quality', 'backlog', 'history', 'sensors', 'controls')
+        if section in config and not isinstance(config[section], dict)
+    ]
+    if invalid:
+        return errors + [f'{section}은 객체여야 합니다' for section in invalid]
+
+    for section in ('mqtt', 'modbus'):
+        port = config.get(section, {}).get('port')
+        if port is not None and (not isinstance(port, int) or not 0 < port < 65536):
+            errors.append(f'{section}.port가 올바르지 않습니다: {port}')
+
+    modbus = config.get('modbus', {})
+    if modbus.get('method', 'tcp') not in MODBUS_METHODS:
+        errors.append(f'modbus.method는 {MODBUS_METHODS} 중 하나여야 합니다')
+    elif modbus.get('method') == 'rtu' and modbus.get('device', '/dev/ttyUSB1') == config.get('serial', {}).get('port'):
+        errors.append('modbus.device와 serial.port는 같은 포트를 쓸 수 없습니다')
+
+    for section, allowed, flags in (('quality', QUALITY_KEYS, ('enabled', 'suppress_bad')),
+                                    ('backlog', BACKLOG_KEYS, ())):
+        for key, value in config.get(section, {}).items():
+            if key not in allowed:
+                errors.append(f'{section}.{key}은 알 수 없는 설정입니다 (사용 가능: {", ".join(sorted(allowed))})')
+            elif key in flags:
+                if not isinstance(value, bool):
+                    errors.append(f'{section}.{key}는 true/false여야 합니다')
+            elif key == 'path':
+                if not isinstance(value, str) or not value:
+                    errors.append(f'{section}.path는 문자열이어야 합니다')
+            elif not (key == 'drift_z' and value is None) and not (_is_number(value) and value >= 0):
+                errors.append(f'{section}.{key}는 0 이상의 숫자여야 합니다: {value}')
+
+    method = config.get('compression', {}).get('method', 'deflate')
+    if method not in COMPRESSION_METHODS:
+        errors.append(f'compression.method은 {COMPRESSION_METHODS} 중 하나여야 합니다')
+
+    for name, sensor in config.get('sensors', {}).items():
+        if not isinstance(sensor, dict):
+            errors.append(f'sensors.{name}은 객체여야 합니다')
+            continue
+        if sensor.get('type') not in SENSOR_TYPES:
+            errors.append(f'sensors.{name}.type은 {SENSOR_TYPES} 중 하나여야 합니다')
+        if 'min' in sensor and 'max' in sensor:
+            bounds = (sensor['min'], sensor['max'])
+            if not all(_is_number(value) for value in bounds):
+                errors.append(f'sensors.{name}: min/max는 숫자여야 합니다')
+            elif sensor['min'] >= sensor['max']:
+                errors.append(f'sensors.{name}: min이 max보다 작아야 합니다')
+        if sensor.get('type') == 'modbus' and sensor.get('function', 'holding') not in READ_FUNCTIONS:
+            errors.append(f'sensors.{name}.function은 {tuple(READ_FUNCTIONS)} 중 하나여야 합니다')
+
+    controls = config.get('controls', {})
+    for name, control in controls.items():
+        if not isinstance(control, dict):
+            errors.append(f'controls.{name}은 객체여야 합니다')
+            continue
+        if control.get('type') not in CONTROL_TYPES:
+            errors.append(f'controls.{name}.type은 {CONTROL_TYPES} 중 하나여야 합니다')
+        if control.get('register', 'holding') not in MAX_WRITE:
+            errors.append(f'controls.{name}.register는 {tuple(MAX_WRITE)} 중 하나여야 합니다')
+
+    rules = config.get('rules', [])
+    if not isinstance(rules, list):
+        errors.append('rules는 배열이어야 합니다')
+        rules = []
+    for rule in rules:
+        if not isinstance(rule, dict):
+            errors.append(f'rules 항목은 객체여야 합니다: {rule!r}')
+            continue
+        try:
+            compiled = Rule(rule)
+        except (KeyError, ValueError, SyntaxError, TypeError) as e:
+            errors.append(f"rules.{rule.get('name', '?')}: {e}")
+            continue
+        if compiled.actuator not in controls:
+            errors.append(f'rules.{compiled.name}: 알 수 없는 제어 출력 {compiled.actuator}')
+
+    return errors
+
+
+def diff_config(old, new):
+    """바뀐 최상위 섹션 -> (이전 값, 새 값)"""
+    return {
+        key: (old.get(key), new.get(key))
+        for key in set(old) | set(new)
+        if old.get(key) != new.get(key)
+    }
+
+
+def changed_keys(old, new):
+    """섹션 안에서 바뀐 키 집합"""
+    old = old or {}
+    new = new or {}
+    return {key for key in set(old) | set(new) if old.get(key) != new.get(key)}
+
+
+def write_config(path, config):
+    """설정 파일 원자적 저장"""
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(config, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+class ConfigWatcher:
+    def __init__(self, path, on_change, poll_interval=2.0, debounce=0.5):
+        """
+        Args:
+            path: 감시할 설정 파일 경로
+            on_change: on_change(config) - 파일이 바뀌어 새 설정을 읽었을 때 호출 (파싱 실패 시 호출 안 함)
+            poll_interval: inotify를 쓸 수 없을 때 mtime 확인 주기 (초)
+            debounce: 연속된 쓰기 이벤트를 하나로 묶는 시간 (초)
+        """
+        self.path = os.path.abspath(path)
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def _run(self):
+        fd = self._inotify_init()
+        if fd is None:
+            logger.info('inotify 사용 불가 - 설정 파일 mtime 폴링')
+            self._poll()
+            return
+        try:
+            self._watch(fd)
+        finally:
+            os.close(fd)
+
+    def _inotify_init(self):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            fd = libc.inotify_init1(os.O_CLOEXEC)
+            if fd < 0:
+                return None
+            mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY
+            if libc.inotify_add_watch(fd, os.path.dirname(self.path).encode(), mask) < 0:
+                os.close(fd)
+                return None
+            return fd
+        except (OSError, AttributeError):
+            return None
+
+    def _watch(self, fd):
+        name = os.path.basename(self.path).encode()
+        while self.running:
+            readable, _, _ = select.select([fd], [], [], 1.0)
+            if not readable:
+                continue
+
+            if not self._matches(os.read(fd, 4096), name):
+                continue
+
+            # 편집기가 여러 번 나눠 쓰는 경우를 하나로 묶음
+            while select.select([fd], [], [], self.debounce)[0]:
+                os.read(fd, 4096)
+            self._reload()
+
+    @staticmethod
+    def _matches(buffer, name):
+        offset = 0
+        while offset + _EVENT.size <= len(buffer):
+            _, _, _, length = _EVENT.unpack_from(buffer, offset)
+            offset += _EVENT.size
+            if buffer[offset:offset + length].rstrip(b'\0') == name:
+                return True
+            offset += length
+        return False
+
+    def _poll(self):
+        last_mtime = self._mtime()
+        while self.running:
+            time.sleep(self.poll_interval)
+            mtime = self._mtime()
+            if mtime != last_mtime:
+                last_mtime = mtime
+                time.sleep(self.debounce)
+                self._reload()
+
+    def _mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _reload(self):
+        try:
+            with open(self.path, 'r') as f:
+                config = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f'설정 파일 읽기 실패 (기존 설정 유지): {e}')
+            return
+        self.on_change(config)
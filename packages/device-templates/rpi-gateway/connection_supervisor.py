@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+연결 감시자 (MQTT / Modbus TCP / 시리얼 / HTTP 공용)
+
+- 지터가 들어간 지수 백오프 (decorrelated jitter)
+  브로커가 재시작되어도 수천 대의 디바이스가 같은 순간에 재접속하지 않도록 대기 시간을 분산
+- 연결 상태 점검 (probe) 또는 연결을 유지하는 서비스 루프 (MQTT network loop)
+- 엔드포인트별 서킷 브레이커: 연속 실패가 max_attempts에 이르면 open_timeout 동안 시도 중단 후 한 번만 재시도
+"""
+
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Backoff:
+    """지터 지수 백오프: delay = random(base, min(cap, 이전 delay * 3))"""
+
+    def __init__(self, base=1.0, cap=60.0):
+        self.base = base
+        self.cap = cap
+        self.attempts = 0
+        self._delay = base
+
+    def next_delay(self):
+        self.attempts += 1
+        self._delay = min(self.cap, random.uniform(self.base, self._delay * 3))
+        return self._delay
+
+    def reset(self):
+        self.attempts = 0
+        self._delay = self.base
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=10, open_timeout=300):
+        """
+        Args:
+            failure_threshold: 이 횟수만큼 연속 실패하면 차단 (open)
+            open_timeout: 차단 유지 시간 (초), 이후 한 번만 시도 (half-open)
+        """
+        self.failure_threshold = failure_threshold
+        self.open_timeout = open_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """지금 시도해도 되는지"""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.open_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+            return True
+
+    def remaining(self):
+        """차단이 풀리기까지 남은 시간 (초)"""
+        with self._lock:
+            if self.state != self.OPEN:
+                return 0.0
+            return max(0.0, self.opened_at + self.open_timeout - time.monotonic())
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"서킷 브레이커 차단: 연속 실패 {self.failures}회, {self.open_timeout}초 후 재시도")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class ConnectionSupervisor:
+    def __init__(self, name, connect, close=None, probe=None, service=None,
+                 base_delay=1.0, max_delay=60.0, max_attempts=10, open_timeout=300,
+                 initial_jitter=0.0, probe_interval=30.0, on_connected=None):
+        """
+        Args:
+            name: 로그용 연결 이름
+            connect: connect() - 실패 시 예외 또는 False. 연결이 실제로 성립한 뒤 반환해야 함
+                (MQTT는 TCP 연결이 아니라 CONNACK rc=0까지 기다려야 인증 거부가 실패로 세어짐)
+            close: close() - 끊긴 연결 정리
+            probe: probe() -> bool, probe_interval마다 연결 상태 점검
+            service: service() -> bool, 연결 중 반복 호출 (예: MQTT network loop), False면 끊김으로 판단
+            base_delay / max_delay: 백오프 범위 (초)
+            max_attempts: 서킷 브레이커 차단 전 연속 실패 횟수
+            open_timeout: 차단 유지 시간 (초)
+            initial_jitter: 첫 연결 전 임의 대기 최대값 (정전 복구 후 동시 접속 분산)
+            probe_interval: 상태 점검 주기 (초)
+            on_connected: 연결(재연결) 성공 시 호출
+        """
+        self.name = name
+        self._connect = connect
+        self._close = close
+        self._probe = probe
+        self._service = service
+        self.backoff = Backoff(base_delay, max_delay)
+        self.breaker = CircuitBreaker(max_attempts, open_timeout)
+        self.initial_jitter = initial_jitter
+        self.probe_interval = probe_interval
+        self.on_connected = on_connected
+
+        self.connected = False
+        self.running = False
+        self.thread = None
+        self._wake = threading.Event()
+        self._failed = False
+        self._attempted = False
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name=f"supervisor-{self.name}", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self._wake.set()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=5)
+        self._disconnect()
+
+    def mark_failed(self):
+        """입출력 오류 발생 시 호출 - 연결을 정리하고 재연결"""
+        if self.connected:
+            self._failed = True
+            self._wake.set()
+
+    def _run(self):
+        if self.initial_jitter:
+            self._sleep(random.uniform(0, self.initial_jitter))
+
+        while self.running:
+            if not self.connected:
+                self._try_connect()
+            elif self._failed:
+                self._failed = False
+                logger.warning(f"{self.name} 연결 오류 - 재연결")
+                self._disconnect()
+            elif self._service:
+                if not self._service():
+                    logger.warning(f"{self.name} 연결 끊김")
+                    self._disconnect()
+            else:
+                self._sleep(self.probe_interval)
+                if self.running and self._probe and not self._failed and not self._safe_probe():
+                    logger.warning(f"{self.name} 상태 점검 실패 - 재연결")
+                    self._disconnect()
+
+    def _try_connect(self):
+        if not self.breaker.allow():
+            self._sleep(self.breaker.remaining())
+            return
+
+        # 끊긴 직후에도 바로 붙지 않고 지터 대기 (브로커 재시작 시 동시 재접속 방지)
+        if self._attempted:
+            delay = self.backoff.next_delay()
+            logger.info(f"{self.name} {delay:.1f}초 후 재연결 시도 ({self.backoff.attempts}회째)")
+            if self._sleep(delay) or not self.running:
+                return
+        self._attempted = True
+
+        try:
+            ok = self._connect()
+        except Exception as e:
+            logger.error(f"{self.name} 연결 실패: {e}")
+            ok = False
+
+        if ok is False:
+            self.breaker.record_failure()
+            return
+
+        self.connected = True
+        self._failed = False
+        self.backoff.reset()
+        self.breaker.record_success()
+        logger.info(f"{self.name} 연결됨")
+        if self.on_connected:
+            self.on_connected()
+
+    def _sleep(self, seconds):
+        """대기 (stop() 등으로 깨어나면 True)"""
+        woken = self._wake.wait(seconds)
+        self._wake.clear()
+        return woken
+
+    def _safe_probe(self):
+        try:
+            return bool(self._probe())
+        except Exception:
+            return False
+
+    def _disconnect(self):
+        was_connected = self.connected
+        self.connected = False
+        if self._close and was_connected:
+            try:
+                self._close()
+            except Exception as e:
+                logger.debug(f"{self.name} 연결 정리 오류: {e}")
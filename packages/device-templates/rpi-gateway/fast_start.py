@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+빠른 시작 (정전 후 재부팅 시 첫 데이터까지 걸리는 시간 단축)
+
+- StateCache: 마지막으로 전송한 상태를 파일에 저장 (임시 파일 → os.replace로 원자적 교체,
+  min_interval마다 최대 한 번만 써서 SD 카드 쓰기 절약). 시작하면 센서/하드웨어 초기화를 기다리지 않고
+  캐시된 마지막 상태를 먼저 발행 (원래 측정 시각 유지, cached 표시)
+- parallel_init: 서로 독립적인 초기화(연결, 하드웨어)를 동시에 실행하고 단계별 소요 시간 반환
+- StartupTimer: 프로세스 시작 시각(/proc/self/stat) 기준 단계별 경과 시간 (인터프리터 기동/import 포함)
+
+벤치마크 (새 인터프리터에서 모듈별 import 시간/RSS 측정):
+    python3 fast_start.py                       # 이 디렉터리의 게이트웨이 + 무거운 라이브러리
+    python3 fast_start.py app requests pymodbus.client.sync
+"""
+
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def process_age():
+    """프로세스 시작 후 경과 시간 (초). /proc이 없으면 None"""
+    try:
+        with open("/proc/self/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK")  # 22번째 필드: starttime (clock tick)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupTimer:
+    """시작 단계별 경과 시간 (ms, 프로세스 시작 기준)"""
+
+    def __init__(self):
+        self._origin = time.monotonic() - (process_age() or 0.0)
+        self.stages = {}
+
+    def mark(self, stage):
+        self.stages[stage] = round((time.monotonic() - self._origin) * 1000, 1)
+        return self.stages[stage]
+
+    def summary(self):
+        return ", ".join(f"{stage} {ms:.0f}ms" for stage, ms in self.stages.items())
+
+
+def parallel_init(tasks, timeout=30.0):
+    """
+    독립적인 초기화 함수들을 동시에 실행
+
+    Args:
+        tasks: {이름: 인자 없는 함수}
+        timeout: 전체 대기 시간 (초, 끝나지 않은 작업은 계속 실행되고 결과에서 빠짐)
+
+    Returns:
+        {이름: (성공 여부, 소요 ms, 예외 또는 None)}
+    """
+    results = {}
+
+    def run(name, task):
+        start = time.monotonic()
+        try:
+            task()
+            results[name] = (True, round((time.monotonic() - start) * 1000, 1), None)
+        except Exception as e:
+            results[name] = (False, round((time.monotonic() - start) * 1000, 1), e)
+
+    threads = [threading.Thread(target=run, args=item, name=f"init-{item[0]}", daemon=True) for item in tasks.items()]
+    deadline = time.monotonic() + timeout
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(max(0.0, deadline - time.monotonic()))
+    return dict(results)
+
+
+class StateCache:
+    def __init__(self, path, min_interval=60.0):
+        """
+        Args:
+            path: 상태 파일 경로
+            min_interval: 저장 최소 간격 (초, SD 카드 쓰기 횟수 제한)
+        """
+        self.path = path
+        self.min_interval = min_interval
+        self._saved_at = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """마지막으로 저장한 상태 (없거나 깨졌으면 None)"""
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"상태 캐시 읽기 실패: {e}")
+            return None
+
+    def save(self, state, force=False):
+        """상태 저장 (min_interval 안에 다시 호출하면 건너뜀). 저장했으면 True"""
+        now = time.monotonic()
+        with self._lock:
+            if not force and self._saved_at is not None and now - self._saved_at < self.min_interval:
+                return False
+            self._saved_at = now
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.path)
+            return True
+        except OSError as e:
+            logger.warning(f"상태 캐시 저장 실패: {e}")
+            return False
+
+
+_MEASURE = """
+import os, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = (time.perf_counter() - start) * 1000
+rss = 0
+try:
+    with open("/proc/self/status") as f:
+        rss = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+except OSError:
+    pass
+print(elapsed, rss)
+"""
+
+
+def _measure(module, rounds):
+    """새 인터프리터에서 import 시간 중앙값 (ms)과 import 후 RSS (KB). 실패하면 None"""
+    times, rss = [], 0
+    for _ in range(rounds):
+        result = subprocess.run(
+            [sys.executable, "-c", _MEASURE.format(module=module)],
+            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        if result.returncode != 0:
+            return None
+        elapsed, rss = result.stdout.split()
+        times.append(float(elapsed))
+    return sorted(times)[len(times) // 2], int(rss)
+
+
+def _benchmark(modules, rounds=5):
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    if not modules:
+        gateways = [name for name in ("app", "mqtt_gateway", "raspberry_gateway") if os.path.exists(os.path.join(base_dir, f"{name}.py"))]
+        modules = gateways + ["paho.mqtt.client", "requests", "pymodbus.client.sync", "serial"]
+
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], check=True)
+    print(f"인터프리터 기동: {(time.perf_counter() - start) * 1000:.0f}ms, 측정 {rounds}회 중앙값")
+    baseline = _measure("os", 1)
+    print(f"{'모듈':<24} {'import ms':>10} {'RSS KB':>8} {'RSS 증가':>8}")
+    for module in modules:
+        measured = _measure(module, rounds)
+        if measured is None:
+            print(f"{module:<24} {'(import 실패)':>10}")
+            continue
+        elapsed, rss = measured
+        print(f"{module:<24} {elapsed:>10.1f} {rss:>8} {rss - baseline[1]:>8}")
+
+
+if __name__ == "__main__":
+    _benchmark(sys.argv[1:])
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+구간별 지연 추적 (센서 읽기 → 시리얼 → 게이트웨이 → MQTT/HTTP 전송 → Bridge ACK)
+
+- 샘플링: sample_rate 비율의 메시지만 추적 (디바이스가 trace를 붙여 보낸 메시지는 항상 이어서 추적)
+- 추적 컨텍스트는 페이로드의 "trace" 필드로 전달: {"id": ..., "hops": [[구간, epoch ms], ...]}
+  (머신 사이 비교는 epoch ms, 게이트웨이 안의 구간 시간은 monotonic_ns로 측정)
+- 구간별 지연 히스토그램 (1-2-5 로그 버킷, ms) → stats()로 p50/p90/p99 조회
+- 완료된 추적은 JSON Lines 파일에 기록 (max_bytes 초과 시 .1로 교체)
+
+사용 예:
+    trace = tracer.start("telemetry")        # 샘플링되지 않으면 None
+    tracer.mark(trace, "processed")
+    payload["trace"] = tracer.context(trace)
+    ...
+    tracer.mark(trace, "ack")
+    tracer.finish(trace)
+"""
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+from timebase import Clock
+
+logger = logging.getLogger(__name__)
+
+# 히스토그램 버킷 상한 (ms): 0.1 ~ 100초
+BUCKETS = [base * 10 ** exp for exp in range(-1, 5) for base in (1, 2, 5)] + [100000]
+
+
+class LatencyHistogram:
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # 마지막은 상한 초과
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value_ms):
+        index = len(BUCKETS)
+        for i, bound in enumerate(BUCKETS):
+            if value_ms <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value_ms
+        self.max = max(self.max, value_ms)
+
+    def percentile(self, p):
+        """p 백분위가 들어 있는 버킷의 상한 (ms)"""
+        if not self.count:
+            return None
+        target = self.count * p / 100
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return BUCKETS[i] if i < len(BUCKETS) else self.max
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 3) if self.count else None,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": round(self.max, 3)
+        }
+
+
+class Trace:
+    """추적 하나 (이전 홉은 epoch ms, 이 프로세스의 홉은 monotonic_ns로 기록)"""
+
+    __slots__ = ("id", "kind", "remote_hops", "local_hops")
+
+    def __init__(self, trace_id, kind, hops=None):
+        self.id = trace_id
+        self.kind = kind
+        self.remote_hops = [list(hop) for hop in (hops or [])]  # 이전 홉 [[구간, epoch ms], ...]
+        self.local_hops = []  # [(구간, monotonic_ns)]
+
+
+class Tracer:
+    def __init__(self, sample_rate=0.01, trace_file=None, max_bytes=5 * 1024 * 1024, clock=None):
+        """
+        Args:
+            sample_rate: 추적할 메시지 비율 (0이면 디바이스가 보낸 trace만)
+            trace_file: 완료된 추적을 기록할 JSON Lines 파일 (None이면 히스토그램만)
+            max_bytes: 추적 파일 최대 크기
+            clock: timebase.Clock (epoch ms 변환용)
+        """
+        self.sample_rate = sample_rate
+        self.trace_file = trace_file
+        self.max_bytes = max_bytes
+        self.clock = clock or Clock()
+        self.histograms = {}  # "종류.구간" -> LatencyHistogram
+        self._lock = threading.Lock()
+
+    def start(self, kind, context=None, started_ns=None, stage="start"):
+        """
+        추적 시작. 샘플링되지 않으면 None
+
+        Args:
+            kind: 추적 종류 (telemetry, command 등, 히스토그램 이름 앞부분)
+            context: 앞 단계에서 받은 trace 필드 (있으면 샘플링과 무관하게 이어서 추적)
+            started_ns: 첫 홉 시각 (monotonic_ns, 기본은 지금)
+        """
+        if isinstance(context, dict) and context.get("id"):
+            trace = Trace(str(context["id"]), kind, context.get("hops"))
+        elif self.sample_rate and random.random() < self.sample_rate:
+            trace = Trace(os.urandom(8).hex(), kind)
+        else:
+            return None
+        trace.local_hops.append((stage, started_ns if started_ns is not None else time.monotonic_ns()))
+        return trace
+
+    def mark(self, trace, stage, ts_ns=None):
+        """홉 기록 (trace가 None이면 무시)"""
+        if trace is not None:
+            trace.local_hops.append((stage, ts_ns if ts_ns is not None else time.monotonic_ns()))
+
+    def context(self, trace):
+        """페이로드에 넣을 trace 필드 (다음 홉이 이어서 추적)"""
+        if trace is None:
+            return None
+        hops = trace.remote_hops + [[stage, self.clock.to_epoch_ms(ns)] for stage, ns in trace.local_hops]
+        return {"id": trace.id, "hops": hops}
+
+    def finish(self, trace):
+        """구간별 지연을 히스토그램에 반영하고 파일에 기록"""
+        if trace is None:
+            return
+        stages = []
+        if trace.remote_hops:
+            # 이전 홉 → 첫 로컬 홉은 epoch ms 차이 (머신 간 시계 오차 포함)
+            first_stage, first_ns = trace.local_hops[0]
+            points = trace.remote_hops + [[first_stage, self.clock.to_epoch_ms(first_ns)]]
+            for (_, prev_ms), (stage, ms) in zip(points, points[1:]):
+                stages.append((stage, float(ms - prev_ms)))
+        for (_, prev_ns), (stage, ns) in zip(trace.local_hops, trace.local_hops[1:]):
+            stages.append((stage, (ns - prev_ns) / 1e6))
+        total = sum(value for _, value in stages)
+
+        with self._lock:
+            for stage, value in stages + [("total", total)]:
+                key = f"{trace.kind}.{stage}"
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = LatencyHistogram()
+                histogram.add(max(0.0, value))
+
+            if self.trace_file:
+                self._write_locked({
+                    "id": trace.id, "kind": trace.kind, "hops": self.context(trace)["hops"],
+                    "stages_ms": {stage: round(value, 3) for stage, value in stages},
+                    "total_ms": round(total, 3)
+                })
+
+    def _write_locked(self, record):
+        try:
+            if os.path.exists(self.trace_file) and os.path.getsize(self.trace_file) > self.max_bytes:
+                os.replace(self.trace_file, self.trace_file + ".1")
+            with open(self.trace_file, "a") as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError as e:
+            logger.warning(f"추적 파일 기록 실패: {e}")
+
+    def stats(self):
+        """구간별 지연 요약 {"종류.구간": {count, mean, p50, p90, p99, max}} (ms)"""
+        with self._lock:
+            return {key: histogram.summary() for key, histogram in sorted(self.histograms.items())}
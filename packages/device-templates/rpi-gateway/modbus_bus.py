@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Modbus 버스 스케줄러 (RTU 시리얼 / TCP 공용)
+
+RS-485 버스 하나에 여러 슬레이브가 물려 있으면 한 번에 트랜잭션 하나만 가능하므로,
+포트마다 전용 스레드가 트랜잭션을 하나씩 실행
+
+- RTU 프레임 간 최소 간격: 3.5 문자 시간 (19200bps 초과는 1.75ms 고정, Modbus over Serial Line 규격)
+  필요한 만큼만 기다리고 고정 지연은 두지 않음 (버스가 낼 수 있는 최대 트랜잭션 수 유지)
+- 폴링 읽기는 슬레이브/함수별로 묶어 가까운 주소는 한 번에 읽음 (간격 max_gap 이하, 최대 max_block 개)
+  묶어 읽기가 실패하면 (중간에 없는 주소 등) 그 슬레이브는 개별 읽기로 전환
+- 쓰기는 우선순위가 높아 대기 중인 폴링보다 먼저 실행 (진행 중인 트랜잭션 하나만 기다림)
+- 여러 지점을 한 번에 쓰면 같은 슬레이브의 연속 주소는 write_registers/write_coils 한 번으로 묶고,
+  필요하면 바로 다시 읽어 확인 (확인 읽기도 쓰기 우선순위라 같은 폴링 주기 안에 끝남)
+"""
+
+import itertools
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_WRITE = 0
+PRIORITY_POLL = 10
+
+READ_FUNCTIONS = {
+    'holding': 'read_holding_registers',
+    'input': 'read_input_registers',
+    'coil': 'read_coils',
+    'discrete': 'read_discrete_inputs',
+}
+MAX_BLOCK = {'holding': 125, 'input': 125, 'coil': 2000, 'discrete': 2000}  # 요청 한 번에 읽을 수 있는 최대 개수
+MAX_WRITE = {'holding': 123, 'coil': 1968}  # 요청 한 번에 쓸 수 있는 최대 개수
+
+
+def silent_interval(baudrate):
+    """RTU 프레임 간 최소 간격 (초)"""
+    if not baudrate or baudrate > 19200:
+        return 0.00175
+    return 3.5 * 11 / baudrate  # 문자당 11비트 (시작 + 8 데이터 + 패리티/정지 2)
+
+
+def plan_reads(points, max_gap=8, max_block=None, no_merge=()):
+    """
+    읽기 지점을 요청 블록으로 묶음
+
+    Args:
+        points: {이름: (unit, function, address, count)}
+        max_gap: 이 개수 이하로 떨어진 주소는 사이를 함께 읽어 한 요청으로 묶음
+        no_merge: 묶지 않을 (unit, function) 집합
+
+    Returns:
+        [(unit, function, start, count, [(이름, 블록 내 위치, count), ...]), ...]
+    """
+    groups = {}
+    for name, (unit, function, address, count) in points.items():
+        groups.setdefault((unit, function), []).append((address, count, name))
+
+    blocks = []
+    for (unit, function), items in sorted(groups.items()):
+        limit = min(max_block or MAX_BLOCK[function], MAX_BLOCK[function])
+        items.sort()
+        current = None
+        for address, count, name in items:
+            if (current is not None and (unit, function) not in no_merge
+                    and address - (current[2] + current[3]) <= max_gap
+                    and max(current[2] + current[3], address + count) - current[2] <= limit):
+                current[3] = max(current[2] + current[3], address + count) - current[2]
+                current[4].append((name, address - current[2], count))
+                continue
+            current = [unit, function, address, count, [(name, 0, count)]]
+            blocks.append(current)
+    return [tuple(block) for block in blocks]
+
+
+def plan_writes(writes):
+    """
+    쓰기 지점을 요청 단위로 묶음 (같은 unit/종류에서 주소가 연속인 것끼리)
+
+    Args:
+        writes: {이름: (unit, kind, address, value)}, kind는 'holding' 또는 'coil'
+
+    Returns:
+        [(unit, kind, start, [값, ...], [이름, ...]), ...]
+    """
+    runs = []
+    current = None
+    for name, (unit, kind, address, value) in sorted(writes.items(), key=lambda item: item[1][:3]):
+        if (current is not None and current[:2] == [unit, kind]
+                and address == current[2] + len(current[3]) and len(current[3]) < MAX_WRITE[kind]):
+            current[3].append(value)
+            current[4].append(name)
+            continue
+        current = [unit, kind, address, [value], [name]]
+        runs.append(current)
+    return [tuple(run) for run in runs]
+
+
+class ModbusBus:
+    def __init__(self, client, name='modbus', baudrate=None, rtu=False, ready=None, on_error=None,
+                 max_gap=8, max_block=None):
+        """
+        Args:
+            client: pymodbus 클라이언트 (ModbusSerialClient 또는 ModbusTcpClient)
+            baudrate: RTU 통신 속도 (프레임 간 간격 계산용)
+            rtu: True면 프레임 간 간격 적용
+            ready: ready() -> bool, 연결되어 있는지 (False면 트랜잭션을 실패 처리)
+            on_error: on_error(exc) - 통신 예외 발생 시 호출 (연결 감시자에 알림)
+            max_gap / max_block: 읽기 묶음 설정 (plan_reads 참고)
+        """
+        self.client = client
+        self.name = name
+        self.gap = silent_interval(baudrate) if rtu else 0.0
+        self.ready = ready
+        self.on_error = on_error
+        self.max_gap = max_gap
+        self.max_block = max_block
+
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._no_merge = set()  # 묶어 읽기가 실패한 (unit, function)
+        self._idle_at = 0.0     # 다음 프레임을 보낼 수 있는 시각
+        self.running = False
+        self.thread = None
+
+        self.transactions = 0
+        self.errors = 0
+        self.busy_time = 0.0
+        self.started_at = time.monotonic()
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name=f'bus-{self.name}', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self._queue.put((-1, next(self._seq), None, None))
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=5)
+        # 남은 요청은 실패 처리 (기다리는 쪽이 타임아웃까지 막히지 않도록)
+        while not self._queue.empty():
+            _, _, call, future = self._queue.get_nowait()
+            if future is not None and future.set_running_or_notify_cancel():
+                future.set_exception(ConnectionError(f'{self.name} 버스 중지됨'))
+
+    def submit(self, call, priority=PRIORITY_POLL):
+        """call(client)을 버스 스레드에서 실행. Future 반환"""
+        future = Future()
+        self._queue.put((priority, next(self._seq), call, future))
+        return future
+
+    def execute(self, call, priority=PRIORITY_WRITE, timeout=5.0):
+        """submit 후 결과 대기 (실패하면 예외)"""
+        return self.submit(call, priority).result(timeout)
+
+    def write_register(self, address, value, unit, timeout=5.0):
+        """레지스터 하나 쓰기 (폴링보다 먼저 실행). 성공 여부 반환"""
+        try:
+            result = self.execute(lambda client: client.write_register(address, value, unit=unit), timeout=timeout)
+            return not result.isError()
+        except Exception as e:
+            logger.error(f'Modbus 쓰기 실패 (unit {unit}, {address}): {e}')
+            return False
+
+    def write_many(self, writes, verify=(), timeout=5.0):
+        """
+        여러 지점 쓰기 (같은 슬레이브의 연속 주소는 요청 하나로 묶음)
+
+        Args:
+            writes: {이름: (unit, kind, address, value)}, kind는 'holding' 또는 'coil'
+            verify: 쓰기 후 다시 읽어 확인할 이름 목록
+
+        Returns:
+            {이름: {'ok': bool, 'verified': bool 또는 None, 'latency_ms': 요청부터 완료(확인)까지}}
+        """
+        start = time.monotonic()
+        verify = set(verify)
+        jobs = []
+        for unit, kind, address, values, names in plan_writes(writes):
+            write = self.submit(self._write_call(unit, kind, address, values), PRIORITY_WRITE)
+            # 같은 우선순위는 넣은 순서대로 실행되므로 확인 읽기는 쓰기 직후에 실행됨
+            check = None
+            if verify.intersection(names):
+                check = self.submit(self._read_call(unit, kind, address, len(values)), PRIORITY_WRITE)
+            jobs.append((unit, kind, address, values, names, write, check))
+
+        deadline = start + timeout
+        results = {}
+        for unit, kind, address, values, names, write, check in jobs:
+            try:
+                ok = not write.result(max(0.0, deadline - time.monotonic())).isError()
+            except Exception as e:
+                logger.error(f'Modbus 쓰기 실패 (unit {unit}, {kind} {address}): {e}')
+                ok = False
+
+            readback = None
+            if ok and check is not None:
+                try:
+                    result = check.result(max(0.0, deadline - time.monotonic()))
+                    if not result.isError():
+                        readback = result.bits[:len(values)] if kind == 'coil' else result.registers
+                except Exception as e:
+                    logger.error(f'Modbus 확인 읽기 실패 (unit {unit}, {kind} {address}): {e}')
+            latency_ms = round((time.monotonic() - start) * 1000, 1)
+
+            for i, name in enumerate(names):
+                verified = None
+                if name in verify and ok:
+                    verified = readback is not None and bool(readback[i]) == bool(values[i]) if kind == 'coil' \
+                        else readback is not None and readback[i] == values[i]
+                results[name] = {'ok': ok and verified is not False, 'verified': verified, 'latency_ms': latency_ms}
+        return results
+
+    def read(self, points, timeout=10.0):
+        """
+        여러 지점 읽기 (슬레이브/함수별로 묶어서 요청)
+
+        Args:
+            points: {이름: (unit, function, address, count)}, function은 READ_FUNCTIONS 키
+
+        Returns:
+            {이름: 레지스터(또는 비트) 목록} - 실패한 지점은 빠짐
+        """
+        blocks = plan_reads(points, self.max_gap, self.max_block, self._no_merge)
+        futures = [(block, self.submit(self._read_call(*block[:4]))) for block in blocks]
+
+        deadline = time.monotonic() + timeout
+        values = {}
+        for (unit, function, start, count, members), future in futures:
+            try:
+                result = future.result(max(0.0, deadline - time.monotonic()))
+                error = result.isError()
+            except Exception as e:
+                result, error = None, e
+            if not error:
+                data = result.bits if function in ('coil', 'discrete') else result.registers
+                for name, offset, size in members:
+                    values[name] = data[offset:offset + size]
+                continue
+
+            if len(members) > 1 and (unit, function) not in self._no_merge and result is not None:
+                # 장치가 중간 주소를 지원하지 않는 경우: 이후로는 개별 읽기
+                logger.warning(f'Modbus unit {unit} {function} {start}~{start + count - 1} 묶어 읽기 실패 - 개별 읽기로 전환')
+                self._no_merge.add((unit, function))
+                values.update(self.read({name: points[name] for name, _, _ in members}, max(0.0, deadline - time.monotonic())))
+            else:
+                logger.error(f"Modbus 읽기 실패 (unit {unit}, {function} {start}): {', '.join(name for name, _, _ in members)}")
+        return values
+
+    def stats(self):
+        """버스 통계 (초당 트랜잭션, 사용률, 평균 트랜잭션 시간)"""
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        return {
+            'transactions': self.transactions,
+            'errors': self.errors,
+            'tps': round(self.transactions / elapsed, 2),
+            'utilization': round(self.busy_time / elapsed, 3),
+            'avg_ms': round(self.busy_time / self.transactions * 1000, 2) if self.transactions else None,
+            'pending': self._queue.qsize(),
+        }
+
+    @staticmethod
+    def _write_call(unit, kind, address, values):
+        if kind == 'coil':
+            if len(values) == 1:
+                return lambda client: client.write_coil(address, bool(values[0]), unit=unit)
+            return lambda client: client.write_coils(address, [bool(value) for value in values], unit=unit)
+        if len(values) == 1:
+            return lambda client: client.write_register(address, values[0], unit=unit)
+        return lambda client: client.write_registers(address, values, unit=unit)
+
+    @staticmethod
+    def _read_call(unit, function, start, count):
+        method = READ_FUNCTIONS[function]
+        return lambda client: getattr(client, method)(start, count, unit=unit)
+
+    def _run(self):
+        while self.running:
+            _, _, call, future = self._queue.get()
+            if call is None:
+                continue
+            if not future.set_running_or_notify_cancel():
+                continue
+            if self.ready and not self.ready():
+                future.set_exception(ConnectionError(f'{self.name} 연결 안 됨'))
+                continue
+
+            # 직전 프레임 이후 최소 간격만큼만 대기
+            wait = self._idle_at - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+
+            start = time.monotonic()
+            try:
+                result = call(self.client)
+            except Exception as e:
+                self.errors += 1
+                future.set_exception(e)
+                if self.on_error:
+                    self.on_error(e)
+            else:
+                if getattr(result, 'isError', lambda: False)():
+                    self.errors += 1
+                future.set_result(result)
+            finally:
+                now = time.monotonic()
+                self._idle_at = now + self.gap
+                self.transactions += 1
+                self.busy_time += now - start
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+MQTT 5 발행 도구 (paho-mqtt 1.5 이상)
+
+- 토픽 별칭: 같은 토픽의 두 번째 메시지부터 토픽 문자열 대신 2바이트 별칭만 전송
+  (별칭은 연결마다 초기화, 브로커가 CONNACK으로 알려준 TopicAliasMaximum 이내에서만 사용)
+  연결된 동안의 QoS 0 메시지에만 사용: QoS 1 이상은 PUBACK 전에 끊기면 paho가 재연결 후 그대로 재전송하는데
+  새 연결에는 별칭이 없으므로 항상 토픽 전체를 보냄 (CONNACK 전/끊긴 동안 발행한 메시지도 별칭 없음)
+- 메시지 만료: 오프라인 동안 브로커에 쌓인 오래된 텔레메트리는 만료 시간 후 폐기
+- 사용자 속성: 스키마 버전, batch_seq 등을 페이로드 파싱 없이 전달
+- 상관 데이터: 명령의 CorrelationData/ResponseTopic을 ACK에 그대로 붙여 서버가 페이로드 파싱 없이 매칭
+
+MQTT 3.1.1 클라이언트에는 속성 없이 그대로 발행하므로 같은 코드로 두 버전을 모두 지원
+
+메시지당 전송 바이트 비교:
+    python3 mqtt_v5.py
+"""
+
+import threading
+
+import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+SCHEMA_VERSION = "1"
+
+
+def create_client(client_id, mqtt5=False):
+    """MQTT 클라이언트 생성 (3.1.1은 영구 세션, 5는 connect_kwargs()의 세션 만료로 유지)"""
+    if mqtt5:
+        return mqtt.Client(client_id=client_id, protocol=mqtt.MQTTv5)
+    return mqtt.Client(client_id=client_id, clean_session=False)
+
+
+def connect_kwargs(mqtt5=False, session_expiry=86400):
+    """client.connect()에 넘길 추가 인자 (MQTT 5: clean_start=False + 세션 만료 시간)"""
+    if not mqtt5:
+        return {}
+    properties = Properties(PacketTypes.CONNECT)
+    properties.SessionExpiryInterval = session_expiry
+    return {"clean_start": False, "properties": properties}
+
+
+def command_correlation(msg):
+    """수신 명령의 (응답 토픽, 상관 데이터). MQTT 3.1.1이거나 없으면 (None, None)"""
+    properties = getattr(msg, "properties", None)
+    return getattr(properties, "ResponseTopic", None), getattr(properties, "CorrelationData", None)
+
+
+class Mqtt5Publisher:
+    def __init__(self, client, mqtt5=False):
+        """
+        Args:
+            client: paho 클라이언트
+            mqtt5: MQTT 5로 연결했는지 여부 (False면 속성 없이 발행)
+        """
+        self.client = client
+        self.mqtt5 = mqtt5
+        self.alias_maximum = 0
+        self._aliases = {}  # 토픽 -> 별칭
+        self._lock = threading.Lock()
+
+    def on_connect(self, properties=None):
+        """연결(재연결)마다 호출 - 브로커가 허용한 별칭 수로 별칭 초기화"""
+        with self._lock:
+            self._aliases.clear()
+            self.alias_maximum = getattr(properties, "TopicAliasMaximum", 0) if properties else 0
+
+    def publish(self, topic, payload, qos=1, expiry=None, user_properties=None,
+                correlation_data=None, retain=False):
+        """
+        메시지 발행
+
+        Args:
+            expiry: 메시지 만료 시간 (초, MQTT 5)
+            user_properties: 사용자 속성 dict (MQTT 5)
+            correlation_data: 상관 데이터 bytes (MQTT 5)
+        """
+        if not self.mqtt5:
+            return self.client.publish(topic, payload, qos=qos, retain=retain)
+
+        properties = Properties(PacketTypes.PUBLISH)
+        if expiry:
+            properties.MessageExpiryInterval = int(expiry)
+        for key, value in (user_properties or {}).items():
+            properties.UserProperty = (key, str(value))
+        if correlation_data:
+            properties.CorrelationData = correlation_data
+
+        # 별칭 설정 메시지가 별칭만 쓰는 메시지보다 먼저 큐에 들어가도록 발행까지 잠금 유지
+        with self._lock:
+            if qos or not self.client.is_connected():
+                return self.client.publish(topic, payload, qos=qos, retain=retain, properties=properties)
+            alias = self._aliases.get(topic)
+            if alias:
+                properties.TopicAlias = alias
+                topic = ""
+            elif len(self._aliases) < self.alias_maximum:
+                alias = len(self._aliases) + 1
+                self._aliases[topic] = alias
+                properties.TopicAlias = alias
+            return self.client.publish(topic, payload, qos=qos, retain=retain, properties=properties)
+
+
+def publish_packet_size(topic, payload_size, qos=1, properties=None):
+    """PUBLISH 패킷 크기 (바이트, 고정 헤더 포함)"""
+    remaining = 2 + len(topic.encode("utf-8")) + payload_size + (2 if qos else 0)
+    if properties is not None:
+        packed = properties.pack()  # 속성 길이(가변 길이 정수) 포함
+        remaining += len(packed)
+
+    length_bytes = 1
+    while remaining >= 128 ** length_bytes:
+        length_bytes += 1
+    return 1 + length_bytes + remaining
+
+
+def _compare(topic, payload_size, expiry=600, batch_seq=1234):
+    def v5_properties(alias=None, user_properties=True):
+        properties = Properties(PacketTypes.PUBLISH)
+        properties.MessageExpiryInterval = expiry
+        if user_properties:
+            properties.UserProperty = ("schema", SCHEMA_VERSION)
+            properties.UserProperty = ("batch_seq", str(batch_seq))
+        if alias:
+            properties.TopicAlias = alias
+        return properties
+
+    # 별칭은 QoS 0 메시지에만 쓰므로 모두 QoS 0으로 비교
+    return (
+        publish_packet_size(topic, payload_size, qos=0),
+        publish_packet_size(topic, payload_size, qos=0, properties=v5_properties(alias=1)),
+        publish_packet_size("", payload_size, qos=0, properties=v5_properties(alias=1)),
+        publish_packet_size("", payload_size, qos=0, properties=v5_properties(alias=1, user_properties=False)),
+    )
+
+
+if __name__ == "__main__":
+    topic = "farms/farm_001/devices/device_001/telemetry"
+    print(f"토픽: {topic} ({len(topic)}바이트), QoS 0, 메시지 만료 포함")
+    print("  5 첫 메시지 / 5 별칭: 사용자 속성(schema, batch_seq) 포함, 5 별칭(만료만): 사용자 속성 없음")
+    print(f"{'페이로드':>6} | {'3.1.1':>6} | {'5 첫 메시지':>9} | {'5 별칭':>7} | {'5 별칭(만료만)':>10}")
+    for payload_size in (32, 128, 512, 2048):
+        v311, first, aliased, minimal = _compare(topic, payload_size)
+        print(f"{payload_size:>8} | {v311:>6} | {first:>12} | {aliased:>4} ({aliased - v311:+d}) | {minimal:>6} ({minimal - v311:+d})")
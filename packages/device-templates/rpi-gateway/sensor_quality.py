@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+센서 값 품질 판정 (엣지 측 증분 통계 + 이상 탐지)
+데이터가 농장 밖으로 나가기 전에 고착(stuck), 급변(spike), 드리프트를 표시
+
+센서 키마다 고정 크기 메모리만 사용:
+- Welford 평균/분산 (장기 통계)
+- EWMA 평균/분산 (최근 추세)
+- 두 개의 힙을 이용한 이동 중앙값 (급변 판정 기준)
+- 동일 값 연속 횟수 (고착 판정)
+
+판정 결과는 기존 quality 필드 값("good"/"suspect"/"bad")을 사용
+"""
+
+import heapq
+import math
+from collections import deque
+
+
+class RollingMedian:
+    """최근 window개 값의 중앙값 (두 개의 힙 + 지연 삭제)"""
+
+    __slots__ = ("window", "values", "_low", "_high", "_low_size", "_high_size", "_delayed")
+
+    def __init__(self, window):
+        self.window = window
+        self.values = deque()
+        self._low = []      # 작은 절반 (최대 힙, 부호 반전 저장)
+        self._high = []     # 큰 절반 (최소 힙)
+        self._low_size = 0
+        self._high_size = 0
+        self._delayed = {}  # 값 -> 아직 힙에서 빼지 못한 삭제 횟수
+
+    def add(self, value):
+        if not self._low or value <= -self._low[0]:
+            heapq.heappush(self._low, -value)
+            self._low_size += 1
+        else:
+            heapq.heappush(self._high, value)
+            self._high_size += 1
+
+        self.values.append(value)
+        if len(self.values) > self.window:
+            self._remove(self.values.popleft())
+        self._rebalance()
+
+    def median(self):
+        if not self.values:
+            return None
+        if self._low_size > self._high_size:
+            return -self._low[0]
+        return (-self._low[0] + self._high[0]) / 2
+
+    def _remove(self, value):
+        self._delayed[value] = self._delayed.get(value, 0) + 1
+        if value <= -self._low[0]:
+            self._low_size -= 1
+            if value == -self._low[0]:
+                self._prune(self._low, -1)
+        else:
+            self._high_size -= 1
+            if self._high and value == self._high[0]:
+                self._prune(self._high, 1)
+
+    def _rebalance(self):
+        if self._low_size > self._high_size + 1:
+            heapq.heappush(self._high, -heapq.heappop(self._low))
+            self._low_size -= 1
+            self._high_size += 1
+            self._prune(self._low, -1)
+        elif self._low_size < self._high_size:
+            heapq.heappush(self._low, -heapq.heappop(self._high))
+            self._high_size -= 1
+            self._low_size += 1
+            self._prune(self._high, 1)
+
+    def _prune(self, heap, sign):
+        while heap:
+            value = sign * heap[0]
+            count = self._delayed.get(value)
+            if not count:
+                break
+            if count == 1:
+                del self._delayed[value]
+            else:
+                self._delayed[value] = count - 1
+            heapq.heappop(heap)
+
+
+class SensorStats:
+    """센서 키 하나의 증분 통계"""
+
+    __slots__ = ("alpha", "count", "mean", "_m2", "ewma", "ewvar", "median", "last", "flat_run", "rejected")
+
+    def __init__(self, window=15, alpha=0.1):
+        self.alpha = alpha
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.ewma = None
+        self.ewvar = 0.0
+        self.median = RollingMedian(window)
+        self.last = None
+        self.flat_run = 0
+        self.rejected = 0
+
+    @property
+    def variance(self):
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def update(self, value):
+        # Welford
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+        # EWMA
+        if self.ewma is None:
+            self.ewma = value
+        else:
+            diff = value - self.ewma
+            incr = self.alpha * diff
+            self.ewma += incr
+            self.ewvar = (1 - self.alpha) * (self.ewvar + diff * incr)
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "mean": round(self.mean, 4),
+            "std": round(math.sqrt(self.variance), 4),
+            "ewma": round(self.ewma, 4) if self.ewma is not None else None,
+            "median": self.median.median(),
+            "flat_run": self.flat_run,
+            "rejected": self.rejected
+        }
+
+
+class SensorQualityMonitor:
+    def __init__(self, limits=None, window=15, alpha=0.1, warmup=10,
+                 spike_z=4.0, bad_z=10.0, drift_z=None, flatline_count=60, flat_epsilon=0.0):
+        """
+        Args:
+            limits: 센서 키 -> {"min": 값, "max": 값} (물리적 범위, 벗어나면 bad)
+            window: 이동 중앙값 창 크기
+            alpha: EWMA 가중치
+            warmup: 급변/드리프트 판정 전 최소 샘플 수
+            spike_z: 중앙값 대비 편차가 이 배수(EWMA 표준편차 기준)를 넘으면 suspect
+            bad_z: 이 배수를 넘으면 bad
+            drift_z: EWMA가 장기 평균에서 이 배수 이상 벗어나면 suspect (None이면 사용 안 함)
+            flatline_count: 같은 값이 이 횟수 이상 연속되면 suspect (고착 의심)
+            flat_epsilon: 같은 값으로 간주할 변화량
+        """
+        self.limits = limits or {}
+        self.window = window
+        self.alpha = alpha
+        self.warmup = warmup
+        self.spike_z = spike_z
+        self.bad_z = bad_z
+        self.drift_z = drift_z
+        self.flatline_count = flatline_count
+        self.flat_epsilon = flat_epsilon
+        self._stats = {}
+
+    def check(self, key, value):
+        """새 값의 품질 판정 후 통계 갱신. "good" / "suspect" / "bad" 반환"""
+        if value is None or isinstance(value, bool) or not isinstance(value, (int, float)) or math.isnan(value):
+            return "bad"
+
+        limit = self.limits.get(key, {})
+        if ("min" in limit and value < limit["min"]) or ("max" in limit and value > limit["max"]):
+            stats = self._stats.get(key)
+            if stats:
+                stats.rejected += 1
+            return "bad"
+
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = SensorStats(self.window, self.alpha)
+
+        quality = "good"
+        if stats.count >= self.warmup:
+            median = stats.median.median()
+            std = max(math.sqrt(stats.ewvar), 0.01 * abs(median), 1e-3)
+            z = abs(value - median) / std
+            if z > self.bad_z:
+                quality = "bad"
+            elif z > self.spike_z:
+                quality = "suspect"
+
+            if quality == "good" and self.drift_z and stats.count > 1:
+                long_std = math.sqrt(stats.variance)
+                if long_std > 0 and abs(stats.ewma - stats.mean) > self.drift_z * long_std:
+                    quality = "suspect"
+
+        # 고착 판정
+        if stats.last is not None and abs(value - stats.last) <= self.flat_epsilon:
+            stats.flat_run += 1
+        else:
+            stats.flat_run = 0
+        stats.last = value
+        if quality == "good" and self.flatline_count and stats.flat_run >= self.flatline_count:
+            quality = "suspect"
+
+        # 중앙값은 항상 갱신 (실제 수준 변화에 적응), 평균/분산은 bad 값 제외
+        stats.median.add(value)
+        if quality == "bad":
+            stats.rejected += 1
+        else:
+            stats.update(value)
+
+        return quality
+
+    def stats(self, key=None):
+        """키별 통계 요약"""
+        if key is not None:
+            stats = self._stats.get(key)
+            return stats.to_dict() if stats else None
+        return {key: stats.to_dict() for key, stats in self._stats.items()}
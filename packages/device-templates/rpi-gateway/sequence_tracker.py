@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+시퀀스 번호 부여 + 누락/중복 검출
+
+- SequenceCounter: 수집 시점에 소스(디바이스)별 단조 증가 번호 부여
+  epoch(카운터 시작 시각, ms)을 함께 보내 수신 측이 재시작과 중복을 구분
+- SequenceWindow: 소스 하나의 슬라이딩 비트맵 (최근 size개 번호의 수신 여부, 정수 하나로 유지)
+  - 앞으로 건너뛴 번호는 누락(missing)으로 표시, 늦게 도착하면 복구(late)
+  - 이미 받은 번호는 중복(duplicate)
+  - 윈도 밖으로 밀려날 때까지 오지 않은 번호는 손실(lost) 확정
+
+수신 측(Universal Bridge)은 seq/seq_epoch로 같은 비트맵을 유지하고, 누락 구간은 전후 수신 시각으로
+backfill 명령을 보내 게이트웨이 백로그(telemetry_backlog)에서 재전송 받음
+"""
+
+import threading
+import time
+
+NEW = "new"
+LATE = "late"
+DUPLICATE = "duplicate"
+STALE = "stale"    # 윈도보다 오래된 번호 (중복인지 알 수 없음)
+RESET = "reset"    # 재시작 (epoch 변경 또는 번호가 윈도 이상 뒤로 감)
+
+# 페이로드의 시퀀스 필드 (측정값이 아니므로 백로그에 저장하지 않음)
+SEQUENCE_FIELDS = ("seq", "seq_epoch", "device_seq")
+
+
+def _popcount(value):
+    return bin(value).count("1")
+
+
+class SequenceCounter:
+    def __init__(self):
+        self.epoch = int(time.time() * 1000)
+        self._next = {}
+        self._lock = threading.Lock()
+
+    def next(self, source):
+        """source의 다음 번호 (0부터)"""
+        with self._lock:
+            seq = self._next.get(source, 0)
+            self._next[source] = seq + 1
+            return seq
+
+
+class SequenceWindow:
+    __slots__ = ("size", "mask", "epoch", "highest", "bitmap", "valid",
+                 "received", "missing", "late", "duplicates", "lost", "resets")
+
+    def __init__(self, size=1024):
+        self.size = size
+        self.mask = (1 << size) - 1
+        self.epoch = None
+        self.highest = None
+        self.bitmap = 0   # 비트 i: highest - i 수신 여부
+        self.valid = 0    # 비트맵에서 의미 있는 위치 수 (시작 직후에는 size보다 작음)
+
+        self.received = 0
+        self.missing = 0  # 윈도 안에서 아직 오지 않은 번호 수
+        self.late = 0
+        self.duplicates = 0
+        self.lost = 0
+        self.resets = 0
+
+    def observe(self, seq, epoch=None):
+        """
+        번호 하나 기록
+
+        Returns:
+            (상태, 새로 생긴 누락 구간 (처음, 끝) 또는 None)
+        """
+        if self.highest is None:
+            self._restart(seq, epoch)
+            return NEW, None
+        if epoch is not None and epoch != self.epoch:
+            self._restart(seq, epoch, reset=True)
+            return RESET, None
+
+        if seq > self.highest:
+            shift = seq - self.highest
+            gap = (self.highest + 1, seq - 1) if shift > 1 else None
+
+            # 윈도 밖으로 밀려나는 위치 중 비어 있던 번호는 손실 확정
+            keep = max(0, self.size - shift)
+            dropped = 0
+            if self.valid > keep:
+                dropped = (self.valid - keep) - _popcount(self.bitmap >> keep)
+            # 건너뛴 번호가 윈도보다 많으면 넘치는 만큼은 바로 손실
+            skipped = shift - 1
+            overflow = max(0, skipped - (self.size - 1))
+
+            self.lost += dropped + overflow
+            self.missing += skipped - overflow - dropped
+            self.bitmap = 1 if shift >= self.size else ((self.bitmap << shift) | 1) & self.mask
+            self.valid = min(self.size, self.valid + shift)
+            self.highest = seq
+            self.received += 1
+            return NEW, gap
+
+        offset = self.highest - seq
+        if offset >= self.size:
+            if epoch is None:
+                # epoch 없이 윈도 이상 뒤로 가면 디바이스 재시작으로 판단
+                self._restart(seq, epoch, reset=True)
+                return RESET, None
+            return STALE, None
+        if offset >= self.valid:
+            # 시작/재시작 이전 번호: 윈도에 누락으로 센 적이 없으므로 늦게 온 것으로 세지 않음
+            return STALE, None
+
+        bit = 1 << offset
+        if self.bitmap & bit:
+            self.duplicates += 1
+            return DUPLICATE, None
+        self.bitmap |= bit
+        self.missing -= 1
+        self.late += 1
+        self.received += 1
+        return LATE, None
+
+    def missing_ranges(self):
+        """윈도 안에서 아직 오지 않은 번호 구간 [(처음, 끝), ...] (오래된 순)"""
+        ranges = []
+        for offset in range(self.valid - 1, -1, -1):
+            if self.bitmap >> offset & 1:
+                continue
+            seq = self.highest - offset
+            if ranges and ranges[-1][1] == seq - 1:
+                ranges[-1][1] = seq
+            else:
+                ranges.append([seq, seq])
+        return [tuple(r) for r in ranges]
+
+    def _restart(self, seq, epoch, reset=False):
+        if reset:
+            self.resets += 1
+            self.lost += self.missing
+        self.epoch = epoch
+        self.highest = seq
+        self.bitmap = 1
+        self.valid = 1
+        self.missing = 0
+        self.received += 1
+
+    def stats(self):
+        return {
+            "epoch": self.epoch,
+            "highest": self.highest,
+            "received": self.received,
+            "missing": self.missing,
+            "late": self.late,
+            "duplicates": self.duplicates,
+            "lost": self.lost,
+            "resets": self.resets
+        }
+
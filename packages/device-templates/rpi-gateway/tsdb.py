@@ -0,0 +1,468 @@
+#!/usr/bin/env python3
+"""
+게이트웨이 내장 시계열 저장소
+SD 카드에 몇 주 분량의 이력을 압축 저장하고 로컬 대시보드/룰에서 조회
+
+저장 구조 (키마다 디렉터리):
+    <root>/<key>/head.log                 열린 청크의 원본 (추가 전용, 16바이트/포인트, 재시작 시 복구용)
+    <root>/<key>/<start_ms>_<end_ms>.gor  봉인된 청크 (Gorilla 압축)
+
+로컬 조회 API (serve_queries):
+    GET /api/history/keys
+    GET /api/history/range?key=temperature&start=<ms>&end=<ms>
+    GET /api/history/downsample?key=temperature&start=<ms>&end=<ms>&step=<ms>&agg=avg
+    GET /api/history/last?key=temperature&n=10
+
+압축 방식 (Facebook Gorilla):
+- 타임스탬프: delta-of-delta 가변 길이 비트 인코딩
+- 값: 이전 값과 XOR 후 선행/후행 0 비트를 제외한 유효 비트만 저장
+"""
+
+import json
+import os
+import re
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+_HEAD_RECORD = struct.Struct('<qd')
+_CHUNK_HEADER = struct.Struct('<4sBIqq')  # magic, version, count, first_ts, last_ts
+_MAGIC = b'GORI'
+_VERSION = 1
+
+
+# ==================== 비트 입출력 ====================
+class BitWriter:
+    __slots__ = ("buf", "_acc", "_nbits")
+
+    def __init__(self):
+        self.buf = bytearray()
+        self._acc = 0
+        self._nbits = 0
+
+    def write(self, value, nbits):
+        self._acc = (self._acc << nbits) | (value & ((1 << nbits) - 1))
+        self._nbits += nbits
+        while self._nbits >= 8:
+            self._nbits -= 8
+            self.buf.append((self._acc >> self._nbits) & 0xFF)
+        self._acc &= (1 << self._nbits) - 1
+
+    def getvalue(self):
+        if self._nbits:
+            return bytes(self.buf) + bytes([(self._acc << (8 - self._nbits)) & 0xFF])
+        return bytes(self.buf)
+
+
+class BitReader:
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def read(self, nbits):
+        start, end = self.pos >> 3, (self.pos + nbits + 7) >> 3
+        chunk = int.from_bytes(self.data[start:end], 'big')
+        shift = (end - start) * 8 - (self.pos & 7) - nbits
+        self.pos += nbits
+        return (chunk >> shift) & ((1 << nbits) - 1)
+
+
+def _float_bits(value):
+    return struct.unpack('>Q', struct.pack('>d', value))[0]
+
+
+def _bits_float(bits):
+    return struct.unpack('>d', struct.pack('>Q', bits))[0]
+
+
+# delta-of-delta 구간: (접두 비트, 접두 길이, 값 비트 수)
+_DOD_BUCKETS = ((0b10, 2, 7), (0b110, 3, 9), (0b1110, 4, 12))
+
+
+# ==================== Gorilla 청크 ====================
+class ChunkEncoder:
+    __slots__ = ("writer", "count", "first_ts", "last_ts", "_delta", "_value", "_leading", "_trailing")
+
+    def __init__(self):
+        self.writer = BitWriter()
+        self.count = 0
+        self.first_ts = None
+        self.last_ts = None
+        self._delta = 0
+        self._value = 0
+        self._leading = None
+        self._trailing = 0
+
+    def append(self, ts, value):
+        bits = _float_bits(value)
+        w = self.writer
+
+        if self.count == 0:
+            w.write(ts, 64)
+            w.write(bits, 64)
+            self.first_ts = ts
+        else:
+            delta = ts - self.last_ts
+            dod = delta - self._delta
+            self._delta = delta
+            if dod == 0:
+                w.write(0, 1)
+            else:
+                for prefix, prefix_len, nbits in _DOD_BUCKETS:
+                    if -(1 << (nbits - 1)) < dod <= (1 << (nbits - 1)):
+                        w.write(prefix, prefix_len)
+                        w.write(dod, nbits)
+                        break
+                else:
+                    w.write(0b1111, 4)
+                    w.write(dod, 32)
+
+            xor = bits ^ self._value
+            if xor == 0:
+                w.write(0, 1)
+            else:
+                leading = min(64 - xor.bit_length(), 31)
+                trailing = (xor & -xor).bit_length() - 1
+                if self._leading is not None and leading >= self._leading and trailing >= self._trailing:
+                    w.write(0b10, 2)
+                    w.write(xor >> self._trailing, 64 - self._leading - self._trailing)
+                else:
+                    meaningful = 64 - leading - trailing
+                    w.write(0b11, 2)
+                    w.write(leading, 5)
+                    w.write(meaningful & 0x3F, 6)  # 64는 0으로 저장
+                    w.write(xor >> trailing, meaningful)
+                    self._leading, self._trailing = leading, trailing
+
+        self._value = bits
+        self.last_ts = ts
+        self.count += 1
+
+    def to_bytes(self):
+        return _CHUNK_HEADER.pack(_MAGIC, _VERSION, self.count, self.first_ts, self.last_ts) + self.writer.getvalue()
+
+
+def decode_chunk(data):
+    """봉인된 청크 디코딩 → (ts, value) 목록"""
+    magic, version, count, _, _ = _CHUNK_HEADER.unpack_from(data)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError("잘못된 청크 형식")
+
+    reader = BitReader(memoryview(data)[_CHUNK_HEADER.size:])
+    points = []
+    if count == 0:
+        return points
+
+    ts = reader.read(64)
+    bits = reader.read(64)
+    points.append((ts, _bits_float(bits)))
+    delta = 0
+    leading = trailing = 0
+
+    for _ in range(count - 1):
+        # 타임스탬프: 접두 비트('0', '10', '110', '1110', '1111')로 값 비트 수 결정
+        if reader.read(1) == 0:
+            dod = 0
+        else:
+            nbits = 32
+            for _, _, bucket_bits in _DOD_BUCKETS:
+                if reader.read(1) == 0:
+                    nbits = bucket_bits
+                    break
+            dod = reader.read(nbits)
+            if dod > 1 << (nbits - 1):
+                dod -= 1 << nbits
+        delta += dod
+        ts += delta
+
+        # 값
+        if reader.read(1) == 1:
+            if reader.read(1) == 1:
+                leading = reader.read(5)
+                meaningful = reader.read(6) or 64
+                trailing = 64 - leading - meaningful
+            bits ^= reader.read(64 - leading - trailing) << trailing
+
+        points.append((ts, _bits_float(bits)))
+
+    return points
+
+
+# ==================== 저장소 ====================
+class _Head:
+    """키별 열린 청크 (메모리 인코더 + 추가 전용 복구 로그)"""
+
+    __slots__ = ("path", "encoder", "points", "file")
+
+    def __init__(self, path):
+        self.path = path
+        self.encoder = ChunkEncoder()
+        self.points = []  # 열린 청크의 원본 (조회용)
+        self.file = None
+
+
+class TimeSeriesStore:
+    def __init__(self, root, chunk_span=2 * 3600, max_chunk_points=4096, retention=30 * 86400):
+        """
+        Args:
+            root: 저장 디렉터리
+            chunk_span: 청크 하나가 담는 최대 시간 (초)
+            max_chunk_points: 청크 하나의 최대 포인트 수
+            retention: 보관 기간 (초), 지난 청크는 삭제
+        """
+        self.root = root
+        self.chunk_span_ms = int(chunk_span * 1000)
+        self.max_chunk_points = max_chunk_points
+        self.retention_ms = int(retention * 1000)
+        self._heads = {}
+        self._chunks = {}  # 키 -> [(start, end, 파일 경로)] (시작 시각 순)
+        self._lock = threading.RLock()
+        self.dropped = 0   # 순서가 뒤바뀌어 버린 포인트 수
+
+        os.makedirs(root, exist_ok=True)
+        for name in os.listdir(root):
+            if os.path.isdir(os.path.join(root, name)):
+                self._load_key(name)
+
+    # ---------- 쓰기 ----------
+
+    def append(self, key, ts_ms, value):
+        """포인트 추가 (같은 키의 이전 포인트보다 늦은 시각만 허용)"""
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return False
+
+        key = self._safe_key(key)
+        ts_ms = int(ts_ms)
+        with self._lock:
+            head = self._heads.get(key) or self._open_head(key)
+            encoder = head.encoder
+            if encoder.count and ts_ms <= encoder.last_ts:
+                self.dropped += 1
+                return False
+
+            if encoder.count and (ts_ms - encoder.first_ts >= self.chunk_span_ms
+                                  or encoder.count >= self.max_chunk_points):
+                self._seal(key, head)
+                encoder = head.encoder
+
+            encoder.append(ts_ms, float(value))
+            head.points.append((ts_ms, float(value)))
+            head.file.write(_HEAD_RECORD.pack(ts_ms, float(value)))
+            head.file.flush()
+            return True
+
+    def append_many(self, values, ts_ms=None):
+        """한 시각의 여러 키 값 추가"""
+        ts_ms = ts_ms if ts_ms is not None else time.time() * 1000
+        for key, value in values.items():
+            self.append(key, ts_ms, value)
+
+    def flush(self):
+        """열린 청크를 모두 봉인 (종료 시 호출)"""
+        with self._lock:
+            for key, head in list(self._heads.items()):
+                if head.encoder.count:
+                    self._seal(key, head)
+
+    def close(self):
+        with self._lock:
+            for head in self._heads.values():
+                if head.file:
+                    head.file.close()
+            self._heads.clear()
+
+    # ---------- 조회 ----------
+
+    def keys(self):
+        with self._lock:
+            return sorted(set(self._chunks) | set(self._heads))
+
+    def query_range(self, key, start_ms, end_ms):
+        """[start_ms, end_ms) 구간의 (ts, value) 목록"""
+        key = self._safe_key(key)
+        with self._lock:
+            chunks = [path for start, end, path in self._chunks.get(key, []) if end >= start_ms and start < end_ms]
+            head = self._heads.get(key)
+            head_points = list(head.points) if head else []
+
+        points = []
+        for path in chunks:
+            try:
+                with open(path, 'rb') as f:
+                    points.extend(p for p in decode_chunk(f.read()) if start_ms <= p[0] < end_ms)
+            except (OSError, ValueError):
+                continue  # 보관 기간 정리로 삭제되었거나 손상된 청크
+        points.extend(p for p in head_points if start_ms <= p[0] < end_ms)
+        return points
+
+    def downsample(self, key, start_ms, end_ms, step_ms, agg='avg'):
+        """step_ms 간격으로 집계한 (bucket_ts, value) 목록. agg: avg/min/max/last/count"""
+        if step_ms <= 0:
+            raise ValueError(f"step은 양수여야 합니다: {step_ms}")
+        buckets = {}
+        for ts, value in self.query_range(key, start_ms, end_ms):
+            bucket = ts - (ts - start_ms) % step_ms
+            acc = buckets.get(bucket)
+            if acc is None:
+                buckets[bucket] = [1, value, value, value, value]
+            else:
+                acc[0] += 1
+                acc[1] += value
+                acc[2] = min(acc[2], value)
+                acc[3] = max(acc[3], value)
+                acc[4] = value
+
+        pick = {
+            'avg': lambda a: a[1] / a[0],
+            'min': lambda a: a[2],
+            'max': lambda a: a[3],
+            'last': lambda a: a[4],
+            'count': lambda a: a[0],
+        }[agg]
+        return [(bucket, pick(acc)) for bucket, acc in sorted(buckets.items())]
+
+    def last(self, key, n=1):
+        """최근 n개 포인트"""
+        key = self._safe_key(key)
+        with self._lock:
+            head = self._heads.get(key)
+            points = list(head.points[-n:]) if head else []
+            chunks = list(self._chunks.get(key, []))
+
+        # 최신 청크부터 필요한 만큼만 디코딩
+        for _, _, path in reversed(chunks):
+            if len(points) >= n:
+                break
+            try:
+                with open(path, 'rb') as f:
+                    points = decode_chunk(f.read())[-(n - len(points)):] + points
+            except (OSError, ValueError):
+                continue
+        return points[-n:]
+
+    def enforce_retention(self, now_ms=None):
+        """보관 기간이 지난 청크 삭제"""
+        cutoff = (now_ms if now_ms is not None else time.time() * 1000) - self.retention_ms
+        with self._lock:
+            for key, chunks in self._chunks.items():
+                while chunks and chunks[0][1] < cutoff:
+                    _, _, path = chunks.pop(0)
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+    # ---------- 내부 처리 ----------
+
+    @staticmethod
+    def _safe_key(key):
+        return re.sub(r'[^A-Za-z0-9._-]', '_', str(key))
+
+    def _open_head(self, key):
+        key_dir = os.path.join(self.root, key)
+        os.makedirs(key_dir, exist_ok=True)
+        head = _Head(os.path.join(key_dir, 'head.log'))
+        head.file = open(head.path, 'ab')
+        self._heads[key] = head
+        self._chunks.setdefault(key, [])
+        return head
+
+    def _seal(self, key, head):
+        """열린 청크를 압축 파일로 저장하고 복구 로그 비우기"""
+        encoder = head.encoder
+        path = os.path.join(self.root, key, f"{encoder.first_ts}_{encoder.last_ts}.gor")
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(encoder.to_bytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+        self._chunks.setdefault(key, []).append((encoder.first_ts, encoder.last_ts, path))
+        head.file.truncate(0)
+        head.encoder = ChunkEncoder()
+        head.points = []
+
+        self.enforce_retention(encoder.last_ts)
+
+    def _load_key(self, key):
+        """디스크의 청크 목록과 복구 로그 읽기"""
+        key_dir = os.path.join(self.root, key)
+        chunks = []
+        for name in os.listdir(key_dir):
+            match = re.fullmatch(r'(\d+)_(\d+)\.gor', name)
+            if match:
+                chunks.append((int(match.group(1)), int(match.group(2)), os.path.join(key_dir, name)))
+        chunks.sort()
+        self._chunks[key] = chunks
+
+        head_path = os.path.join(key_dir, 'head.log')
+        if not os.path.exists(head_path):
+            return
+
+        with open(head_path, 'rb') as f:
+            data = f.read()
+        head = self._open_head(key)
+        last_sealed = chunks[-1][1] if chunks else -1
+        usable = len(data) - len(data) % _HEAD_RECORD.size  # 전원 차단으로 잘린 마지막 레코드 제외
+        for ts, value in _HEAD_RECORD.iter_unpack(data[:usable]):
+            if ts > last_sealed and (not head.encoder.count or ts > head.encoder.last_ts):
+                head.encoder.append(ts, value)
+                head.points.append((ts, value))
+        if usable != len(data):
+            head.file.truncate(usable)
+
+
+# ==================== 로컬 조회 API ====================
+def serve_queries(store, host='127.0.0.1', port=8081):
+    """로컬 대시보드용 조회 HTTP 서버를 백그라운드 스레드로 시작"""
+
+    class QueryHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {k: v[0] for k, v in parse_qs(url.query).items()}
+            now_ms = int(time.time() * 1000)
+
+            try:
+                if url.path == '/api/history/keys':
+                    result = store.keys()
+                elif url.path == '/api/history/range':
+                    result = store.query_range(
+                        query['key'], int(query.get('start', now_ms - 3600_000)), int(query.get('end', now_ms + 1))
+                    )
+                elif url.path == '/api/history/downsample':
+                    result = store.downsample(
+                        query['key'],
+                        int(query.get('start', now_ms - 86400_000)),
+                        int(query.get('end', now_ms + 1)),
+                        int(query.get('step', 60_000)),
+                        query.get('agg', 'avg')
+                    )
+                elif url.path == '/api/history/last':
+                    result = store.last(query['key'], int(query.get('n', 1)))
+                else:
+                    self._reply(404, {'error': 'Not Found'})
+                    return
+            except (KeyError, ValueError) as e:
+                self._reply(400, {'error': f'잘못된 요청: {e}'})
+                return
+
+            self._reply(200, {'data': result})
+
+        def _reply(self, status, body):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass  # 요청마다 stderr에 출력하지 않음
+
+    server = ThreadingHTTPServer((host, port), QueryHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server